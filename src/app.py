@@ -1,96 +1,245 @@
 # src/app.py
+#
+# Startup is split so the server binds quickly: this module only imports Dash and a few
+# light modules, registers the HTTP routes, and starts a warm-up thread. The warm-up
+# thread imports the dashboards (plotly.express, pandas), registers their callbacks,
+# loads the data and publishes it to the dataset registry. The page layout is built by
+# a factory on the first request for each dataset version.
+#
+#   /healthz  liveness:  200 as soon as the process serves HTTP
+#   /readyz   readiness: 200 once data is loaded and callbacks are registered, else 503
+#   /events   server push of dataset version changes (see live_updates.py)
+#   /api/v1   read-only JSON/Arrow API for other plant systems (see kpi_api.py)
 
 import dash
-from dash import dcc, html, Input, Output, State
-import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
+from dash import html
 import os
+import logging
+import threading
+import flask
 import dash_bootstrap_components as dbc
 
-# Import our custom data processing and KPI calculation functions
-from data_processor import load_and_process_copq_data, load_and_process_oee_data, load_and_process_mfg_cost_data
-from kpi_calculations import calculate_copq_kpis, calculate_oee_kpis, calculate_mfg_cost_kpis
+from data_registry import DatasetRegistry, load_datasets, watch_sources
+from load_profiler import profile_load
+from exports import register_export_routes
+from kpi_api import register_api_routes
+from live_updates import create_live_updates_status, register_live_update_callbacks, register_live_update_routes
+from utils.instrumentation import coalesce_callback_requests, instrument_callbacks, register_metrics_routes
+from utils.layout_cache import LayoutCache, serve_cached_layout
 
-# Import dashboard layouts and callbacks
-from dashboards.copq_dashboard import create_copq_layout, register_copq_callbacks
-from dashboards.oee_dashboard import create_oee_layout, register_oee_callbacks
-from dashboards.mfg_cost_dashboard import create_mfg_cost_layout, register_mfg_cost_callbacks
-from dashboards.ai_insights_dashboard import create_ai_insights_layout, register_ai_insights_callbacks
+logging.basicConfig(level=os.environ.get('KPI_LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(name)s %(levelname)s %(message)s')
+logger = logging.getLogger('kpi.app')
 
-# Import generic UI components (though not directly used in app.py layout, good to know where they are)
-from utils.ui_components import create_kpi_card, create_filter_card
+# Debug mode (Dash dev tools and the auto-reloader) is on unless KPI_DEBUG is 0/false
+DEBUG = os.environ.get('KPI_DEBUG', 'true').strip().lower() not in ('0', 'false', 'no')
 
-# --- Data Loading and Initial KPI Calculation ---
-# Define file paths
-current_dir = os.path.dirname(__file__)
-data_dir = os.path.join(current_dir, '..', 'data')
+# Site the loaded worksheets belong to in the optional fact store ($KPI_FACT_STORE)
+SITE = os.environ.get('KPI_SITE')
 
-COPQ_FILE = os.path.join(data_dir, 'COPQ_Dummy_Data.csv')
-OEE_FILE = os.path.join(data_dir, 'OEE_Dummy_Data.csv')
-MFG_COST_FILE = os.path.join(data_dir, 'Manufacturing_Cost_per_Unit_Calculator.csv')
+# How long the first page request waits for the initial data load before showing a
+# "loading" page instead
+LAYOUT_WAIT_SECONDS = float(os.environ.get('KPI_LAYOUT_WAIT', 30))
 
-# Load and process all data
-copq_raw_data = load_and_process_copq_data(COPQ_FILE)
-oee_raw_data = load_and_process_oee_data(OEE_FILE)
-mfg_cost_raw_data = load_and_process_mfg_cost_data(MFG_COST_FILE)
+# Seconds between checks of the source files for changes (0 disables reloading)
+RELOAD_INTERVAL_SECONDS = float(os.environ.get('KPI_RELOAD_INTERVAL', 10))
 
-# Calculate initial KPIs and get augmented dataframes
-copq_kpis, copq_augmented_data = calculate_copq_kpis(copq_raw_data) if copq_raw_data else ({}, {})
-oee_kpis, oee_augmented_data = calculate_oee_kpis(oee_raw_data) if oee_raw_data else ({}, {})
-mfg_cost_kpis, mfg_cost_augmented_data = calculate_mfg_cost_kpis(mfg_cost_raw_data) if mfg_cost_raw_data else ({}, {})
+registry = DatasetRegistry()
 
 # --- Dash App Setup ---
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP]) 
-
-# --- Dash App Layout ---
-app.layout = dbc.Container([
-    # Header
-    dbc.Row([
-        dbc.Col(html.H1("Manufacturing KPI Dashboards", className="text-center text-primary my-4"), width=12)
-    ]),
-
-    # Tabs for each Dashboard
-    dbc.Tabs(id="tabs-main", active_tab="tab-copq", children=[
-        dbc.Tab(label="COPQ Dashboard", tab_id="tab-copq", children=[
-            create_copq_layout(copq_kpis, copq_augmented_data)
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+
+
+# --- Dash App Layout (factory) ---
+def create_layout(snapshot):
+    """Builds the full page for a dataset snapshot (or an empty page for callback validation)."""
+    from dashboards.copq_dashboard import create_copq_layout
+    from dashboards.oee_dashboard import create_oee_layout
+    from dashboards.mfg_cost_dashboard import create_mfg_cost_layout
+    from dashboards.ai_insights_dashboard import create_ai_insights_layout
+    from dashboards.admin_dashboard import create_admin_layout
+    from utils.ui_components import create_data_stores
+
+    kpis = snapshot.kpis if snapshot else {}
+    augmented = snapshot.augmented if snapshot else {}
+
+    return dbc.Container([
+        # Header
+        dbc.Row([
+            dbc.Col(html.H1("Manufacturing KPI Dashboards", className="text-center text-primary my-4"), width=12)
         ]),
-
-        dbc.Tab(label="OEE Dashboard", tab_id="tab-oee", children=[
-            create_oee_layout(oee_kpis, oee_augmented_data)
-        ]),
-
-        dbc.Tab(label="Manufacturing Cost per Unit Dashboard", tab_id="tab-mfg-cost", children=[
-            create_mfg_cost_layout(mfg_cost_kpis, mfg_cost_augmented_data)
-        ]),
-        
-        dbc.Tab(label="AI Insights", tab_id="tab-ai-insights", children=[
-            create_ai_insights_layout()
-        ])
-    ], className="mt-4"),
-    
-    # Hidden Div to store processed data for callbacks
-    dcc.Store(id='stored-copq-data', data=copq_augmented_data['monthly_copq_tracking'].to_json(date_format='iso', orient='records') if copq_augmented_data and copq_augmented_data['monthly_copq_tracking'] is not None else None),
-    dcc.Store(id='stored-copq-breakdown-data', data=copq_augmented_data['copq_breakdown'].to_json(orient='records') if copq_augmented_data and copq_augmented_data['copq_breakdown'] is not None else None),
-    dcc.Store(id='stored-copq-defect-data', data=copq_augmented_data['defect_categories'].to_json(orient='records') if copq_augmented_data and copq_augmented_data['defect_categories'] is not None else None),
-
-    dcc.Store(id='stored-oee-data', data=oee_augmented_data['monthly_oee_trends'].to_json(date_format='iso', orient='split') if oee_augmented_data and oee_augmented_data['monthly_oee_trends'] is not None else None),
-    dcc.Store(id='stored-downtime-data', data=oee_augmented_data['downtime_cost_analysis'].to_json(date_format='iso', orient='split') if oee_augmented_data and oee_augmented_data['downtime_cost_analysis'] is not None else None),
-
-    dcc.Store(id='stored-mfg-cost-data', data=mfg_cost_augmented_data['total_mfg_cost_trends'].to_json(date_format='iso', orient='split') if mfg_cost_augmented_data and mfg_cost_augmented_data['total_mfg_cost_trends'] is not None else None),
-    dcc.Store(id='stored-efficiency-data', data=mfg_cost_augmented_data['efficiency_trends'].to_json(date_format='iso', orient='split') if mfg_cost_augmented_data and mfg_cost_augmented_data['efficiency_trends'] is not None else None),
-    dcc.Store(id='stored-cost-variance-data', data=mfg_cost_augmented_data['cost_variance_analysis'].to_json(orient='split') if mfg_cost_augmented_data and mfg_cost_augmented_data['cost_variance_analysis'] is not None else None),
-
-], fluid=True, className="my-4")
-
-
-# --- Register Callbacks from all Dashboards ---
-register_copq_callbacks(app)
-register_oee_callbacks(app)
-register_mfg_cost_callbacks(app)
-register_ai_insights_callbacks(app) # Registering the placeholder callback function
+        create_live_updates_status(snapshot),
+
+        # Tabs for each Dashboard
+        dbc.Tabs(id="tabs-main", active_tab="tab-copq", children=[
+            dbc.Tab(label="COPQ Dashboard", tab_id="tab-copq", children=[
+                create_copq_layout(kpis.get('copq', {}), augmented.get('copq', {}))
+            ]),
+
+            dbc.Tab(label="OEE Dashboard", tab_id="tab-oee", children=[
+                create_oee_layout(kpis.get('oee', {}), augmented.get('oee', {}), sites=snapshot.oee_sites if snapshot else [])
+            ]),
+
+            dbc.Tab(label="Manufacturing Cost per Unit Dashboard", tab_id="tab-mfg-cost", children=[
+                create_mfg_cost_layout(kpis.get('mfg_cost', {}), augmented.get('mfg_cost', {}), augmented.get('copq', {}))
+            ]),
+
+            dbc.Tab(label="AI Insights", tab_id="tab-ai-insights", children=[
+                create_ai_insights_layout()
+            ]),
+
+            # Hidden admin tab with callback latency percentiles (open the dashboard at /#admin)
+            dbc.Tab(label="Admin", tab_id="tab-admin", tab_style={'display': 'none'}, children=[
+                create_admin_layout()
+            ])
+        ], className="mt-4"),
+
+        # Hidden Div to store processed data for callbacks
+        *create_data_stores(augmented),
+
+    ], fluid=True, className="my-4")
+
+
+def create_loading_layout():
+    return dbc.Container([
+        html.H1("Manufacturing KPI Dashboards", className="text-center text-primary my-4"),
+        html.P("Loading KPI data, please refresh in a few seconds.", className="text-center text-muted"),
+    ], fluid=True, className="my-4")
+
+
+layout_cache = LayoutCache(create_layout)
+
+def serve_layout():
+    """Layout factory: the page of the current dataset version, built once per version."""
+    # Dash also calls the factory when it is assigned and on the first request of any kind
+    # (to validate it); only the page's own layout request waits for the data load, so
+    # probes and other early requests are never held up.
+    if flask.has_request_context() and flask.request.path.endswith('/_dash-layout'):
+        snapshot = registry.wait(LAYOUT_WAIT_SECONDS)
+    else:
+        snapshot = registry.current()
+    if snapshot is None:
+        return create_loading_layout()
+    return layout_cache.get(snapshot)['layout']
+
+app.layout = serve_layout
+
+# Page loads are answered from the pre-rendered JSON of the current version (Dash would
+# serialise the whole component tree, stores included, on every request)
+serve_cached_layout(app, layout_cache, lambda: registry.wait(LAYOUT_WAIT_SECONDS))
+
+
+# --- Warm-up: heavy imports, callbacks, data load ---
+callbacks_registered = threading.Event()
+
+def warm_up():
+    try:
+        # KPI_PROFILE_LOADS=cprofile or pyinstrument profiles the whole warm-up
+        with profile_load('startup'):
+            from dashboards.copq_dashboard import register_copq_callbacks
+            from dashboards.oee_dashboard import register_oee_callbacks
+            from dashboards.mfg_cost_dashboard import register_mfg_cost_callbacks
+            from dashboards.ai_insights_dashboard import register_ai_insights_callbacks
+            from dashboards.admin_dashboard import register_admin_callbacks
+            from fact_store import open_fact_store_from_env
+
+            # Optional historical fact store (set KPI_FACT_STORE to a SQLite file path). Each load is
+            # upserted under KPI_SITE, and date/site filters are then answered from the store.
+            fact_store = open_fact_store_from_env()
+
+            # Dashboard callbacks are instrumented: per-phase timings, payload sizes and cache hits
+            with instrument_callbacks(app):
+                register_copq_callbacks(app)
+                register_oee_callbacks(app, fact_store=fact_store)
+                register_mfg_cost_callbacks(app, fact_store=fact_store)
+            register_ai_insights_callbacks(app) # Registering the placeholder callback function
+            register_admin_callbacks(app)
+            register_live_update_callbacks(app)
+            app.validation_layout = create_layout(None)
+            callbacks_registered.set()
+
+            # Load and process all data. Each load logs a JSON load report (logger 'kpi.load').
+            snapshot = registry.publish(**load_datasets(fact_store, site=SITE))
+        logger.info("Dataset version %d loaded; app ready.", snapshot.version)
+    except Exception as e:
+        logger.exception("Startup data load failed.")
+        registry.fail(e)
+        return
+
+    # Pre-render the page of every published version (startup, reloads and ingested
+    # worksheets alike), so no page request pays for building it
+    def prerender_layouts():
+        version = 0
+        while True:
+            snapshot = registry.wait_for_version(version)
+            version = snapshot.version
+            try:
+                layout_cache.get(snapshot)
+            except Exception:
+                logger.exception("Pre-rendering the page of dataset version %d failed.", version)
+    threading.Thread(target=prerender_layouts, name='kpi-layout-prerender', daemon=True).start()
+
+    # Reload when a source file changes; connected pages are told over /events
+    if RELOAD_INTERVAL_SECONDS > 0:
+        def reload_datasets():
+            previous_version = registry.version
+            snapshot = registry.publish(**load_datasets(fact_store, site=SITE))
+            if snapshot.version == previous_version:
+                logger.info("Source files changed but the data did not; still version %d.", snapshot.version)
+            else:
+                logger.info("Dataset version %d published (changed: %s).", snapshot.version,
+                            ', '.join(snapshot.changed_since(previous_version)))
+        threading.Thread(target=watch_sources, args=(reload_datasets, RELOAD_INTERVAL_SECONDS),
+                         name='kpi-source-watcher', daemon=True).start()
+
+    # Worksheets pushed by the line PCs: drop folders ($KPI_DROP_FOLDERS) and export
+    # services ($KPI_HTTP_SOURCES), ingested asynchronously as they arrive
+    from ingest_service import IngestService, registry_publisher, sources_from_env, start_ingest_service
+    sources = sources_from_env()
+    if sources:
+        service = IngestService(sources, registry_publisher(registry, fact_store, site=SITE),
+                                concurrency=int(os.environ.get('KPI_INGEST_CONCURRENCY', 8)))
+        start_ingest_service(service)
+        logger.info("Ingesting from %s.", ', '.join(map(str, sources)))
+
+# In debug mode `python app.py` first starts a file watcher that re-runs this script in a
+# child process (WERKZEUG_RUN_MAIN set); only the child serves, so only it warms up.
+# KPI_WARM_UP=0 imports the app without loading anything (tooling, import-time benchmarks).
+is_reloader_watcher = __name__ == '__main__' and DEBUG and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+if os.environ.get('KPI_WARM_UP', '1') != '0' and not is_reloader_watcher:
+    threading.Thread(target=warm_up, name='kpi-warm-up', daemon=True).start()
+
+
+# --- Health Endpoints ---
+@app.server.route('/healthz')
+def healthz():
+    return flask.jsonify(status='ok')
+
+@app.server.route('/readyz')
+def readyz():
+    if registry.ready and callbacks_registered.is_set():
+        return flask.jsonify(status='ready', dataset_version=registry.version)
+    if registry.error:
+        return flask.jsonify(status='failed', error=registry.error), 503
+    return flask.jsonify(status='loading'), 503
+
+
+# --- Metrics Endpoint (Prometheus text format at /metrics) ---
+register_metrics_routes(app.server)
+
+# --- Request coalescing: identical concurrent callback requests (e.g. wall displays on
+# the default view) share one computation and response ---
+coalesce_callback_requests(app, dataset_version=lambda: registry.version)
+
+# --- Live Updates (Server-Sent Events at /events) ---
+register_live_update_routes(app.server, registry)
+
+# --- Read-only KPI API (/api/v1) ---
+register_api_routes(app.server, registry)
+
+# --- Export Routes (CSV/Parquet tables and figure images) ---
+register_export_routes(app.server, lambda: registry.current().augmented if registry.ready else {})
 
 # Run the app
 if __name__ == '__main__':
-    port = int(os.environ.get("PORT", 8050))  
-    app.run(host='0.0.0.0', port=port, debug=True)
+    port = int(os.environ.get("PORT", 8050))
+    app.run(host='0.0.0.0', port=port, debug=DEBUG)
@@ -0,0 +1,121 @@
+// src/assets/live_updates.js
+//
+// Push client for the /events channel (see live_updates.py). Dash serves everything in
+// assets/ automatically. When the server announces a new dataset version, the stores of
+// the changed datasets are fetched and written with dash_clientside.set_props, which
+// re-runs only the callbacks that read them. Datasets whose tab is hidden are kept
+// pending and applied when the tab is opened. When the server refuses the stream (all
+// stream slots taken) the client polls /live/changes.json and retries the stream later.
+
+window.kpiLiveUpdates = (function () {
+    var POLL_MILLISECONDS = 15000;
+    var STREAM_RETRY_MILLISECONDS = 300000;
+
+    var source = null;
+    var poller = null;
+    var activeTab = null;
+    var position = null;  // "<server boot id>-<version>", as the server hands it out
+    var pending = {};  // dataset -> tab id
+
+    function setStatus(text) {
+        window.dash_clientside.set_props('live-updates-status', {children: text});
+    }
+
+    function applyDataset(dataset) {
+        return fetch('/live/stores/' + dataset + '.json', {cache: 'no-cache'})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            })
+            .then(function (body) {
+                Object.keys(body.stores).forEach(function (storeId) {
+                    window.dash_clientside.set_props(storeId, {data: body.stores[storeId]});
+                });
+            });
+    }
+
+    function flush() {
+        Object.keys(pending).forEach(function (dataset) {
+            var tab = pending[dataset];
+            if (tab !== activeTab) {
+                return;
+            }
+            delete pending[dataset];
+            applyDataset(dataset).catch(function () {
+                pending[dataset] = tab;  // retried with the next event or tab change
+            });
+        });
+    }
+
+    function receive(message) {
+        position = message.version;
+        message.changed.forEach(function (dataset) {
+            pending[dataset] = message.tabs[dataset];
+        });
+        setStatus('Live updates on · data version ' + message.version.split('-').pop());
+        flush();
+    }
+
+    function poll() {
+        fetch('/live/changes.json?since=' + encodeURIComponent(position), {cache: 'no-cache'})
+            .then(function (response) {
+                if (response.status === 200) {
+                    return response.json().then(receive);
+                }
+            })
+            .catch(function () {});  // the next poll tries again
+    }
+
+    function startPolling() {
+        if (poller) {
+            return;
+        }
+        setStatus('Live updates on (polling)');
+        poller = setInterval(poll, POLL_MILLISECONDS);
+        setTimeout(function () {
+            clearInterval(poller);
+            poller = null;
+            connect();
+        }, STREAM_RETRY_MILLISECONDS);
+    }
+
+    function connect() {
+        var status = document.getElementById('live-updates-status');
+        if (source || poller || !status) {
+            return;
+        }
+        if (position === null) {
+            position = status.getAttribute('data-version') || '';
+        }
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+        source = new EventSource('/events?since=' + encodeURIComponent(position));
+        source.onopen = function () {
+            setStatus('Live updates on');
+        };
+        source.onerror = function () {
+            // A refused stream (503) is closed for good; a dropped one reconnects by itself
+            if (source.readyState === EventSource.CLOSED) {
+                source = null;
+                startPolling();
+            } else {
+                setStatus('Live updates reconnecting…');
+            }
+        };
+        source.addEventListener('dataset', function (event) {
+            receive(JSON.parse(event.data));
+        });
+    }
+
+    return {
+        setActiveTab: function (tab) {
+            activeTab = tab;
+            connect();
+            flush();
+        }
+    };
+})();
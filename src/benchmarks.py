@@ -0,0 +1,913 @@
+# src/benchmarks.py
+#
+# Benchmark suite for the loaders, KPI calculations, dashboard callbacks and figure
+# builders, run against synthetic worksheets at a chosen scale:
+#
+#     python benchmarks.py --scale production
+#
+# Each run appends one JSON line to the history file and is compared with the previous
+# run at the same scale, so regressions show up as soon as they land.
+
+import argparse
+import asyncio
+import collections
+import copy
+import datetime
+import io
+import json
+import os
+import platform
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import warnings
+from contextlib import contextmanager, nullcontext, redirect_stdout
+
+import dash
+import flask
+import dash_bootstrap_components as dbc
+import numpy as np
+import pandas as pd
+from dash import html
+
+from data_processor import process_worksheet
+from kpi_calculations import calculate_copq_kpis, calculate_oee_kpis, calculate_mfg_cost_kpis
+from section_parser import read_raw_worksheet, classify_worksheet
+from synthetic_data import generate_worksheet_text, write_padded_worksheet, write_synthetic_worksheets
+from dashboards.copq_dashboard import (
+    create_copq_layout, register_copq_callbacks,
+    build_copq_breakdown_figure, build_copq_monthly_trend_figure, build_defect_type_cost_figure,
+)
+from dashboards.oee_dashboard import create_oee_layout, register_oee_callbacks, build_oee_trend_figure
+from dashboards.mfg_cost_dashboard import (
+    create_mfg_cost_layout, register_mfg_cost_callbacks,
+    build_mfg_cost_trend_figure, build_mfg_cost_breakdown_pie,
+)
+from pareto import ParetoIndex
+from what_if import mfg_cost_baseline, copq_baseline, run_what_if
+from validation import validate_sections
+from data_registry import DatasetRegistry
+from formula_evaluator import evaluate_formulas
+from cost_attribution import build_cost_facts, decompose_cost_per_unit
+from dashboards.mfg_cost_dashboard import filter_cost_attribution
+from bulk_ingest import ingest_directory
+from ingest_service import IngestService, HttpEndpoint, StubExportServer
+from cost_variance import VarianceIndex, build_variance_facts
+from initiatives import InitiativeTracker, InitiativeIndex, unit_cost_series, track_initiatives
+from shift_calendar import ShiftCalendar, shift_constants, expand_monthly_oee, shift_oee_aggregates, build_shift_oee
+from kpi_api import RESPONSE_CACHE, register_api_routes
+from utils.instrumentation import CALLBACK_FLIGHTS, coalesce_callback_requests, instrument_callbacks
+from utils.layout_cache import LayoutCache, serve_cached_layout
+from utils.ui_components import DATA_STORES, create_data_stores
+
+# Synthetic data scales: months per worksheet, sites x lines worksheets of each type,
+# and defect categories per COPQ worksheet.
+SCALES = {
+    'sample': {'months': 6, 'sites': 1, 'lines': 1, 'defect_types': 5},
+    'production': {'months': 60, 'sites': 5, 'lines': 4, 'defect_types': 250},
+    'stress': {'months': 240, 'sites': 10, 'lines': 10, 'defect_types': 2000},
+}
+
+DEFAULT_HISTORY_FILE = os.path.join(os.path.dirname(__file__), '..', 'benchmark_history.jsonl')
+REGRESSION_THRESHOLD = 0.20
+
+KPI_CALCULATORS = {
+    'copq': calculate_copq_kpis,
+    'oee': calculate_oee_kpis,
+    'mfg_cost': calculate_mfg_cost_kpis,
+}
+
+
+# --- Timing ---
+
+def measure(func, min_time=0.5, max_rounds=200, warmup=1):
+    """
+    Times repeated calls of `func`, pytest-benchmark style.
+
+    Rounds are repeated until `min_time` seconds have elapsed (at least 3 rounds, at most
+    `max_rounds`) after `warmup` untimed calls.
+
+    Returns:
+        dict: min/max/mean/median/stddev in milliseconds, plus the number of rounds.
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_rounds and (len(timings) < 3 or time.perf_counter() - started < min_time):
+        t0 = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return summarise(timings)
+
+
+def summarise(timings):
+    """pytest-benchmark style statistics for a list of timings in milliseconds."""
+    return {
+        'min_ms': min(timings),
+        'max_ms': max(timings),
+        'mean_ms': statistics.fmean(timings),
+        'median_ms': statistics.median(timings),
+        'stddev_ms': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'rounds': len(timings),
+    }
+
+
+# Expectations checked while the suite runs (e.g. a memory bound). Failed checks are
+# listed at the end of the run and make it exit non-zero.
+FAILED_CHECKS = []
+
+
+def check(condition, message):
+    """Records `message` as a failed check unless `condition` holds."""
+    if not condition:
+        print(f"  CHECK FAILED: {message}")
+        FAILED_CHECKS.append(message)
+    return condition
+
+
+# Months in the large OEE sheet used to time the formula evaluator
+FORMULA_BENCHMARK_MONTHS = 20000
+
+# Machines sharing the shift pattern in the plant-sized shift calendar benchmark
+SHIFT_BENCHMARK_MACHINES = 200
+
+# Sites, cost lines and months in the group-sized cost variance benchmark
+VARIANCE_BENCHMARK_SHAPE = (50, 20, 120)
+
+# Initiatives in the portfolio-sized initiative tracker benchmark
+INITIATIVE_BENCHMARK_COUNT = 500
+
+# API paths timed in-process (cold, cached and conditional) and polled by the load test
+API_BENCHMARK_PATHS = [
+    '/api/v1/copq/kpis',
+    '/api/v1/oee/frames/monthly_oee_trends',
+    '/api/v1/copq/frames/defect_categories',
+]
+
+
+# --- Fixtures ---
+
+class BenchmarkData:
+    """Synthetic worksheets for one scale, plus everything derived from them."""
+
+    def __init__(self, scale, workdir):
+        self.scale = scale
+        self.paths = write_synthetic_worksheets(workdir, **scale)
+        self.sheet_text = {t: generate_worksheet_text(t, scale['months'], scale['defect_types'])
+                           for t in KPI_CALCULATORS}
+        self.raw = {t: read_raw_worksheet(io.StringIO(text)) for t, text in self.sheet_text.items()}
+        self.sections = {t: process_worksheet(t, raw) for t, raw in self.raw.items()}
+        self.kpis, self.augmented = {}, {}
+        for t, calculate in KPI_CALCULATORS.items():
+            self.kpis[t], self.augmented[t] = calculate(self.sections[t])
+
+
+def build_benchmark_app(data, coalesce=None):
+    """
+    A Dash app with the three dashboards' layouts, stores and callbacks for `data`.
+    With `coalesce` set the callbacks are instrumented as in app.py, with callback
+    request coalescing on or off.
+    """
+    app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+    app.layout = html.Div([
+        create_copq_layout(data.kpis['copq'], data.augmented['copq']),
+        create_oee_layout(data.kpis['oee'], data.augmented['oee']),
+        create_mfg_cost_layout(data.kpis['mfg_cost'], data.augmented['mfg_cost'], data.augmented['copq']),
+        *create_data_stores(data.augmented),
+    ])
+    with instrument_callbacks(app) if coalesce is not None else nullcontext():
+        register_copq_callbacks(app)
+        register_oee_callbacks(app)
+        register_mfg_cost_callbacks(app)
+    if coalesce:
+        coalesce_callback_requests(app)
+    return app
+
+
+def _split_output_key(key):
+    """'a.figure' or '..a.figure...b.figure..' -> [('a', 'figure'), ('b', 'figure')]."""
+    parts = key[2:-2].split('...') if key.startswith('..') else [key]
+    return [tuple(part.rsplit('.', 1)) for part in parts]
+
+
+def callback_requests(app):
+    """
+    Builds one /_dash-update-component request body per callback, with every input
+    and state set to its initial value in the layout, as on first page load.
+    """
+    initial = {}
+    for component in app.layout._traverse():
+        component_id = getattr(component, 'id', None)
+        if isinstance(component_id, str):
+            initial[component_id] = component
+
+    def with_value(dependency):
+        component = initial.get(dependency['id'])
+        return {**dependency, 'value': getattr(component, dependency['property'], None)}
+
+    requests = {}
+    for key, spec in app.callback_map.items():
+        outputs = [{'id': cid, 'property': prop} for cid, prop in _split_output_key(key)]
+        requests[key] = {
+            'output': key,
+            'outputs': outputs if key.startswith('..') else outputs[0],
+            'inputs': [with_value(dep) for dep in spec['inputs']],
+            'state': [with_value(dep) for dep in spec['state']],
+            'changedPropIds': [f"{dep['id']}.{dep['property']}" for dep in spec['inputs']],
+        }
+    return requests
+
+
+# Trend charts that answer with a Patch when only the latest months change: graph id -> its store
+DELTA_CHARTS = {
+    'copq-monthly-trend-chart': 'stored-copq-data',
+    'oee-trend-chart': 'stored-oee-data',
+}
+
+
+def delta_requests(data, requests):
+    """
+    Request bodies for the delta-updating trend charts as a refresh that appends one
+    month. Filters, store and "rendered" state are those of a page loaded before the
+    last month existed (a real render of it); only the store then receives every month,
+    as a live update push does. A body that would not be answered with a Patch is
+    reported, since the benchmark would then time something other than the append.
+    """
+    store_specs = {store_id: (dataset, frame_key, kwargs) for store_id, dataset, frame_key, kwargs in DATA_STORES}
+    previous = copy.copy(data)
+    previous.augmented = {dataset: dict(frames) for dataset, frames in data.augmented.items()}
+    for store_id in DELTA_CHARTS.values():
+        dataset, frame_key, _ = store_specs[store_id]
+        previous.augmented[dataset][frame_key] = data.augmented[dataset][frame_key].iloc[:-1]
+    previous_app = build_benchmark_app(previous)
+    previous_requests = callback_requests(previous_app)
+    client = previous_app.server.test_client()
+    bodies = {}
+    for key in requests:
+        graph_id = _split_output_key(key)[0][0]
+        store_id = DELTA_CHARTS.get(graph_id)
+        if store_id is None:
+            continue
+        dataset, frame_key, to_json_kwargs = store_specs[store_id]
+        body = previous_requests[key]
+        rendered = client.post('/_dash-update-component', json=body).get_json()['response'][f"{graph_id}-rendered"]['data']
+        inputs = [dict(dep, value=data.augmented[dataset][frame_key].to_json(**to_json_kwargs)) if dep['id'] == store_id
+                  else dep for dep in body['inputs']]
+        bodies[key] = dict(body, inputs=inputs, state=[dict(dep, value=rendered) for dep in body['state']])
+
+        # The figure is left out of the response when the callback returns no_update
+        figure = client.post('/_dash-update-component', json=bodies[key]).get_json()['response'].get(graph_id, {}).get('figure')
+        if not (isinstance(figure, dict) and '__dash_patch_update' in figure):
+            print(f"Warning: {graph_id} does not answer a month appended to its default view with a Patch.")
+    return bodies
+
+
+def identical_page_loads(app, bodies, clients):
+    """
+    `clients` threads released together, each sending every callback request of a page
+    load in the same order (wall displays opening the default view at once).
+
+    Returns:
+        (float, float): Process CPU time and wall time of the burst, in milliseconds.
+    """
+    barrier = threading.Barrier(clients + 1)
+
+    def page_load():
+        client = app.server.test_client()
+        barrier.wait()
+        for body in bodies:
+            client.post('/_dash-update-component', json=body)
+
+    threads = [threading.Thread(target=page_load) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    cpu, wall = time.process_time(), time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    return (time.process_time() - cpu) * 1000, (time.perf_counter() - wall) * 1000
+
+
+def concurrent_page_loads(app, clients, loads=3):
+    """
+    `clients` threads released together, each loading the page layout `loads` times
+    with gzip accepted, as browsers do.
+
+    Returns:
+        (list, float, int): Per-request latencies and the burst's wall time in
+                            milliseconds, and the response size in bytes.
+    """
+    barrier = threading.Barrier(clients + 1)
+    latencies, sizes = [], []
+
+    def page_load():
+        client = app.server.test_client()
+        barrier.wait()
+        for _ in range(loads):
+            t0 = time.perf_counter()
+            response = client.get('/_dash-layout', headers={'Accept-Encoding': 'gzip'})
+            latencies.append((time.perf_counter() - t0) * 1000)
+            sizes.append(len(response.data))
+
+    threads = [threading.Thread(target=page_load) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    return latencies, (time.perf_counter() - started) * 1000, sizes[-1]
+
+
+# --- Suite ---
+
+def run_suite(data, min_time=0.5):
+    """Runs every benchmark group and returns {benchmark name: stats}."""
+    results = {}
+
+    def record(name, func, note=lambda: ''):
+        results[name] = measure(func, min_time=min_time)
+        print(f"  {name:<55} {results[name]['median_ms']:10.2f} ms  ({results[name]['rounds']} rounds){note()}")
+
+    print("Parsing")
+    for t, text in data.sheet_text.items():
+        record(f"parse/{t}", lambda t=t, text=text: process_worksheet(t, read_raw_worksheet(io.StringIO(text))))
+    record(f"parse/all_files[{len(data.paths)}]",
+           lambda: [process_worksheet(classify_worksheet(raw), raw) for raw in map(read_raw_worksheet, data.paths)])
+
+    print("Bulk ingestion")
+    # The same files as parse/all_files, discovered, classified and merged by bulk_ingest
+    ingest_root = os.path.dirname(data.paths[0])
+
+    def ingest(workers):
+        with redirect_stdout(io.StringIO()):
+            return ingest_directory(ingest_root, workers=workers)
+
+    serial_name = f"ingest/serial[{len(data.paths)} files]"
+    record(serial_name, lambda: ingest(1))
+    for workers in sorted({2, os.cpu_count() or 1} - {1}):
+        name = f"ingest/workers={workers}[{len(data.paths)} files]"
+        record(name, lambda workers=workers: ingest(workers),
+               note=lambda name=name: f"  x{results[serial_name]['median_ms'] / results[name]['median_ms']:.2f} vs serial")
+
+    # Export services with 20 ms of latency per response, polled when nothing changed (the
+    # untimed warm-up round fetches the documents and records their ETags)
+    stub = StubExportServer({os.path.basename(path): b'not a worksheet\n' for path in data.paths}, latency=0.02)
+    try:
+        for concurrency in (1, 8):
+            service = IngestService([HttpEndpoint(stub.url(os.path.basename(path))) for path in data.paths],
+                                    lambda *loaded: None, concurrency=concurrency)
+
+            def poll(service=service):
+                with redirect_stdout(io.StringIO()):
+                    return asyncio.run(service.run_once())
+
+            record(f"ingest/http_poll_unchanged[{len(data.paths)} endpoints, concurrency={concurrency}]", poll)
+    finally:
+        stub.close()
+
+    print("Formula evaluation")
+    for t, raw in data.raw.items():
+        record(f"formulas/{t}", lambda raw=raw: evaluate_formulas(raw))
+    # One TEEP formula per month: tens of thousands of same-shaped formula cells
+    formula_grid = read_raw_worksheet(io.StringIO(generate_worksheet_text('oee', FORMULA_BENCHMARK_MONTHS)))
+    record(f"formulas/oee[{FORMULA_BENCHMARK_MONTHS} TEEP rows]", lambda: evaluate_formulas(formula_grid))
+
+    print("Validation")
+    for t in KPI_CALCULATORS:
+        record(f"validate/{t}", lambda t=t: validate_sections(t, data.sections[t]))
+    site_sections = [(t, process_worksheet(t, raw))
+                     for t, raw in ((classify_worksheet(raw), raw) for raw in map(read_raw_worksheet, data.paths))]
+    record(f"validate/all_files[{len(site_sections)}]",
+           lambda: [validate_sections(t, sections) for t, sections in site_sections])
+
+    print("KPI calculation")
+    for t, calculate in KPI_CALCULATORS.items():
+        record(f"kpi/{t}", lambda calculate=calculate, t=t: calculate(data.sections[t]))
+
+    print("Shift calendar")
+    oee_sections = data.sections['oee']
+    record("shifts/build_shift_oee", lambda: build_shift_oee(oee_sections))
+    constants = shift_constants(oee_sections.get('basic_data'))
+    monthly_oee = oee_sections['monthly_oee']
+    plant = ShiftCalendar(monthly_oee['Month'], constants, machines=SHIFT_BENCHMARK_MACHINES)
+    record(f"shifts/calendar[{len(plant):,} machine-shifts]",
+           lambda: ShiftCalendar(monthly_oee['Month'], constants, machines=SHIFT_BENCHMARK_MACHINES))
+    plant_records = expand_monthly_oee(plant, monthly_oee)
+    record(f"shifts/aggregate[{len(plant):,} machine-shifts]", lambda: shift_oee_aggregates(plant, *plant_records))
+
+    print("Cost attribution")
+    mfg_sections = data.sections['mfg_cost']
+    cost_facts = build_cost_facts(mfg_sections)
+    attribution = decompose_cost_per_unit(cost_facts)
+    record(f"attribution/facts[{len(cost_facts):,} rows]", lambda: build_cost_facts(mfg_sections))
+    record(f"attribution/decompose[{len(cost_facts):,} rows]", lambda: decompose_cost_per_unit(cost_facts))
+    last_month = attribution['Month'].iloc[-1].strftime('%B')
+    record("attribution/by_category", lambda: filter_cost_attribution(attribution, last_month))
+    record("attribution/drill_down", lambda: filter_cost_attribution(attribution, last_month, 'Direct Labor'))
+
+    print("Cost variance")
+    record("variance/facts", lambda: build_variance_facts(mfg_sections))
+    sites, lines, n_months = VARIANCE_BENCHMARK_SHAPE
+    rng = np.random.default_rng(0)
+    budget = rng.uniform(10, 100, size=sites * lines * n_months)
+    group_facts = pd.DataFrame({
+        'Site': np.repeat([f"Site {i}" for i in range(sites)], lines * n_months),
+        'Period': np.tile(np.arange(n_months), sites * lines),
+        'Month': np.tile(pd.date_range('2015-01-01', periods=n_months, freq='MS'), sites * lines),
+        'KPI': np.tile(np.repeat([f"Cost Line {i}" for i in range(lines)], n_months), sites),
+        'Actual': budget * rng.uniform(0.9, 1.1, size=budget.size),
+        'Budget': budget,
+    })
+    size = f"{sites} sites x {lines} lines x {n_months} months"
+    record(f"variance/index[{size}]", lambda: VarianceIndex(group_facts))
+    variance_index = VarianceIndex(group_facts)
+    ytd_start = int(variance_index.period_start('ytd', n_months - 3))
+    record("variance/ytd_view[prefix sums]", lambda: variance_index.period_view('ytd', n_months - 3))
+    record("variance/ytd_view[groupby]",
+           lambda: group_facts[group_facts['Period'].between(ytd_start, n_months - 3)]
+           .groupby(['Site', 'KPI'], sort=False)[['Actual', 'Budget']].sum())
+    record("variance/rolling_12_trend[one line]", lambda: variance_index.trend('rolling_12', 'Cost Line 0'))
+
+    print("Initiatives")
+    record("initiatives/track_mfg_cost", lambda: track_initiatives(mfg_sections, 'mfg_cost'))
+    months, unit_costs, units = unit_cost_series(mfg_sections, 'mfg_cost')
+    rng = np.random.default_rng(0)
+    portfolio = pd.DataFrame({
+        'Source': 'mfg_cost',
+        'Initiative': [f"Initiative {i}" for i in range(INITIATIVE_BENCHMARK_COUNT)],
+        'Status': rng.choice(['Completed', 'In Progress', 'Planned'], size=INITIATIVE_BENCHMARK_COUNT),
+        'Month Implemented': pd.to_datetime(rng.integers(1, 13, size=INITIATIVE_BENCHMARK_COUNT).astype(str), format='%m'),
+        'Target Monthly Savings (£)': rng.uniform(1000, 10000, size=INITIATIVE_BENCHMARK_COUNT),
+        'Implementation Cost (£)': rng.uniform(10000, 50000, size=INITIATIVE_BENCHMARK_COUNT),
+    })
+
+    def tracked(months_tracked):
+        tracker = InitiativeTracker(portfolio)
+        tracker.extend(months[:months_tracked], unit_costs[:months_tracked], units[:months_tracked])
+        return tracker
+
+    size = f"{INITIATIVE_BENCHMARK_COUNT} x {len(months)} months"
+    record(f"initiatives/tracker[{size}]", lambda: tracked(len(months)))
+    previous = tracked(len(months) - 1)
+    record(f"initiatives/extend_one_month[{size}]",
+           lambda: copy.deepcopy(previous).extend(months[-1:], unit_costs[-1:], units[-1:]))
+    portfolio_tracking = tracked(len(months)).tracking()
+    record(f"initiatives/index[{size}]", lambda: InitiativeIndex(portfolio_tracking))
+    initiative_index = InitiativeIndex(portfolio_tracking)
+    record("initiatives/roi_view", lambda: initiative_index.roi_view('In Progress', len(months) // 2))
+
+    print("Pareto")
+    defects = data.augmented['copq']['defect_categories']
+    pareto_index = ParetoIndex(defects)
+    first_family = pareto_index.top_level()[0]
+    record(f"pareto/index[{len(pareto_index.codes)} codes]", lambda: ParetoIndex(defects)._metric('cost'))
+    record("pareto/top_level", lambda: pareto_index.pareto('cost', None, 10))
+    record("pareto/drill_down", lambda: pareto_index.pareto('cost', first_family, 10))
+    record("pareto/vital_few", lambda: pareto_index.vital_few('cost'))
+
+    print("What-if simulation")
+    mfg_base = mfg_cost_baseline(data.augmented['mfg_cost']['total_mfg_cost_trends'],
+                                 data.augmented['mfg_cost']['efficiency_trends'])
+    copq_base = copq_baseline(data.augmented['copq']['monthly_copq_tracking'], data.augmented['copq']['copq_breakdown'])
+    for n in (1000, 10000):
+        record(f"what_if/monte_carlo[{n} x {len(mfg_base)} months]",
+               lambda n=n: run_what_if(mfg_base, copq_base, {'material_yield': 0.02, 'scrap': -0.10}, n=n))
+
+    print("KPI API (in-process)")
+    api_registry = DatasetRegistry()
+    api_registry.publish({t: data.sections[t] for t in KPI_CALCULATORS}, data.kpis, data.augmented)
+    api_server = flask.Flask(__name__)
+    register_api_routes(api_server, api_registry)
+    api_client = api_server.test_client()
+    for path in API_BENCHMARK_PATHS:
+        name = path[len('/api/'):]
+        gzip_etag = api_client.get(path, headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        cold = api_client.get(path).data
+        record(f"api/{name}[cold]", lambda path=path: (RESPONSE_CACHE.clear(), api_client.get(path)),
+               note=lambda cold=cold: f"  {len(cold):,} bytes")
+        record(f"api/{name}[cached, gzip]", lambda path=path: api_client.get(path, headers={'Accept-Encoding': 'gzip'}))
+        record(f"api/{name}[If-None-Match]",
+               lambda path=path, etag=gzip_etag: api_client.get(path, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}))
+
+    print("Figures")
+    copq, oee, mfg = data.augmented['copq'], data.augmented['oee'], data.augmented['mfg_cost']
+    first_month = mfg['total_mfg_cost_trends'].index[0].strftime('%B')
+    record("figure/copq-cost-breakdown-chart", lambda: build_copq_breakdown_figure(copq['copq_breakdown']))
+    record("figure/copq-monthly-trend-chart", lambda: build_copq_monthly_trend_figure(copq['monthly_copq_tracking'], None))
+    record("figure/copq-defect-type-cost-chart", lambda: build_defect_type_cost_figure(copq['defect_categories'], 'Total'))
+    record("figure/oee-trend-chart", lambda: build_oee_trend_figure(oee['monthly_oee_trends']))
+    record("figure/mfg-cost-trend-chart",
+           lambda: build_mfg_cost_trend_figure(mfg['total_mfg_cost_trends'], 'Total Direct Material Cost (£)'))
+    record("figure/mfg-cost-breakdown-pie", lambda: build_mfg_cost_breakdown_pie(mfg['total_mfg_cost_trends'], first_month))
+
+    print("Callbacks (full request through the Dash server)")
+    app = build_benchmark_app(data)
+    client = app.server.test_client()
+    requests = callback_requests(app)
+    cases = [(f"callback/{key}", body) for key, body in requests.items()]
+    cases += [(f"callback/{key}[append month]", body) for key, body in delta_requests(data, requests).items()]
+    for name, body in cases:
+        sizes = []
+        def call(body=body):
+            response = client.post('/_dash-update-component', json=body)
+            # 204 is Dash's PreventUpdate; anything else non-200 is a broken benchmark
+            if response.status_code not in (200, 204):
+                raise RuntimeError(f"Callback {body['output']} failed with HTTP {response.status_code}")
+            sizes.append(len(response.data))
+        record(name, call, note=lambda sizes=sizes: f"  {sizes[-1]:,} bytes")
+        results[name]['response_bytes'] = sizes[-1]
+
+    print("Callback coalescing (identical concurrent page loads, CPU time per burst)")
+    bodies = list(requests.values())
+    for coalesce in (False, True):
+        coalescing_app = build_benchmark_app(data, coalesce=coalesce)
+        identical_page_loads(coalescing_app, bodies, 1)
+        for clients in (1, 10, 30):
+            bursts = []
+            for _ in range(3):
+                # Each burst starts cold: no response lingering from the previous one
+                CALLBACK_FLIGHTS.clear()
+                bursts.append(identical_page_loads(coalescing_app, bodies, clients))
+            name = f"coalescing/page_load[{clients} clients, {'coalesced' if coalesce else 'independent'}]"
+            results[name] = summarise([cpu for cpu, _ in bursts])
+            results[name]['wall_ms'] = statistics.median(wall for _, wall in bursts)
+            print(f"  {name:<55} {results[name]['median_ms']:10.2f} ms CPU  "
+                  f"({results[name]['wall_ms']:.2f} ms wall, {results[name]['median_ms'] / clients:.2f} ms CPU per client)")
+    # Concurrent identical requests share one callback run, so the burst costs less CPU
+    for clients in (10, 30):
+        independent = results[f"coalescing/page_load[{clients} clients, independent]"]['median_ms']
+        coalesced = results[f"coalescing/page_load[{clients} clients, coalesced]"]['median_ms']
+        check(coalesced < independent,
+              f"coalesced page loads for {clients} clients took {coalesced:.2f} ms CPU, "
+              f"independent ones {independent:.2f} ms")
+
+    print("Page load (/_dash-layout, concurrent clients)")
+    # Dash serialises the (already built) layout tree on every request; the layout cache
+    # serves the JSON pre-rendered for the dataset version
+    dash_app = build_benchmark_app(data)
+    cached_app = build_benchmark_app(data)
+    page_snapshot = api_registry.current()
+    serve_cached_layout(cached_app, LayoutCache(lambda snapshot: cached_app.layout), lambda: page_snapshot)
+    for label, page_app in (('dash', dash_app), ('cached', cached_app)):
+        concurrent_page_loads(page_app, 1, loads=1)
+        for clients in (1, 10, 30):
+            latencies, wall, size = concurrent_page_loads(page_app, clients)
+            name = f"page_load/layout[{clients} clients, {label}]"
+            results[name] = summarise(latencies)
+            results[name]['requests_per_second'] = len(latencies) / wall * 1000
+            results[name]['response_bytes'] = size
+            print(f"  {name:<55} {results[name]['median_ms']:10.2f} ms median  "
+                  f"({results[name]['requests_per_second']:,.0f} req/s, {size:,} bytes)")
+
+    return results
+
+
+# --- Startup ---
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_time_ms(module='app'):
+    """
+    Cumulative import time of `module` in a fresh interpreter, from `python -X importtime`.
+
+    Returns:
+        tuple: (milliseconds, [(self ms, module name)] for the five slowest imports).
+    """
+    # Without the warm-up thread, whose extension-module imports would hold the GIL and
+    # inflate the main thread's numbers; this measures what the module itself imports
+    env = dict(os.environ, KPI_WARM_UP='0', KPI_LOG_LEVEL='WARNING')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True)
+    total = None
+    self_times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        self_times.append((int(self_us) / 1000, name))
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return total, sorted(self_times, reverse=True)[:5]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    return False
+
+
+@contextmanager
+def running_app(debug=False):
+    """
+    Runs `python app.py` on a free port for the duration of the `with` block.
+
+    Yields:
+        tuple: (base URL, perf_counter() at process start)
+    """
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port), KPI_LOG_LEVEL='WARNING', KPI_DEBUG='1' if debug else '0')
+    started = time.perf_counter()
+    # Own process group, so the debug reloader's child process is stopped too
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=SRC_DIR, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        yield f"http://127.0.0.1:{port}", started
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+
+
+def time_to_ready(timeout=60, debug=False):
+    """
+    Starts `python app.py` and returns seconds until /healthz (port bound) and /readyz
+    (data loaded) first answer 200. Either is None if it timed out. By default the app
+    runs as in production, without the debug reloader.
+    """
+    with running_app(debug) as (base, started):
+        deadline = started + timeout
+        live = time.perf_counter() - started if _wait_for(base + '/healthz', deadline) else None
+        ready = time.perf_counter() - started if _wait_for(base + '/readyz', deadline) else None
+        return live, ready
+
+
+def run_startup_suite(rounds=3):
+    """Import time (-X importtime) and time-to-live/ready of the app, over a few cold starts."""
+    results = {}
+    print("Startup")
+    imports, top = [], []
+    for _ in range(rounds):
+        total, top = import_time_ms('app')
+        imports.append(total)
+    results['startup/import_app'] = summarise(imports)
+    print(f"  {'startup/import_app (-X importtime)':<55} {results['startup/import_app']['median_ms']:10.2f} ms")
+    for self_ms, name in top:
+        print(f"      {name:<51} {self_ms:10.2f} ms self")
+
+    live, ready = [], []
+    for _ in range(rounds):
+        live_s, ready_s = time_to_ready()
+        if live_s is None or ready_s is None:
+            print("  app did not become live/ready within the timeout; startup timings skipped")
+            return results
+        live.append(live_s * 1000)
+        ready.append(ready_s * 1000)
+    results['startup/healthz'] = summarise(live)
+    results['startup/readyz'] = summarise(ready)
+    for name in ('startup/healthz', 'startup/readyz'):
+        print(f"  {name:<55} {results[name]['median_ms']:10.2f} ms")
+    return results
+
+
+# --- Large exports (peak RSS) ---
+
+# Peak RSS growth allowed for a memory-mapped load, whatever the file size: the mapped
+# reader only keeps the lines of the sections (about 32 MB is pandas parsing them)
+MAPPED_PEAK_RSS_MB = 64
+
+# Loads one worksheet in a fresh interpreter; prints seconds and peak RSS growth (KiB) as
+# JSON. The kernel's peak RSS (VmHWM) is reset after the imports, so the peak is the load's.
+_LOAD_PEAK_RSS = """
+import contextlib, io, json, sys, time
+from data_processor import process_worksheet
+from mapped_reader import read_mapped_worksheet
+from section_parser import read_raw_worksheet
+
+def status_kib(field):
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field + ':'))
+
+path, worksheet_type, mode = sys.argv[1:]
+with open('/proc/self/clear_refs', 'w') as f:
+    f.write('5')
+baseline = status_kib('VmRSS')
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    grid = read_mapped_worksheet(path, worksheet_type) if mode == 'mapped' else read_raw_worksheet(path)
+    sections = process_worksheet(worksheet_type, grid)
+seconds = time.perf_counter() - started
+print(json.dumps({'seconds': seconds, 'peak_kib': status_kib('VmHWM') - baseline,
+                  'rows': len(grid), 'sections': len(sections)}))
+"""
+
+
+def run_large_export_suite(sizes_mb=(25, 100), worksheet_type='oee'):
+    """
+    Loads worksheets padded with an archived log of each size, reading the whole file
+    versus memory-mapping it and reading only its sections, and reports the peak RSS
+    growth of each load (measured in a fresh interpreter; Linux only). Mapped loads are
+    checked against MAPPED_PEAK_RSS_MB.
+    """
+    results = {}
+    print(f"Large exports ({worksheet_type} worksheet padded ahead of its sections; peak RSS growth per load)")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size_mb in sizes_mb:
+            path = os.path.join(workdir, f"{worksheet_type}_{size_mb}mb.csv")
+            write_padded_worksheet(path, worksheet_type, size_mb * 1024 * 1024)
+            file_mb = os.path.getsize(path) / 1024 / 1024
+            for mode in ('full', 'mapped'):
+                output = subprocess.run([sys.executable, '-c', _LOAD_PEAK_RSS, path, worksheet_type, mode],
+                                        cwd=SRC_DIR, capture_output=True, text=True, check=True).stdout
+                load = json.loads(output.strip().splitlines()[-1])
+                name = f"large_export/{mode}[{size_mb} MB]"
+                results[name] = summarise([load['seconds'] * 1000])
+                results[name]['peak_rss_mb'] = load['peak_kib'] / 1024
+                print(f"  {name:<55} {results[name]['median_ms']:10.2f} ms  peak RSS +{results[name]['peak_rss_mb']:,.1f} MB "
+                      f"({file_mb:,.1f} MB file, {load['rows']:,} grid rows)")
+                if mode == 'mapped':
+                    check(results[name]['peak_rss_mb'] < MAPPED_PEAK_RSS_MB,
+                          f"{name} grew peak RSS by {results[name]['peak_rss_mb']:,.1f} MB (bound {MAPPED_PEAK_RSS_MB} MB)")
+    return results
+
+
+# --- API load test ---
+
+def _poll(url, stop_at, conditional, latencies, statuses, sizes):
+    """One polling client: GETs `url` until `stop_at`, revalidating with its last ETag if `conditional`."""
+    etag = None
+    while time.perf_counter() < stop_at:
+        headers = {'Accept-Encoding': 'gzip'}
+        if conditional and etag:
+            headers['If-None-Match'] = etag
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as response:
+                body, status, etag = response.read(), response.status, response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            # urllib raises for 304 Not Modified
+            body, status = e.read(), e.code
+        except (urllib.error.URLError, ConnectionError, OSError):
+            body, status = b'', 'error'
+        latencies.append((time.perf_counter() - t0) * 1000)
+        statuses[status] += 1
+        sizes.append(len(body))
+
+
+def run_api_load_suite(clients=100, seconds=5.0, timeout=60):
+    """
+    Many concurrent pollers against a running app's /api/v1: first fetching full
+    (gzip) responses every time, then revalidating with If-None-Match. Checks that every
+    request succeeds and that revalidating sends less data than full fetches.
+    """
+    results = {}
+    print(f"KPI API load test ({clients} clients, {seconds:.0f} s per mode)")
+    with running_app() as (base, started):
+        if not _wait_for(base + '/readyz', started + timeout):
+            print("  app did not become ready within the timeout; API load test skipped")
+            return results
+        for mode, conditional in (('full', False), ('If-None-Match', True)):
+            latencies, sizes, statuses = [], [], collections.Counter()
+            stop_at = time.perf_counter() + seconds
+            threads = [threading.Thread(target=_poll, args=(base + API_BENCHMARK_PATHS[i % len(API_BENCHMARK_PATHS)],
+                                                            stop_at, conditional, latencies, statuses, sizes))
+                       for i in range(clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            name = f"api_load/{mode}[{clients} clients]"
+            results[name] = summarise(latencies)
+            results[name]['requests_per_second'] = len(latencies) / seconds
+            results[name]['bytes_per_response'] = statistics.fmean(sizes) if sizes else 0
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            print(f"  {name:<55} {results[name]['median_ms']:10.2f} ms median, {p95:.2f} ms p95, "
+                  f"{results[name]['requests_per_second']:.0f} req/s, {results[name]['bytes_per_response']:,.0f} bytes/response "
+                  f"{dict(statuses)}")
+            expected = {200, 304} if conditional else {200}
+            check(set(statuses) <= expected,
+                  f"{name} got responses other than {sorted(expected)}: {dict(statuses)}")
+        full = results[f"api_load/full[{clients} clients]"]['bytes_per_response']
+        revalidated = results[f"api_load/If-None-Match[{clients} clients]"]['bytes_per_response']
+        check(revalidated < full,
+              f"revalidating API pollers received {revalidated:,.0f} bytes/response, full fetches {full:,.0f}")
+    return results
+
+
+# --- History ---
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(history_file):
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(history_file, entry):
+    with open(history_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+# Metrics compared with the previous run: metric -> (unit, whether a higher value is worse)
+COMPARED_METRICS = {
+    'median_ms': ('ms', True),
+    'peak_rss_mb': ('MB', True),
+    'requests_per_second': ('req/s', False),
+}
+
+
+def compare_runs(previous, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compares each benchmark's COMPARED_METRICS with a previous run.
+
+    Returns:
+        list: (name, metric, previous value, current value, relative worsening) for metrics
+              worse by more than `threshold` (times and memory up, throughput down).
+    """
+    regressions = []
+    for name, stats in current.items():
+        before = previous.get(name) or {}
+        for metric, (_, higher_is_worse) in COMPARED_METRICS.items():
+            if not before.get(metric) or not stats.get(metric):
+                continue
+            ratio = stats[metric] / before[metric]
+            change = ratio - 1 if higher_is_worse else 1 / ratio - 1
+            if change > threshold:
+                regressions.append((name, metric, before[metric], stats[metric], change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parsing, KPI calculation, callbacks and figures.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='production')
+    parser.add_argument('--min-time', type=float, default=0.5, help="Seconds to spend on each benchmark.")
+    parser.add_argument('--history-file', default=DEFAULT_HISTORY_FILE)
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative worsening of a median time, peak RSS or throughput reported as a regression.")
+    parser.add_argument('--no-save', action='store_true', help="Do not append this run to the history file.")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--skip-startup', action='store_true', help="Skip the cold-start (subprocess) benchmarks.")
+    parser.add_argument('--large-exports', action='store_true',
+                        help="Also measure peak RSS of full vs memory-mapped loads of large padded exports.")
+    parser.add_argument('--api-load', type=int, default=0, metavar='CLIENTS',
+                        help="Also load-test the /api/v1 endpoints of a running app with this many polling clients.")
+    args = parser.parse_args()
+
+    # The callbacks' read_json deprecation warning would otherwise drown out the timings
+    warnings.filterwarnings('ignore', category=FutureWarning)
+    warnings.filterwarnings('ignore', message='.*scattermapbox', category=DeprecationWarning)
+
+    scale = SCALES[args.scale]
+    print(f"Scale '{args.scale}': {scale}")
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_suite(BenchmarkData(scale, workdir), min_time=args.min_time)
+    if not args.skip_startup:
+        results.update(run_startup_suite())
+    if args.large_exports:
+        results.update(run_large_export_suite())
+    if args.api_load:
+        results.update(run_api_load_suite(args.api_load))
+
+    previous = [entry for entry in load_history(args.history_file) if entry.get('scale_name') == args.scale]
+    regressions = compare_runs(previous[-1]['results'], results, args.threshold) if previous else []
+    if previous:
+        print(f"\nCompared with {previous[-1]['timestamp']} ({previous[-1].get('commit') or 'unknown commit'}):")
+        for name, metric, before, after, change in regressions:
+            unit = COMPARED_METRICS[metric][0]
+            print(f"  REGRESSION {name}: {before:.2f} {unit} -> {after:.2f} {unit} ({(after / before - 1) * 100:+.0f}%)")
+        if not regressions:
+            print(f"  no benchmark worse by more than {args.threshold * 100:.0f}%")
+    if FAILED_CHECKS:
+        print(f"\n{len(FAILED_CHECKS)} check(s) failed:")
+        for message in FAILED_CHECKS:
+            print(f"  {message}")
+
+    if not args.no_save:
+        append_history(args.history_file, {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'scale_name': args.scale,
+            'scale': scale,
+            'results': results,
+        })
+    if FAILED_CHECKS or (regressions and args.fail_on_regression):
+        sys.exit(1)
@@ -0,0 +1,360 @@
+# src/bulk_ingest.py
+#
+# Bulk ingestion of a directory of worksheets (e.g. one export per line per month).
+# Worksheets are discovered recursively and classified by their title row. Only the
+# first few lines of each CSV are read for this. The files are then parsed in parallel
+# across a process pool.
+#
+# Workers get a path and return parsed sections, never raw grids. A worksheet's sections
+# hold a few thousand values, so the transfer is small. Above SHARED_MEMORY_MIN_BYTES
+# the numeric columns are written to one shared memory block per file. Only the
+# manifest (names, dtypes, offsets and text columns) is then pickled, and the parent
+# copies the arrays out and unlinks the block. Warnings a worker prints are captured
+# and printed by the parent under the file's name, so output from different files does
+# not interleave.
+#
+# Results are merged in the parent as they arrive: optionally upserted into the fact
+# store, with one site per source file, and grouped by worksheet type. A progress
+# callback is called after every file.
+
+import contextlib
+import csv
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from data_schema import WORKSHEET_SCHEMAS
+from data_processor import read_worksheet_grid, process_worksheet, load_and_process_workbook
+from load_profiler import LoadReport, publish_load_report
+from workbook_reader import EXCEL_EXTENSIONS, is_workbook
+
+WORKSHEET_EXTENSIONS = ('.csv',) + EXCEL_EXTENSIONS
+
+# Files whose sections hold fewer numeric bytes than this are pickled as they are
+SHARED_MEMORY_MIN_BYTES = 256 * 1024
+
+# Rows searched for the title when classifying a CSV (as in classify_worksheet)
+TITLE_ROWS = 5
+
+WORKBOOK = 'workbook'
+
+
+# --- Discovery and classification ---
+
+def discover_worksheets(root):
+    """All CSV exports and Excel workbooks under `root`, sorted by path."""
+    paths = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        paths.extend(os.path.join(directory, name) for name in sorted(files)
+                     if name.lower().endswith(WORKSHEET_EXTENSIONS) and not name.startswith(('.', '~$')))
+    return paths
+
+
+def classify_file(path, title_rows=TITLE_ROWS):
+    """
+    Worksheet type of a CSV export from its title row, reading only the first lines.
+    Workbooks are classified sheet by sheet when they are loaded, so they return WORKBOOK.
+
+    Returns:
+        str or None: 'copq', 'oee', 'mfg_cost', WORKBOOK, or None if not recognised.
+    """
+    if is_workbook(path):
+        return WORKBOOK
+    try:
+        with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+            for _, row in zip(range(title_rows), csv.reader(f)):
+                first = row[0].strip().lower() if row else ''
+                if first:
+                    return next((worksheet_type for worksheet_type, schema in WORKSHEET_SCHEMAS.items()
+                                 if schema['title'] in first), None)
+    except OSError:
+        return None
+    return None
+
+
+def source_key(path, root, worksheet_type=None):
+    """
+    Name of a source file relative to the ingestion root, used as its fact store site:
+    'site01/line02_copq.csv' -> 'site01/line02' (a trailing worksheet type is dropped).
+    """
+    key = os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, '/')
+    for separator in ('_', '-', '/'):
+        suffix = f"{separator}{worksheet_type}"
+        if worksheet_type and key.lower().endswith(suffix) and len(key) > len(suffix):
+            return key[:-len(suffix)]
+    return key
+
+
+# --- Section transfer ---
+
+def _column_spec(values, arrays):
+    """Encodes one column or index: numeric arrays go to `arrays`, everything else stays inline."""
+    if isinstance(values, pd.RangeIndex):
+        return ('range', values.start, values.stop, values.step)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return ('category', _column_spec(pd.Series(values.cat.codes if hasattr(values, 'cat') else values.codes), arrays),
+                list(values.dtype.categories), values.dtype.ordered)
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufM':
+        arrays.append(np.ascontiguousarray(np.asarray(values)))
+        return ('array', len(arrays) - 1)
+    return ('inline', list(values))
+
+
+def _column_values(spec, arrays):
+    kind = spec[0]
+    if kind == 'range':
+        return pd.RangeIndex(*spec[1:])
+    if kind == 'category':
+        _, codes, categories, ordered = spec
+        return pd.Categorical.from_codes(_column_values(codes, arrays), categories=categories, ordered=ordered)
+    if kind == 'array':
+        return arrays[spec[1]]
+    return spec[1]
+
+
+def pack_sections(data_sections):
+    """
+    Encodes parsed sections for the trip back from a worker.
+
+    Returns:
+        tuple: (manifest, shared memory name or None). Without shared memory the manifest
+               carries the arrays itself.
+    """
+    from multiprocessing import shared_memory
+
+    arrays, manifest = [], {}
+    for name, section in (data_sections or {}).items():
+        if isinstance(section, pd.DataFrame):
+            manifest[name] = ('frame', _column_spec(section.index, arrays), section.index.name,
+                              [(column, _column_spec(section[column], arrays)) for column in section.columns])
+        elif isinstance(section, pd.Series):
+            manifest[name] = ('series', _column_spec(section.index, arrays), section.name,
+                              _column_spec(section, arrays))
+        else:
+            manifest[name] = ('object', section)
+
+    # 8-byte aligned offsets within one block
+    offsets, total = [], 0
+    for array in arrays:
+        offsets.append(total)
+        total += -(-array.nbytes // 8) * 8
+    layout = [(offset, array.dtype.str, array.shape) for offset, array in zip(offsets, arrays)]
+    if total < SHARED_MEMORY_MIN_BYTES:
+        return {'sections': manifest, 'arrays': arrays}, None
+
+    block = shared_memory.SharedMemory(create=True, size=total)
+    try:
+        for (offset, dtype, shape), array in zip(layout, arrays):
+            np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[...] = array
+    finally:
+        block.close()
+    return {'sections': manifest, 'layout': layout}, block.name
+
+
+def unpack_sections(manifest, shared_memory_name=None):
+    """Rebuilds the sections encoded by pack_sections, releasing the shared memory block."""
+    if shared_memory_name is None:
+        arrays = manifest['arrays']
+    else:
+        from multiprocessing import shared_memory
+
+        block = shared_memory.SharedMemory(name=shared_memory_name)
+        try:
+            arrays = [np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset).copy()
+                      for offset, dtype, shape in manifest['layout']]
+        finally:
+            block.close()
+            block.unlink()
+
+    sections = {}
+    for name, entry in manifest['sections'].items():
+        if entry[0] == 'frame':
+            _, index, index_name, columns = entry
+            sections[name] = pd.DataFrame({column: _column_values(spec, arrays) for column, spec in columns},
+                                          index=pd.Index(_column_values(index, arrays), name=index_name),
+                                          columns=[column for column, _ in columns])
+        elif entry[0] == 'series':
+            _, index, series_name, values = entry
+            sections[name] = pd.Series(_column_values(values, arrays),
+                                       index=pd.Index(_column_values(index, arrays)), name=series_name)
+        else:
+            sections[name] = entry[1]
+    return sections
+
+
+# --- Workers ---
+
+def _ingest_file(path, worksheet_type):
+    """
+    Loads one worksheet file (in a worker process).
+
+    Returns:
+        dict: 'path', 'datasets' (worksheet type -> packed sections), 'reports' (as dicts),
+              'output' (captured prints), 'error' and 'seconds'.
+    """
+    started = time.perf_counter()
+    output = io.StringIO()
+    result = {'path': path, 'datasets': {}, 'reports': [], 'error': None}
+    with contextlib.redirect_stdout(output):
+        try:
+            if worksheet_type == WORKBOOK:
+                # Sheets are classified as they stream; their reports are logged by this worker
+                datasets = load_and_process_workbook(path) or {}
+            else:
+                report = LoadReport(worksheet_type, path)
+                try:
+                    with report.timed('total'):
+                        datasets = {worksheet_type: process_worksheet(
+                            worksheet_type, read_worksheet_grid(path, worksheet_type, report), report)}
+                finally:
+                    result['reports'].append(report.to_dict())
+            result['datasets'] = {name: pack_sections(sections) for name, sections in datasets.items() if sections}
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+    result['output'] = output.getvalue()
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def _report_from_dict(entry):
+    report = LoadReport(entry['worksheet_type'], entry['source'])
+    for name in ('started_at', 'bytes_read', 'grid_rows', 'grid_cols', 'sections', 'formulas', 'validation', 'error'):
+        setattr(report, name, entry[name])
+    report.timings = {step: seconds for step, seconds in entry['timings'].items() if step != 'convert'}
+    return report
+
+
+class BulkIngestResult:
+    """
+    Merged outcome of a bulk ingestion.
+
+    Attributes:
+        datasets (dict): Worksheet type -> {source key -> data sections}.
+        reports (list): LoadReport of every CSV worksheet loaded.
+        failures (list): (path, error) of every file that could not be loaded.
+        skipped (list): Paths that are not a recognised worksheet.
+        workers (int): Processes used (1: loaded in this process).
+        seconds (float): Wall-clock time of the whole ingestion.
+    """
+
+    def __init__(self, workers):
+        self.datasets = {worksheet_type: {} for worksheet_type in WORKSHEET_SCHEMAS}
+        self.reports = []
+        self.failures = []
+        self.skipped = []
+        self.workers = workers
+        self.seconds = 0.0
+
+    @property
+    def files_loaded(self):
+        return sum(len(sources) for sources in self.datasets.values())
+
+    def summary(self):
+        counts = ', '.join(f"{len(sources)} {worksheet_type}" for worksheet_type, sources in self.datasets.items())
+        return (f"Ingested {self.files_loaded} worksheet(s) ({counts}) in {self.seconds:.2f} s with "
+                f"{self.workers} worker(s); {len(self.failures)} failed, {len(self.skipped)} skipped.")
+
+
+def print_progress(done, total, path, seconds):
+    """Default progress callback: one line per file."""
+    print(f"[{done:>{len(str(total))}}/{total}] {path} ({seconds * 1000:.0f} ms)")
+
+
+def ingest_directory(root, workers=None, progress=None, fact_store=None, mp_context=None):
+    """
+    Discovers, classifies and loads every worksheet under `root`.
+
+    Args:
+        root (str): Directory to search (recursively).
+        workers (int): Worker processes (default: CPU count). 1 loads in this process.
+        progress (callable): Called as progress(done, total, path, seconds) after each file.
+        fact_store (FactStore): When given, every file's sections are upserted under its source key as site.
+        mp_context: multiprocessing context for the pool (default: the platform's).
+
+    Returns:
+        BulkIngestResult
+    """
+    started = time.perf_counter()
+    workers = max(int(workers or os.cpu_count() or 1), 1)
+    result = BulkIngestResult(workers)
+
+    tasks = []
+    for path in discover_worksheets(root):
+        worksheet_type = classify_file(path)
+        if worksheet_type is None:
+            print(f"Warning: {path} does not match any known worksheet; skipped.")
+            result.skipped.append(path)
+        else:
+            tasks.append((path, worksheet_type))
+    # Largest files first, so a long file does not start last and hold up the pool
+    tasks.sort(key=lambda task: os.path.getsize(task[0]), reverse=True)
+
+    def merge(loaded, done):
+        if loaded['output']:
+            print(f"--- {loaded['path']}:\n{loaded['output'].rstrip()}")
+        for entry in loaded['reports']:
+            report = _report_from_dict(entry)
+            publish_load_report(report)
+            result.reports.append(report)
+        if loaded['error']:
+            print(f"Warning: could not load {loaded['path']}: {loaded['error']}")
+            result.failures.append((loaded['path'], loaded['error']))
+        for worksheet_type, packed in loaded['datasets'].items():
+            sections = unpack_sections(*packed)
+            key = source_key(loaded['path'], root, worksheet_type)
+            result.datasets[worksheet_type][key] = sections
+            if fact_store is not None:
+                fact_store.upsert_sections(worksheet_type, sections, site=key)
+        if progress is not None:
+            progress(done, len(tasks), loaded['path'], loaded['seconds'])
+
+    if workers == 1 or len(tasks) <= 1:
+        result.workers = 1
+        for done, task in enumerate(tasks, 1):
+            merge(_ingest_file(*task), done)
+    else:
+        from multiprocessing import resource_tracker
+
+        # Workers must share this process's tracker, which then sees every block unlinked
+        resource_tracker.ensure_running()
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=mp_context) as pool:
+            futures = [pool.submit(_ingest_file, *task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                merge(future.result(), done)
+
+    # Sources in path order, whatever order they finished in
+    result.datasets = {worksheet_type: dict(sorted(sources.items())) for worksheet_type, sources in result.datasets.items()}
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load every COPQ/OEE/Mfg Cost worksheet under a directory in parallel.")
+    parser.add_argument('root')
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument('--fact-store', default=None, help="SQLite fact store to upsert into (one site per file).")
+    parser.add_argument('--quiet', action='store_true', help="No per-file progress lines.")
+    parser.add_argument('--compare-serial', action='store_true', help="Also load in one process and report the speedup.")
+    args = parser.parse_args()
+
+    store = None
+    if args.fact_store:
+        from fact_store import FactStore
+        store = FactStore(args.fact_store)
+
+    with contextlib.redirect_stdout(io.StringIO()) if args.quiet else contextlib.nullcontext():
+        parallel = ingest_directory(args.root, workers=args.workers, fact_store=store,
+                                    progress=None if args.quiet else print_progress)
+    print(parallel.summary())
+    if args.compare_serial:
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial = ingest_directory(args.root, workers=1)
+        print(f"Serial: {serial.seconds:.2f} s; speedup x{serial.seconds / parallel.seconds:.2f} "
+              f"with {parallel.workers} worker(s).")
@@ -0,0 +1,225 @@
+# src/cost_attribution.py
+#
+# Cost attribution for the Manufacturing Cost worksheet. Every line item of the DIRECT
+# MATERIAL, DIRECT LABOR and MANUFACTURING OVERHEAD sections becomes rows of a
+# long-format fact table, one per (month, line item):
+#   cost = price x quantity
+# The price of a labour item is its hourly rate, so its quantity is its hours. Items
+# tracked by a 'TRENDING ANALYSIS - KEY COST DRIVERS' index take that index / 100 as
+# their price, so their quantity is their cost at base-month prices. Any other item has
+# a price of 1.
+#
+# The month-over-month change in each item's cost per unit (cost / units produced) is
+# split exactly into three effects, from month 0 to month 1:
+#   volume = cost0 x (1 / units1 - 1 / units0)         base spend spread over the new volume
+#   rate   = (price1 - price0) x quantity1 / units1    price change at the new usage
+#   mix    = price0 x (quantity1 - quantity0) / units1 change in usage at base prices
+# For variable costs the volume and mix effects largely offset. What remains is the
+# change in usage per unit, across the mix of inputs.
+#
+# All items and months are decomposed at once, as (items, months) arrays. The results
+# are computed once per load by calculate_mfg_cost_kpis, so each dataset version keeps
+# its own attribution frames.
+
+import numpy as np
+import pandas as pd
+
+COST_CATEGORIES = {
+    'direct_material': 'Direct Material',
+    'direct_labor': 'Direct Labor',
+    'manufacturing_overhead': 'Manufacturing Overhead',
+}
+
+ALL_CATEGORIES = 'All Categories'
+
+# Line items: (section, cost field, price field or cost-driver index)
+LINE_ITEMS = [
+    ('direct_material', 'Raw Material A Cost (£)', 'Raw Material Index (Base=100)'),
+    ('direct_material', 'Raw Material B Cost (£)', 'Raw Material Index (Base=100)'),
+    ('direct_material', 'Raw Material C Cost (£)', 'Raw Material Index (Base=100)'),
+    ('direct_material', 'Components Cost (£)', None),
+    ('direct_material', 'Packaging Materials (£)', None),
+    ('direct_labor', 'Production Labor Cost (£)', 'Average Labor Rate (£/hour)'),
+    ('direct_labor', 'Setup Labor Cost (£)', 'Average Setup Labor Rate (£/hour)'),
+    ('direct_labor', 'Quality Control Labor Cost (£)', 'Average QC Labor Rate (£/hour)'),
+    ('manufacturing_overhead', 'Indirect Labor Cost (£)', 'Labor Rate Index (Base=100)'),
+    ('manufacturing_overhead', 'Equipment Depreciation (£)', None),
+    ('manufacturing_overhead', 'Facility Costs (Rent/Mortgage) (£)', None),
+    ('manufacturing_overhead', 'Utilities (£)', 'Energy Cost Index (Base=100)'),
+    ('manufacturing_overhead', 'Maintenance and Repairs (£)', None),
+    ('manufacturing_overhead', 'Consumable Supplies (£)', None),
+    ('manufacturing_overhead', 'Production IT Systems (£)', None),
+    ('manufacturing_overhead', 'Other Overhead Costs (£)', None),
+]
+
+FACT_COLUMNS = ['Period', 'Month', 'Category', 'Line Item', 'Cost (£)', 'Quantity', 'Price', 'Units Produced']
+
+EFFECTS = ['Volume Effect (£/unit)', 'Rate Effect (£/unit)', 'Mix Effect (£/unit)']
+
+ATTRIBUTION_COLUMNS = (['Period', 'Month', 'Category', 'Line Item', 'Previous Cost per Unit (£)', 'Cost per Unit (£)']
+                       + EFFECTS + ['Total Change (£/unit)'])
+
+
+def _row(df, field, n_months):
+    """One field of a Month-indexed section as float64, or NaNs when it is missing."""
+    if df is None or field not in df.columns or len(df) != n_months:
+        return np.full(n_months, np.nan)
+    return df[field].to_numpy(dtype='float64', na_value=np.nan)
+
+
+def build_cost_facts(mfg_cost_data_sections):
+    """
+    Long-format fact table of every line item of a parsed Manufacturing Cost worksheet.
+
+    Args:
+        mfg_cost_data_sections (dict): Sections from the Manufacturing Cost loader.
+
+    Returns:
+        pd.DataFrame or None: FACT_COLUMNS, one row per (month, line item) with a cost;
+                              None without production data.
+    """
+    production = mfg_cost_data_sections.get('production_data')
+    if production is None or production.empty:
+        return None
+    months = production.index
+    n_months = len(months)
+    units = _row(production, 'Total Units Produced', n_months)
+
+    # Driver indices line up with the month header by position (months repeat across years)
+    drivers = mfg_cost_data_sections.get('cost_drivers')
+
+    cost = np.vstack([_row(mfg_cost_data_sections.get(section), field, n_months)
+                      for section, field, _ in LINE_ITEMS])
+    price = np.ones_like(cost)
+    for i, (section, _, price_field) in enumerate(LINE_ITEMS):
+        if price_field is None:
+            continue
+        if price_field.endswith('(Base=100)'):
+            values = _row(drivers, price_field, n_months) / 100
+        else:
+            values = _row(mfg_cost_data_sections.get(section), price_field, n_months)
+        price[i] = np.where(values > 0, values, np.nan)
+    # Without a usable price the whole change is volume and mix
+    price = np.where(np.isnan(price), 1.0, price)
+
+    present = ~np.isnan(cost)
+    item, period = np.nonzero(present)
+    facts = pd.DataFrame({
+        'Period': period.astype(np.int32),
+        'Month': months[period],
+        'Category': pd.Categorical.from_codes(
+            np.array([list(COST_CATEGORIES).index(section) for section, _, _ in LINE_ITEMS])[item],
+            categories=list(COST_CATEGORIES.values())),
+        'Line Item': pd.Categorical.from_codes(item, categories=[field for _, field, _ in LINE_ITEMS]),
+        'Cost (£)': cost[present],
+        'Quantity': (cost / price)[present],
+        'Price': price[present],
+        'Units Produced': units[period],
+    }, columns=FACT_COLUMNS)
+    return facts.sort_values(['Period', 'Line Item'], kind='stable').reset_index(drop=True)
+
+
+def decompose_cost_per_unit(facts):
+    """
+    Splits every month-over-month change in each line item's cost per unit into volume,
+    rate and mix effects (which sum exactly to the change).
+
+    Args:
+        facts (pd.DataFrame): From build_cost_facts.
+
+    Returns:
+        pd.DataFrame: ATTRIBUTION_COLUMNS, one row per (month after the first, line item).
+    """
+    if facts is None or facts.empty or facts['Period'].max() < 1:
+        return pd.DataFrame({column: [] for column in ATTRIBUTION_COLUMNS})
+
+    n_items, n_periods = len(facts['Line Item'].cat.categories), int(facts['Period'].max()) + 1
+    item, period = facts['Line Item'].cat.codes.to_numpy(), facts['Period'].to_numpy()
+
+    def matrix(column):
+        values = np.full((n_items, n_periods), np.nan)
+        values[item, period] = facts[column].to_numpy(dtype='float64')
+        return values
+
+    cost, quantity, price = matrix('Cost (£)'), matrix('Quantity'), matrix('Price')
+    units = np.full(n_periods, np.nan)
+    units[period] = facts['Units Produced'].to_numpy(dtype='float64')
+    units = np.where(units > 0, units, np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_unit = cost / units
+        volume = cost[:, :-1] * (1 / units[1:] - 1 / units[:-1])
+        rate = (price[:, 1:] - price[:, :-1]) * quantity[:, 1:] / units[1:]
+        mix = price[:, :-1] * (quantity[:, 1:] - quantity[:, :-1]) / units[1:]
+
+    change = per_unit[:, 1:] - per_unit[:, :-1]
+    valid = ~np.isnan(change)
+    item_index, step = np.nonzero(valid)
+    months = facts.drop_duplicates('Period').set_index('Period')['Month']
+    sections = [section for section, _, _ in LINE_ITEMS]
+    category_codes = np.array([list(COST_CATEGORIES).index(section) for section in sections])
+
+    result = pd.DataFrame({
+        'Period': (step + 1).astype(np.int32),
+        'Month': months.reindex(step + 1).to_numpy(),
+        'Category': pd.Categorical.from_codes(category_codes[item_index], categories=list(COST_CATEGORIES.values())),
+        'Line Item': pd.Categorical.from_codes(item_index, categories=facts['Line Item'].cat.categories),
+        'Previous Cost per Unit (£)': per_unit[:, :-1][valid],
+        'Cost per Unit (£)': per_unit[:, 1:][valid],
+        'Volume Effect (£/unit)': volume[valid],
+        'Rate Effect (£/unit)': rate[valid],
+        'Mix Effect (£/unit)': mix[valid],
+        'Total Change (£/unit)': change[valid],
+    }, columns=ATTRIBUTION_COLUMNS)
+    return result.sort_values(['Period', 'Line Item'], kind='stable').reset_index(drop=True)
+
+
+def summarise_attribution(attribution, category=ALL_CATEGORIES):
+    """
+    Effects per month: summed per category, or per line item of one category (the drill-down).
+
+    Returns:
+        pd.DataFrame: 'Period', 'Month', 'Group' and the effect and total change columns.
+    """
+    if category and category != ALL_CATEGORIES:
+        rows = attribution[(attribution['Category'] == category).to_numpy()]
+        labels = rows['Line Item']
+    else:
+        rows, labels = attribution, attribution['Category']
+    values = EFFECTS + ['Total Change (£/unit)']
+
+    group_codes, groups = pd.factorize(labels.astype(str), sort=True)
+    periods, period_codes = np.unique(rows['Period'].to_numpy(), return_inverse=True)
+    keys, key_codes = np.unique(period_codes * len(groups) + group_codes, return_inverse=True)
+    months = rows['Month'].to_numpy()[np.unique(period_codes, return_index=True)[1]]
+
+    summary = pd.DataFrame({
+        'Period': periods[keys // max(len(groups), 1)],
+        'Month': months[keys // max(len(groups), 1)],
+        'Group': np.asarray(groups, dtype=object)[keys % max(len(groups), 1)],
+    })
+    for column in values:
+        summary[column] = np.bincount(key_codes, weights=rows[column].to_numpy(dtype='float64'), minlength=len(keys))
+    return summary
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    from data_processor import load_and_process_mfg_cost_data
+
+    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    sections = load_and_process_mfg_cost_data(os.path.join(data_dir, 'Manufacturing_Cost_per_Unit_Calculator.csv'))
+    started = time.perf_counter()
+    facts = build_cost_facts(sections)
+    attribution = decompose_cost_per_unit(facts)
+    elapsed = time.perf_counter() - started
+    print(f"\n{len(facts)} facts -> {len(attribution)} attribution rows in {elapsed * 1000:.1f} ms")
+    print(summarise_attribution(attribution).to_string())
+
+    # The effects of every month add up to the change in the line items' cost per unit
+    per_unit = facts.groupby('Period')['Cost (£)'].sum() / facts.groupby('Period')['Units Produced'].first()
+    print("\nLine item cost per unit change:", np.round(np.diff(per_unit.to_numpy()), 4))
+    print("Sum of effects:                ",
+          np.round(attribution.groupby('Period')['Total Change (£/unit)'].sum().to_numpy(), 4))
+    print("\nDirect Labor drill-down:\n", summarise_attribution(attribution, 'Direct Labor').to_string())
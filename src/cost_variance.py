@@ -0,0 +1,408 @@
+# src/cost_variance.py
+#
+# Cost variance analytics for the Manufacturing Cost worksheet. The 'COST VARIANCE
+# ANALYSIS' table labels each row with one combined text cell ('January Manufacturing
+# Cost/Unit'). Here the month name and the cost line (KPI) are split into separate
+# keyed columns, and each row is placed on the worksheet's month header:
+#   - the rows of one KPI are consecutive calendar months; the first is matched to the
+#     first header month with the same name, and each later row steps forward by the
+#     number of months between the names (so 24 rows cover two years)
+#   - the Month of a row is that header month, with the header's years (see data_schema.py)
+#
+# The monthly facts are also kept as a Month-indexed section ('cost_variance_monthly',
+# one '<KPI> | Actual' and '<KPI> | Budget' column per cost line), so the fact store
+# holds them for every site like any other month-keyed section.
+#
+# VarianceIndex holds cumulative sums of actual and budget as (site x KPI, periods + 1)
+# arrays, so the totals of any run of months are two lookups:
+#   actual(start..end) = cum_actual[end + 1] - cum_actual[start]
+# Year to date, quarter to date and rolling twelve months, as of any month, are such
+# runs; the trend of one period type over every month is one array subtraction.
+#
+# Only amounts add up over months. A rate such as 'Manufacturing Cost/Unit' is
+# averaged over the period weighted by the units produced each month (the period's
+# cost over its units), and both actual and budget use the actual units, i.e. the
+# budget is flexed to the volume produced. Without units for every month of a rate
+# line, its months are averaged unweighted.
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from data_schema import WORKSHEET_START_YEAR
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+               'September', 'October', 'November', 'December']
+
+# First month of the financial year (1 = January) ($KPI_FISCAL_YEAR_START)
+FISCAL_YEAR_START = int(os.environ.get('KPI_FISCAL_YEAR_START', 1))
+
+# Period types: name -> label
+PERIOD_TYPES = {
+    'month': 'Month',
+    'qtd': 'Quarter to Date',
+    'ytd': 'Year to Date',
+    'rolling_12': 'Rolling 12 Months',
+}
+
+ALL_SITES = 'All Sites'
+
+FACT_COLUMNS = ['Period', 'Month', 'KPI', 'Actual', 'Budget', 'Units', 'Variance (£)', 'Variance (%)']
+
+VIEW_COLUMNS = ['Site', 'KPI', 'Basis', 'From', 'To', 'Months', 'Actual', 'Budget', 'Variance (£)', 'Variance (%)']
+
+TREND_COLUMNS = ['Period', 'Month', 'Site', 'KPI', 'Basis', 'Actual', 'Budget', 'Variance (£)', 'Variance (%)']
+
+# How the period figures of a cost line are formed: amounts are summed, rates averaged
+TOTAL_BASIS = 'Total'
+RATE_BASIS = 'Per unit (unit-weighted)'
+
+# Cost lines that are rates rather than amounts ('Manufacturing Cost/Unit', 'Cost per Unit')
+RATE_KPI = re.compile(r'/\s*unit\b|\bper\s+unit\b', flags=re.IGNORECASE)
+
+# Separates the KPI from the measure in the columns of the monthly section
+MEASURE_SEPARATOR = ' | '
+
+MONTHLY_SECTION = 'cost_variance_monthly'
+
+
+def is_rate_kpi(kpi):
+    """Whether a cost line is a per-unit rate, whose period figure is an average rather than a sum."""
+    return bool(RATE_KPI.search(str(kpi)))
+
+
+def split_month_kpi(labels):
+    """
+    Splits 'Month_KPI' labels into month numbers (1-12, 0 when the label does not start
+    with a month name) and KPI names.
+    """
+    parts = pd.Series(labels, dtype=object).astype(str).str.strip().str.extract(
+        r'^(?P<month>' + '|'.join(MONTH_NAMES) + r')\s+(?P<kpi>.+)$', flags=re.IGNORECASE)
+    months = parts['month'].str.capitalize().map({name: i + 1 for i, name in enumerate(MONTH_NAMES)})
+    return months.fillna(0).astype(np.int64).to_numpy(), parts['kpi'].str.strip().to_numpy()
+
+
+def _header_months(mfg_cost_data_sections):
+    """The worksheet's month header (the Month index of its wide sections), or an empty index."""
+    for name in ('production_data', 'total_manufacturing_cost'):
+        df = mfg_cost_data_sections.get(name)
+        if isinstance(df, pd.DataFrame) and isinstance(df.index, pd.DatetimeIndex) and len(df):
+            return df.index
+    return pd.DatetimeIndex([])
+
+
+def _periods(month_numbers, header):
+    """Header positions of one KPI's consecutive monthly rows."""
+    steps = (np.diff(month_numbers) - 1) % 12 + 1
+    matches = np.flatnonzero(header.month == month_numbers[0]) if len(header) else []
+    first = int(matches[0]) if len(matches) else 0
+    return first + np.concatenate([[0], np.cumsum(steps)])
+
+
+def build_variance_facts(mfg_cost_data_sections):
+    """
+    Monthly actual, budget and variance per cost line from the COST VARIANCE ANALYSIS table.
+
+    Args:
+        mfg_cost_data_sections (dict): Sections from the Manufacturing Cost loader.
+
+    Returns:
+        pd.DataFrame or None: FACT_COLUMNS, one row per (period, KPI); None without
+                              a variance table.
+    """
+    table = mfg_cost_data_sections.get('cost_variance')
+    if table is None or table.empty or 'Month_KPI' not in table.columns:
+        return None
+    month_numbers, kpis = split_month_kpi(table['Month_KPI'])
+    keep = month_numbers > 0
+    if not keep.all():
+        print(f"Warning: {(~keep).sum()} cost variance row(s) without a month name were skipped.")
+    if not keep.any():
+        return None
+    table = table[keep]
+    month_numbers, kpis = month_numbers[keep], kpis[keep]
+
+    header = _header_months(mfg_cost_data_sections)
+    periods = np.empty(len(table), dtype=np.int64)
+    kpi_codes, kpi_names = pd.factorize(kpis)
+    for code in range(len(kpi_names)):
+        rows = np.flatnonzero(kpi_codes == code)
+        periods[rows] = _periods(month_numbers[rows], header)
+
+    # The header is consecutive months, so periods past its end continue from its first month
+    anchor = header[0] if len(header) else pd.Timestamp(WORKSHEET_START_YEAR, int(month_numbers[0]), 1)
+    total = anchor.year * 12 + anchor.month - 1 + periods
+    months = pd.to_datetime({'year': total // 12, 'month': total % 12 + 1, 'day': 1}).to_numpy()
+
+    actual = table['Actual'].to_numpy(dtype='float64', na_value=np.nan)
+    budget = table['Budget'].to_numpy(dtype='float64', na_value=np.nan)
+    # Units produced in each row's month, by header position (NaN past the header)
+    production = mfg_cost_data_sections.get('production_data')
+    units = np.full(len(table), np.nan)
+    if isinstance(production, pd.DataFrame) and 'Total Units Produced' in production.columns and len(header):
+        by_period = production['Total Units Produced'].to_numpy(dtype='float64', na_value=np.nan)
+        inside = periods < len(by_period)
+        units[inside] = by_period[periods[inside]]
+    facts = pd.DataFrame({
+        'Period': periods.astype(np.int32),
+        'Month': months,
+        'KPI': pd.Categorical.from_codes(kpi_codes, categories=list(kpi_names)),
+        'Actual': actual,
+        'Budget': budget,
+        'Units': units,
+        'Variance (£)': actual - budget,
+        'Variance (%)': np.where(budget != 0, (actual - budget) / np.where(budget != 0, budget, 1), np.nan),
+    }, columns=FACT_COLUMNS)
+    return facts.sort_values(['Period', 'KPI'], kind='stable').reset_index(drop=True)
+
+
+def add_monthly_variance_section(data_sections):
+    """Post-processing step: adds the Month-indexed 'cost_variance_monthly' section."""
+    facts = build_variance_facts(data_sections)
+    if facts is None:
+        return data_sections
+    wide = facts.astype({'KPI': str}).pivot(index=['Period', 'Month'], columns='KPI', values=['Actual', 'Budget', 'Units'])
+    wide.columns = [f"{kpi}{MEASURE_SEPARATOR}{measure}" for measure, kpi in wide.columns]
+    # Units are only needed (and stored) for the rate lines
+    wide = wide[[f"{kpi}{MEASURE_SEPARATOR}{measure}" for kpi in facts['KPI'].cat.categories
+                 for measure in (('Actual', 'Budget', 'Units') if is_rate_kpi(kpi) else ('Actual', 'Budget'))]]
+    data_sections[MONTHLY_SECTION] = wide.reset_index(level='Period', drop=True)
+    return data_sections
+
+
+def facts_from_monthly(wide):
+    """
+    Variance facts back from monthly sections as returned by FactStore.query_section
+    ('Site' and 'Month' columns plus '<KPI> | <measure>' columns).
+
+    Periods number the distinct months of all sites in order.
+    """
+    measures = [col for col in wide.columns if MEASURE_SEPARATOR in str(col)]
+    if wide.empty or not measures:
+        return pd.DataFrame(columns=['Site'] + FACT_COLUMNS)
+    long = wide.melt(id_vars=['Site', 'Month'], value_vars=measures, var_name='column', value_name='value')
+    long[['KPI', 'measure']] = long['column'].str.rsplit(MEASURE_SEPARATOR, n=1, expand=True)
+    facts = long.pivot_table(index=['Site', 'Month', 'KPI'], columns='measure', values='value',
+                             aggfunc='first', dropna=False).reset_index()
+    facts.columns.name = None
+    facts = facts.reindex(columns=[*facts.columns.drop('Units', errors='ignore'), 'Units'])
+    facts = facts.dropna(subset=['Actual', 'Budget'], how='all')
+    facts['Month'] = pd.to_datetime(facts['Month'])
+    facts['Period'] = facts['Month'].rank(method='dense').astype(np.int32) - 1
+    actual = facts['Actual'].astype('float64')
+    budget = facts['Budget'].astype('float64')
+    facts['Variance (£)'] = actual - budget
+    facts['Variance (%)'] = (actual - budget) / budget.where(budget != 0)
+    return facts[['Site'] + FACT_COLUMNS].sort_values(['Site', 'Period', 'KPI'], kind='stable').reset_index(drop=True)
+
+
+class VarianceIndex:
+    """
+    Period totals of actual, budget and variance per site and KPI, from cumulative sums
+    held as (groups, periods + 1) arrays. Rate KPIs (is_rate_kpi) hold sums weighted by
+    units produced, and their period figures are those sums over the period's units.
+
+    Months missing for a group add nothing to its totals and are not counted in 'Months'.
+    """
+
+    def __init__(self, facts, fiscal_year_start=FISCAL_YEAR_START):
+        site_codes, sites = pd.factorize(facts['Site'] if 'Site' in facts.columns else pd.Series('', index=facts.index))
+        kpi_codes, kpis = pd.factorize(facts['KPI'])
+        # Groups in order of first appearance, so KPIs keep the worksheet's order
+        keys, first, codes = np.unique(site_codes.astype(np.int64) * max(len(kpis), 1) + kpi_codes,
+                                       return_index=True, return_inverse=True)
+        order = np.argsort(first, kind='stable')
+        codes = np.argsort(order)[codes]
+        first = first[order]
+        self.site = np.asarray(sites, dtype=object).astype(str)[site_codes[first]]
+        self.kpi = np.asarray(kpis, dtype=object).astype(str)[kpi_codes[first]]
+
+        periods = facts['Period'].to_numpy(dtype=np.int64)
+        self.n_periods = int(periods.max()) + 1 if len(periods) else 0
+        shape = (len(keys), self.n_periods)
+        self.rate = np.array([is_rate_kpi(kpi) for kpi in self.kpi], dtype=bool)
+        actual, budget, months = np.zeros(shape), np.zeros(shape), np.zeros(shape, dtype=np.int64)
+        values = facts[['Actual', 'Budget']].to_numpy(dtype='float64', na_value=np.nan)
+        present = ~np.isnan(values).any(axis=1)
+        actual[codes[present], periods[present]] = values[present, 0]
+        budget[codes[present], periods[present]] = values[present, 1]
+        months[codes[present], periods[present]] = 1
+
+        # Weight of each month: its units for rate lines with units in every month, else 1
+        weights = months.astype('float64')
+        if self.rate.any() and 'Units' in facts.columns:
+            units = np.full(shape, np.nan)
+            units[codes[present], periods[present]] = facts['Units'].to_numpy(dtype='float64', na_value=np.nan)[present]
+            weighted = self.rate & np.where(months == 1, np.isfinite(units) & (units > 0), True).all(axis=1)
+            weights[weighted] = np.where(months[weighted] == 1, units[weighted], 0)
+        weights[~self.rate] = months[~self.rate]
+
+        zero = np.zeros((len(keys), 1))
+        self.cum_actual = np.hstack([zero, np.cumsum(np.where(self.rate[:, None], actual * weights, actual), axis=1)])
+        self.cum_budget = np.hstack([zero, np.cumsum(np.where(self.rate[:, None], budget * weights, budget), axis=1)])
+        self.cum_weights = np.hstack([zero, np.cumsum(weights, axis=1)])
+        self.cum_months = np.hstack([zero.astype(np.int64), np.cumsum(months, axis=1)])
+
+        # Month of each period; periods are consecutive months, so gaps follow from the nearest known one
+        month_values = np.full(self.n_periods, np.datetime64('NaT'), dtype='datetime64[ns]')
+        month_values[periods] = pd.to_datetime(facts['Month']).to_numpy(dtype='datetime64[ns]')
+        self.months = pd.Series(month_values)
+        known = np.flatnonzero(self.months.notna().to_numpy())
+        first_month = self.months.iloc[known[0]].month - known[0] if len(known) else 1
+        self.month_number = (first_month - 1 + np.arange(self.n_periods)) % 12 + 1
+        # Months into the financial year and quarter
+        self._into_year = (self.month_number - fiscal_year_start) % 12
+        self.by_kpi = {kpi: np.flatnonzero(self.kpi == kpi) for kpi in pd.unique(self.kpi)}
+
+    def kpis(self):
+        return list(self.by_kpi)
+
+    def sites(self):
+        return list(pd.unique(self.site))
+
+    def period_start(self, period_type, end):
+        """First period of the period ending at `end` (an int or an array of them)."""
+        end = np.asarray(end)
+        offset = {
+            'month': np.zeros_like(end),
+            'qtd': self._into_year[end] % 3,
+            'ytd': self._into_year[end],
+            'rolling_12': np.full_like(end, 11),
+        }[period_type]
+        return np.maximum(end - offset, 0)
+
+    def _groups(self, kpi=None, site=None):
+        rows = (np.arange(len(self.kpi)) if not kpi
+                else self.by_kpi.get(kpi, np.array([], dtype=np.int64)))
+        if site and site != ALL_SITES:
+            rows = rows[self.site[rows] == site]
+        return rows
+
+    def _figures(self, rows, starts, ends):
+        """(actual, budget) of groups `rows` over periods starts..ends: sums, or unit-weighted averages for rates."""
+        actual = self.cum_actual[rows][:, ends + 1] - self.cum_actual[rows][:, starts]
+        budget = self.cum_budget[rows][:, ends + 1] - self.cum_budget[rows][:, starts]
+        rate = self.rate[rows]
+        if rate.any():
+            weights = self.cum_weights[rows][:, ends + 1] - self.cum_weights[rows][:, starts]
+            weights = np.where(weights > 0, weights, np.nan)
+            actual = np.where(rate[:, None], actual / weights, actual)
+            budget = np.where(rate[:, None], budget / weights, budget)
+        return actual, budget
+
+    def basis(self, rows):
+        """TOTAL_BASIS or RATE_BASIS of each group."""
+        return np.where(self.rate[rows], RATE_BASIS, TOTAL_BASIS)
+
+    def totals(self, start, end, kpi=None, site=None):
+        """
+        Actual, budget and variance of every site and KPI (or one) over periods start..end.
+
+        Returns:
+            pd.DataFrame: VIEW_COLUMNS, one row per site and KPI.
+        """
+        rows = self._groups(kpi, site)
+        if not self.n_periods:
+            return pd.DataFrame(columns=VIEW_COLUMNS)
+        end = min(max(int(end), 0), self.n_periods - 1)
+        start = min(max(int(start), 0), end)
+        actual, budget = (values[:, 0] for values in self._figures(rows, np.array([start]), np.array([end])))
+        return pd.DataFrame({
+            'Site': self.site[rows],
+            'KPI': self.kpi[rows],
+            'Basis': self.basis(rows),
+            'From': self.months.iloc[start],
+            'To': self.months.iloc[end],
+            'Months': self.cum_months[rows, end + 1] - self.cum_months[rows, start],
+            'Actual': actual,
+            'Budget': budget,
+            'Variance (£)': actual - budget,
+            'Variance (%)': np.where(budget != 0, (actual - budget) / np.where(budget != 0, budget, 1), np.nan),
+        }, columns=VIEW_COLUMNS)
+
+    def period_view(self, period_type, end=None, kpi=None, site=None):
+        """Totals of the period of one type ending at `end` (the latest period when None)."""
+        end = self.n_periods - 1 if end is None else min(max(int(end), 0), self.n_periods - 1)
+        return self.totals(self.period_start(period_type, max(end, 0)), end, kpi, site)
+
+    def trend(self, period_type, kpi=None, site=None):
+        """
+        Variance of the period of one type ending at every period, per site and KPI.
+
+        Returns:
+            pd.DataFrame: TREND_COLUMNS in long format.
+        """
+        rows = self._groups(kpi, site)
+        ends = np.arange(self.n_periods)
+        starts = self.period_start(period_type, ends)
+        actual, budget = self._figures(rows, starts, ends)
+        variance = actual - budget
+        return pd.DataFrame({
+            'Period': np.tile(ends, len(rows)),
+            'Month': np.tile(self.months.to_numpy(), len(rows)),
+            'Site': np.repeat(self.site[rows], self.n_periods),
+            'KPI': np.repeat(self.kpi[rows], self.n_periods),
+            'Basis': np.repeat(self.basis(rows), self.n_periods),
+            'Actual': actual.ravel(),
+            'Budget': budget.ravel(),
+            'Variance (£)': variance.ravel(),
+            'Variance (%)': np.where(budget != 0, variance / np.where(budget != 0, budget, 1), np.nan).ravel(),
+        })
+
+
+def period_variance(facts, period_type='ytd', end=None, kpi=None):
+    """Totals of one period type ending at `end` for a variance facts frame (see VarianceIndex)."""
+    if facts is None or facts.empty or period_type not in PERIOD_TYPES:
+        return pd.DataFrame(columns=VIEW_COLUMNS)
+    return VarianceIndex(facts).period_view(period_type, end, kpi)
+
+
+def variance_trend(facts, period_type='ytd', kpi=None):
+    """VarianceIndex.trend of a variance facts frame, for one KPI (the first when None)."""
+    if facts is None or facts.empty or period_type not in PERIOD_TYPES:
+        return pd.DataFrame(columns=TREND_COLUMNS)
+    index = VarianceIndex(facts)
+    return index.trend(period_type, kpi if kpi in index.by_kpi else index.kpis()[0])
+
+
+if __name__ == "__main__":
+    import time
+    from data_processor import load_and_process_mfg_cost_data
+
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 20)
+    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    sections = load_and_process_mfg_cost_data(os.path.join(data_dir, 'Manufacturing_Cost_per_Unit_Calculator.csv'))
+    facts = build_variance_facts(sections)
+    print("Variance facts:\n", facts.to_string())
+    index = VarianceIndex(facts)
+    for period_type, label in PERIOD_TYPES.items():
+        print(f"\n{label}, as of the latest month:\n", index.period_view(period_type).to_string())
+
+    # Ten years of monthly variance for 50 sites and 20 cost lines
+    rng = np.random.default_rng(0)
+    sites, kpis, months = 50, 20, 120
+    n = sites * kpis * months
+    budget = rng.uniform(10, 100, size=n)
+    facts = pd.DataFrame({
+        'Site': np.repeat([f"Site {i}" for i in range(sites)], kpis * months),
+        'Period': np.tile(np.arange(months), sites * kpis).astype(np.int32),
+        'Month': np.tile(pd.date_range('2015-01-01', periods=months, freq='MS'), sites * kpis),
+        'KPI': np.tile(np.repeat([f"Cost Line {i}" for i in range(kpis)], months), sites),
+        'Actual': budget * rng.uniform(0.9, 1.1, size=n),
+        'Budget': budget,
+    })
+    started = time.perf_counter()
+    index = VarianceIndex(facts)
+    print(f"\nIndexed {n:,} facts in {(time.perf_counter() - started) * 1000:.1f} ms")
+    started = time.perf_counter()
+    for end in range(months):
+        index.period_view('ytd', end)
+    print(f"{months} year-to-date views of {sites * kpis:,} site/cost lines: "
+          f"{(time.perf_counter() - started) * 1000 / months:.2f} ms each")
+    started = time.perf_counter()
+    trend = index.trend('rolling_12', 'Cost Line 0')
+    print(f"Rolling 12 month trend of one cost line at every month ({len(trend):,} rows): "
+          f"{(time.perf_counter() - started) * 1000:.2f} ms")
@@ -0,0 +1,65 @@
+# src/dashboards/admin_dashboard.py
+
+import dash
+from dash import dcc, html, Input, Output
+import pandas as pd
+import dash_bootstrap_components as dbc
+
+from utils.instrumentation import METRICS
+
+# Hash that reveals the admin tab, e.g. http://host:8050/#admin
+ADMIN_HASH = '#admin'
+
+# --- Admin Layout Function ---
+def create_admin_layout():
+    return html.Div([
+        dcc.Location(id='admin-location'),
+        dcc.Interval(id='admin-metrics-interval', interval=5000, disabled=True),
+        html.H3("Callback Performance", className="text-center my-4"),
+        html.P("Latency percentiles over the last 1,024 calls of each callback, and per-call averages of "
+               "phase time and payload size. The same data is served at /metrics for Prometheus.",
+               className="text-center text-muted mb-4"),
+        html.Div(id='admin-metrics-table-container')
+    ], className="p-4")
+
+# --- Admin Callbacks ---
+def register_admin_callbacks(app):
+    # The admin tab has no visible tab header; opening the dashboard at #admin selects it
+    @app.callback(
+        Output('tabs-main', 'active_tab'),
+        [Input('admin-location', 'hash')]
+    )
+    def open_admin_tab(url_hash):
+        if url_hash != ADMIN_HASH:
+            return dash.no_update
+        return 'tab-admin'
+
+    # Only poll the metrics while the admin tab is showing
+    @app.callback(
+        Output('admin-metrics-interval', 'disabled'),
+        [Input('tabs-main', 'active_tab')]
+    )
+    def toggle_admin_polling(active_tab):
+        return active_tab != 'tab-admin'
+
+    @app.callback(
+        Output('admin-metrics-table-container', 'children'),
+        [Input('admin-metrics-interval', 'n_intervals'),
+         Input('tabs-main', 'active_tab')]
+    )
+    def update_admin_metrics_table(n_intervals, active_tab):
+        if active_tab != 'tab-admin':
+            return dash.no_update
+
+        rows = METRICS.snapshot()
+        if not rows:
+            return html.Div("No callbacks recorded yet.")
+
+        df_display = pd.DataFrame(rows)
+        for col in df_display.columns:
+            if col.endswith('(ms)'):
+                df_display[col] = df_display[col].apply(lambda x: f"{x:,.1f}")
+            elif col.endswith('(bytes)'):
+                df_display[col] = df_display[col].apply(lambda x: f"{x:,.0f}")
+
+        return dbc.Table.from_dataframe(df_display, striped=True, bordered=True, hover=True, size="sm", className="mt-2")
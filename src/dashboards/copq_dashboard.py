@@ -1,14 +1,26 @@
 # src/dashboards/copq_dashboard.py
 
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State
+from plotly.subplots import make_subplots
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import dash_bootstrap_components as dbc
 
 # Import generic UI components
-from utils.ui_components import create_kpi_card, create_filter_card
+from utils.ui_components import create_kpi_card, create_filter_card, decode_store
+from utils.instrumentation import timed_phase
+from utils.figure_deltas import trend_figure_update
+from pareto import (
+    ParetoIndex, get_pareto_index, split_defect_family, DEFAULT_TOP_N, VITAL_FEW_SHARE, OTHER_LABEL,
+)
+
+def month_options(months):
+    """Month filter options; the value is iso format to ensure consistent date parsing in callbacks."""
+    months = pd.to_datetime(pd.Series(months)).dropna()
+    label_format = '%B' if months.dt.year.nunique() <= 1 else '%b %Y'
+    return [{'label': month.strftime(label_format), 'value': month.strftime('%Y-%m-01')} for month in months]
 
 # --- COPQ Layout Function ---
 def create_copq_layout(copq_kpis, copq_augmented_data):
@@ -32,42 +44,178 @@ def create_copq_layout(copq_kpis, copq_augmented_data):
                     html.Label("Select Month for Trend:"),
                     dcc.Dropdown(
                         id='copq-month-filter',
-                        # Use iso format for value to ensure consistent date parsing in callback
-                        options=[{'label': month.strftime('%B'), 'value': month.strftime('%Y-%m-01')} 
-                                 for month in copq_augmented_data['monthly_copq_tracking']['Month']] if copq_augmented_data and copq_augmented_data['monthly_copq_tracking'] is not None else [],
+                        options=month_options(copq_augmented_data['monthly_copq_tracking']['Month']) if copq_augmented_data and copq_augmented_data['monthly_copq_tracking'] is not None else [],
                         value=None, # Default to None to show full trend initially
                         placeholder="All Months (Full Trend)",
                         multi=False
                     ),
                 ], md=6),
                 dbc.Col([
-                    html.Label("Select Defect Type for Table:"),
+                    html.Label("Drill Down to Defect Family / Type:"),
                     dcc.Dropdown(
                         id='copq-defect-type-filter',
-                        options=[{'label': dt, 'value': dt} 
-                                 for dt in (copq_augmented_data['defect_categories']['Defect Type'].unique() if copq_augmented_data and copq_augmented_data['defect_categories'] is not None else [])],
+                        # Families (or defect types, if the codes have no family prefix), largest cost first
+                        options=[{'label': 'All Defects', 'value': 'Total'}] +
+                                [{'label': label, 'value': label}
+                                 for label in (ParetoIndex(copq_augmented_data['defect_categories']).top_level() if copq_augmented_data and copq_augmented_data['defect_categories'] is not None else [])],
                         value='Total', # Default to Total to show all data initially
+                        clearable=False,
                         multi=False
                     ),
                 ], md=6),
-            ])
+            ]),
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Rank Defects By:"),
+                    dcc.RadioItems(
+                        id='copq-pareto-metric',
+                        options=[{'label': ' Associated Cost', 'value': 'cost'},
+                                 {'label': ' Occurrences', 'value': 'occurrences'}],
+                        value='cost',
+                        inline=True,
+                        inputStyle={'margin-left': '12px'}
+                    ),
+                ], md=6),
+                dbc.Col([
+                    html.Label("Show Top N (rest grouped as 'Other'):"),
+                    dcc.Input(id='copq-pareto-top-n', type='number', min=1, step=1, value=DEFAULT_TOP_N, debounce=True),
+                ], md=6),
+            ], className="mt-2")
         ]),
         
         # COPQ Visualizations
         dbc.Row([
             dbc.Col(dcc.Graph(id='copq-cost-breakdown-chart'), md=6),
-            dbc.Col(dcc.Graph(id='copq-monthly-trend-chart'), md=6),
+            dbc.Col([
+                dcc.Graph(id='copq-monthly-trend-chart'),
+                dcc.Store(id='copq-monthly-trend-chart-rendered'), # What the chart shows, for delta updates
+            ], md=6),
         ], className="mb-4"),
         dbc.Row([
-            dbc.Col(html.H4("Defect Categories Breakdown", className="mt-4 text-center"), width=12),
+            dbc.Col(html.H4("Defect Categories Pareto", className="mt-4 text-center"), width=12),
             dbc.Col(html.Div(id='copq-defect-table-container'), width=12) 
         ]),
-        dbc.Row([ # New Row for Defect Type Associated Cost Chart
-            dbc.Col(html.H4("Associated Cost by Selected Defect Type", className="mt-4 text-center"), width=12),
-            dbc.Col(dcc.Graph(id='copq-defect-type-cost-chart'), md=12), # New Chart for Defect Type cost
+        dbc.Row([ # Pareto chart; clicking a family's bar drills down into its defect types
+            dbc.Col(html.H4("Defect Pareto Chart", className="mt-4 text-center"), width=12),
+            dbc.Col(dcc.Graph(id='copq-defect-type-cost-chart'), md=12),
         ])
     ], className="p-4")
 
+# --- COPQ Filters and Figure Builders ---
+# Shared by the callbacks below and by the export routes, so a download always matches
+# what the dashboard shows for the same control values.
+
+@timed_phase('filter')
+def filter_copq_monthly(df, selected_month_iso):
+    """Rows of the monthly COPQ table for the selected month (all rows if none selected)."""
+    if not selected_month_iso:
+        return df.copy()
+    selected_month_dt = pd.to_datetime(selected_month_iso)
+    return df[
+        (df['Month'].dt.year == selected_month_dt.year) &
+        (df['Month'].dt.month == selected_month_dt.month)
+    ]
+
+@timed_phase('filter')
+def filter_defect_categories(df, selected_defect_type):
+    """Defect category rows for the selected defect family or type ('Total' keeps every row)."""
+    if selected_defect_type and selected_defect_type != 'Total':
+        families = split_defect_family(df['Defect Type']).to_numpy()
+        return df[(df['Defect Type'] == selected_defect_type).to_numpy() | (families == selected_defect_type)]
+    return df.copy()
+
+@timed_phase('figure')
+def build_copq_breakdown_figure(df):
+    df_filtered = df[df['Category'].astype(str).str.strip().str.lower() != 'total']
+
+    fig = px.bar(
+        df_filtered,
+        x='Category',
+        y='Cost (£)',
+        title='COPQ Cost Breakdown',
+        color='Category',
+        color_discrete_map={
+            'Scrap': '#EF4444', # red-500
+            'Rework': '#F97316', # orange-500
+            'Warranty': '#F59E0B' # amber-500
+        },
+        labels={'Cost (£)': 'Cost (£)', 'Category': 'COPQ Category'},
+        height=400
+    )
+    fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
+    return fig
+
+@timed_phase('figure')
+def build_copq_monthly_trend_figure(df, selected_month_iso):
+    filtered_df = filter_copq_monthly(df, selected_month_iso)
+
+    if selected_month_iso: # If a month is selected (value is YYYY-MM-DD string)
+        selected_month_dt = pd.to_datetime(selected_month_iso)
+        title = f"COPQ for {selected_month_dt.strftime('%B %Y')}"
+        
+        # Use px.bar for a single month
+        fig = px.bar(
+            filtered_df,
+            x='Month',
+            y='COPQ (£)',
+            title=title,
+            labels={'COPQ (£)': 'COPQ (£)', 'Month': 'Month'},
+            height=400
+        )
+    else: # No month selected, show full trend
+        title = "Monthly COPQ Trend"
+        # Use px.line for trend over time, KEEP markers=True
+        fig = px.line(
+            filtered_df,
+            x='Month',
+            y='COPQ (£)',
+            title=title,
+            labels={'COPQ (£)': 'COPQ (£)', 'Month': 'Month'},
+            markers=True,
+            height=400
+        )
+        
+    if filtered_df.empty:
+        return go.Figure().update_layout(title="No data for selected filter.")
+
+    fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
+    fig.update_xaxes(dtick="M1", tickformat="%b\n%Y") # Format x-axis for monthly display
+    return fig
+
+def _drill_down_level(selected_defect_type):
+    """The ParetoIndex family argument for the drill-down dropdown's value."""
+    return None if not selected_defect_type or selected_defect_type == 'Total' else selected_defect_type
+
+@timed_phase('figure')
+def build_defect_pareto_figure(pareto_table, metric, title_suffix):
+    """Bars of each defect (or family) in descending order, with the cumulative share on a second axis."""
+    value_label = 'Cost (£)' if metric == 'cost' else 'Occurrences'
+    fig = make_subplots(specs=[[{'secondary_y': True}]])
+    fig.add_trace(go.Bar(
+        x=pareto_table['Defect'], y=pareto_table['Value'], name=value_label,
+        marker_color=['#9CA3AF' if str(label).startswith(OTHER_LABEL) else '#EF4444' for label in pareto_table['Defect']],
+    ), secondary_y=False)
+    fig.add_trace(go.Scatter(
+        x=pareto_table['Defect'], y=pareto_table['Cumulative Share'] * 100, name='Cumulative %',
+        mode='lines+markers', line={'color': '#1F2937'},
+    ), secondary_y=True)
+    fig.add_hline(y=VITAL_FEW_SHARE * 100, line_dash='dot', line_color='gray', secondary_y=True)
+    fig.update_layout(title=f"Defect Pareto: {title_suffix}", height=450, showlegend=False,
+                      margin={"r":0,"t":40,"l":0,"b":0})
+    fig.update_yaxes(title_text=value_label, secondary_y=False)
+    fig.update_yaxes(title_text='Cumulative %', range=[0, 105], secondary_y=True)
+    fig.update_xaxes(type='category')
+    return fig
+
+def build_defect_type_cost_figure(df, selected_defect_type, metric='cost', top_n=DEFAULT_TOP_N):
+    """Pareto chart straight from a defect_categories frame (used by the exports)."""
+    index = ParetoIndex(df)
+    family = _drill_down_level(selected_defect_type)
+    pareto_table = index.pareto(metric, family, top_n)
+    if pareto_table.empty:
+        return go.Figure().update_layout(title="No data for selected defect type.")
+    return build_defect_pareto_figure(pareto_table, metric, family or "All Defects")
+
 # --- COPQ Callbacks ---
 
 def register_copq_callbacks(app):
@@ -80,147 +228,128 @@ def register_copq_callbacks(app):
         if jsonified_data is None:
             return {}
         
-        df = pd.read_json(jsonified_data, orient='records')
+        df = decode_store(jsonified_data, 'records')
         if df.empty:
             return {}
 
-        df_filtered = df[df['Category'].astype(str).str.strip().str.lower() != 'total']
+        return build_copq_breakdown_figure(df)
 
-        fig = px.bar(
-            df_filtered,
-            x='Category',
-            y='Cost (£)',
-            title='COPQ Cost Breakdown',
-            color='Category',
-            color_discrete_map={
-                'Scrap': '#EF4444', # red-500
-                'Rework': '#F97316', # orange-500
-                'Warranty': '#F59E0B' # amber-500
-            },
-            labels={'Cost (£)': 'Cost (£)', 'Category': 'COPQ Category'},
-            height=400
-        )
-        fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
-        return fig
+    # Month options follow the store as pushed data adds months (the layout has the
+    # options as of page load)
+    @app.callback(
+        Output('copq-month-filter', 'options'),
+        [Input('stored-copq-data', 'data')],
+        prevent_initial_call=True
+    )
+    def update_copq_month_options(jsonified_data):
+        if jsonified_data is None:
+            return []
+        df = decode_store(jsonified_data, 'records')
+        return month_options(df['Month']) if 'Month' in df.columns else []
 
-    # Callback for COPQ Monthly Trend Chart (now reacts to month filter)
+    # Callback for COPQ Monthly Trend Chart (now reacts to month filter). When new data only
+    # revises the latest month or adds months, only those points are sent (a Patch).
     @app.callback(
-        Output('copq-monthly-trend-chart', 'figure'),
+        [Output('copq-monthly-trend-chart', 'figure'),
+         Output('copq-monthly-trend-chart-rendered', 'data')],
         [Input('stored-copq-data', 'data'),
-         Input('copq-month-filter', 'value')] # Month filter input
+         Input('copq-month-filter', 'value')], # Month filter input
+        [State('copq-monthly-trend-chart-rendered', 'data')]
     )
-    def update_copq_monthly_trend_chart(jsonified_data, selected_month_iso):
+    def update_copq_monthly_trend_chart(jsonified_data, selected_month_iso, rendered):
         if jsonified_data is None:
-            return {}
+            return {}, None
         
-        df = pd.read_json(jsonified_data, orient='records')
-        df['Month'] = pd.to_datetime(df['Month']) # Ensure Month is datetime
+        df = decode_store(jsonified_data, 'records')
 
         if df.empty:
-            return {}
-        
-        filtered_df = df.copy()
-        
-        if selected_month_iso: # If a month is selected (value is YYYY-MM-DD string)
-            selected_month_dt = pd.to_datetime(selected_month_iso)
-            # Filter by year and month
-            filtered_df = df[
-                (df['Month'].dt.year == selected_month_dt.year) &
-                (df['Month'].dt.month == selected_month_dt.month)
-            ]
-            title = f"COPQ for {selected_month_dt.strftime('%B %Y')}"
-            
-            # Use px.bar for a single month
-            fig = px.bar(
-                filtered_df,
-                x='Month',
-                y='COPQ (£)',
-                title=title,
-                labels={'COPQ (£)': 'COPQ (£)', 'Month': 'Month'},
-                height=400
-            )
-        else: # No month selected, show full trend
-            title = "Monthly COPQ Trend"
-            # Use px.line for trend over time, KEEP markers=True
-            fig = px.line(
-                filtered_df,
-                x='Month',
-                y='COPQ (£)',
-                title=title,
-                labels={'COPQ (£)': 'COPQ (£)', 'Month': 'Month'},
-                markers=True,
-                height=400
-            )
-            
+            return {}, None
+
+        df['Month'] = pd.to_datetime(df['Month']) # Ensure Month is datetime
+        filtered_df = filter_copq_monthly(df, selected_month_iso).sort_values('Month', kind='stable')
         if filtered_df.empty:
-            return go.Figure().update_layout(title="No data for selected filter.")
+            return build_copq_monthly_trend_figure(filtered_df, selected_month_iso), None
 
-        fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
-        fig.update_xaxes(dtick="M1", tickformat="%b\n%Y") # Format x-axis for monthly display
-        return fig
+        return trend_figure_update(
+            rendered, filtered_df, 'Month', ['COPQ (£)'], key=[selected_month_iso],
+            build_figure=lambda d: build_copq_monthly_trend_figure(d, selected_month_iso)
+        )
 
-    # Callback for COPQ Defect Categories Breakdown Table
+    # Callback for the defect Pareto table: top N defects (or families) and an 'Other' bucket
     @app.callback(
         Output('copq-defect-table-container', 'children'), # Output to the Div, not direct table
         [Input('stored-copq-defect-data', 'data'),
-         Input('copq-defect-type-filter', 'value')]
+         Input('copq-defect-type-filter', 'value'),
+         Input('copq-pareto-metric', 'value'),
+         Input('copq-pareto-top-n', 'value')]
     )
-    def update_copq_defect_table(jsonified_data, selected_defect_type):
+    def update_copq_defect_table(jsonified_data, selected_defect_type, metric, top_n):
         if jsonified_data is None:
             return html.Div("No Defect Categories Data Available.")
         
-        df = pd.read_json(jsonified_data, orient='records')
-        if df.empty:
+        index = get_pareto_index(jsonified_data)
+        if not len(index.codes):
             return html.Div("No Defect Categories Data Available.")
         
-        filtered_df = df.copy()
-        if selected_defect_type and selected_defect_type != 'Total':
-            filtered_df = df[df['Defect Type'] == selected_defect_type]
+        family = _drill_down_level(selected_defect_type)
+        pareto_table = index.pareto(metric, family, top_n)
 
-        if filtered_df.empty:
+        if pareto_table.empty:
             return html.Div(f"No data for selected defect type: {selected_defect_type}.")
 
-        df_display = filtered_df.copy()
-        if '% of Total Defects' in df_display.columns:
-            df_display['% of Total Defects'] = df_display['% of Total Defects'].apply(lambda x: f"{x * 100:.2f}%" if pd.notna(x) else "N/A")
-        df_display['Associated Cost (£)'] = df_display['Associated Cost (£)'].apply(lambda x: f"£{x:,.2f}" if pd.notna(x) else "N/A")
+        df_display = pareto_table.copy()
+        value_column = 'Associated Cost (£)' if metric == 'cost' else 'Number of Occurrences'
+        df_display[value_column] = df_display.pop('Value').apply(
+            lambda x: f"£{x:,.2f}" if metric == 'cost' else f"{x:,.0f}")
+        for col in ('Share', 'Cumulative Share'):
+            df_display[col] = df_display[col].apply(lambda x: f"{x * 100:.2f}%")
+        if family is not None or not index.has_hierarchy:
+            df_display = df_display.drop(columns='Items')
+        else:
+            df_display = df_display.rename(columns={'Items': 'Defect Types'})
+        df_display = df_display[[c for c in df_display.columns if c not in ('Share', 'Cumulative Share')] + ['Share', 'Cumulative Share']]
+
+        vital_few = index.vital_few(metric, family)
+        level_size = len(index.top_level(metric)) if family is None else int(pareto_table['Items'].sum())
+        summary = html.P(f"{vital_few:,} of {level_size:,} account for {VITAL_FEW_SHARE:.0%} of "
+                         f"{'cost' if metric == 'cost' else 'occurrences'}.", className="text-muted mb-1")
 
-        return dbc.Table.from_dataframe(df_display, striped=True, bordered=True, hover=True, className="mt-2")
+        return html.Div([summary, dbc.Table.from_dataframe(df_display, striped=True, bordered=True, hover=True, className="mt-2")])
 
-    # NEW Callback for COPQ Defect Type Associated Cost Chart
+    # Callback for the defect Pareto chart
     @app.callback(
         Output('copq-defect-type-cost-chart', 'figure'),
         [Input('stored-copq-defect-data', 'data'),
-         Input('copq-defect-type-filter', 'value')]
+         Input('copq-defect-type-filter', 'value'),
+         Input('copq-pareto-metric', 'value'),
+         Input('copq-pareto-top-n', 'value')]
     )
-    def update_copq_defect_type_cost_chart(jsonified_data, selected_defect_type):
+    def update_copq_defect_type_cost_chart(jsonified_data, selected_defect_type, metric, top_n):
         if jsonified_data is None:
             return {}
 
-        df = pd.read_json(jsonified_data, orient='records')
-        if df.empty:
+        index = get_pareto_index(jsonified_data)
+        if not len(index.codes):
             return {}
 
-        if selected_defect_type == 'Total':
-            df_plot = df[df['Defect Type'] != 'Total']
-            title_suffix = "All Defect Types"
-        else:
-            df_plot = df[df['Defect Type'] == selected_defect_type]
-            title_suffix = f"'{selected_defect_type}'"
-        
-        if df_plot.empty:
+        family = _drill_down_level(selected_defect_type)
+        pareto_table = index.pareto(metric, family, top_n)
+        if pareto_table.empty:
             return go.Figure().update_layout(title="No data for selected defect type.")
+        return build_defect_pareto_figure(pareto_table, metric, family or "All Defects")
 
-        fig = px.bar(
-            df_plot,
-            x='Defect Type',
-            y='Associated Cost (£)',
-            title=f'Associated Cost for {title_suffix}',
-            labels={'Associated Cost (£)': 'Cost (£)', 'Defect Type': 'Defect Type'},
-            color='Defect Type',
-            height=400
-        )
-        fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
-        return fig
-
-       
\ No newline at end of file
+    # Clicking a family's bar at the top level drills down into that family
+    @app.callback(
+        Output('copq-defect-type-filter', 'value'),
+        [Input('copq-defect-type-cost-chart', 'clickData')],
+        [State('copq-defect-type-filter', 'value'),
+         State('stored-copq-defect-data', 'data')]
+    )
+    def drill_down_on_click(click_data, selected_defect_type, jsonified_data):
+        if not click_data or jsonified_data is None or _drill_down_level(selected_defect_type) is not None:
+            return dash.no_update
+        label = click_data['points'][0].get('x')
+        index = get_pareto_index(jsonified_data)
+        if not index.has_hierarchy or label not in set(index.family_names):
+            return dash.no_update
+        return label
@@ -1,17 +1,73 @@
 # src/dashboards/mfg_cost_dashboard.py
 
+import collections
+import threading
+
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
 import dash_bootstrap_components as dbc
 
 # Import generic UI components
-from utils.ui_components import create_kpi_card, create_filter_card
+from utils.ui_components import create_kpi_card, create_filter_card, decode_store
+from utils.instrumentation import count_cache, timed_phase
+from what_if import mfg_cost_baseline, copq_baseline, run_what_if, DEFAULT_SCENARIOS
+from cost_attribution import ALL_CATEGORIES, COST_CATEGORIES, EFFECTS, summarise_attribution
+from initiatives import ALL_STATUSES, InitiativeIndex
+from cost_variance import PERIOD_TYPES, MONTHLY_SECTION, VarianceIndex, facts_from_monthly, is_rate_kpi
+
+# What-if drivers: (control id suffix, label, what_if parameter)
+WHAT_IF_DRIVERS = [
+    ('material-yield', "Material Yield Change (%)", 'material_yield'),
+    ('labor-efficiency', "Labor Efficiency Change (%)", 'labor_efficiency'),
+    ('overhead', "Overhead Change (%)", 'overhead'),
+    ('defect-rate', "Defect Rate Change (%)", 'defect_rate'),
+    ('scrap', "Scrap Change (%)", 'scrap'),
+]
+
+def _period_labels(months):
+    """Month names of consecutive periods, numbered when the names repeat across years."""
+    names = pd.Series(pd.to_datetime(months)).dt.strftime('%B').fillna('')
+    if not names.duplicated().any():
+        return names.tolist()
+    return [f"{name} (month {period + 1})" for period, name in enumerate(names)]
+
+def _variance_filter_options(augmented):
+    """Cost line and 'as of' month options from the cost variance facts."""
+    facts = (augmented or {}).get('cost_variance_facts')
+    if facts is None or facts.empty:
+        return [], None, [], None
+    kpis = [str(kpi) for kpi in pd.unique(facts['KPI'])]
+    months = facts.drop_duplicates('Period').set_index('Period')['Month'].sort_index()
+    periods = [{'label': label, 'value': int(period)} for period, label in zip(months.index, _period_labels(months))]
+    return [{'label': kpi, 'value': kpi} for kpi in kpis], kpis[0], periods, periods[-1]['value']
+
+def _initiative_filter_options(*augmented):
+    """Status and 'as of' month options from the initiative tracking frames of each worksheet."""
+    trackings = [data.get('initiative_tracking') for data in augmented if data]
+    trackings = [df for df in trackings if df is not None and not df.empty]
+    if not trackings:
+        return [{'label': ALL_STATUSES, 'value': ALL_STATUSES}], [], None
+    statuses = sorted(set().union(*(df['Status'].unique() for df in trackings)))
+    longest = max(trackings, key=lambda df: df['Period'].max())
+    months = longest.drop_duplicates('Period').set_index('Period')['Month'].sort_index()
+    names = pd.to_datetime(months).dt.strftime('%B')
+    repeated = names.duplicated().any()
+    periods = [{'label': f"{name} (month {period + 1})" if repeated else name, 'value': int(period)}
+               for period, name in names.items()]
+    return ([{'label': status, 'value': status} for status in [ALL_STATUSES] + statuses],
+            periods, periods[-1]['value'])
 
 # --- Manufacturing Cost Layout Function ---
-def create_mfg_cost_layout(mfg_cost_kpis, mfg_cost_augmented_data):
+def create_mfg_cost_layout(mfg_cost_kpis, mfg_cost_augmented_data, copq_augmented_data=None):
+    status_options, period_options, latest_period = _initiative_filter_options(copq_augmented_data, mfg_cost_augmented_data)
+    kpi_options, headline_kpi, variance_periods, latest_variance_period = _variance_filter_options(mfg_cost_augmented_data)
+    # The variance cards follow the headline cost line: a per-unit line is averaged over
+    # the year (unit-weighted), an amount is totalled
+    per_unit = headline_kpi is not None and is_rate_kpi(headline_kpi)
     return html.Div([
         html.H3("Manufacturing Cost per Unit Overview", className="text-center my-4"),
         html.P("Track the efficiency of material usage, labor, and overhead to understand and optimize the total cost of production per unit.", className="text-center text-muted"),
@@ -21,7 +77,10 @@ def create_mfg_cost_layout(mfg_cost_kpis, mfg_cost_augmented_data):
             dbc.Col(create_kpi_card("Avg Total Cost/Unit", mfg_cost_kpis.get('Average Total Cost per Unit (£)'), unit="£"), md=4),
             dbc.Col(create_kpi_card("Avg Labor Efficiency", mfg_cost_kpis.get('Average Labor Efficiency (%)'), is_percentage=True), md=4),
             dbc.Col(create_kpi_card("Avg Material Yield", mfg_cost_kpis.get('Average Material Yield (%)'), is_percentage=True), md=4),
-            dbc.Col(create_kpi_card("Latest Cost Variance", mfg_cost_kpis.get('Latest Cost Variance (£)'), unit="£"), md=4),
+            dbc.Col(create_kpi_card("Latest Cost Variance (£/unit)" if per_unit else "Latest Cost Variance (£)",
+                                    mfg_cost_kpis.get('Latest Cost Variance (£)'), unit="£"), md=4),
+            dbc.Col(create_kpi_card("YTD Cost Variance (avg £/unit)" if per_unit else "YTD Cost Variance (total £)",
+                                    mfg_cost_kpis.get('YTD Cost Variance (£)'), unit="£"), md=4),
         ], className="mb-4 justify-content-center"),
 
         # Filters for Manufacturing Cost
@@ -58,12 +117,317 @@ def create_mfg_cost_layout(mfg_cost_kpis, mfg_cost_augmented_data):
         dbc.Row([
             dbc.Col(html.H4("Cost Variance Analysis", className="mt-4 text-center"), width=12),
             dbc.Col(html.Div(id='mfg-cost-variance-table-container'), width=12) 
-        ])
+        ]),
+
+        # Actual against budget over a period (month, quarter/year to date, rolling 12 months) per site
+        html.H4("Variance over Period", className="mt-5 text-center"),
+        html.P("Actual against budget for each cost line, summed over the period ending in the selected month, "
+               "for every site.", className="text-center text-muted"),
+        create_filter_card([
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Period:"),
+                    dcc.Dropdown(id='cost-variance-period-type',
+                                 options=[{'label': label, 'value': value} for value, label in PERIOD_TYPES.items()],
+                                 value='ytd', clearable=False, multi=False)
+                ], md=4),
+                dbc.Col([
+                    html.Label("Cost Line:"),
+                    dcc.Dropdown(id='cost-variance-kpi', options=kpi_options, value=headline_kpi,
+                                 clearable=False, multi=False)
+                ], md=4),
+                dbc.Col([
+                    html.Label("As Of:"),
+                    dcc.Dropdown(id='cost-variance-as-of', options=variance_periods, value=latest_variance_period,
+                                 clearable=False, multi=False)
+                ], md=4),
+            ])
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='cost-variance-period-chart'), md=7),
+            dbc.Col(html.Div(id='cost-variance-period-table-container'), md=5),
+        ], className="mb-4"),
+
+        # Volume/rate/mix attribution of the selected month's change in cost per unit
+        html.H4("Cost per Unit Change Attribution", className="mt-5 text-center"),
+        html.P("The selected month's change in cost per unit against the month before, split into volume, rate "
+               "and mix effects. Click a category (or pick one) to drill down to its line items.",
+               className="text-center text-muted"),
+        create_filter_card([
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Drill Down:"),
+                    dcc.Dropdown(
+                        id='mfg-cost-attribution-category',
+                        options=[{'label': category, 'value': category}
+                                 for category in [ALL_CATEGORIES] + list(COST_CATEGORIES.values())],
+                        value=ALL_CATEGORIES,
+                        clearable=False,
+                        multi=False
+                    )
+                ], md=6),
+            ])
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='mfg-cost-attribution-chart'), md=7),
+            dbc.Col(html.Div(id='mfg-cost-attribution-table-container'), md=5),
+        ], className="mb-4"),
+
+        # Quality improvement and cost reduction initiatives: realised savings against cost
+        html.H4("Improvement Initiatives", className="mt-5 text-center"),
+        html.P("Savings realised by the quality improvement and cost reduction initiatives since they went live, "
+               "measured against unit costs before the first one, with ROI and payback as of the selected month.",
+               className="text-center text-muted"),
+        create_filter_card([
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Status:"),
+                    dcc.Dropdown(id='initiative-status-filter', options=status_options, value=ALL_STATUSES,
+                                 clearable=False, multi=False)
+                ], md=6),
+                dbc.Col([
+                    html.Label("As Of:"),
+                    dcc.Dropdown(id='initiative-period-filter', options=period_options, value=latest_period,
+                                 clearable=False, multi=False)
+                ], md=6),
+            ])
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='initiative-roi-chart'), md=6),
+            dbc.Col(html.Div(id='initiative-table-container'), md=6),
+        ], className="mb-4"),
+
+        # What-if simulation: Monte Carlo around the planner's driver changes
+        html.H4("What-If Simulation", className="mt-5 text-center"),
+        html.P("Change the drivers by a percentage and run thousands of scenarios around them to see cost per unit "
+               "and COPQ with their 5th-95th percentile range.", className="text-center text-muted"),
+        create_filter_card([
+            dbc.Row([
+                dbc.Col([
+                    html.Label(label),
+                    dcc.Input(id=f'whatif-{suffix}', type='number', value=0, step=0.5, className="form-control"),
+                ], md=2)
+                for suffix, label, _ in WHAT_IF_DRIVERS
+            ] + [
+                dbc.Col([
+                    html.Label("Uncertainty (± % s.d.)"),
+                    dcc.Input(id='whatif-uncertainty', type='number', value=2, min=0, step=0.5, className="form-control"),
+                ], md=2),
+            ]),
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Scenarios:"),
+                    dcc.Input(id='whatif-scenarios', type='number', value=DEFAULT_SCENARIOS, min=1, max=100000, step=1000,
+                              className="form-control"),
+                ], md=2),
+                dbc.Col(dbc.Button("Run Simulation", id='whatif-run-button', color="primary", className="mt-4"), md=2),
+            ], className="mt-2"),
+        ]),
+        dbc.Row([
+            dbc.Col(html.Div(id='whatif-summary-container'), width=12),
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='whatif-cost-per-unit-chart'), md=6),
+            dbc.Col(dcc.Graph(id='whatif-copq-chart'), md=6),
+        ], className="mb-4"),
     ], className="p-4")
 
+# --- Manufacturing Cost Filters and Figure Builders ---
+# Shared by the callbacks below and by the export routes.
+
+@timed_phase('figure')
+def build_mfg_cost_trend_figure(df, selected_category):
+    fig = px.line(
+        df,
+        x=df.index, # Month is the index
+        y=selected_category,
+        title=f'Monthly Trend: {selected_category}',
+        labels={
+            df.index.name: 'Month',
+            selected_category: 'Cost (£)'
+        },
+        markers=True,
+        height=400
+    )
+    fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
+    fig.update_xaxes(dtick="M1", tickformat="%b\n%Y")
+    return fig
+
+@timed_phase('figure')
+def build_mfg_cost_breakdown_pie(df, selected_month):
+    """Pie of materials/labour/overhead for the selected month name, or None if the month is absent."""
+    df_filtered = df[df.index.strftime('%B') == selected_month]
+
+    if df_filtered.empty:
+        return None
+    
+    materials_cost = df_filtered['Total Direct Material Cost (£)'].iloc[0] if 'Total Direct Material Cost (£)' in df_filtered.columns else 0
+    labor_cost = df_filtered['Total Direct Labor Cost (£)'].iloc[0] if 'Total Direct Labor Cost (£)' in df_filtered.columns else 0
+    overhead_cost = df_filtered['Total Manufacturing Overhead (£)'].iloc[0] if 'Total Manufacturing Overhead (£)' in df_filtered.columns else 0
+
+    costs = [materials_cost, labor_cost, overhead_cost]
+    labels = ['Materials', 'Labor', 'Overhead']
+
+    fig = px.pie(
+        names=labels,
+        values=costs,
+        title=f'Cost Components Breakdown for {selected_month}',
+        hole=0.3,
+        height=400,
+        color_discrete_sequence=px.colors.sequential.RdBu 
+    )
+    fig.update_traces(textinfo='percent+label', marker=dict(line=dict(color='#000000', width=1)))
+    fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
+    return fig
+
+@timed_phase('figure')
+def build_what_if_band_figure(summary, value_name, title):
+    """Baseline line with the scenarios' median and 5th-95th percentile band, per month."""
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=summary['Month'], y=summary[f"{value_name} P95"], mode='lines',
+                             line={'width': 0}, showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=summary['Month'], y=summary[f"{value_name} P5"], mode='lines', line={'width': 0},
+                             fill='tonexty', fillcolor='rgba(59, 130, 246, 0.2)', name='P5-P95'))
+    fig.add_trace(go.Scatter(x=summary['Month'], y=summary[f"{value_name} P50"], mode='lines+markers',
+                             line={'color': '#3B82F6'}, name='Scenario median'))
+    fig.add_trace(go.Scatter(x=summary['Month'], y=summary[f"{value_name} Baseline"], mode='lines+markers',
+                             line={'color': '#6B7280', 'dash': 'dash'}, name='Baseline'))
+    fig.update_layout(title=title, height=400, yaxis_title=value_name, margin={"r":0,"t":40,"l":0,"b":0},
+                      legend={'orientation': 'h', 'y': -0.2})
+    fig.update_xaxes(dtick="M1", tickformat="%b\n%Y")
+    return fig
+
+@timed_phase('filter')
+def filter_cost_variance(df, selected_month):
+    """Cost variance rows for the selected month name (all rows if none selected)."""
+    if not selected_month:
+        return df.copy()
+    return df[df['Month_KPI'].astype(str).str.strip().str.startswith(selected_month)]
+
+# One VarianceIndex per cost variance facts store payload (the JSON string), so the
+# cumulative sums are built once per data version and shared by every filter change.
+_VARIANCE_CACHE_SIZE = 8
+_variance_cache = collections.OrderedDict()
+_variance_lock = threading.Lock()
+
+@timed_phase('filter')
+def get_variance_index(facts_json):
+    """The VarianceIndex for a stored-cost-variance-facts payload, or None without one."""
+    if not facts_json:
+        return None
+    with _variance_lock:
+        index = _variance_cache.get(facts_json)
+        if index is not None:
+            _variance_cache.move_to_end(facts_json)
+    count_cache(index is not None)
+    if index is None:
+        facts = decode_store(facts_json, 'split')
+        if facts.empty:
+            return None
+        facts['Month'] = pd.to_datetime(facts['Month'])
+        index = VarianceIndex(facts)
+        with _variance_lock:
+            _variance_cache[facts_json] = index
+            while len(_variance_cache) > _VARIANCE_CACHE_SIZE:
+                _variance_cache.popitem(last=False)
+    return index
+
+@timed_phase('filter')
+def query_variance_index(fact_store):
+    """A VarianceIndex over every site's monthly cost variance in the fact store, or None."""
+    facts = facts_from_monthly(fact_store.query_section('mfg_cost', MONTHLY_SECTION))
+    return VarianceIndex(facts) if not facts.empty else None
+
+@timed_phase('figure')
+def build_variance_period_figure(trend, period_type):
+    """
+    Variance (%) of the period ending in each month for one cost line, one line per site
+    (None if empty). Per-unit lines are unit-weighted averages over each period.
+    """
+    if trend.empty:
+        return None
+    labels = np.array(_period_labels(trend.drop_duplicates('Period').sort_values('Period')['Month']), dtype=object)
+    trend = trend.assign(Label=labels[trend['Period'].to_numpy()], **{'Variance (%)': trend['Variance (%)'] * 100})
+    fig = px.line(trend, x='Label', y='Variance (%)', color='Site' if trend['Site'].nunique() > 1 else None,
+                  markers=True, height=450, hover_data=['Actual', 'Budget', 'Variance (£)'],
+                  title=f"{trend['KPI'].iloc[0]}: {PERIOD_TYPES[period_type]} Variance against Budget"
+                        + (" (unit-weighted average)" if is_rate_kpi(trend['KPI'].iloc[0]) else ""),
+                  labels={'Label': 'Period ending'})
+    fig.add_hline(y=0, line_dash='dash', line_color='#6B7280')
+    fig.update_layout(margin={"r": 0, "t": 40, "l": 0, "b": 0}, legend={'orientation': 'h', 'y': -0.25})
+    return fig
+
+@timed_phase('filter')
+def filter_cost_attribution(df, selected_month, category=ALL_CATEGORIES):
+    """
+    Attribution summed per category (or per line item of one category) for the latest
+    month with the selected name; every month when none is selected.
+    """
+    if selected_month:
+        periods = df.loc[(pd.to_datetime(df['Month']).dt.month_name() == selected_month).to_numpy(), 'Period']
+        df = df[df['Period'] == periods.max()] if not periods.empty else df.iloc[:0]
+    return summarise_attribution(df, category)
+
+@timed_phase('figure')
+def build_cost_attribution_figure(summary, selected_month, category=ALL_CATEGORIES):
+    """Stacked volume/rate/mix bars per category or line item, with the net change marked."""
+    fig = go.Figure()
+    for effect, color in zip(EFFECTS, ['#6B7280', '#EF4444', '#3B82F6']):
+        fig.add_trace(go.Bar(x=summary['Group'], y=summary[effect], name=effect.replace(' (£/unit)', ''),
+                             marker_color=color))
+    fig.add_trace(go.Scatter(x=summary['Group'], y=summary['Total Change (£/unit)'], mode='markers',
+                             marker={'symbol': 'diamond', 'size': 12, 'color': '#111827'}, name='Net Change'))
+    scope = "by Category" if category == ALL_CATEGORIES else f"within {category}"
+    fig.update_layout(barmode='relative', title=f"Change in Cost per Unit, {selected_month}, {scope}",
+                      yaxis_title='£ per unit', height=450, margin={"r": 0, "t": 40, "l": 0, "b": 0},
+                      legend={'orientation': 'h', 'y': -0.25})
+    return fig
+
+# One InitiativeIndex per pair of tracking store payloads (the JSON strings), so the
+# arrays are built once per data version and shared by every filter change.
+_INITIATIVE_CACHE_SIZE = 8
+_initiative_cache = collections.OrderedDict()
+_initiative_lock = threading.Lock()
+
+@timed_phase('filter')
+def get_initiative_index(copq_json, mfg_json):
+    """The InitiativeIndex for the stored-copq/mfg-initiative-data payloads, or None without any."""
+    key = (copq_json, mfg_json)
+    with _initiative_lock:
+        index = _initiative_cache.get(key)
+        if index is not None:
+            _initiative_cache.move_to_end(key)
+    count_cache(index is not None)
+    if index is None:
+        frames = [decode_store(payload, 'split') for payload in key if payload]
+        frames = [df for df in frames if not df.empty]
+        if not frames:
+            return None
+        tracking = pd.concat(frames, ignore_index=True)
+        tracking['Month'] = pd.to_datetime(tracking['Month'])
+        index = InitiativeIndex(tracking)
+        with _initiative_lock:
+            _initiative_cache[key] = index
+            while len(_initiative_cache) > _INITIATIVE_CACHE_SIZE:
+                _initiative_cache.popitem(last=False)
+    return index
+
+@timed_phase('figure')
+def build_initiative_roi_figure(view, as_of):
+    """Realised savings against implementation cost per initiative, as of a month."""
+    fig = go.Figure()
+    fig.add_trace(go.Bar(y=view['Initiative'], x=view['Implementation Cost (£)'], orientation='h',
+                         name='Implementation Cost', marker_color='#9CA3AF'))
+    fig.add_trace(go.Bar(y=view['Initiative'], x=view['Realised Savings (£)'], orientation='h',
+                         name='Realised Savings', marker_color=['#10B981' if paid else '#3B82F6' for paid in view['Paid Back']]))
+    fig.update_layout(barmode='group', title=f"Realised Savings vs Cost, as of {as_of}", xaxis_title='£',
+                      height=max(400, 40 * len(view)), margin={"r": 0, "t": 40, "l": 0, "b": 0},
+                      yaxis={'autorange': 'reversed'}, legend={'orientation': 'h', 'y': -0.15})
+    return fig
+
 # --- Manufacturing Cost Callbacks ---
 
-def register_mfg_cost_callbacks(app):
+def register_mfg_cost_callbacks(app, fact_store=None):
     # Callback for Manufacturing Cost Trend Chart
     @app.callback(
         Output('mfg-cost-trend-chart', 'figure'),
@@ -74,28 +438,14 @@ def register_mfg_cost_callbacks(app):
         if jsonified_data is None:
             return {}
         
-        df = pd.read_json(jsonified_data, orient='split')
+        df = decode_store(jsonified_data, 'split')
         if not isinstance(df.index, pd.DatetimeIndex):
             df.index = pd.to_datetime(df.index)
 
         if df.empty or selected_category not in df.columns:
             return {}
 
-        fig = px.line(
-            df,
-            x=df.index, # Month is the index
-            y=selected_category,
-            title=f'Monthly Trend: {selected_category}',
-            labels={
-                df.index.name: 'Month',
-                selected_category: 'Cost (£)'
-            },
-            markers=True,
-            height=400
-        )
-        fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
-        fig.update_xaxes(dtick="M1", tickformat="%b\n%Y")
-        return fig
+        return build_mfg_cost_trend_figure(df, selected_category)
 
     # Callback for Manufacturing Cost Breakdown Pie Chart
     @app.callback(
@@ -107,36 +457,15 @@ def register_mfg_cost_callbacks(app):
         if jsonified_data is None:
             return {}
         
-        df = pd.read_json(jsonified_data, orient='split')
+        df = decode_store(jsonified_data, 'split')
         if not isinstance(df.index, pd.DatetimeIndex):
             df.index = pd.to_datetime(df.index)
 
         if df.empty:
             return {}
         
-        df_filtered = df[df.index.strftime('%B') == selected_month]
-
-        if df_filtered.empty:
-            return {}
-        
-        materials_cost = df_filtered['Total Direct Material Cost (£)'].iloc[0] if 'Total Direct Material Cost (£)' in df_filtered.columns else 0
-        labor_cost = df_filtered['Total Direct Labor Cost (£)'].iloc[0] if 'Total Direct Labor Cost (£)' in df_filtered.columns else 0
-        overhead_cost = df_filtered['Total Manufacturing Overhead (£)'].iloc[0] if 'Total Manufacturing Overhead (£)' in df_filtered.columns else 0
-
-        costs = [materials_cost, labor_cost, overhead_cost]
-        labels = ['Materials', 'Labor', 'Overhead']
-
-        fig = px.pie(
-            names=labels,
-            values=costs,
-            title=f'Cost Components Breakdown for {selected_month}',
-            hole=0.3,
-            height=400,
-            color_discrete_sequence=px.colors.sequential.RdBu 
-        )
-        fig.update_traces(textinfo='percent+label', marker=dict(line=dict(color='#000000', width=1)))
-        fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
-        return fig
+        fig = build_mfg_cost_breakdown_pie(df, selected_month)
+        return fig if fig is not None else {}
 
     # Callback for Manufacturing Cost Variance Table
     @app.callback(
@@ -147,7 +476,7 @@ def register_mfg_cost_callbacks(app):
         if jsonified_data is None:
             return html.Div("No Cost Variance Data Available.")
         
-        df = pd.read_json(jsonified_data, orient='split')
+        df = decode_store(jsonified_data, 'split')
         if df.empty:
             return html.Div("No Cost Variance Data Available.")
         
@@ -161,4 +490,163 @@ def register_mfg_cost_callbacks(app):
         if 'Variance (£)' in df_display.columns:
             df_display['Variance (£)'] = df_display['Variance (£)'].apply(lambda x: f"£{x:,.2f}" if pd.notna(x) else "N/A")
 
-        return dbc.Table.from_dataframe(df_display, striped=True, bordered=True, hover=True, className="mt-2")
\ No newline at end of file
+        return dbc.Table.from_dataframe(df_display, striped=True, bordered=True, hover=True, className="mt-2")
+
+    # Actual against budget over the selected period type, per site. With the fact store
+    # enabled, every site's monthly variance is read back from it.
+    @app.callback(
+        [Output('cost-variance-period-chart', 'figure'),
+         Output('cost-variance-period-table-container', 'children')],
+        [Input('stored-cost-variance-facts', 'data'),
+         Input('cost-variance-period-type', 'value'),
+         Input('cost-variance-kpi', 'value'),
+         Input('cost-variance-as-of', 'value')]
+    )
+    def update_variance_over_period(facts_json, period_type, kpi, as_of):
+        index = query_variance_index(fact_store) if fact_store is not None else get_variance_index(facts_json)
+        if index is None or not index.n_periods or period_type not in PERIOD_TYPES:
+            return {}, html.Div("No Cost Variance Data Available.")
+        kpi = kpi if kpi in index.by_kpi else index.kpis()[0]
+
+        # Sites in the fact store may have fewer months than the local worksheet
+        end = min(max(int(as_of if as_of is not None else index.n_periods - 1), 0), index.n_periods - 1)
+        df_display = index.period_view(period_type, end, kpi).drop(columns=['KPI'])
+        if index.sites() == ['']:
+            df_display = df_display.drop(columns=['Site'])
+        labels = _period_labels(index.months)
+        df_display['From'] = labels[int(index.period_start(period_type, end))]
+        df_display['To'] = labels[end]
+        # Per-unit lines are unit-weighted averages over the period (see the Basis column)
+        for col in ('Actual', 'Budget', 'Variance (£)'):
+            df_display[col] = df_display[col].apply(lambda x: f"£{x:,.2f}" if pd.notna(x) else "N/A")
+        df_display['Variance (%)'] = df_display['Variance (%)'].apply(lambda x: f"{x * 100:+.2f}%" if pd.notna(x) else "N/A")
+        return (build_variance_period_figure(index.trend(period_type, kpi), period_type),
+                dbc.Table.from_dataframe(df_display, striped=True, bordered=True, hover=True, size='sm', className="mt-2"))
+
+    # Cost per unit change attribution for the selected month, by category or line item
+    @app.callback(
+        [Output('mfg-cost-attribution-chart', 'figure'),
+         Output('mfg-cost-attribution-table-container', 'children')],
+        [Input('stored-cost-attribution-data', 'data'),
+         Input('mfg-cost-month-filter', 'value'),
+         Input('mfg-cost-attribution-category', 'value')]
+    )
+    def update_cost_attribution(jsonified_data, selected_month, category):
+        if jsonified_data is None or not selected_month:
+            return {}, html.Div("No Cost Attribution Data Available.")
+
+        df = decode_store(jsonified_data, 'split')
+        if df.empty:
+            return {}, html.Div("No Cost Attribution Data Available.")
+
+        summary = filter_cost_attribution(df, selected_month, category)
+        if summary.empty:
+            return {}, html.Div(f"No earlier month to compare {selected_month} with.")
+
+        df_display = summary.drop(columns=['Period', 'Month']).rename(columns={'Group': 'Line Item' if category != ALL_CATEGORIES else 'Category'})
+        for col in EFFECTS + ['Total Change (£/unit)']:
+            df_display[col] = df_display[col].apply(lambda x: f"£{x:+,.3f}" if pd.notna(x) else "N/A")
+        return (build_cost_attribution_figure(summary, selected_month, category),
+                dbc.Table.from_dataframe(df_display, striped=True, bordered=True, hover=True, size='sm', className="mt-2"))
+
+    # Clicking a category's bars drills down into its line items
+    @app.callback(
+        Output('mfg-cost-attribution-category', 'value'),
+        [Input('mfg-cost-attribution-chart', 'clickData')],
+        [State('mfg-cost-attribution-category', 'value')]
+    )
+    def drill_down_cost_attribution(click_data, category):
+        clicked = (click_data or {}).get('points', [{}])[0].get('x')
+        if category == ALL_CATEGORIES and clicked in COST_CATEGORIES.values():
+            return clicked
+        return dash.no_update
+
+    # Initiative ROI and payback as of the selected month, for one status or all
+    @app.callback(
+        [Output('initiative-roi-chart', 'figure'),
+         Output('initiative-table-container', 'children')],
+        [Input('stored-copq-initiative-data', 'data'),
+         Input('stored-mfg-initiative-data', 'data'),
+         Input('initiative-status-filter', 'value'),
+         Input('initiative-period-filter', 'value')]
+    )
+    def update_initiatives(copq_json, mfg_json, status, period):
+        index = get_initiative_index(copq_json, mfg_json)
+        if index is None or not index.n_periods:
+            return {}, html.Div("No Initiative Data Available.")
+
+        view = index.roi_view(status, period)
+        if view.empty:
+            return {}, html.Div(f"No {status} initiatives.")
+        as_of = index.months.iloc[min(period if period is not None else index.n_periods - 1, index.n_periods - 1)]
+
+        df_display = view.drop(columns=['Paid Back'])
+        df_display['Source'] = df_display['Source'].map({'copq': 'Quality', 'mfg_cost': 'Cost Reduction'})
+        df_display['Live From'] = pd.to_datetime(df_display['Live From']).dt.strftime('%B').fillna('Not live')
+        for col in ('Implementation Cost (£)', 'Realised Savings (£)'):
+            df_display[col] = df_display[col].apply(lambda x: f"£{x:,.0f}")
+        df_display['ROI (%)'] = df_display['ROI (%)'].apply(lambda x: f"{x * 100:.1f}%" if pd.notna(x) else "N/A")
+        return (build_initiative_roi_figure(view, as_of.strftime('%B') if pd.notna(as_of) else "the latest month"),
+                dbc.Table.from_dataframe(df_display, striped=True, bordered=True, hover=True, size='sm', className="mt-2"))
+
+    # What-if simulation. With the fact store enabled, every site's months are simulated.
+    @app.callback(
+        [Output('whatif-summary-container', 'children'),
+         Output('whatif-cost-per-unit-chart', 'figure'),
+         Output('whatif-copq-chart', 'figure')],
+        [Input('whatif-run-button', 'n_clicks'),
+         Input('stored-mfg-cost-data', 'data'),
+         Input('stored-efficiency-data', 'data'),
+         Input('stored-copq-data', 'data'),
+         Input('stored-copq-breakdown-data', 'data')],
+        [State(f'whatif-{suffix}', 'value') for suffix, _, _ in WHAT_IF_DRIVERS] +
+        [State('whatif-uncertainty', 'value'),
+         State('whatif-scenarios', 'value')]
+    )
+    def update_what_if(n_clicks, mfg_json, efficiency_json, copq_json, breakdown_json, *values):
+        if not n_clicks:
+            return html.Div("Set the driver changes and run the simulation.", className="text-muted text-center"), {}, {}
+
+        *driver_values, uncertainty, scenarios = values
+        changes = {parameter: (value or 0) / 100 for (_, _, parameter), value in zip(WHAT_IF_DRIVERS, driver_values)}
+
+        breakdown_df = decode_store(breakdown_json, 'records') if breakdown_json else None
+        if fact_store is not None:
+            mfg_base = mfg_cost_baseline(fact_store.query_section('mfg_cost', 'total_manufacturing_cost'),
+                                         fact_store.query_section('mfg_cost', 'efficiency_indicators'))
+            copq_base = copq_baseline(fact_store.query_section('copq', 'monthly_copq_tracking'), breakdown_df)
+        else:
+            mfg_base = copq_base = None
+            if mfg_json and efficiency_json:
+                mfg_df = decode_store(mfg_json, 'split')
+                efficiency_df = decode_store(efficiency_json, 'split')
+                mfg_df.index = pd.to_datetime(mfg_df.index)
+                efficiency_df.index = pd.to_datetime(efficiency_df.index)
+                mfg_base = mfg_cost_baseline(mfg_df.rename_axis('Month'), efficiency_df.rename_axis('Month'))
+            if copq_json:
+                copq_df = decode_store(copq_json, 'records')
+                copq_df['Month'] = pd.to_datetime(copq_df['Month'])
+                copq_base = copq_baseline(copq_df, breakdown_df)
+
+        result = run_what_if(mfg_base, copq_base, changes, uncertainty=(uncertainty or 0) / 100,
+                             n=min(max(int(scenarios or DEFAULT_SCENARIOS), 1), 100000))
+
+        rows = [{'Measure': name, 'Baseline': totals['baseline'], 'Scenario P5': totals['P5'],
+                 'Scenario Median': totals['P50'], 'Scenario P95': totals['P95'],
+                 'Median Change': f"{(totals['P50'] / totals['baseline'] - 1) * 100:+.2f}%" if totals['baseline'] else "N/A"}
+                for name, totals in result['totals'].items()]
+        if not rows:
+            return html.Div("No cost or COPQ data to simulate."), {}, {}
+        df_display = pd.DataFrame(rows)
+        for col in ('Baseline', 'Scenario P5', 'Scenario Median', 'Scenario P95'):
+            df_display[col] = df_display[col].apply(lambda x: f"£{x:,.2f}")
+        summary = html.Div([
+            html.P(f"{result['scenarios']:,} scenarios simulated.", className="text-muted mb-1"),
+            dbc.Table.from_dataframe(df_display, striped=True, bordered=True, hover=True, className="mt-2"),
+        ])
+
+        cost_fig = (build_what_if_band_figure(result['cost_per_unit'], 'Cost per Unit (£)', 'What-If: Cost per Unit')
+                    if 'cost_per_unit' in result else {})
+        copq_fig = (build_what_if_band_figure(result['copq'], 'COPQ (£)', 'What-If: Monthly COPQ')
+                    if 'copq' in result else {})
+        return summary, cost_fig, copq_fig
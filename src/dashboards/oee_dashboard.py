@@ -1,17 +1,30 @@
 # src/dashboards/oee_dashboard.py
 
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import dash_bootstrap_components as dbc
 
 # Import generic UI components
-from utils.ui_components import create_kpi_card, create_filter_card
+from utils.ui_components import create_kpi_card, create_filter_card, decode_store
+from utils.instrumentation import timed_phase
+from utils.figure_deltas import trend_figure_update
+from shift_calendar import ALL_SHIFTS
+
+def _shift_options(oee_augmented_data):
+    """'All Shifts' followed by the shifts of the calendar built from the worksheet constants."""
+    shift_df = (oee_augmented_data or {}).get('shift_oee_trends')
+    shifts = list(shift_df['Shift'].cat.categories) if shift_df is not None and not shift_df.empty else []
+    return [{'label': shift, 'value': shift} for shift in [ALL_SHIFTS] + shifts]
+
+def _latest_month(oee_augmented_data):
+    monthly = (oee_augmented_data or {}).get('monthly_oee_trends')
+    return monthly['Month'].max().date() if monthly is not None and not monthly.empty else None
 
 # --- OEE Layout Function ---
-def create_oee_layout(oee_kpis, oee_augmented_data):
+def create_oee_layout(oee_kpis, oee_augmented_data, sites=None):
     return html.Div([
         html.H3("Overall Equipment Effectiveness Overview", className="text-center my-4"),
         html.P("Monitor and improve manufacturing productivity by tracking OEE components (Availability, Performance, Quality) and downtime costs.", className="text-center text-muted"),
@@ -30,9 +43,13 @@ def create_oee_layout(oee_kpis, oee_augmented_data):
                     html.Label("Select Date Range:"),
                     dcc.DatePickerRange(
                         id='oee-date-range-filter',
-                        # Ensure data exists before trying to get min/max dates
-                        start_date=oee_augmented_data['monthly_oee_trends']['Month'].min().date() if (oee_augmented_data and oee_augmented_data['monthly_oee_trends'] is not None and not oee_augmented_data['monthly_oee_trends'].empty) else None,
-                        end_date=oee_augmented_data['monthly_oee_trends']['Month'].max().date() if (oee_augmented_data and oee_augmented_data['monthly_oee_trends'] is not None and not oee_augmented_data['monthly_oee_trends'].empty) else None,
+                        # Open-ended by default, so months pushed in later are included
+                        start_date=None,
+                        end_date=None,
+                        start_date_placeholder_text="First month",
+                        end_date_placeholder_text="Latest month",
+                        initial_visible_month=_latest_month(oee_augmented_data),
+                        clearable=True,
                         display_format='MMM DD, YYYY',
                     )
                 ], md=4),
@@ -40,8 +57,8 @@ def create_oee_layout(oee_kpis, oee_augmented_data):
                     html.Label("Select Shift:"),
                     dcc.Dropdown(
                         id='oee-shift-filter',
-                        options=[{'label': 'All Shifts', 'value': 'All Shifts'}], # Dummy for now, as no shift data in CSV
-                        value='All Shifts', # Default to 'All Shifts'
+                        options=_shift_options(oee_augmented_data),
+                        value=ALL_SHIFTS, # Default to 'All Shifts'
                         multi=False
                     )
                 ], md=4),
@@ -55,12 +72,28 @@ def create_oee_layout(oee_kpis, oee_augmented_data):
                         multi=False
                     )
                 ], md=4),
-            ])
+            ]),
+            dbc.Row([
+                dbc.Col([ # Site filter, only meaningful when the historical fact store is enabled
+                    html.Label("Select Site:"),
+                    dcc.Dropdown(
+                        id='oee-site-filter',
+                        options=[{'label': site, 'value': site} for site in (sites or [])],
+                        value=sites[0] if sites else None,
+                        placeholder="Current worksheet",
+                        disabled=not sites,
+                        multi=False
+                    )
+                ], md=4),
+            ], className="mt-2")
         ]),
         
         # OEE Visualizations
         dbc.Row([
-            dbc.Col(dcc.Graph(id='oee-trend-chart'), md=8),
+            dbc.Col([
+                dcc.Graph(id='oee-trend-chart'),
+                dcc.Store(id='oee-trend-chart-rendered'), # What the chart shows, for delta updates
+            ], md=8),
             dbc.Col(dcc.Graph(id='oee-components-gauge'), md=4), # Gauge for latest OEE components
         ], className="mb-4"),
         dbc.Row([
@@ -69,9 +102,74 @@ def create_oee_layout(oee_kpis, oee_augmented_data):
         ])
     ], className="p-4")
 
+# --- OEE Filters and Figure Builders ---
+# Shared by the callbacks below and by the export routes.
+
+@timed_phase('filter')
+def filter_oee_by_date(df, start_date, end_date):
+    """Monthly rows between the date picker's start and end dates (inclusive; an unset date is open)."""
+    mask = pd.Series(True, index=df.index)
+    if start_date:
+        mask &= df['Month'] >= pd.to_datetime(start_date)
+    if end_date:
+        mask &= df['Month'] <= pd.to_datetime(end_date)
+    return df[mask]
+
+@timed_phase('filter')
+def filter_downtime_by_reason(df, selected_reason):
+    """Downtime rows whose root causes mention the selected reason ('All Reasons' keeps every row)."""
+    if selected_reason and selected_reason != 'All Reasons':
+        return df[df['Root Cause (Top 3)'].astype(str).str.strip().str.contains(selected_reason.strip(), case=False, na=False)]
+    return df.copy()
+
+@timed_phase('filter')
+def filter_oee_by_shift(df, selected_shift):
+    """Per-shift OEE rows for one shift ('All Shifts' keeps every row)."""
+    if selected_shift and selected_shift != ALL_SHIFTS:
+        return df[df['Shift'].astype(str) == selected_shift]
+    return df.copy()
+
+def _shift_oee(jsonified_shift_data, selected_shift):
+    """Monthly OEE of one shift from the per-shift store, or None for 'All Shifts' (or no shift data)."""
+    if not selected_shift or selected_shift == ALL_SHIFTS or jsonified_shift_data is None:
+        return None
+    df = decode_store(jsonified_shift_data, 'split')
+    if df.empty:
+        return None
+    df['Month'] = pd.to_datetime(df['Month'])
+    return filter_oee_by_shift(df, selected_shift)
+
+@timed_phase('filter')
+def _query_monthly_oee(fact_store, start_date, end_date, site):
+    """Monthly OEE rows for the date range and site, filtered inside the fact store."""
+    return fact_store.query_section('oee', 'monthly_oee', start_date, end_date, sites=[site] if site else None)
+
+# Trend chart traces, in order
+OEE_TREND_METRICS = ['OEE (%)', 'Availability (%)', 'Performance (%)', 'Quality (%)']
+
+@timed_phase('figure')
+def build_oee_trend_figure(df_filtered):
+    """Line chart of monthly OEE and its components."""
+    fig = px.line(
+        df_filtered,
+        x='Month',
+        y=OEE_TREND_METRICS,
+        title='Monthly OEE and Components Trend',
+        labels={
+            'value': 'Percentage (%)', 
+            'variable': 'Metric',
+            'Month': 'Month'
+        },
+        markers=True,
+        height=450
+    )
+    fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
+    fig.update_xaxes(dtick="M1", tickformat="%b\n%Y")
+    return fig
+
 # --- OEE Callbacks ---
 
-def register_oee_callbacks(app):
+def register_oee_callbacks(app, fact_store=None):
     # Callback to populate Downtime Reason filter options dynamically for OEE dashboard
     @app.callback(
         Output('oee-downtime-reason-filter', 'options'),
@@ -81,7 +179,7 @@ def register_oee_callbacks(app):
         if jsonified_data is None:
             return []
         
-        df = pd.read_json(jsonified_data, orient='split')
+        df = decode_store(jsonified_data, 'split')
         if df.empty:
             return []
 
@@ -96,61 +194,82 @@ def register_oee_callbacks(app):
         options.extend([{'label': reason, 'value': reason} for reason in sorted(list(all_reasons))])
         return options
 
-    # Callback for OEE Trend Chart
+    # Site options follow the fact store as pushed data adds sites (the layout has the
+    # options as of page load)
+    if fact_store is not None:
+        @app.callback(
+            [Output('oee-site-filter', 'options'),
+             Output('oee-site-filter', 'disabled')],
+            [Input('stored-oee-data', 'data')],
+            prevent_initial_call=True
+        )
+        def update_oee_site_options(_):
+            sites = fact_store.list_sites('oee')
+            return [{'label': site, 'value': site} for site in sites], not sites
+
+    # Callback for OEE Trend Chart. When new data only revises the latest month or adds
+    # months, only those points are sent (a Patch) instead of the whole history.
+    # A single shift is read from the precomputed per-shift aggregates of the loaded
+    # worksheet (the fact store only holds monthly totals).
     @app.callback(
-        Output('oee-trend-chart', 'figure'),
+        [Output('oee-trend-chart', 'figure'),
+         Output('oee-trend-chart-rendered', 'data')],
         [Input('stored-oee-data', 'data'),
          Input('oee-date-range-filter', 'start_date'),
-         Input('oee-date-range-filter', 'end_date')]
+         Input('oee-date-range-filter', 'end_date'),
+         Input('oee-site-filter', 'value'),
+         Input('oee-shift-filter', 'value'),
+         Input('stored-oee-shift-data', 'data')],
+        [State('oee-trend-chart-rendered', 'data')]
     )
-    def update_oee_trend_chart(jsonified_data, start_date, end_date):
-        if jsonified_data is None:
-            return {}
-        
-        df = pd.read_json(jsonified_data, orient='split')
-        if df.empty:
-            return {}
-        
-        df['Month'] = pd.to_datetime(df['Month'])
-        
-        df_filtered = df.copy()
-        if start_date and end_date:
-            start_dt = pd.to_datetime(start_date)
-            end_dt = pd.to_datetime(end_date)
-            df_filtered = df[(df['Month'] >= start_dt) & 
-                             (df['Month'] <= end_dt)]
-        
+    def update_oee_trend_chart(jsonified_data, start_date, end_date, selected_site, selected_shift,
+                               jsonified_shift_data, rendered):
+        shift_df = _shift_oee(jsonified_shift_data, selected_shift)
+        if shift_df is not None:
+            df_filtered = filter_oee_by_date(shift_df, start_date, end_date)
+        elif fact_store is not None:
+            # Date range and site are pushed down to the indexed fact store query
+            df_filtered = _query_monthly_oee(fact_store, start_date, end_date, selected_site)
+        else:
+            if jsonified_data is None:
+                return {}, None
+
+            df = decode_store(jsonified_data, 'split')
+            if df.empty:
+                return {}, None
+
+            df['Month'] = pd.to_datetime(df['Month'])
+
+            df_filtered = filter_oee_by_date(df, start_date, end_date)
+
         if df_filtered.empty:
-            return go.Figure().update_layout(title="No data for selected filter.")
-        
-        fig = px.line(
-            df_filtered,
-            x='Month',
-            y=['OEE (%)', 'Availability (%)', 'Performance (%)', 'Quality (%)'],
-            title='Monthly OEE and Components Trend',
-            labels={
-                'value': 'Percentage (%)', 
-                'variable': 'Metric',
-                'Month': 'Month'
-            },
-            markers=True,
-            height=450
+            return go.Figure().update_layout(title="No data for selected filter."), None
+
+        return trend_figure_update(
+            rendered, df_filtered.sort_values('Month', kind='stable'), 'Month', OEE_TREND_METRICS,
+            key=[start_date, end_date, selected_site, selected_shift], build_figure=build_oee_trend_figure
         )
-        fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
-        fig.update_xaxes(dtick="M1", tickformat="%b\n%Y")
-        return fig
 
     # Callback for OEE Components Gauge
     @app.callback(
         Output('oee-components-gauge', 'figure'),
         [Input('stored-oee-data', 'data'),
-         Input('oee-date-range-filter', 'end_date')] 
+         Input('oee-date-range-filter', 'end_date'),
+         Input('oee-site-filter', 'value'),
+         Input('oee-shift-filter', 'value'),
+         Input('stored-oee-shift-data', 'data')]
     )
-    def update_oee_components_gauge(jsonified_data, end_date):
-        if jsonified_data is None:
-            return {}
-        
-        df = pd.read_json(jsonified_data, orient='split')
+    def update_oee_components_gauge(jsonified_data, end_date, selected_site, selected_shift, jsonified_shift_data):
+        shift_df = _shift_oee(jsonified_shift_data, selected_shift)
+        if shift_df is not None:
+            df = shift_df
+        elif fact_store is not None:
+            df = _query_monthly_oee(fact_store, None, end_date, selected_site)
+        else:
+            if jsonified_data is None:
+                return {}
+            df = decode_store(jsonified_data, 'split')
+
         if df.empty:
             return {}
         
@@ -217,13 +336,11 @@ def register_oee_callbacks(app):
         if jsonified_data is None:
             return html.Div("No Downtime Cost Analysis Data Available.")
         
-        df = pd.read_json(jsonified_data, orient='split')
+        df = decode_store(jsonified_data, 'split')
         if df.empty:
             return html.Div("No Downtime Cost Analysis Data Available.")
         
-        filtered_df = df.copy()
-        if selected_reason and selected_reason != 'All Reasons':
-            filtered_df = df[df['Root Cause (Top 3)'].astype(str).str.strip().str.contains(selected_reason.strip(), case=False, na=False)]
+        filtered_df = filter_downtime_by_reason(df, selected_reason)
 
         if filtered_df.empty:
             return html.Div(f"No data for selected downtime reason: {selected_reason}.")
@@ -1,369 +1,195 @@
 # src/data_processor.py
 
-import pandas as pd
 import os
-# --- NEW: Import KPI calculation functions for testing purposes ---
-from kpi_calculations import calculate_copq_kpis, calculate_oee_kpis, calculate_mfg_cost_kpis
+import time
+from data_schema import WORKSHEET_SCHEMAS, format_memory_report
+from section_parser import read_raw_worksheet, parse_worksheet, classify_worksheet
+from workbook_reader import is_workbook, iter_workbook_sheets, read_workbook_sheet
+from load_profiler import LoadReport, publish_load_report, profile_load
+from validation import validate_sections, format_mismatches
+from formula_evaluator import evaluate_formulas
+from mapped_reader import read_mapped_worksheet, use_mapped_read
+from cost_variance import add_monthly_variance_section
+
+def _fill_missing_teep(data_sections):
+    # TEEP (%) is a formula in the export. Rows the formula evaluator could not evaluate
+    # (e.g. references that no longer line up in a trimmed export) fall back to
+    # Utilization x OEE; both are fractions, so no further scaling is applied.
+    df_teep_detailed = data_sections.get('teep_detailed')
+    if df_teep_detailed is not None:
+        missing = df_teep_detailed['TEEP (%)'].isna()
+        if missing.any():
+            recomputed = df_teep_detailed['Utilization (%)'] * df_teep_detailed['OEE (%)']
+            df_teep_detailed['TEEP (%)'] = df_teep_detailed['TEEP (%)'].where(~missing, recomputed)
+    return data_sections
+
+# Worksheet-specific steps run after the shared section parser
+POST_PROCESSORS = {
+    'oee': [_fill_missing_teep],
+    'mfg_cost': [add_monthly_variance_section],
+}
+
+def read_worksheet_grid(file_path, worksheet_type, report=None):
+    """
+    Reads the raw grid for a worksheet type from a CSV export or an Excel workbook.
+    Very large CSV exports are memory-mapped and only their sections read (see mapped_reader.py).
+    """
+    if report is None:
+        report = LoadReport(worksheet_type, file_path)
+    with report.timed('read'):
+        if is_workbook(file_path):
+            raw_data = read_workbook_sheet(file_path, worksheet_type)
+        elif use_mapped_read(file_path):
+            raw_data = read_mapped_worksheet(file_path, worksheet_type)
+        else:
+            raw_data = read_raw_worksheet(file_path)
+    report.bytes_read = os.path.getsize(file_path)
+    return raw_data
 
-def load_and_process_copq_data(file_path):
+def process_worksheet(worksheet_type, raw_data, report=None):
     """
-    Loads and processes the COPQ data from a CSV file.
-    Performs initial cleaning and prepares relevant sections.
+    Evaluates the grid's formula cells (see formula_evaluator.py), parses it, applies
+    that worksheet's post-processing steps and checks its exported totals against their
+    components (see validation.py).
     """
+    label = WORKSHEET_SCHEMAS[worksheet_type]['label']
+    started = time.perf_counter()
+    raw_data, formula_stats = evaluate_formulas(raw_data)
+    skipped = formula_stats['misaligned'] + formula_stats['circular'] + formula_stats['unsupported']
+    if skipped:
+        print(f"Warning: {skipped} of {formula_stats['cells']} formula cell(s) in the {label} file could not be "
+              f"evaluated ({formula_stats['misaligned']} reference empty or text cells, {formula_stats['circular']} "
+              f"circular, {formula_stats['unsupported']} unsupported) and were left empty.")
+    if report is not None:
+        report.timings['formulas'] = time.perf_counter() - started
+        report.formulas = formula_stats
+
+    data_sections = parse_worksheet(worksheet_type, raw_data, report)
+    started = time.perf_counter()
+    for step in POST_PROCESSORS.get(worksheet_type, []):
+        data_sections = step(data_sections)
+    validated = time.perf_counter()
+    mismatches = validate_sections(worksheet_type, data_sections)
+    if len(mismatches):
+        print(f"Warning: {len(mismatches)} exported value(s) in the {label} "
+              f"file do not match their components (stale totals?):\n{format_mismatches(mismatches)}")
+    if report is not None:
+        report.timings['post_process'] = validated - started
+        report.timings['validate'] = time.perf_counter() - validated
+        report.validation = mismatches.to_dict('records')
+    return data_sections
+
+def _load_worksheet(worksheet_type, file_path, report):
+    """Reads and parses one worksheet file, filling in and publishing its load report."""
     try:
-        raw_data = pd.read_csv(file_path, header=None, keep_default_na=False)
-        data_sections = {}
-
-        # --- Helper to find a section's precise start based on a primary and secondary keyword ---
-        # This version is more flexible about whitespace and uses 'in' for secondary
-        def find_section_start_flexible(primary_keyword, secondary_keyword=None, primary_col=0, secondary_col=None, df_raw=raw_data):
-            for i, row in df_raw.iterrows():
-                primary_cell_value = str(row[primary_col]).strip().lower() if primary_col < len(row) else ''
-                primary_match = primary_keyword.lower() in primary_cell_value
-                
-                if primary_match:
-                    if secondary_keyword:
-                        if secondary_col is not None and secondary_col < len(row):
-                            secondary_cell_value = str(row[secondary_col]).strip().lower()
-                            secondary_match = secondary_keyword.lower() in secondary_cell_value
-                            if secondary_match:
-                                return i
-                        else: # Search secondary keyword anywhere in the row (excluding primary_col)
-                            if any(secondary_keyword.lower() in str(cell).strip().lower() for j, cell in enumerate(row) if j != primary_col and str(cell).strip()):
-                                return i
-                    else:
-                        return i
-            return -1
+        with report.timed('total'):
+            raw_data = read_worksheet_grid(file_path, worksheet_type, report)
+            return process_worksheet(worksheet_type, raw_data, report)
+    except Exception as e:
+        report.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        publish_load_report(report)
 
-        # --- Section 1: BASIC PRODUCTION DATA - MONTHLY (Key-Value Pairs) ---
-        start_idx = find_section_start_flexible('Total Units Produced', df_raw=raw_data)
-        if start_idx != -1:
-            basic_kpis = {}
-            # Directly assign values based on their known relative positions
-            basic_kpis['Total Units Produced'] = pd.to_numeric(raw_data.iloc[start_idx, 1], errors='coerce')
-            basic_kpis['Defective Units'] = pd.to_numeric(raw_data.iloc[start_idx + 1, 1], errors='coerce')
-            
-            defect_rate_percent_str = str(raw_data.iloc[start_idx + 2, 1]).strip().replace('%', '')
-            basic_kpis['Defect Rate (%)'] = pd.to_numeric(defect_rate_percent_str, errors='coerce') / 100
-            
-            basic_kpis['Defect Rate (PPM)'] = pd.to_numeric(raw_data.iloc[start_idx + 3, 1], errors='coerce')
-            data_sections['basic_copq'] = pd.Series(basic_kpis)
-        else:
-            print("Warning: 'BASIC PRODUCTION DATA - MONTHLY' section not found in COPQ file.")
+def load_and_process_workbook(file_path):
+    """
+    Loads every recognised sheet of an Excel workbook in a single streaming pass.
 
-        # --- Section 2: COST OF QUALITY BREAKDOWN (Table) ---
-        start_table_row = find_section_start_flexible('Category', df_raw=raw_data)
-        if start_table_row != -1:
-            df_breakdown_copq = raw_data.iloc[start_table_row + 1 : start_table_row + 5, :4].copy()
-            df_breakdown_copq.columns = ['Category', 'Cost (£)', '% of Total COPQ', '% of Revenue']
-            
-            for col in ['Cost (£)']:
-                df_breakdown_copq[col] = pd.to_numeric(df_breakdown_copq[col], errors='coerce')
-            for col in ['% of Total COPQ', '% of Revenue']:
-                df_breakdown_copq[col] = df_breakdown_copq[col].astype(str).str.replace('%', '', regex=False).astype(float) / 100
-            data_sections['breakdown_copq'] = df_breakdown_copq
-        else:
-            print("Warning: 'COST OF QUALITY BREAKDOWN' section not found in COPQ file.")
+    Each sheet is classified by its title row (or sheet name) and routed to the
+    COPQ, OEE or Mfg Cost section parser. Only one sheet's grid is in memory at a time.
 
-        # --- Section 3: MONTHLY COPQ TRACKING (Table) ---
-        # Find the header row by looking for "Month" in col 0 and "COPQ" (more lenient) in col 3
-        start_table_row = -1
-        for i, row in raw_data.iterrows():
-            if str(row[0]).strip().lower() == 'month' and \
-               len(row) > 3 and \
-               'copq' in str(row[3]).strip().lower(): # Check for 'copq' more generally
-                start_table_row = i
+    Returns:
+        dict: Worksheet type ('copq', 'oee', 'mfg_cost') -> data sections, or None on error.
+    """
+    try:
+        datasets = {}
+        sheets = iter_workbook_sheets(file_path)
+        while True:
+            # Each sheet's grid is built lazily, so its read time is the time to the next sheet
+            read_started = time.perf_counter()
+            sheet_name, raw_data = next(sheets, (None, None))
+            if sheet_name is None:
                 break
-
-        if start_table_row != -1:
-            df_monthly_copq = raw_data.iloc[start_table_row + 1 : start_table_row + 7, :5].copy()
-            # Explicitly set column names, using the correct 'COPQ (£)'
-            df_monthly_copq.columns = ['Month', 'Total Units', 'Defective Units', 'COPQ (£)', 'COPQ % of Revenue']
-            
-            df_monthly_copq['Month'] = df_monthly_copq['Month'].astype(str).str.strip()
-            df_monthly_copq['Month'] = pd.to_datetime(df_monthly_copq['Month'], format='%B', errors='coerce')
-            df_monthly_copq = df_monthly_copq.dropna(subset=['Month']) # Ensures only valid dates proceed
-
-            for col in ['Total Units', 'Defective Units', 'COPQ (£)']:
-                df_monthly_copq[col] = pd.to_numeric(df_monthly_copq[col], errors='coerce')
-            df_monthly_copq['COPQ % of Revenue'] = df_monthly_copq['COPQ % of Revenue'].astype(str).str.replace('%', '', regex=False).astype(float) / 100
-            data_sections['monthly_copq_tracking'] = df_monthly_copq
-        else:
-            print("Warning: 'MONTHLY COPQ TRACKING' section not found in COPQ file. Check its exact header, especially 'COPQ (£)' or similar.")
-
-        # --- Section 4: DEFECT CATEGORIES BREAKDOWN (Table) ---
-        start_table_row = find_section_start_flexible('Defect Type', df_raw=raw_data)
-        if start_table_row != -1:
-            df_defect_categories = raw_data.iloc[start_table_row + 1 : start_table_row + 6, :4].copy()
-            df_defect_categories.columns = ['Defect Type', 'Number of Occurrences', '% of Total Defects', 'Associated Cost (£)']
-            
-            for col in ['Number of Occurrences', 'Associated Cost (£)']:
-                df_defect_categories[col] = pd.to_numeric(df_defect_categories[col], errors='coerce')
-            df_defect_categories['% of Total Defects'] = df_defect_categories['% of Total Defects'].astype(str).str.replace('%', '', regex=False).astype(float) / 100
-            data_sections['defect_categories'] = df_defect_categories
-        else:
-            print("Warning: 'DEFECT CATEGORIES BREAKDOWN' section not found in COPQ file.")
-
-        return data_sections
+            read_seconds = time.perf_counter() - read_started
+
+            worksheet_type = classify_worksheet(raw_data, sheet_name)
+            if worksheet_type is None:
+                print(f"Warning: sheet '{sheet_name}' in {file_path} does not match any known worksheet; skipped.")
+            elif worksheet_type in datasets:
+                print(f"Warning: sheet '{sheet_name}' is a second '{worksheet_type}' worksheet in {file_path}; skipped.")
+            else:
+                report = LoadReport(worksheet_type, f"{file_path}[{sheet_name}]")
+                report.timings['read'] = read_seconds
+                with report.timed('total'):
+                    datasets[worksheet_type] = process_worksheet(worksheet_type, raw_data, report)
+                report.timings['total'] += read_seconds
+                publish_load_report(report)
+        return datasets
 
     except FileNotFoundError:
-        print(f"Error: COPQ file not found at {file_path}. Ensure it's named 'COPQ_Dummy_Data.csv' and is in the 'data' folder.")
+        print(f"Error: workbook not found at {file_path}.")
         return None
     except Exception as e:
-        print(f"An unexpected error occurred while processing COPQ data: {e}. This might indicate a problem with the file's structure beyond typical parsing issues.")
+        print(f"An unexpected error occurred while processing workbook {file_path}: {e}.")
         return None
 
-def load_and_process_oee_data(file_path):
+def load_and_process_copq_data(file_path, return_report=False):
     """
-    Loads and processes the OEE data from a CSV file.
-    Extracts different tables and cleans data types.
+    Loads and processes the COPQ data from a CSV file or Excel workbook.
+    Sections and column types are declared in data_schema.WORKSHEET_SCHEMAS['copq'].
+    With return_report=True, returns (data_sections, load_profiler.LoadReport).
     """
+    report = LoadReport('copq', file_path)
     try:
-        raw_data = pd.read_csv(file_path, header=None, keep_default_na=False)
-        data_sections = {}
-
-        # --- Helper to find a section's precise start based on a primary and secondary keyword ---
-        def find_section_start_flexible_oee(primary_keyword, secondary_keyword=None, primary_col=0, secondary_col=None, df_raw=raw_data):
-            for i, row in df_raw.iterrows():
-                primary_cell_value = str(row[primary_col]).strip().lower() if primary_col < len(row) else ''
-                primary_match = primary_keyword.lower() in primary_cell_value
-                
-                if primary_match:
-                    if secondary_keyword:
-                        if secondary_col is not None and secondary_col < len(row):
-                            secondary_cell_value = str(row[secondary_col]).strip().lower()
-                            secondary_match = secondary_keyword.lower() in secondary_cell_value
-                            if secondary_match:
-                                return i
-                        else:
-                            if any(secondary_keyword.lower() in str(cell).strip().lower() for j, cell in enumerate(row) if j != primary_col and str(cell).strip()):
-                                return i
-                    else:
-                        return i
-            return -1
-
-        # --- Section 1: MONTHLY OEE & TEEP SUMMARY (Table) ---
-        # Look for header row "Month" in col 0 and "OEE (%)" in col 4
-        start_table_row = -1
-        for i, row in raw_data.iterrows():
-            if str(row[0]).strip().lower() == 'month' and \
-               len(row) > 4 and \
-               str(row[4]).strip().lower() == 'oee (%)':
-                start_table_row = i
-                break
-
-        if start_table_row != -1:
-            df_monthly_oee = raw_data.iloc[start_table_row + 1 : start_table_row + 6, :6].copy()
-            df_monthly_oee.columns = ['Month', 'Availability (%)', 'Performance (%)', 'Quality (%)', 'OEE (%)', 'TEEP (%)']
-            
-            df_monthly_oee['Month'] = df_monthly_oee['Month'].astype(str).str.strip()
-            df_monthly_oee['Month'] = pd.to_datetime(df_monthly_oee['Month'], format='%B', errors='coerce')
-            df_monthly_oee = df_monthly_oee.dropna(subset=['Month'])
-
-            for col in ['Availability (%)', 'Performance (%)', 'Quality (%)', 'OEE (%)', 'TEEP (%)']:
-                df_monthly_oee[col] = df_monthly_oee[col].astype(str).str.replace('%', '', regex=False).astype(float) / 100
-                df_monthly_oee[col] = pd.to_numeric(df_monthly_oee[col], errors='coerce')
-            data_sections['monthly_oee'] = df_monthly_oee
-        else:
-            print("Warning: 'MONTHLY OEE & TEEP SUMMARY' section not found in OEE file. Check its exact header, especially 'OEE (%)'.")
-
-        # --- Section 2: TEEP CALCULATION (DETAILED) (Table) ---
-        start_table_row = -1
-        for i, row in raw_data.iterrows():
-            if str(row[0]).strip().lower() == 'month' and \
-               len(row) > 1 and \
-               str(row[1]).strip().lower() == 'scheduled shifts':
-                start_table_row = i
-                break
-
-        if start_table_row != -1:
-            df_teep_detailed = raw_data.iloc[start_table_row + 1 : start_table_row + 6, :6].copy()
-            df_teep_detailed.columns = ['Month', 'Scheduled Shifts', 'Actual Shifts', 'Utilization (%)', 'OEE (%)', 'TEEP (%)']
-            
-            df_teep_detailed['Month'] = df_teep_detailed['Month'].astype(str).str.strip()
-            df_teep_detailed['Month'] = pd.to_datetime(df_teep_detailed['Month'], format='%B', errors='coerce')
-            df_teep_detailed = df_teep_detailed.dropna(subset=['Month'])
-
-            for col in ['Scheduled Shifts', 'Actual Shifts']:
-                df_teep_detailed[col] = pd.to_numeric(df_teep_detailed[col], errors='coerce')
-            
-            for col in ['Utilization (%)', 'OEE (%)']:
-                df_teep_detailed[col] = df_teep_detailed[col].astype(str).str.replace('%', '', regex=False).astype(float) / 100
-                df_teep_detailed[col] = pd.to_numeric(df_teep_detailed[col], errors='coerce')
-
-            df_teep_detailed['TEEP (%)'] = (df_teep_detailed['Utilization (%)'] / 100) * (df_teep_detailed['OEE (%)'] / 100) * 100
-            df_teep_detailed['TEEP (%)'] = pd.to_numeric(df_teep_detailed['TEEP (%)'], errors='coerce')
-            data_sections['teep_detailed'] = df_teep_detailed
-        else:
-            print("Warning: 'TEEP CALCULATION (DETAILED)' section not found in OEE file. Check its exact header.")
-
-        # --- Section 3: DOWNTIME COST ANALYSIS (Table) ---
-        start_table_row = -1
-        for i, row in raw_data.iterrows():
-            if str(row[0]).strip().lower() == 'month' and \
-               len(row) > 1 and \
-               str(row[1]).strip().lower() == 'downtime (min)':
-                start_table_row = i
-                break
-
-        if start_table_row != -1:
-            df_downtime_cost = raw_data.iloc[start_table_row + 1 : start_table_row + 6, :5].copy()
-            df_downtime_cost.columns = ['Month', 'Downtime (min)', 'Cost/Min (£)', 'Total Cost (£)', 'Root Cause (Top 3)']
-            
-            df_downtime_cost['Month'] = df_downtime_cost['Month'].astype(str).str.strip()
-            df_downtime_cost['Month'] = pd.to_datetime(df_downtime_cost['Month'], format='%B', errors='coerce')
-            df_downtime_cost = df_downtime_cost.dropna(subset=['Month'])
-
-            for col in ['Downtime (min)', 'Cost/Min (£)', 'Total Cost (£)']:
-                df_downtime_cost[col] = pd.to_numeric(df_downtime_cost[col], errors='coerce')
-            data_sections['downtime_cost'] = df_downtime_cost
-        else:
-            print("Warning: 'DOWNTIME COST ANALYSIS' section not found in OEE file. Check its exact header.")
-
-        # --- Section 4: MAINTENANCE COSTS BREAKDOWN (Table) ---
-        start_table_row = -1
-        for i, row in raw_data.iterrows():
-            if str(row[0]).strip().lower() == 'month' and \
-               len(row) > 1 and \
-               str(row[1]).strip().lower() == 'preventive (£)':
-                start_table_row = i
-                break
-
-        if start_table_row != -1:
-            df_maintenance_costs = raw_data.iloc[start_table_row + 1 : start_table_row + 6, :6].copy()
-            df_maintenance_costs.columns = ['Month', 'Preventive (£)', 'Corrective (£)', 'Downtime Cost (£)', 'Total (£)', '% of Revenue']
-            
-            df_maintenance_costs['Month'] = df_maintenance_costs['Month'].astype(str).str.strip()
-            df_maintenance_costs['Month'] = pd.to_datetime(df_maintenance_costs['Month'], format='%B', errors='coerce')
-            df_maintenance_costs = df_maintenance_costs.dropna(subset=['Month'])
-
-            for col in ['Preventive (£)', 'Corrective (£)', 'Downtime Cost (£)', 'Total (£)']:
-                df_maintenance_costs[col] = pd.to_numeric(df_maintenance_costs[col], errors='coerce')
-            
-            df_maintenance_costs['% of Revenue'] = df_maintenance_costs['% of Revenue'].astype(str).str.replace('%', '', regex=False).astype(float) / 100
-            df_maintenance_costs['% of Revenue'] = pd.to_numeric(df_maintenance_costs['% of Revenue'], errors='coerce')
-
-            data_sections['maintenance_costs'] = df_maintenance_costs
-        else:
-            print("Warning: 'MAINTENANCE COSTS BREAKDOWN' section not found in OEE file. Check its exact header.")
+        data_sections = _load_worksheet('copq', file_path, report)
+    except FileNotFoundError:
+        print(f"Error: COPQ file not found at {file_path}. Ensure it's named 'COPQ_Dummy_Data.csv' and is in the 'data' folder.")
+        data_sections = None
+    except Exception as e:
+        print(f"An unexpected error occurred while processing COPQ data: {e}. This might indicate a problem with the file's structure beyond typical parsing issues.")
+        data_sections = None
+    return (data_sections, report) if return_report else data_sections
 
-        return data_sections
+def load_and_process_oee_data(file_path, return_report=False):
+    """
+    Loads and processes the OEE data from a CSV file or Excel workbook.
+    Sections and column types are declared in data_schema.WORKSHEET_SCHEMAS['oee'].
+    With return_report=True, returns (data_sections, load_profiler.LoadReport).
+    """
+    report = LoadReport('oee', file_path)
+    try:
+        data_sections = _load_worksheet('oee', file_path, report)
     except FileNotFoundError:
         print(f"Error: OEE file not found at {file_path}. Ensure it's named 'OEE_Dummy_Data.csv' and is in the 'data' folder.")
-        return None
+        data_sections = None
     except Exception as e:
         print(f"An unexpected error occurred while processing OEE data: {e}. This might indicate a problem with the file's structure beyond typical parsing issues.")
-        return None
+        data_sections = None
+    return (data_sections, report) if return_report else data_sections
 
-def load_and_process_mfg_cost_data(file_path):
+def load_and_process_mfg_cost_data(file_path, return_report=False):
     """
-    Loads and processes the Manufacturing Cost per Unit data from a CSV file.
-    Extracts different tables and cleans data types.
+    Loads and processes the Manufacturing Cost per Unit data from a CSV file or Excel workbook.
+    Sections and column types are declared in data_schema.WORKSHEET_SCHEMAS['mfg_cost'].
+    With return_report=True, returns (data_sections, load_profiler.LoadReport).
     """
+    report = LoadReport('mfg_cost', file_path)
     try:
-        raw_data = pd.read_csv(file_path, header=None, keep_default_na=False)
-        data_sections = {}
-
-        def find_section_start_mfg(keyword_part, df_raw, col_idx=0):
-            matches = df_raw[df_raw[col_idx].astype(str).str.contains(keyword_part, na=False, case=False)]
-            if not matches.empty:
-                return matches.index[0]
-            return -1
-
-        # MONTHLY PRODUCTION DATA
-        start_row_idx = find_section_start_mfg('MONTHLY PRODUCTION DATA', raw_data)
-        if start_row_idx != -1:
-            months_header_row = raw_data.iloc[start_row_idx + 1]
-            total_units_produced_row = raw_data.iloc[start_row_idx + 2]
-            
-            months = [m.strip() for m in months_header_row.iloc[1:6].tolist() if str(m).strip()]
-            values = [pd.to_numeric(v, errors='coerce') for v in total_units_produced_row.iloc[1:6].tolist()]
-            
-            df_production = pd.DataFrame([values], columns=months)
-            df_production.index = ['Total Units Produced']
-            df_production = df_production.T
-            df_production.index.name = 'Month'
-            df_production.index = pd.to_datetime(df_production.index, format='%B')
-            df_production['Total Units Produced'] = pd.to_numeric(df_production['Total Units Produced'], errors='coerce')
-            data_sections['production_data'] = df_production
-        else:
-            print("Warning: 'MONTHLY PRODUCTION DATA' section not found in Mfg Cost file.")
-
-        # TOTAL MANUFACTURING COST
-        start_row_idx = find_section_start_mfg('TOTAL MANUFACTURING COST', raw_data)
-        if start_row_idx != -1:
-            cost_categories = [
-                'Total Direct Material Cost (£)', 'Total Direct Labor Cost (£)',
-                'Total Manufacturing Overhead (£)', 'Total Manufacturing Cost (£)',
-                'Manufacturing Cost per Unit (£)'
-            ]
-            months = ['January', 'February', 'March', 'April', 'May']
-            
-            df_total_cost = pd.DataFrame(index=months, columns=cost_categories)
-            
-            for category in cost_categories:
-                row_found = raw_data[raw_data[0].astype(str).str.strip() == category].index
-                if not row_found.empty:
-                    row_idx = row_found[0]
-                    values = pd.to_numeric(raw_data.iloc[row_idx, 1:6], errors='coerce').tolist()
-                    df_total_cost.loc[months, category] = values
-            
-            df_total_cost.index.name = 'Month'
-            df_total_cost.index = pd.to_datetime(df_total_cost.index, format='%B')
-            data_sections['total_manufacturing_cost'] = df_total_cost
-        else:
-            print("Warning: 'TOTAL MANUFACTURING COST' section not found in Mfg Cost file.")
-
-
-        # COST EFFICIENCY INDICATORS
-        start_row_idx = find_section_start_mfg('COST EFFICIENCY INDICATORS', raw_data)
-        if start_row_idx != -1:
-            efficiency_kpis = ['Material Yield (%)', 'Labor Efficiency (%)', 'Capacity Utilization (%)']
-            months = ['January', 'February', 'March', 'April', 'May']
-
-            df_efficiency = pd.DataFrame(index=months, columns=efficiency_kpis)
-
-            for kpi_name in efficiency_kpis:
-                row_found = raw_data[raw_data[0].astype(str).str.strip() == kpi_name].index
-                if not row_found.empty:
-                    row_idx = row_found[0]
-                    values = raw_data.iloc[row_idx, 1:6].astype(str).str.replace('%', '', regex=False).astype(float).tolist()
-                    df_efficiency.loc[months, kpi_name] = [v / 100 for v in values]
-            
-            df_efficiency.index.name = 'Month'
-            df_efficiency.index = pd.to_datetime(df_efficiency.index, format='%B')
-            data_sections['efficiency_indicators'] = df_efficiency
-        else:
-            print("Warning: 'COST EFFICIENCY INDICATORS' section not found in Mfg Cost file.")
-
-
-        # COST VARIANCE ANALYSIS
-        start_row_idx = find_section_start_mfg('COST VARIANCE ANALYSIS', raw_data)
-        if start_row_idx != -1:
-            df_variance = raw_data.iloc[start_row_idx + 1 : start_row_idx + 7, :5].copy() # Header + 5 data rows
-            df_variance.columns = ['Month_KPI', 'Actual', 'Budget', 'Variance (£)', 'Variance (%)']
-            df_variance = df_variance[1:].reset_index(drop=True)
-            
-            for col in ['Actual', 'Budget', 'Variance (£)']:
-                df_variance[col] = pd.to_numeric(df_variance[col], errors='coerce')
-            df_variance['Variance (%)'] = df_variance['Variance (%)'].astype(str).str.replace('%', '', regex=False).astype(float) / 100
-            
-            data_sections['cost_variance'] = df_variance
-        else:
-            print("Warning: 'COST VARIANCE ANALYSIS' section not found in Mfg Cost file.")
-
-        return data_sections
-
+        data_sections = _load_worksheet('mfg_cost', file_path, report)
     except FileNotFoundError:
         print(f"Error: Manufacturing Cost file not found at {file_path}. Ensure it's named 'Manufacturing_Cost_per_Unit_Calculator.csv' and is in the 'data' folder.")
-        return None
+        data_sections = None
     except Exception as e:
         print(f"An unexpected error occurred while processing Manufacturing Cost data: {e}. Review the CSV content for unexpected characters or layout changes in the specified sections.")
-        return None
+        data_sections = None
+    return (data_sections, report) if return_report else data_sections
 
 
 # Example usage (for testing purposes, will not be part of the final app execution flow)
 if __name__ == "__main__":
+    # Imported here, not at module level, so loading data does not pull in the KPI module
+    from kpi_calculations import calculate_copq_kpis, calculate_oee_kpis, calculate_mfg_cost_kpis
+
     current_dir = os.path.dirname(__file__)
     data_dir = os.path.join(current_dir, '..', 'data')
 
@@ -372,11 +198,16 @@ if __name__ == "__main__":
     mfg_cost_file = os.path.join(data_dir, 'Manufacturing_Cost_per_Unit_Calculator.csv')
 
     # --- ALL DATA LOADING FIRST ---
+    # KPI_PROFILE_LOADS=cprofile (or pyinstrument) profiles the three loads together
     print("--- Loading All Data ---")
-    copq_raw_data = load_and_process_copq_data(copq_file)
-    oee_raw_data = load_and_process_oee_data(oee_file)
-    mfg_cost_raw_data = load_and_process_mfg_cost_data(mfg_cost_file)
+    with profile_load('data_processor'):
+        copq_raw_data, copq_report = load_and_process_copq_data(copq_file, return_report=True)
+        oee_raw_data, oee_report = load_and_process_oee_data(oee_file, return_report=True)
+        mfg_cost_raw_data, mfg_cost_report = load_and_process_mfg_cost_data(mfg_cost_file, return_report=True)
     print("--- Data Loading Complete ---")
+    for dataset_name, report in (('copq', copq_report), ('oee', oee_report), ('mfg_cost', mfg_cost_report)):
+        print(report.summary())
+        print(format_memory_report(dataset_name))
 
     # --- THEN ALL KPI CALCULATIONS ---
 
@@ -0,0 +1,276 @@
+# src/data_registry.py
+
+import datetime
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+# Only the standard library is imported at module level: app.py imports this module
+# before the server binds, and the loaders (pandas, openpyxl) are imported when
+# load_datasets() runs in the background.
+
+DATASET_NAMES = ('copq', 'oee', 'mfg_cost')
+
+logger = logging.getLogger('kpi.data')
+
+# Snapshot versions count up from 1 in every process, so they only identify data within
+# one process; anything that outlives it (ETags, SSE event ids) pairs them with this id
+# or uses DatasetSnapshot.content_tag instead
+BOOT_ID = uuid.uuid4().hex[:12]
+
+
+class DatasetSnapshot:
+    """
+    One loaded generation of the COPQ, OEE and Mfg Cost data.
+
+    Attributes:
+        version (int): Increases by one with every published load; caches key on it.
+        raw (dict): Dataset name -> parsed data sections (None if the load failed).
+        kpis (dict): Dataset name -> KPI dict.
+        augmented (dict): Dataset name -> augmented DataFrames, as used by the dashboards.
+        oee_sites (list): Sites available in the fact store, current site first.
+        fingerprints (dict): Dataset name -> content hash of its parsed sections.
+        dataset_versions (dict): Dataset name -> the snapshot version in which it last changed.
+        loaded_at (datetime.datetime): When the snapshot was published.
+    """
+
+    def __init__(self, version, raw, kpis, augmented, oee_sites=None, fingerprints=None, dataset_versions=None):
+        self.version = version
+        self.raw = raw
+        self.kpis = kpis
+        self.augmented = augmented
+        self.oee_sites = list(oee_sites or [])
+        self.fingerprints = dict(fingerprints or {})
+        self.dataset_versions = dict(dataset_versions or dict.fromkeys(DATASET_NAMES, version))
+        self.loaded_at = datetime.datetime.now()
+
+    def content_tag(self, datasets=DATASET_NAMES):
+        """
+        Short hash of the named datasets' fingerprints (plus the OEE sites), the same in
+        every process for the same data, for ETags. Without a fingerprint, a dataset
+        counts by its version in this process.
+        """
+        parts = [self.fingerprints.get(name, f"{BOOT_ID}-{self.dataset_versions.get(name)}") for name in datasets]
+        if 'oee' in datasets:
+            parts.append(self.oee_sites)
+        return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+    def changed_since(self, version):
+        """Names of the datasets that changed after the given snapshot version."""
+        return [name for name, changed_in in self.dataset_versions.items() if changed_in > version]
+
+
+class DatasetRegistry:
+    """
+    Holds the current DatasetSnapshot and tells waiting threads when a new one arrives.
+
+    The app starts with an empty registry, binds its port, and the background loader
+    publishes the first snapshot; readiness is simply "a snapshot has been published".
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._snapshot = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    @property
+    def version(self):
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else 0
+
+    def current(self):
+        """The latest snapshot, or None before the first load completes."""
+        return self._snapshot
+
+    def publish(self, raw, kpis, augmented, oee_sites=None, fingerprints=None):
+        """
+        Publishes a new snapshot under the next version number and wakes all waiters.
+
+        With fingerprints, datasets whose content is unchanged keep their previous
+        dataset version, and a reload that changes nothing publishes nothing.
+
+        Returns:
+            DatasetSnapshot: The current snapshot after the call.
+        """
+        with self._condition:
+            previous = self._snapshot
+            version = self.version + 1
+            dataset_versions = {}
+            for name in DATASET_NAMES:
+                unchanged = (previous is not None and fingerprints is not None
+                             and fingerprints.get(name) == previous.fingerprints.get(name))
+                dataset_versions[name] = previous.dataset_versions[name] if unchanged else version
+            if previous is not None and all(v < version for v in dataset_versions.values()) \
+                    and list(oee_sites or []) == previous.oee_sites:
+                return previous
+
+            self._snapshot = DatasetSnapshot(version, raw, kpis, augmented, oee_sites, fingerprints, dataset_versions)
+            self.error = None
+            self._condition.notify_all()
+            return self._snapshot
+
+    def fail(self, error):
+        """Records a failed load; the previous snapshot (if any) stays current."""
+        with self._condition:
+            self.error = f"{type(error).__name__}: {error}"
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """Blocks until a snapshot exists (or the timeout passes) and returns it, or None."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._snapshot is not None or self.error is not None, timeout)
+            return self._snapshot
+
+    def wait_for_version(self, newer_than, timeout=None):
+        """Blocks until the version exceeds `newer_than`; returns the current snapshot either way."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version > newer_than, timeout)
+            return self._snapshot
+
+
+def fingerprint_sections(data_sections):
+    """Content hash of a dataset's parsed sections (None for a failed load)."""
+    if not data_sections:
+        return None
+    import pandas as pd
+
+    digest = hashlib.blake2b(digest_size=16)
+    for section_name in sorted(data_sections):
+        section = data_sections[section_name]
+        digest.update(section_name.encode())
+        if isinstance(section, (pd.DataFrame, pd.Series)):
+            digest.update(pd.util.hash_pandas_object(section, index=True).to_numpy().tobytes())
+            if isinstance(section, pd.DataFrame):
+                digest.update('|'.join(map(str, section.columns)).encode())
+        else:
+            digest.update(repr(section).encode())
+    return digest.hexdigest()
+
+
+def source_paths():
+    """The files load_datasets() reads, given the current environment."""
+    workbook_file = os.environ.get('KPI_WORKBOOK')
+    if workbook_file:
+        return [workbook_file]
+    data_dir = os.environ.get('KPI_DATA_DIR')
+    if data_dir:
+        from bulk_ingest import discover_worksheets
+        return discover_worksheets(data_dir)
+    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    return [os.path.join(data_dir, name) for name in (
+        'COPQ_Dummy_Data.csv', 'OEE_Dummy_Data.csv', 'Manufacturing_Cost_per_Unit_Calculator.csv')]
+
+
+def watch_sources(reload, interval, stop_event=None):
+    """
+    Calls `reload()` whenever the modification time or size of a source file changes.
+
+    Runs until `stop_event` is set; meant for a daemon thread. Only os.stat() is called
+    between changes, so a short interval is cheap.
+    """
+    def signature():
+        stats = []
+        for path in source_paths():
+            try:
+                st = os.stat(path)
+                stats.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                stats.append((path, None, None))
+        return stats
+
+    stop_event = stop_event or threading.Event()
+    last = signature()
+    while not stop_event.wait(interval):
+        current = signature()
+        if current != last:
+            last = current
+            logger.info("Source files changed; reloading datasets.")
+            try:
+                reload()
+            except Exception:
+                logger.exception("Dataset reload failed; keeping the previous version.")
+
+
+def load_datasets(fact_store=None, site=None):
+    """
+    Loads all three worksheets, upserts them into the fact store and calculates KPIs.
+
+    Sources come from the environment, as before: $KPI_WORKBOOK for a single Excel
+    workbook, otherwise the CSV exports in the data folder. With $KPI_DATA_DIR, every
+    worksheet under that directory is loaded in parallel ($KPI_INGEST_WORKERS processes,
+    see bulk_ingest.py) and upserted with its file as site; the dashboards show the
+    files of `site` (or the first file of each type).
+
+    Returns:
+        dict: Keyword arguments for DatasetRegistry.publish().
+    """
+    from data_processor import (
+        load_and_process_copq_data, load_and_process_oee_data, load_and_process_mfg_cost_data,
+        load_and_process_workbook,
+    )
+    from fact_store import DEFAULT_SITE
+
+    site = site or DEFAULT_SITE
+    workbook_file = os.environ.get('KPI_WORKBOOK')
+    data_dir = os.environ.get('KPI_DATA_DIR')
+    upserted = False
+
+    if data_dir and not workbook_file:
+        import multiprocessing
+        from bulk_ingest import ingest_directory
+
+        # Loads run on a background thread of the server, so workers are not forked from it
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        ingested = ingest_directory(data_dir, workers=int(os.environ.get('KPI_INGEST_WORKERS', 0)) or None,
+                                    fact_store=fact_store, mp_context=multiprocessing.get_context(start_method))
+        logger.info(ingested.summary())
+        raw = {name: ingested.datasets[name].get(site, next(iter(ingested.datasets[name].values()), None))
+               for name in DATASET_NAMES}
+        upserted = True
+    elif workbook_file:
+        workbook_data = load_and_process_workbook(workbook_file) or {}
+        raw = {name: workbook_data.get(name) for name in DATASET_NAMES}
+    else:
+        copq_file, oee_file, mfg_cost_file = source_paths()
+        raw = {
+            'copq': load_and_process_copq_data(copq_file),
+            'oee': load_and_process_oee_data(oee_file),
+            'mfg_cost': load_and_process_mfg_cost_data(mfg_cost_file),
+        }
+
+    oee_sites = []
+    if fact_store is not None:
+        if not upserted:
+            for dataset_name, data_sections in raw.items():
+                fact_store.upsert_sections(dataset_name, data_sections, site=site)
+        # Current site first so it is the dropdown default
+        oee_sites = sorted(fact_store.list_sites('oee'), key=lambda s: s != site)
+
+    return build_datasets(raw, oee_sites)
+
+
+def build_datasets(raw, oee_sites=None, previous=None):
+    """
+    KPIs, augmented frames and fingerprints for parsed worksheets, as keyword arguments for
+    DatasetRegistry.publish(). Datasets whose content matches the `previous` snapshot
+    reuse its KPIs and frames instead of being recalculated.
+    """
+    from kpi_calculations import calculate_copq_kpis, calculate_oee_kpis, calculate_mfg_cost_kpis
+
+    calculators = {'copq': calculate_copq_kpis, 'oee': calculate_oee_kpis, 'mfg_cost': calculate_mfg_cost_kpis}
+    fingerprints = {name: fingerprint_sections(raw.get(name)) for name in DATASET_NAMES}
+    kpis, augmented = {}, {}
+    for dataset_name, calculate in calculators.items():
+        if previous is not None and fingerprints[dataset_name] == previous.fingerprints.get(dataset_name):
+            kpis[dataset_name], augmented[dataset_name] = previous.kpis[dataset_name], previous.augmented[dataset_name]
+        else:
+            kpis[dataset_name], augmented[dataset_name] = calculate(raw[dataset_name]) if raw.get(dataset_name) else ({}, {})
+
+    return {'raw': {name: raw.get(name) for name in DATASET_NAMES}, 'kpis': kpis, 'augmented': augmented,
+            'oee_sites': list(oee_sites or []), 'fingerprints': fingerprints}
@@ -0,0 +1,393 @@
+# src/data_schema.py
+
+import os
+
+import pandas as pd
+
+# --- Column kinds and their storage dtypes ---
+# Every parsed column is tagged with a "kind". Text labels become categoricals and
+# counts are downcast to 32-bit integers (exact at any realistic size). Percentages,
+# other numbers and currency stay float64: float32 would put rounding noise (0.8405 ->
+# 0.8404999971) into every store payload, API response and export.
+KIND_DTYPES = {
+    'category': 'category',
+    'count': 'int32',
+    'percent': 'float64',
+    'number': 'float64',
+    'money': 'float64',
+}
+
+# Year of the first month of a worksheet ($KPI_WORKSHEET_START_YEAR). 1900 is what a bare
+# month name parses to, so single-year worksheets keep their dates.
+WORKSHEET_START_YEAR = int(os.environ.get('KPI_WORKSHEET_START_YEAR', 1900))
+
+# --- Worksheet schemas ---
+# One declarative schema per worksheet type. section_parser.py compiles these into
+# parsers, so supporting a new worksheet (or a new section of an existing one) only
+# needs an entry here.
+#
+# Matchers are (column, text, mode) tuples compared against the stripped, lower-cased
+# cell; mode is 'equals' or 'contains'. A section is located at the first row where all
+# of its anchor matchers hold, and its rows run until the next fully blank row.
+#
+# Section layouts:
+#   'table'     - a header row followed by one record per row. 'header_offset' is the
+#                 distance from the anchor row to the header row (default 0).
+#                 'label_overflow': True rejoins first-column labels the export split on
+#                 unquoted commas (the second column must be numeric).
+#   'key_value' - label/value rows starting at the anchor row; returns a Series.
+#   'wide'      - label rows with one column per month (months taken from the
+#                 worksheet's 'month_header'); transposed to a Month-indexed frame.
+#
+# Columns/fields are (name, kind) pairs; kinds are the keys of KIND_DTYPES plus
+# 'month' (full month name parsed to a datetime) and 'text' (kept as a stripped string).
+#
+# Month names carry no year. The month header and the key column of month-keyed tables
+# are consecutive months, so they start in WORKSHEET_START_YEAR and move to the next year
+# each time the month rolls over (December -> January); a 24-month export covers two
+# years. Other month columns (e.g. 'Month Implemented') stay in WORKSHEET_START_YEAR.
+WORKSHEET_SCHEMAS = {
+    'copq': {
+        'label': 'COPQ',
+        'title': 'cost of poor quality',
+        'sections': {
+            'basic_copq': {
+                'label': 'BASIC PRODUCTION DATA - MONTHLY',
+                'layout': 'key_value',
+                'anchor': [(0, 'total units produced', 'contains')],
+                'fields': [
+                    ('Total Units Produced', 'number'),
+                    ('Defective Units', 'number'),
+                    ('Defect Rate (%)', 'percent'),
+                    ('Defect Rate (PPM)', 'number'),
+                ],
+            },
+            'breakdown_copq': {
+                'label': 'COST OF QUALITY BREAKDOWN',
+                'layout': 'table',
+                'anchor': [(0, 'category', 'contains')],
+                'columns': [
+                    ('Category', 'category'),
+                    ('Cost (£)', 'money'),
+                    ('% of Total COPQ', 'percent'),
+                    ('% of Revenue', 'percent'),
+                ],
+            },
+            'monthly_copq_tracking': {
+                'label': 'MONTHLY COPQ TRACKING',
+                'layout': 'table',
+                'anchor': [(0, 'month', 'equals'), (3, 'copq', 'contains')],
+                'columns': [
+                    ('Month', 'month'),
+                    ('Total Units', 'count'),
+                    ('Defective Units', 'count'),
+                    ('COPQ (£)', 'money'),
+                    ('COPQ % of Revenue', 'percent'),
+                ],
+            },
+            'defect_categories': {
+                'label': 'DEFECT CATEGORIES BREAKDOWN',
+                'layout': 'table',
+                'anchor': [(0, 'defect type', 'contains')],
+                'columns': [
+                    ('Defect Type', 'category'),
+                    ('Number of Occurrences', 'count'),
+                    ('% of Total Defects', 'percent'),
+                    ('Associated Cost (£)', 'money'),
+                ],
+            },
+            'quality_costs': {
+                'label': 'PREVENTION VS. DETECTION VS. FAILURE COSTS',
+                'layout': 'table',
+                'anchor': [(0, 'cost category', 'equals')],
+                'label_overflow': True,
+                'columns': [
+                    ('Cost Category', 'text'),
+                    ('Monthly Cost (£)', 'money'),
+                    ('% of Total Quality Costs', 'percent'),
+                ],
+            },
+            'quality_initiatives': {
+                'label': 'QUALITY IMPROVEMENT INITIATIVES',
+                'layout': 'table',
+                'anchor': [(0, 'initiative', 'equals'), (1, 'target copq reduction', 'contains')],
+                'label_overflow': True,
+                'columns': [
+                    ('Initiative', 'text'),
+                    ('Target COPQ Reduction (£)', 'money'),
+                    ('Estimated Implementation Cost (£)', 'money'),
+                    ('ROI (%)', 'percent'),
+                    ('Status', 'category'),
+                ],
+            },
+        },
+    },
+    'oee': {
+        'label': 'OEE',
+        'title': 'oee calculation worksheet',
+        'sections': {
+            'basic_data': {
+                'label': 'BASIC DATA (CONSTANTS)',
+                'layout': 'key_value',
+                'anchor': [(0, 'shift length (minutes)', 'equals')],
+                # The ideal cycle time in minutes and the production rate are formulas
+                # of these, derived again in shift_calendar.shift_constants
+                'fields': [
+                    ('Shift Length (minutes)', 'number'),
+                    ('Planned Breaks (minutes)', 'number'),
+                    ('Meal Breaks (minutes)', 'number'),
+                    ('Ideal Cycle Time (seconds)', 'number'),
+                    ('Total Possible Shifts/Month', 'number'),
+                    ('Total Possible Days/Month', 'number'),
+                ],
+            },
+            'monthly_oee': {
+                'label': 'MONTHLY OEE & TEEP SUMMARY',
+                'layout': 'table',
+                'anchor': [(0, 'month', 'equals'), (4, 'oee (%)', 'equals')],
+                'columns': [
+                    ('Month', 'month'),
+                    ('Availability (%)', 'percent'),
+                    ('Performance (%)', 'percent'),
+                    ('Quality (%)', 'percent'),
+                    ('OEE (%)', 'percent'),
+                    ('TEEP (%)', 'percent'),
+                ],
+            },
+            'teep_detailed': {
+                'label': 'TEEP CALCULATION (DETAILED)',
+                'layout': 'table',
+                'anchor': [(0, 'month', 'equals'), (1, 'scheduled shifts', 'equals')],
+                'columns': [
+                    ('Month', 'month'),
+                    ('Scheduled Shifts', 'count'),
+                    ('Actual Shifts', 'count'),
+                    ('Utilization (%)', 'percent'),
+                    ('OEE (%)', 'percent'),
+                    ('TEEP (%)', 'percent'),
+                ],
+            },
+            'downtime_cost': {
+                'label': 'DOWNTIME COST ANALYSIS',
+                'layout': 'table',
+                'anchor': [(0, 'month', 'equals'), (1, 'downtime (min)', 'equals')],
+                'columns': [
+                    ('Month', 'month'),
+                    ('Downtime (min)', 'count'),
+                    ('Cost/Min (£)', 'money'),
+                    ('Total Cost (£)', 'money'),
+                    ('Root Cause (Top 3)', 'category'),
+                ],
+            },
+            'maintenance_costs': {
+                'label': 'MAINTENANCE COSTS BREAKDOWN',
+                'layout': 'table',
+                'anchor': [(0, 'month', 'equals'), (1, 'preventive (£)', 'equals')],
+                'columns': [
+                    ('Month', 'month'),
+                    ('Preventive (£)', 'money'),
+                    ('Corrective (£)', 'money'),
+                    ('Downtime Cost (£)', 'money'),
+                    ('Total (£)', 'money'),
+                    ('% of Revenue', 'percent'),
+                ],
+            },
+        },
+    },
+    'mfg_cost': {
+        'label': 'Mfg Cost',
+        'title': 'manufacturing cost per unit',
+        'month_header': {'anchor': [(0, 'monthly production data', 'contains')], 'offset': 1},
+        'sections': {
+            'production_data': {
+                'label': 'MONTHLY PRODUCTION DATA',
+                'layout': 'wide',
+                'anchor': [(0, 'monthly production data', 'contains')],
+                'fields': [
+                    ('Total Units Produced', 'count'),
+                ],
+            },
+            'direct_material': {
+                'label': 'DIRECT MATERIAL COSTS',
+                'layout': 'wide',
+                'anchor': [(0, 'direct material costs (£)', 'equals')],
+                'fields': [
+                    ('Raw Material A Cost (£)', 'money'),
+                    ('Raw Material B Cost (£)', 'money'),
+                    ('Raw Material C Cost (£)', 'money'),
+                    ('Components Cost (£)', 'money'),
+                    ('Packaging Materials (£)', 'money'),
+                    ('Total Direct Material Cost (£)', 'money'),
+                ],
+            },
+            'direct_labor': {
+                'label': 'DIRECT LABOR COSTS',
+                'layout': 'wide',
+                'anchor': [(0, 'direct labor costs (£)', 'equals')],
+                'fields': [
+                    ('Production Labor Hours', 'number'),
+                    ('Average Labor Rate (£/hour)', 'money'),
+                    ('Production Labor Cost (£)', 'money'),
+                    ('Setup Labor Hours', 'number'),
+                    ('Average Setup Labor Rate (£/hour)', 'money'),
+                    ('Setup Labor Cost (£)', 'money'),
+                    ('Quality Control Labor Hours', 'number'),
+                    ('Average QC Labor Rate (£/hour)', 'money'),
+                    ('Quality Control Labor Cost (£)', 'money'),
+                    ('Total Direct Labor Cost (£)', 'money'),
+                ],
+            },
+            'manufacturing_overhead': {
+                'label': 'MANUFACTURING OVERHEAD COSTS',
+                'layout': 'wide',
+                'anchor': [(0, 'manufacturing overhead costs (£)', 'equals')],
+                'fields': [
+                    ('Indirect Labor Cost (£)', 'money'),
+                    ('Equipment Depreciation (£)', 'money'),
+                    ('Facility Costs (Rent/Mortgage) (£)', 'money'),
+                    ('Utilities (£)', 'money'),
+                    ('Maintenance and Repairs (£)', 'money'),
+                    ('Consumable Supplies (£)', 'money'),
+                    ('Production IT Systems (£)', 'money'),
+                    ('Other Overhead Costs (£)', 'money'),
+                    ('Total Manufacturing Overhead (£)', 'money'),
+                ],
+            },
+            'total_manufacturing_cost': {
+                'label': 'TOTAL MANUFACTURING COST',
+                'layout': 'wide',
+                'anchor': [(0, 'total manufacturing cost', 'contains')],
+                'fields': [
+                    ('Total Direct Material Cost (£)', 'money'),
+                    ('Total Direct Labor Cost (£)', 'money'),
+                    ('Total Manufacturing Overhead (£)', 'money'),
+                    ('Total Manufacturing Cost (£)', 'money'),
+                    ('Manufacturing Cost per Unit (£)', 'money'),
+                ],
+            },
+            'efficiency_indicators': {
+                'label': 'COST EFFICIENCY INDICATORS',
+                'layout': 'wide',
+                'anchor': [(0, 'cost efficiency indicators', 'contains')],
+                'fields': [
+                    ('Material Yield (%)', 'percent'),
+                    ('Labor Efficiency (%)', 'percent'),
+                    ('Capacity Utilization (%)', 'percent'),
+                ],
+            },
+            'cost_variance': {
+                'label': 'COST VARIANCE ANALYSIS',
+                'layout': 'table',
+                'anchor': [(0, 'cost variance analysis', 'contains')],
+                'header_offset': 1,
+                'columns': [
+                    ('Month_KPI', 'category'),
+                    ('Actual', 'money'),
+                    ('Budget', 'money'),
+                    ('Variance (£)', 'money'),
+                    ('Variance (%)', 'percent'),
+                ],
+            },
+            'cost_reduction_initiatives': {
+                'label': 'COST REDUCTION INITIATIVES',
+                'layout': 'table',
+                'anchor': [(0, 'initiative', 'equals'), (1, 'target monthly savings', 'contains')],
+                'label_overflow': True,
+                'columns': [
+                    ('Initiative', 'text'),
+                    ('Target Monthly Savings (£)', 'money'),
+                    ('Implementation Cost (£)', 'money'),
+                    ('Payback Period (months)', 'number'),
+                    ('Status', 'category'),
+                    ('Month Implemented', 'month'),
+                ],
+            },
+            'cost_drivers': {
+                'label': 'TRENDING ANALYSIS - KEY COST DRIVERS',
+                'layout': 'table',
+                'anchor': [(0, 'month', 'equals'), (1, 'raw material index (base=100)', 'equals')],
+                'columns': [
+                    ('Month', 'month'),
+                    ('Raw Material Index (Base=100)', 'number'),
+                    ('Labor Rate Index (Base=100)', 'number'),
+                    ('Energy Cost Index (Base=100)', 'number'),
+                    ('Total Cost Index (Base=100)', 'number'),
+                ],
+            },
+        },
+    },
+}
+
+# --- Per-section column kinds ---
+# Flattened view of WORKSHEET_SCHEMAS, keyed by the section names returned by the loaders.
+# Columns whose kind has no storage dtype ('month', 'text') are left out.
+SECTION_SCHEMAS = {
+    section_name: {
+        name: kind
+        for name, kind in section.get('columns', section.get('fields', []))
+        if kind in KIND_DTYPES
+    }
+    for worksheet in WORKSHEET_SCHEMAS.values()
+    for section_name, section in worksheet['sections'].items()
+}
+
+# Memory footprint (bytes) per dataset and section, raw vs. typed, recorded by the
+# section parser (WorksheetParser.parse with record_memory=True).
+MEMORY_REPORTS = {}
+
+
+def cast_column(series, kind):
+    """Casts a single column to the storage dtype of its kind."""
+    if kind == 'category':
+        return series.astype(str).str.strip().astype('category')
+    if kind not in KIND_DTYPES:
+        return series
+
+    numeric = series if pd.api.types.is_numeric_dtype(series) else pd.to_numeric(series, errors='coerce')
+    if kind == 'count' and numeric.isna().any():
+        # Integer columns cannot hold NaN, so a count with gaps is stored as float32
+        return numeric.astype('float32')
+    return numeric.astype(KIND_DTYPES[kind])
+
+
+def apply_section_schema(df, section_name):
+    """
+    Casts the columns of a parsed section to the dtypes declared in SECTION_SCHEMAS.
+
+    Returns the DataFrame unchanged if the section has no schema.
+    """
+    schema = SECTION_SCHEMAS.get(section_name)
+    if df is None or schema is None or not isinstance(df, pd.DataFrame):
+        return df
+
+    df = df.copy()
+    for col, kind in schema.items():
+        if col in df.columns:
+            df[col] = cast_column(df[col], kind)
+    return df
+
+
+def memory_bytes(obj):
+    """Deep memory usage of a DataFrame or Series, in bytes."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    return 0
+
+
+def format_memory_report(dataset_name):
+    """Human-readable summary of MEMORY_REPORTS[dataset_name]."""
+    report = MEMORY_REPORTS.get(dataset_name)
+    if not report:
+        return f"No memory report recorded for '{dataset_name}'."
+
+    lines = [f"Memory footprint for '{dataset_name}':"]
+    total_before = total_after = 0
+    for section_name, sizes in report.items():
+        total_before += sizes['before']
+        total_after += sizes['after']
+        lines.append(f"  {section_name:<28} {sizes['before']:>10,} B -> {sizes['after']:>10,} B")
+    saved = (1 - total_after / total_before) * 100 if total_before else 0.0
+    lines.append(f"  {'TOTAL':<28} {total_before:>10,} B -> {total_after:>10,} B ({saved:.1f}% saved)")
+    return "\n".join(lines)
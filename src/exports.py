@@ -0,0 +1,360 @@
+# src/exports.py
+
+import importlib
+import io
+import zlib
+
+import flask
+
+# The routes are registered before the server binds, so this module stays light:
+# pandas, plotly and the dashboard modules are imported on the first export request.
+# Optional dependencies: Parquet needs pyarrow, static images need kaleido.
+
+
+def _deferred(module_name, function_name):
+    """Stand-in for a dashboard helper that imports its module on first call."""
+    def call(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), function_name)(*args, **kwargs)
+    call.__name__ = function_name
+    return call
+
+
+filter_copq_monthly = _deferred('dashboards.copq_dashboard', 'filter_copq_monthly')
+filter_defect_categories = _deferred('dashboards.copq_dashboard', 'filter_defect_categories')
+build_copq_breakdown_figure = _deferred('dashboards.copq_dashboard', 'build_copq_breakdown_figure')
+build_copq_monthly_trend_figure = _deferred('dashboards.copq_dashboard', 'build_copq_monthly_trend_figure')
+build_defect_type_cost_figure = _deferred('dashboards.copq_dashboard', 'build_defect_type_cost_figure')
+filter_oee_by_date = _deferred('dashboards.oee_dashboard', 'filter_oee_by_date')
+filter_downtime_by_reason = _deferred('dashboards.oee_dashboard', 'filter_downtime_by_reason')
+filter_oee_by_shift = _deferred('dashboards.oee_dashboard', 'filter_oee_by_shift')
+build_oee_trend_figure = _deferred('dashboards.oee_dashboard', 'build_oee_trend_figure')
+filter_cost_variance = _deferred('dashboards.mfg_cost_dashboard', 'filter_cost_variance')
+filter_cost_attribution = _deferred('dashboards.mfg_cost_dashboard', 'filter_cost_attribution')
+build_mfg_cost_trend_figure = _deferred('dashboards.mfg_cost_dashboard', 'build_mfg_cost_trend_figure')
+build_mfg_cost_breakdown_pie = _deferred('dashboards.mfg_cost_dashboard', 'build_mfg_cost_breakdown_pie')
+build_variance_period_figure = _deferred('dashboards.mfg_cost_dashboard', 'build_variance_period_figure')
+filter_by_status = _deferred('initiatives', 'filter_by_status')
+period_variance = _deferred('cost_variance', 'period_variance')
+variance_trend = _deferred('cost_variance', 'variance_trend')
+
+
+def _pyarrow():
+    """(pyarrow, pyarrow.parquet), or (None, None) when pyarrow is not installed."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None, None
+    return pa, pq
+
+DEFAULT_CHUNK_ROWS = 10000
+
+# --- Query argument validation ---
+# Each reader returns the parsed argument (or its default when absent) and raises
+# ValueError on a value the dashboard control could not have produced; the routes turn
+# that into a 400, as kpi_api.filter_frame does for /api/v1.
+
+def _date_arg(args, name):
+    """A YYYY-MM-DD argument as given (None when absent)."""
+    value = args.get(name)
+    if not value:
+        return None
+    import pandas as pd
+    try:
+        pd.to_datetime(value, format='%Y-%m-%d')
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid {name} '{value}': expected a YYYY-MM-DD date.") from None
+    return value
+
+
+def _choice_arg(args, name, choices, default=None):
+    """An argument that must be one of `choices`."""
+    value = args.get(name, default)
+    if value is not None and value not in choices:
+        listed = sorted(map(str, choices)) if isinstance(choices, set) else list(map(str, choices))
+        listed = ', '.join(listed[:20])
+        raise ValueError(f"Unknown {name} '{value}'. Expected one of: {listed}.")
+    return value
+
+
+def _int_arg(args, name, default=None, minimum=None):
+    """An integer argument, at least `minimum`."""
+    value = args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}': expected an integer.") from None
+    if minimum is not None and number < minimum:
+        raise ValueError(f"Invalid {name} '{value}': must be at least {minimum}.")
+    return number
+
+
+def _month_name_arg(args, name='month'):
+    """A month name argument (mfg-cost-month-filter)."""
+    from cost_variance import MONTH_NAMES
+    return _choice_arg(args, name, MONTH_NAMES)
+
+
+def _values(df, column):
+    """Distinct non-null values of a column as strings."""
+    return set(df[column].dropna().astype(str)) if column in df.columns else set()
+
+
+def _defect_types(df):
+    from pareto import split_defect_family
+    return {'Total'} | _values(df, 'Defect Type') | set(split_defect_family(df['Defect Type']).dropna().astype(str))
+
+
+def _shifts(df):
+    from shift_calendar import ALL_SHIFTS
+    return {ALL_SHIFTS} | _values(df, 'Shift')
+
+
+def _statuses(df):
+    from initiatives import ALL_STATUSES
+    return {ALL_STATUSES} | _values(df, 'Status')
+
+
+def _cost_categories():
+    from cost_attribution import ALL_CATEGORIES, COST_CATEGORIES
+    return [ALL_CATEGORIES] + list(COST_CATEGORIES.values())
+
+
+def _variance_period(args):
+    from cost_variance import PERIOD_TYPES
+    return _choice_arg(args, 'period', PERIOD_TYPES, 'ytd')
+
+
+def _pareto_args(df, args):
+    """(defect_type, metric, top_n) for the defect Pareto chart."""
+    from pareto import PARETO_METRICS
+    return (_choice_arg(args, 'defect_type', _defect_types(df), 'Total'),
+            _choice_arg(args, 'metric', PARETO_METRICS, 'cost'),
+            _int_arg(args, 'top_n', 10, minimum=1))
+
+
+def _oee_dates(df, args):
+    return filter_oee_by_date(df, _date_arg(args, 'start_date'), _date_arg(args, 'end_date'))
+
+# --- Exportable tables ---
+# Each entry maps a URL name to (dataset, augmented frame key, filter function). The filter
+# receives the request's query args, named after the dashboard controls they mirror:
+#   month        -> copq-month-filter (YYYY-MM-DD) / mfg-cost-month-filter (month name)
+#   defect_type  -> copq-defect-type-filter (a defect family or type)
+#   metric, top_n -> copq-pareto-metric, copq-pareto-top-n (defect Pareto chart)
+#   start_date, end_date -> oee-date-range-filter
+#   reason       -> oee-downtime-reason-filter
+#   shift        -> oee-shift-filter
+#   category     -> mfg-cost-category-filter / mfg-cost-attribution-category (cost-attribution)
+#   status       -> initiative-status-filter
+#   period, kpi, as_of -> cost-variance-period-type, cost-variance-kpi, cost-variance-as-of
+EXPORT_TABLES = {
+    'copq-monthly': ('copq', 'monthly_copq_tracking',
+                     lambda df, args: filter_copq_monthly(df, _date_arg(args, 'month'))),
+    'copq-breakdown': ('copq', 'copq_breakdown', lambda df, args: df),
+    'defects': ('copq', 'defect_categories',
+                lambda df, args: filter_defect_categories(
+                    df, _choice_arg(args, 'defect_type', _defect_types(df), 'Total'))),
+    'oee-monthly': ('oee', 'monthly_oee_trends', _oee_dates),
+    'oee-shifts': ('oee', 'shift_oee_trends',
+                   lambda df, args: filter_oee_by_shift(
+                       _oee_dates(df, args), _choice_arg(args, 'shift', _shifts(df), 'All Shifts'))),
+    # Reasons are matched as text within the root causes, so any reason is valid
+    'downtime': ('oee', 'downtime_cost_analysis',
+                 lambda df, args: filter_downtime_by_reason(_oee_dates(df, args), args.get('reason', 'All Reasons'))),
+    'mfg-cost': ('mfg_cost', 'total_mfg_cost_trends', lambda df, args: df),
+    'cost-variance': ('mfg_cost', 'cost_variance_analysis',
+                      lambda df, args: filter_cost_variance(df, _month_name_arg(args))),
+    'cost-attribution': ('mfg_cost', 'cost_attribution',
+                         lambda df, args: filter_cost_attribution(
+                             df, _month_name_arg(args),
+                             _choice_arg(args, 'category', _cost_categories(), 'All Categories'))),
+    'cost-facts': ('mfg_cost', 'cost_facts', lambda df, args: df),
+    'cost-variance-periods': ('mfg_cost', 'cost_variance_facts',
+                              lambda df, args: period_variance(df, _variance_period(args), _int_arg(args, 'as_of', minimum=0),
+                                                               _choice_arg(args, 'kpi', _values(df, 'KPI')))),
+    'quality-costs': ('copq', 'quality_costs', lambda df, args: df),
+    'copq-initiatives': ('copq', 'initiatives',
+                         lambda df, args: filter_by_status(df, _choice_arg(args, 'status', _statuses(df), 'All Statuses'))),
+    'mfg-initiatives': ('mfg_cost', 'initiatives',
+                        lambda df, args: filter_by_status(df, _choice_arg(args, 'status', _statuses(df), 'All Statuses'))),
+}
+
+# --- Exportable figures, keyed by their dcc.Graph id ---
+EXPORT_FIGURES = {
+    'copq-cost-breakdown-chart': ('copq', 'copq_breakdown',
+                                  lambda df, args: build_copq_breakdown_figure(df)),
+    'copq-monthly-trend-chart': ('copq', 'monthly_copq_tracking',
+                                 lambda df, args: build_copq_monthly_trend_figure(df, _date_arg(args, 'month'))),
+    'copq-defect-type-cost-chart': ('copq', 'defect_categories',
+                                    lambda df, args: build_defect_type_cost_figure(df, *_pareto_args(df, args))),
+    'oee-trend-chart': ('oee', 'monthly_oee_trends',
+                        lambda df, args: build_oee_trend_figure(_oee_dates(df, args))),
+    'mfg-cost-trend-chart': ('mfg_cost', 'total_mfg_cost_trends',
+                             lambda df, args: build_mfg_cost_trend_figure(
+                                 df, _choice_arg(args, 'category', list(df.columns), 'Total Direct Material Cost (£)'))),
+    'cost-variance-period-chart': ('mfg_cost', 'cost_variance_facts',
+                                   lambda df, args: build_variance_period_figure(
+                                       variance_trend(df, _variance_period(args), _choice_arg(args, 'kpi', _values(df, 'KPI'))),
+                                       _variance_period(args))),
+    'mfg-cost-breakdown-pie': ('mfg_cost', 'total_mfg_cost_trends',
+                               lambda df, args: build_mfg_cost_breakdown_pie(
+                                   df, _month_name_arg(args)
+                                   or (df.index[0].strftime('%B') if len(df) else None))),
+}
+
+IMAGE_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml', 'pdf': 'application/pdf'}
+
+
+# --- Chunked encoders ---
+
+def iter_csv_chunks(df, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yields the frame as CSV bytes, `chunk_rows` rows at a time (header in the first chunk)."""
+    import pandas as pd
+
+    index = isinstance(df.index, pd.DatetimeIndex)
+    if df.empty:
+        yield df.to_csv(index=index).encode('utf-8')
+        return
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(header=start == 0, index=index).encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever has been written since the last drain."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_parquet_chunks(df, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yields a Parquet file one row group at a time."""
+    import pandas as pd
+
+    pa, pq = _pyarrow()
+    index = isinstance(df.index, pd.DatetimeIndex)
+    sink = _ChunkSink()
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=index)
+    with pq.ParquetWriter(sink, schema) as writer:
+        for start in range(0, max(len(df), 1), chunk_rows):
+            writer.write_table(pa.Table.from_pandas(df.iloc[start:start + chunk_rows], schema=schema, preserve_index=index))
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def gzip_stream(chunks):
+    """Compresses a byte stream on the fly into a single gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# --- Routes ---
+
+def _lookup(get_datasets, dataset, frame_key):
+    augmented = (get_datasets() or {}).get(dataset) or {}
+    df = augmented.get(frame_key)
+    if df is None:
+        flask.abort(404, description=f"No '{frame_key}' data loaded for {dataset}.")
+    return df
+
+
+def register_export_routes(server, get_datasets):
+    """
+    Adds streaming export endpoints to the Dash Flask server.
+
+    Args:
+        server (flask.Flask): The Dash app's server (app.server).
+        get_datasets (callable): Returns {'copq': augmented, 'oee': augmented, 'mfg_cost': augmented},
+                                 evaluated per request so exports follow data reloads.
+
+    Routes:
+        /export/<table>.<csv|parquet>[?compress=gzip&chunk_rows=N&<filters>]
+        /export/figure/<graph id>.<png|svg|pdf|json>[?<filters>]
+    """
+
+    @server.route('/export/<table>.<fmt>')
+    def export_table(table, fmt):
+        if table not in EXPORT_TABLES:
+            flask.abort(404, description=f"Unknown export table '{table}'.")
+        if fmt not in ('csv', 'parquet'):
+            flask.abort(400, description="Table exports support 'csv' and 'parquet'.")
+        if fmt == 'parquet' and _pyarrow()[1] is None:
+            flask.abort(501, description="Parquet export requires the optional 'pyarrow' package.")
+
+        dataset, frame_key, apply_filters = EXPORT_TABLES[table]
+        args = flask.request.args
+        try:
+            df = apply_filters(_lookup(get_datasets, dataset, frame_key), args)
+            chunk_rows = _int_arg(args, 'chunk_rows', DEFAULT_CHUNK_ROWS, minimum=1)
+            _choice_arg(args, 'compress', ('gzip',))
+        except ValueError as e:
+            flask.abort(400, description=str(e))
+
+        chunks = iter_csv_chunks(df, chunk_rows) if fmt == 'csv' else iter_parquet_chunks(df, chunk_rows)
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/vnd.apache.parquet'
+        filename = f"{table}.{fmt}"
+        if args.get('compress') == 'gzip':
+            chunks = gzip_stream(chunks)
+            mimetype = 'application/gzip'
+            filename += '.gz'
+
+        return flask.Response(
+            flask.stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+        )
+
+    @server.route('/export/figure/<figure_id>.<fmt>')
+    def export_figure(figure_id, fmt):
+        if figure_id not in EXPORT_FIGURES:
+            flask.abort(404, description=f"Unknown figure '{figure_id}'.")
+        if fmt != 'json' and fmt not in IMAGE_MIMETYPES:
+            flask.abort(400, description="Figure exports support 'png', 'svg', 'pdf' and 'json'.")
+
+        import plotly.io as pio
+
+        dataset, frame_key, build_figure = EXPORT_FIGURES[figure_id]
+        try:
+            fig = build_figure(_lookup(get_datasets, dataset, frame_key), flask.request.args)
+        except ValueError as e:
+            flask.abort(400, description=str(e))
+        if fig is None:
+            flask.abort(404, description="No data for the selected filter.")
+
+        if fmt == 'json':
+            return flask.Response(pio.to_json(fig), mimetype='application/json')
+        try:
+            image = pio.to_image(fig, format=fmt)
+        except (ValueError, ImportError, RuntimeError) as e:
+            flask.abort(501, description=f"Image export requires the optional 'kaleido' package: {e}")
+        return flask.Response(
+            image,
+            mimetype=IMAGE_MIMETYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename="{figure_id}.{fmt}"'},
+        )
@@ -0,0 +1,207 @@
+# src/fact_store.py
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from data_schema import SECTION_SCHEMAS, apply_section_schema
+
+DEFAULT_SITE = 'default'
+
+# One long-format fact table: every month-keyed section of every worksheet is stored as
+# (dataset, section, site, month, metric) -> value, so new sections need no DDL changes.
+# The primary key doubles as the index for site + date-range lookups; the second index
+# serves date-range queries across all sites.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kpi_facts (
+    dataset     TEXT NOT NULL,
+    section     TEXT NOT NULL,
+    site        TEXT NOT NULL,
+    month       TEXT NOT NULL,
+    metric      TEXT NOT NULL,
+    value       REAL,
+    text_value  TEXT,
+    PRIMARY KEY (dataset, section, site, month, metric)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_kpi_facts_month ON kpi_facts (dataset, section, month, site);
+"""
+
+_UPSERT = """
+INSERT INTO kpi_facts (dataset, section, site, month, metric, value, text_value)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (dataset, section, site, month, metric) DO UPDATE SET
+    value = excluded.value,
+    text_value = excluded.text_value
+WHERE kpi_facts.value IS NOT excluded.value OR kpi_facts.text_value IS NOT excluded.text_value
+"""
+
+
+class ConnectionPool:
+    """
+    A small bounded pool of SQLite connections shared by Dash/Flask worker threads.
+
+    Connections are created lazily up to `max_size`; a thread that finds the pool empty
+    and at capacity waits for a connection to be returned.
+    """
+
+    def __init__(self, db_path, max_size=8, timeout=30.0):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            conn = self._connect() if can_create else self._idle.get(timeout=self.timeout)
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def _month_keyed_frame(section):
+    """Returns the section as a frame with a 'Month' column, or None if it is not month-keyed."""
+    if not isinstance(section, pd.DataFrame) or section.empty:
+        return None
+    if 'Month' in section.columns:
+        return section
+    if isinstance(section.index, pd.DatetimeIndex):
+        return section.rename_axis('Month').reset_index()
+    return None
+
+
+class FactStore:
+    """
+    File-based store of historical KPI facts.
+
+    Loaders upsert each load incrementally (unchanged facts are not rewritten) and
+    dashboard callbacks read back only the date range and sites they display.
+    """
+
+    def __init__(self, db_path, pool_size=8):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, max_size=pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    # --- Writes ---
+
+    def upsert_sections(self, dataset, data_sections, site=DEFAULT_SITE):
+        """
+        Upserts every month-keyed section of a loaded dataset.
+
+        Args:
+            dataset (str): 'copq', 'oee' or 'mfg_cost'.
+            data_sections (dict): Section name -> DataFrame, as returned by a loader.
+            site (str): Site/plant the worksheet belongs to.
+
+        Returns:
+            int: Number of fact rows inserted or changed.
+        """
+        rows = []
+        for section_name, section in (data_sections or {}).items():
+            frame = _month_keyed_frame(section)
+            if frame is None:
+                continue
+            repeated = frame['Month'].duplicated() & frame['Month'].notna()
+            if repeated.any():
+                # Later rows would overwrite earlier ones under the same fact key
+                print(f"Warning: '{section_name}' of {dataset} ({site}) repeats {repeated.sum()} month(s); "
+                      f"only the last row of each month is stored.")
+            long = frame.melt(id_vars='Month', var_name='metric', value_name='value').dropna(subset=['Month'])
+            months = long['Month'].dt.strftime('%Y-%m-%d')
+            is_number = pd.to_numeric(long['value'], errors='coerce')
+            for month, metric, number, raw in zip(months, long['metric'], is_number, long['value']):
+                if pd.notna(number):
+                    rows.append((dataset, section_name, site, month, metric, float(number), None))
+                elif pd.notna(raw):
+                    rows.append((dataset, section_name, site, month, metric, None, str(raw)))
+
+        with self.pool.connection() as conn:
+            with conn:
+                before = conn.total_changes
+                conn.executemany(_UPSERT, rows)
+                return conn.total_changes - before
+
+    # --- Reads ---
+
+    def list_sites(self, dataset=None):
+        query = "SELECT DISTINCT site FROM kpi_facts" + (" WHERE dataset = ?" if dataset else "") + " ORDER BY site"
+        with self.pool.connection() as conn:
+            return [row[0] for row in conn.execute(query, (dataset,) if dataset else ())]
+
+    def query_section(self, dataset, section, start_date=None, end_date=None, sites=None):
+        """
+        Reads one section back as a wide, typed frame for a date range and set of sites.
+
+        The filters are applied in SQL against the indexed (dataset, section, site, month)
+        keys, so only the requested slice of history is loaded.
+
+        Returns:
+            pd.DataFrame: 'Month' and 'Site' columns plus one column per metric,
+                          sorted by site and month. Empty if nothing matches.
+        """
+        clauses = ["dataset = ?", "section = ?"]
+        params = [dataset, section]
+        if start_date:
+            clauses.append("month >= ?")
+            params.append(pd.to_datetime(start_date).strftime('%Y-%m-%d'))
+        if end_date:
+            clauses.append("month <= ?")
+            params.append(pd.to_datetime(end_date).strftime('%Y-%m-%d'))
+        if sites:
+            sites = [sites] if isinstance(sites, str) else list(sites)
+            clauses.append(f"site IN ({', '.join('?' * len(sites))})")
+            params.extend(sites)
+
+        query = ("SELECT site, month, metric, value, text_value FROM kpi_facts WHERE "
+                 + " AND ".join(clauses) + " ORDER BY site, month")
+        with self.pool.connection() as conn:
+            long = pd.read_sql_query(query, conn, params=params)
+        if long.empty:
+            return pd.DataFrame(columns=['Site', 'Month'])
+
+        long['value'] = long['value'].astype(object).where(long['value'].notna(), long['text_value'])
+        wide = long.pivot(index=['site', 'month'], columns='metric', values='value')
+        # Keep the worksheet's column order rather than the alphabetical pivot order
+        schema_order = [col for col in SECTION_SCHEMAS.get(section, {}) if col in wide.columns]
+        wide = wide[schema_order + [col for col in wide.columns if col not in schema_order]]
+        wide = wide.reset_index().rename(columns={'site': 'Site', 'month': 'Month'}).infer_objects()
+        wide.columns.name = None
+        wide['Month'] = pd.to_datetime(wide['Month'])
+        return apply_section_schema(wide, section)
+
+    def close(self):
+        self.pool.close()
+
+
+def open_fact_store_from_env():
+    """Opens the store at $KPI_FACT_STORE, or returns None when the store is not configured."""
+    db_path = os.environ.get('KPI_FACT_STORE')
+    return FactStore(db_path) if db_path else None
@@ -0,0 +1,441 @@
+# src/formula_evaluator.py
+#
+# Evaluates the Excel formulas left in the calculator's CSV exports (e.g. '=B16/60' and
+# '=1/B17' in the OEE constants, '=E32*F32/100' in every TEEP row) before the section
+# parsers see the grid, so formula cells carry values instead of being coerced to NaN.
+#
+# Supported: A1 references ($-anchored or relative), numbers, + - * / ^, parentheses,
+# a postfix % on numbers, and ABS / ROUND / MIN / MAX / SUM / AVERAGE over scalar
+# arguments, with Excel's operator precedence (-2^2 is 4, 2^3^2 is 64). Ranges, text
+# operators and comparisons are not supported; such cells evaluate to empty, as do
+# errors such as =1/0.
+#
+# Formulas copied down a column share one shape: the same text once every reference is
+# written relative to the formula's own cell. Each shape is compiled once and
+# evaluated for all its cells as one NumPy expression over gathered reference values.
+# Cells referencing other formula cells wait for them: evaluation runs in passes over
+# the cells whose inputs are resolved, so the number of passes is the depth of the
+# dependency graph. Cells still waiting when a pass makes no progress are part of (or
+# depend on) a circular reference and are left empty.
+#
+# Row numbers in a reference are lines of the exported file, so the grid must keep
+# blank lines (read_raw_worksheet does), or carry each row's file line in its index
+# (mapped_reader.py keeps only the lines of the sections it needs; references to lines
+# it skipped count as out of the grid).
+#
+# Exports trimmed from a larger workbook keep formulas whose references no longer point
+# at the intended cells; the bundled OEE export is one, its constants read the January
+# summary row and its TEEP rows the maintenance table. A reference counts as misaligned,
+# and its formulas are left empty rather than given a wrong value, when it points at:
+#   - an empty or text cell (Excel would give 0 or #VALUE!)
+#   - another section block, i.e. across a fully blank row ($-anchored cells such as a
+#     shared constant may sit anywhere)
+#   - a percent cell, from a formula in a column of mostly plain constants
+
+import re
+
+import numpy as np
+import pandas as pd
+
+_REF_PATTERN = r'(?<![A-Za-z_$])(\$?)([A-Z]{1,3})(\$?)([0-9]+)(?![0-9A-Za-z_(:])'
+_REF = re.compile(_REF_PATTERN)
+
+# Stands in for each reference in a formula's shape (not NUL: pandas hashes strings up to a NUL)
+_PLACEHOLDER = '§'
+
+# What may remain of a formula once its references are replaced by placeholders
+_SHAPE_TOKEN = re.compile(r'\s+|§|\d+(?:\.\d*)?(?:[eE][+-]?\d+)?%?|\.\d+%?|[-+*/^(),]|ABS|ROUND|MIN|MAX|SUM|AVERAGE')
+
+_NUMERIC_JUNK = r'[%£�,\s]'
+
+
+def _sum(*args):
+    return sum(args)
+
+
+def _average(*args):
+    # AVERAGE() is #DIV/0!, i.e. NaN
+    return np.float64(sum(args)) / len(args) if args else np.nan
+
+
+def _min(*args):
+    return np.minimum.reduce(np.broadcast_arrays(*args))
+
+
+def _max(*args):
+    return np.maximum.reduce(np.broadcast_arrays(*args))
+
+
+def _round(value, digits=0):
+    return np.round(value, int(np.max(digits)))
+
+
+FUNCTIONS = {'ABS': np.abs, 'ROUND': _round, 'MIN': _min, 'MAX': _max, 'SUM': _sum, 'AVERAGE': _average}
+
+
+def column_index(letters):
+    """Zero-based column index of a column name ('A' -> 0, 'AA' -> 26)."""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+class _ShapeParser:
+    """
+    Rewrites a tokenised formula shape as a fully parenthesised Python expression with
+    Excel's precedence: unary minus binds tighter than ^ (-2^2 is 4) and ^ is
+    left-associative (2^3^2 is 64). Numbers become float64 constants, so 1/0 and 10^400
+    give inf (an empty cell) instead of raising.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.refs = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise SyntaxError(f"expected {expected or 'a term'}, found {token}")
+        self.position += 1
+        return token
+
+    def binary(self, operand, operators):
+        left = operand()
+        while self.peek() in operators:
+            operator = self.take()
+            left = f"({left}{'**' if operator == '^' else operator}{operand()})"
+        return left
+
+    def expression(self):
+        return self.binary(self.term, ('+', '-'))
+
+    def term(self):
+        return self.binary(self.power, ('*', '/'))
+
+    def power(self):
+        return self.binary(self.unary, ('^',))
+
+    def unary(self):
+        if self.peek() in ('+', '-'):
+            return f"({self.take()}{self.unary()})"
+        return self.primary()
+
+    def primary(self):
+        token = self.take()
+        if token == _PLACEHOLDER:
+            self.refs += 1
+            return f"v{self.refs - 1}"
+        if token in FUNCTIONS:
+            self.take('(')
+            args = []
+            if self.peek() != ')':
+                args.append(self.expression())
+                while self.peek() == ',':
+                    self.take()
+                    args.append(self.expression())
+            self.take(')')
+            return f"{token}({', '.join(args)})"
+        if token == '(':
+            inner = self.expression()
+            self.take(')')
+            return inner
+        if token[0].isdigit() or token[0] == '.':
+            if token.endswith('%'):
+                return f"(_f({token[:-1]})/100)"
+            return f"_f({token})"
+        raise SyntaxError(f"unexpected {token}")
+
+
+def compile_shape(shape):
+    """
+    Compiles a formula shape (references replaced by _PLACEHOLDER) into a code object over
+    v0, v1, ... (one per reference), or returns None if it uses unsupported syntax.
+    """
+    tokens = []
+    position = 0
+    for match in _SHAPE_TOKEN.finditer(shape):
+        if match.start() != position:
+            return None
+        if not match.group().isspace():
+            tokens.append(match.group())
+        position = match.end()
+    if position != len(shape):
+        return None
+
+    parser = _ShapeParser(tokens)
+    try:
+        expression = parser.expression()
+        if parser.peek() is not None:
+            return None
+        return compile(expression, '<formula>', 'eval')
+    except SyntaxError:
+        return None
+
+
+def cell_values(cells):
+    """
+    Values of raw cell strings as Excel holds them: (float64 values, percent-formatted
+    mask). '84.05%' is 0.8405; empty and text cells are NaN.
+    """
+    cells = pd.Series(cells, dtype='object').astype(str).str.strip()
+    is_percent = cells.str.endswith('%').to_numpy()
+    numbers = pd.to_numeric(cells.str.replace(_NUMERIC_JUNK, '', regex=True), errors='coerce').to_numpy(dtype='float64')
+    return np.where(is_percent, numbers / 100, numbers), is_percent
+
+
+def _format_results(values, percent):
+    """Result cells as the export would show them: '' when empty, '64.8%' when percent-formatted."""
+    return ['' if np.isnan(v) else (f"{v * 100:.10g}%" if p else f"{v:.15g}") for v, p in zip(values, percent)]
+
+
+class FormulaGroup:
+    """Formula cells of one shape: their positions and where each reference points."""
+
+    def __init__(self, code, rows, cols, ref_rows, ref_cols, anchored):
+        self.code = code
+        self.rows = rows            # (m,)
+        self.cols = cols            # (m,)
+        self.ref_rows = ref_rows    # (m, k)
+        self.ref_cols = ref_cols    # (m, k)
+        self.anchored = anchored    # (k,) reference has both row and column $-anchored
+        self.in_bounds = None       # (m, k), set by evaluate_formulas
+
+
+def _file_lines(raw_data):
+    """Zero-based file line of each grid row, or None when row i is line i + 1."""
+    index = raw_data.index
+    if isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1:
+        return None
+    return index.to_numpy(dtype='int64')
+
+
+def _parse_formulas(raw_data, formula_mask):
+    """Groups the formula cells by shape and resolves every reference to grid coordinates."""
+    rows, cols = np.nonzero(formula_mask)
+    lines = _file_lines(raw_data)
+    # Offsets and absolute references are worked out in file lines, then mapped to grid rows
+    own_rows = rows if lines is None else lines[rows]
+    texts = [text.strip()[1:].upper() for text in raw_data.to_numpy()[rows, cols]]
+    shapes = [_REF.sub(_PLACEHOLDER, text) for text in texts]
+
+    found = [_REF.findall(text) for text in texts]
+    ref_count = np.fromiter(map(len, found), dtype='int64', count=len(found))
+    offsets = np.zeros((len(texts), int(ref_count.max(initial=0)), 4), dtype='int64')
+    if ref_count.any():
+        refs = np.array([ref for refs in found for ref in refs], dtype=object)
+        cell = np.repeat(np.arange(len(texts)), ref_count)
+        match = np.arange(len(cell)) - np.repeat(np.cumsum(ref_count) - ref_count, ref_count)
+        unique_letters, letter_codes = np.unique(refs[:, 1].astype(str), return_inverse=True)
+        ref_col = np.array([column_index(l) for l in unique_letters], dtype='int64')[letter_codes]
+        ref_row = refs[:, 3].astype('int64') - 1  # file line -> grid row
+        col_absolute = refs[:, 0] == '$'
+        row_absolute = refs[:, 2] == '$'
+        # Relative references are stored as offsets from the formula's own cell, so
+        # formulas copied down a column end up with identical keys
+        offsets[cell, match, 0] = row_absolute
+        offsets[cell, match, 1] = np.where(row_absolute, ref_row, ref_row - own_rows[cell])
+        offsets[cell, match, 2] = col_absolute
+        offsets[cell, match, 3] = np.where(col_absolute, ref_col, ref_col - cols[cell])
+
+    shape_codes, shape_names = pd.factorize(np.array(shapes, dtype=object))
+    keys = pd.DataFrame(np.column_stack([shape_codes, ref_count, offsets.reshape(len(texts), -1)]))
+    group_ids = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+
+    groups, unsupported = [], np.zeros(len(texts), dtype=bool)
+    order = np.argsort(group_ids, kind='stable')
+    bounds = np.flatnonzero(np.diff(group_ids[order])) + 1
+    for members in np.split(order, bounds):
+        first = members[0]
+        code = compile_shape(shape_names[shape_codes[first]])
+        if code is None:
+            unsupported[members] = True
+            continue
+        k = ref_count[first]
+        spec = offsets[first, :k]
+        member_rows, member_cols = rows[members], cols[members]
+        ref_rows = np.where(spec[:, 0] == 1, spec[:, 1], own_rows[members][:, None] + spec[:, 1])
+        ref_cols = np.where(spec[:, 2] == 1, spec[:, 3], member_cols[:, None] + spec[:, 3])
+        if lines is not None:
+            # Lines not in the grid become -1, i.e. out of bounds
+            position = np.minimum(np.searchsorted(lines, ref_rows), len(lines) - 1)
+            ref_rows = np.where(lines[position] == ref_rows, position, -1)
+        anchored = (spec[:, 0] == 1) & (spec[:, 2] == 1)
+        groups.append(FormulaGroup(code, member_rows, member_cols, ref_rows, ref_cols, anchored))
+    return groups, rows[unsupported], cols[unsupported]
+
+
+def _section_blocks(raw_data):
+    """
+    Block number of each grid row. Blocks end at fully blank rows, as sections do in the
+    parsers, and at lines the mapped reader skipped.
+    """
+    # Only rows with an empty first cell can be blank; most rows are ruled out by it alone
+    candidates = (raw_data.iloc[:, 0].astype(str).str.strip() == '').to_numpy()
+    blank = np.zeros(len(raw_data), dtype=bool)
+    blank[candidates] = (raw_data[candidates].astype(str).apply(lambda c: c.str.strip()) == '').all(axis=1).to_numpy()
+    lines = _file_lines(raw_data)
+    if lines is not None:
+        blank[1:] |= np.diff(lines) > 1
+    return np.cumsum(blank)
+
+
+def _holds_constants(grid, formulas, blocks, block, col):
+    """Whether a column of one block holds mostly plain numbers rather than percentages (formulas aside)."""
+    start, end = np.searchsorted(blocks, [block, block + 1])
+    cells = grid[start:end, col][~formulas[start:end, col]]
+    numbers, is_percent = cell_values(cells)
+    counted = np.isfinite(numbers)
+    return bool((counted & ~is_percent).sum() > (counted & is_percent).sum())
+
+
+def evaluate_formulas(raw_data):
+    """
+    Replaces every formula cell of a raw worksheet grid with its evaluated value.
+
+    A group of same-shaped formulas is evaluated only if none of its references is
+    misaligned (see the header); otherwise the whole group is left empty, since a column
+    of copied formulas that partly points at headers, gaps or other sections does not
+    line up with this export (its other results would be taken from the wrong rows).
+
+    Args:
+        raw_data (pd.DataFrame): All-string grid from read_raw_worksheet (or one indexed by
+                                 zero-based file line, from read_mapped_worksheet).
+
+    Returns:
+        tuple: (grid with formula cells replaced by value strings, stats dict with
+               'cells', 'groups', 'passes', 'unsupported', 'misaligned', 'circular'
+               and 'empty' counts)
+    """
+    grid = raw_data.to_numpy(dtype=object, copy=True)
+    # A formula cell starts with '=' (the export writes no leading whitespace)
+    formulas = grid.astype('U1') == '='
+    stats = {'cells': int(formulas.sum()), 'groups': 0, 'passes': 0, 'unsupported': 0,
+             'misaligned': 0, 'circular': 0, 'empty': 0}
+    if not stats['cells']:
+        return raw_data, stats
+
+    groups, bad_rows, bad_cols = _parse_formulas(raw_data, formulas)
+    stats['groups'] = len(groups)
+    stats['unsupported'] = len(bad_rows)
+    n_rows, n_cols = grid.shape
+
+    # Only referenced cells are converted to numbers
+    values = np.full(grid.shape, np.nan)
+    percent = np.zeros(grid.shape, dtype=bool)
+    referenced = np.zeros(grid.shape, dtype=bool)
+    for group in groups:
+        group.in_bounds = ((group.ref_rows >= 0) & (group.ref_rows < n_rows)
+                           & (group.ref_cols >= 0) & (group.ref_cols < n_cols))
+        group.ref_rows = np.where(group.in_bounds, group.ref_rows, 0)
+        group.ref_cols = np.where(group.in_bounds, group.ref_cols, 0)
+        referenced[group.ref_rows[group.in_bounds], group.ref_cols[group.in_bounds]] = True
+    referenced &= ~formulas
+    rows, cols = np.nonzero(referenced)
+    values[rows, cols], percent[rows, cols] = cell_values(grid[rows, cols])
+
+    blocks = _section_blocks(raw_data)
+    constant_columns = {}
+    pending = formulas.copy()
+    pending[bad_rows, bad_cols] = False
+    for group in groups:
+        ref_formula = formulas[group.ref_rows, group.ref_cols]
+        # References outside the grid, or to non-formula cells without a number
+        misaligned = (~group.in_bounds | (~ref_formula & np.isnan(values[group.ref_rows, group.ref_cols]))).any()
+        # References into another section block
+        own_blocks = blocks[group.rows]
+        misaligned |= (~group.anchored & (blocks[group.ref_rows] != own_blocks[:, None])).any()
+        # Percent cells feeding a formula that sits among plain constants
+        feeds_percent = (~ref_formula & percent[group.ref_rows, group.ref_cols]).any(axis=1)
+        for block, col in set(zip(own_blocks[feeds_percent].tolist(), group.cols[feeds_percent].tolist())):
+            if (block, col) not in constant_columns:
+                constant_columns[block, col] = _holds_constants(grid, formulas, blocks, block, col)
+            misaligned |= constant_columns[block, col]
+        if misaligned:
+            stats['misaligned'] += len(group.rows)
+            pending[group.rows, group.cols] = False
+            group.rows = group.rows[:0]
+
+    namespace = {'__builtins__': {}, '_f': np.float64, **FUNCTIONS}
+    while any(len(group.rows) for group in groups):
+        progress = False
+        for group in groups:
+            if not len(group.rows):
+                continue
+            waiting = pending[group.ref_rows, group.ref_cols].any(axis=1)
+            ready = ~waiting
+            if not ready.any():
+                continue
+            progress = True
+            ref_rows, ref_cols = group.ref_rows[ready], group.ref_cols[ready]
+            gathered = values[ref_rows, ref_cols]
+            try:
+                with np.errstate(all='ignore'):
+                    result = eval(group.code, namespace, {f"v{j}": gathered[:, j] for j in range(gathered.shape[1])})
+            except (ArithmeticError, ValueError):
+                # Anything float64 still cannot represent leaves the group's cells empty
+                result = np.nan
+            result = np.broadcast_to(np.asarray(result, dtype='float64'), (int(ready.sum()),))
+            rows, cols = group.rows[ready], group.cols[ready]
+            # #DIV/0! and other errors become empty cells
+            values[rows, cols] = np.where(np.isfinite(result), result, np.nan)
+            # Like Excel, a result takes the number format of its first reference
+            if gathered.shape[1]:
+                percent[rows, cols] = percent[ref_rows[:, 0], ref_cols[:, 0]]
+            pending[rows, cols] = False
+            group.rows, group.cols = group.rows[waiting], group.cols[waiting]
+            group.ref_rows, group.ref_cols = group.ref_rows[waiting], group.ref_cols[waiting]
+        stats['passes'] += 1
+        if not progress:
+            break
+
+    stats['circular'] = int(pending.sum())
+    rows, cols = np.nonzero(formulas)
+    stats['empty'] = int(np.isnan(values[rows, cols]).sum())
+    grid[rows, cols] = _format_results(values[rows, cols], percent[rows, cols])
+    return pd.DataFrame(grid, index=raw_data.index, columns=raw_data.columns), stats
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    from section_parser import read_raw_worksheet
+    from synthetic_data import generate_oee_lines
+
+    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    raw = read_raw_worksheet(os.path.join(data_dir, 'OEE_Dummy_Data.csv'))
+    evaluated, stats = evaluate_formulas(raw)
+    print(f"OEE_Dummy_Data.csv: {stats}")
+    changed = raw.to_numpy() != evaluated.to_numpy()
+    for row, col in zip(*np.nonzero(changed)):
+        print(f"  line {row + 1:>3} col {col}: {raw.iat[row, col]!r} -> {evaluated.iat[row, col]!r}")
+
+    # Constant formulas Python would raise on, and Excel's precedence for ^
+    import io
+    cases = ['=1/0', '=AVERAGE()', '=10^400', '=-2^2', '=2^3^2', '=2^-1', '=-A1^2']
+    expected = ['', '', '', '4', '64', '0.5', '9']
+    sheet = read_raw_worksheet(io.StringIO('3\n' + '\n'.join(cases) + '\n'))
+    results = evaluate_formulas(sheet)[0][0].tolist()[1:]
+    print()
+    for formula, result, want in zip(cases, results, expected):
+        print(f"  {formula:<12} -> {result!r}{'' if result == want else f'  (expected {want!r})'}")
+
+    # Misaligned references: a percent cell feeding a constant, and a reference across a
+    # blank row ($-anchored ones may cross)
+    sheet = read_raw_worksheet(io.StringIO('Length,480\nBreaks,30\nShare,84%\nRate,=B3/60\n\n'
+                                           'Half,=$B$1/2\nHalf,=B1/2\n'))
+    results = evaluate_formulas(sheet)[0][1].tolist()
+    print(f"  =B3/60 -> {results[3]!r}, =$B$1/2 -> {results[5]!r}, =B1/2 -> {results[6]!r}"
+          f"  (expected '', '240', '')")
+
+    # A sheet with tens of thousands of TEEP formulas, plus a chain and a cycle
+    lines = generate_oee_lines(months=30000)
+    lines += ['Chain,=B2*2,=B{0}+1,=C{0}+1,,,'.format(len(lines) + 1), 'Cycle,=C{0},=B{0},,,,'.format(len(lines) + 2)]
+    big = read_raw_worksheet(io.StringIO('\n'.join(lines) + '\n'))
+    started = time.perf_counter()
+    _, stats = evaluate_formulas(big)
+    print(f"\n{len(big):,} rows: {stats} in {(time.perf_counter() - started) * 1000:.1f} ms")
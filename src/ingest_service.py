@@ -0,0 +1,466 @@
+# src/ingest_service.py
+#
+# Asyncio ingestion of worksheets as they arrive from the line PCs: drop folders on
+# disk and small HTTP export services. Every source is polled on its own task:
+#
+#   DropFolder    picks up new or changed files once their size and modification time
+#                 are unchanged between two polls (so half-copied files are left alone).
+#   HttpEndpoint  GETs a URL with If-None-Match / If-Modified-Since, so an unchanged
+#                 export costs one 304. The client is a small HTTP/1.1 GET over asyncio
+#                 streams (no extra dependency).
+#
+# Fetched bytes go onto a bounded queue. When the parsers fall behind, producers wait on
+# queue.put(), which is the backpressure. A semaphore caps the reads and fetches in
+# flight. Consumers parse straight from memory (io.BytesIO, no temp files) in an
+# executor, then pass (worksheet type, source key, sections) to a handler.
+# registry_publisher() is the handler the app uses: it upserts into the fact store and
+# publishes a new dataset version.
+
+import asyncio
+import email.utils
+import io
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from bulk_ingest import WORKSHEET_EXTENSIONS, source_key
+from data_processor import process_worksheet, load_and_process_workbook
+from load_profiler import LoadReport, publish_load_report
+from section_parser import read_raw_worksheet, classify_worksheet
+from workbook_reader import is_workbook
+
+logger = logging.getLogger('kpi.ingest')
+
+DEFAULT_POLL_SECONDS = 5.0
+DEFAULT_CONCURRENCY = 8
+DEFAULT_QUEUE_SIZE = 32
+
+# Largest response body accepted from an HTTP endpoint
+MAX_HTTP_BYTES = 64 * 1024 * 1024
+
+
+class Payload:
+    """One fetched worksheet: where it came from and its raw bytes."""
+
+    def __init__(self, source, name, key, data):
+        self.source = source
+        self.name = name
+        self.key = key
+        self.data = data
+
+
+# --- Sources ---
+
+class DropFolder:
+    """A directory line PCs copy worksheet exports into (searched recursively)."""
+
+    def __init__(self, path, interval=DEFAULT_POLL_SECONDS):
+        self.path = path
+        self.interval = interval
+        self._seen = {}
+        self._pending = {}
+
+    def __str__(self):
+        return f"folder {self.path}"
+
+    def _scan(self):
+        signatures = {}
+        for directory, _, files in os.walk(self.path):
+            for name in files:
+                if name.lower().endswith(WORKSHEET_EXTENSIONS) and not name.startswith(('.', '~$')):
+                    file_path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    signatures[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    async def poll(self):
+        """Paths whose signature is new, and unchanged since the previous poll."""
+        signatures = await asyncio.to_thread(self._scan)
+        ready = [path for path, signature in signatures.items()
+                 if self._pending.get(path) == signature and self._seen.get(path) != signature]
+        self._pending = signatures
+        return ready
+
+    async def fetch(self, path):
+        with open(path, 'rb') as f:
+            data = await asyncio.to_thread(f.read)
+        self._seen[path] = self._pending.get(path)
+        return Payload(str(self), path, os.path.relpath(path, self.path), data)
+
+
+class HttpEndpoint:
+    """A URL that returns one worksheet export (CSV or workbook)."""
+
+    def __init__(self, url, interval=DEFAULT_POLL_SECONDS, timeout=30.0):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self._validators = {}
+
+    def __str__(self):
+        return f"endpoint {self.url}"
+
+    async def poll(self):
+        return [self.url]
+
+    async def fetch(self, url):
+        headers = {}
+        if self._validators.get('etag'):
+            headers['If-None-Match'] = self._validators['etag']
+        if self._validators.get('last-modified'):
+            headers['If-Modified-Since'] = self._validators['last-modified']
+        status, response_headers, body = await asyncio.wait_for(http_get(url, headers), self.timeout)
+        if status == 304:
+            return None
+        if status != 200:
+            raise IOError(f"HTTP {status} from {url}")
+        self._validators = {name: response_headers.get(name) for name in ('etag', 'last-modified')}
+        path = urllib.parse.urlsplit(url).path.lstrip('/') or 'index'
+        return Payload(str(self), url, path, body)
+
+
+async def http_get(url, headers=None):
+    """
+    Minimal HTTP/1.1 GET over asyncio streams.
+
+    Returns:
+        tuple: (status, lower-cased response headers, body bytes).
+    """
+    parts = urllib.parse.urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=secure or None)
+    try:
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        lines = [f"GET {target} HTTP/1.1", f"Host: {parts.netloc}", "Connection: close", "Accept-Encoding: identity"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if status in (204, 304):
+            body = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks, size = [], 0
+            while True:
+                length = int((await reader.readline()).split(b';')[0], 16)
+                if not length:
+                    break
+                size += length
+                if size > MAX_HTTP_BYTES:
+                    raise IOError(f"response from {url} is larger than {MAX_HTTP_BYTES} bytes")
+                chunks.append(await reader.readexactly(length))
+                await reader.readline()
+            body = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            length = int(response_headers['content-length'])
+            if length > MAX_HTTP_BYTES:
+                raise IOError(f"response from {url} is larger than {MAX_HTTP_BYTES} bytes")
+            body = await reader.readexactly(length)
+        else:
+            body = await reader.read(MAX_HTTP_BYTES + 1)
+            if len(body) > MAX_HTTP_BYTES:
+                raise IOError(f"response from {url} is larger than {MAX_HTTP_BYTES} bytes")
+        return status, response_headers, body
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+# --- Parsing ---
+
+def parse_payload(payload):
+    """
+    Parses a fetched worksheet from memory.
+
+    Returns:
+        list: (worksheet type, source key, data sections) for every worksheet recognised
+              (a workbook can hold several).
+    """
+    if is_workbook(payload.name) or payload.data[:4] == b'PK\x03\x04':
+        datasets = load_and_process_workbook(io.BytesIO(payload.data)) or {}
+        return [(worksheet_type, source_key(payload.key, '.', worksheet_type), sections)
+                for worksheet_type, sections in datasets.items()]
+
+    raw_data = read_raw_worksheet(io.BytesIO(payload.data))
+    worksheet_type = classify_worksheet(raw_data)
+    if worksheet_type is None:
+        print(f"Warning: {payload.name} does not match any known worksheet; skipped.")
+        return []
+    report = LoadReport(worksheet_type, payload.name)
+    report.bytes_read = len(payload.data)
+    try:
+        with report.timed('total'):
+            sections = process_worksheet(worksheet_type, raw_data, report)
+    except Exception as e:
+        report.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        publish_load_report(report)
+    return [(worksheet_type, source_key(payload.key, '.', worksheet_type), sections)]
+
+
+# --- Service ---
+
+class IngestService:
+    """
+    Polls every source concurrently and parses what arrives.
+
+    Args:
+        sources (list): DropFolder / HttpEndpoint instances.
+        handler (callable): Called as handler(worksheet_type, source_key, sections) for every
+                            worksheet parsed (in the executor, not on the event loop).
+        concurrency (int): Reads/fetches in flight, and parser tasks.
+        queue_size (int): Fetched payloads waiting to be parsed before producers wait.
+        executor: Executor for parsing and the handler (default: a thread pool of `concurrency`).
+    """
+
+    def __init__(self, sources, handler, concurrency=DEFAULT_CONCURRENCY, queue_size=DEFAULT_QUEUE_SIZE, executor=None):
+        self.sources = list(sources)
+        self.handler = handler
+        self.concurrency = max(int(concurrency), 1)
+        self.queue_size = max(int(queue_size), 1)
+        self.executor = executor
+        self.stats = {'fetched': 0, 'unchanged': 0, 'parsed': 0, 'failed': 0, 'bytes': 0, 'queue_high_water': 0}
+
+    async def _fetch(self, source, item, queue, semaphore):
+        try:
+            async with semaphore:
+                payload = await source.fetch(item)
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.warning("Could not fetch %s from %s: %s", item, source, e)
+            return
+        if payload is None:
+            self.stats['unchanged'] += 1
+            return
+        self.stats['fetched'] += 1
+        self.stats['bytes'] += len(payload.data)
+        await queue.put(payload)
+        self.stats['queue_high_water'] = max(self.stats['queue_high_water'], queue.qsize())
+
+    async def _poll_once(self, source, queue, semaphore):
+        try:
+            items = await source.poll()
+        except Exception as e:
+            logger.warning("Could not poll %s: %s", source, e)
+            return
+        await asyncio.gather(*(self._fetch(source, item, queue, semaphore) for item in items))
+
+    async def _produce(self, source, queue, semaphore, stop):
+        while not stop.is_set():
+            await self._poll_once(source, queue, semaphore)
+            try:
+                await asyncio.wait_for(stop.wait(), source.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _parse_and_handle(self, payload):
+        loaded = parse_payload(payload)
+        for worksheet_type, key, sections in loaded:
+            self.handler(worksheet_type, key, sections)
+        return len(loaded)
+
+    async def _consume(self, queue, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            payload = await queue.get()
+            try:
+                parsed = await loop.run_in_executor(executor, self._parse_and_handle, payload)
+                self.stats['parsed'] += parsed
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.warning("Could not parse %s: %s", payload.name, e)
+            finally:
+                queue.task_done()
+
+    async def _run(self, producer):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        executor = self.executor or ThreadPoolExecutor(self.concurrency, thread_name_prefix='kpi-ingest')
+        consumers = [asyncio.create_task(self._consume(queue, executor)) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*(producer(source, queue, semaphore) for source in self.sources))
+            await queue.join()
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+            if self.executor is None:
+                executor.shutdown(wait=False)
+
+    async def run_once(self):
+        """Polls every source once and waits until everything fetched has been parsed."""
+        await self._run(self._poll_once)
+        return dict(self.stats)
+
+    async def run(self, stop=None):
+        """Polls until `stop` (an asyncio.Event) is set."""
+        stop = stop or asyncio.Event()
+        await self._run(lambda source, queue, semaphore: self._produce(source, queue, semaphore, stop))
+
+
+def sources_from_env():
+    """Sources from $KPI_DROP_FOLDERS (os.pathsep-separated) and $KPI_HTTP_SOURCES (comma-separated)."""
+    interval = float(os.environ.get('KPI_INGEST_INTERVAL', DEFAULT_POLL_SECONDS))
+    folders = [path for path in os.environ.get('KPI_DROP_FOLDERS', '').split(os.pathsep) if path.strip()]
+    urls = [url.strip() for url in os.environ.get('KPI_HTTP_SOURCES', '').split(',') if url.strip()]
+    return [DropFolder(path.strip(), interval) for path in folders] + [HttpEndpoint(url, interval) for url in urls]
+
+
+def registry_publisher(registry, fact_store=None, site=None):
+    """
+    Handler that publishes every ingested worksheet: upserted into the fact store under
+    its source key, and shown on the dashboards when it is the current site's (or when
+    there is no fact store to choose from).
+    """
+    from data_registry import build_datasets
+
+    lock = threading.Lock()
+
+    def handle(worksheet_type, key, sections):
+        with lock:
+            oee_sites = []
+            if fact_store is not None:
+                fact_store.upsert_sections(worksheet_type, sections, site=key)
+                oee_sites = sorted(fact_store.list_sites('oee'), key=lambda s: s != site)
+            previous = registry.current()
+            raw = dict(previous.raw) if previous is not None else {}
+            if fact_store is None or key == site or not raw.get(worksheet_type):
+                raw[worksheet_type] = sections
+            registry.publish(**build_datasets(raw, oee_sites, previous))
+
+    return handle
+
+
+def start_ingest_service(service):
+    """Runs the service on its own event loop in a daemon thread; returns (thread, stop callable)."""
+    loop = asyncio.new_event_loop()
+    stop = asyncio.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(service.run(stop))
+
+    thread = threading.Thread(target=run, name='kpi-ingest-service', daemon=True)
+    thread.start()
+    return thread, lambda: loop.call_soon_threadsafe(stop.set)
+
+
+# --- Local stub of a line PC's export service ---
+
+class StubExportServer:
+    """
+    Serves in-memory worksheets over HTTP on localhost (with ETag/Last-Modified), to try
+    the service without real line PCs. Each response is delayed by `latency` seconds.
+    """
+
+    def __init__(self, documents, latency=0.0):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.documents = dict(documents)
+        self.requests = 0
+        stub = self
+        modified = email.utils.formatdate(usegmt=True)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(latency)
+                body = stub.documents.get(self.path.lstrip('/'))
+                if body is None:
+                    self.send_error(404)
+                    return
+                etag = f'"{hash(body) & 0xffffffff:x}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', modified)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # The default backlog of 5 drops concurrent connects, which then retry after 1 s
+            request_queue_size = 128
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/{name}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    import contextlib
+    import tempfile
+    from synthetic_data import generate_worksheet_text
+
+    # 30 worksheets behind a stub export service (50 ms per response) and 30 in a drop folder
+    documents = {f"line{i + 1:02d}_{t}.csv": generate_worksheet_text(t, months=24, seed=i).encode()
+                 for i in range(10) for t in ('copq', 'oee', 'mfg_cost')}
+    stub = StubExportServer(documents, latency=0.05)
+    loaded = {}
+
+    with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()):
+        for i in range(10):
+            for t in ('copq', 'oee', 'mfg_cost'):
+                with open(os.path.join(folder, f"cell{i + 1:02d}_{t}.csv"), 'w', encoding='utf-8') as f:
+                    f.write(generate_worksheet_text(t, months=24, seed=100 + i))
+        drop_folder = DropFolder(folder)
+        sources = [drop_folder] + [HttpEndpoint(stub.url(name)) for name in documents]
+        service = IngestService(sources, lambda t, key, sections: loaded.setdefault(t, {}).__setitem__(key, sections))
+
+        asyncio.run(drop_folder.poll())  # first sight of the folder; files are picked up once settled
+        started = time.perf_counter()
+        first = asyncio.run(service.run_once())
+        first_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        second = asyncio.run(service.run_once())
+        second_seconds = time.perf_counter() - started
+
+    print(f"First pass: {first['parsed']} worksheets ({first['bytes']:,} bytes) in {first_seconds:.2f} s, "
+          f"queue high water {first['queue_high_water']}")
+    print(f"Second pass (nothing changed): {second['unchanged'] - first['unchanged']} unchanged endpoints, "
+          f"{second['parsed'] - first['parsed']} parsed, in {second_seconds:.2f} s")
+    print("Loaded:", {t: len(keys) for t, keys in loaded.items()}, f"({stub.requests} HTTP requests)")
+
+    # The same unchanged poll with one fetch at a time
+    one_at_a_time = IngestService(sources[1:], service.handler, concurrency=1)
+    asyncio.run(one_at_a_time.run_once())
+    started = time.perf_counter()
+    asyncio.run(one_at_a_time.run_once())
+    print(f"Unchanged poll, one fetch at a time: {time.perf_counter() - started:.2f} s")
+    stub.close()
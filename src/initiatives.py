@@ -0,0 +1,362 @@
+# src/initiatives.py
+#
+# Improvement initiative tracking. The COPQ 'QUALITY IMPROVEMENT INITIATIVES' and the
+# Manufacturing Cost 'COST REDUCTION INITIATIVES' tables become one initiative fact
+# table, and every initiative's realised savings are tracked month by month:
+#
+# - An initiative is live from its implementation month when it is Completed or In
+#   Progress. A Completed initiative with no implementation month (the COPQ table has
+#   none) is live from the first tracked month; one In Progress without a month is not
+#   live yet. Planned initiatives are never live.
+# - Savings are measured against the portfolio baseline: the unit cost of the month
+#   before the first initiative went live. COPQ initiatives use COPQ per unit from
+#   monthly_copq_tracking; cost reduction initiatives use the Manufacturing Cost per
+#   Unit trend. Realised savings in a month = (baseline - unit cost) x units. They are
+#   split across the live initiatives in proportion to their target monthly savings,
+#   so overlapping initiatives are not counted twice.
+# - COPQ targets are annual reductions (the worksheet's ROI is target / cost), so they
+#   are divided by 12.
+#
+# InitiativeTracker keeps running totals and can be extended a block of months at a
+# time; loads build it in one call. InitiativeIndex answers the dashboard's ROI views
+# from arrays indexed by status and month.
+
+import numpy as np
+import pandas as pd
+
+INITIATIVE_COLUMNS = ['Source', 'Initiative', 'Status', 'Month Implemented',
+                      'Target Monthly Savings (£)', 'Implementation Cost (£)']
+
+SUMMARY_COLUMNS = INITIATIVE_COLUMNS + ['Live From', 'Realised Savings to Date (£)', 'ROI to Date (%)',
+                                        'Payback Month', 'Projected Payback (months)']
+
+TRACKING_COLUMNS = ['Source', 'Initiative', 'Status', 'Period', 'Month', 'Live', 'Realised Savings (£)',
+                    'Cumulative Savings (£)', 'Implementation Cost (£)']
+
+# Statuses that count as live from the implementation month
+LIVE_STATUSES = ('completed', 'in progress')
+
+ALL_STATUSES = 'All Statuses'
+
+# Prevention / appraisal / failure type of a quality cost category, by leading keyword
+PAF_TYPES = {'prevention': 'Prevention', 'detection': 'Appraisal', 'appraisal': 'Appraisal',
+             'inspection': 'Appraisal', 'failure': 'Failure', 'total': 'Total'}
+
+
+def quality_cost_breakdown(quality_costs):
+    """
+    The COPQ quality-cost table with a 'PAF Type' column (Prevention, Appraisal, Failure or Total).
+
+    Returns:
+        pd.DataFrame or None: A copy of the table, or None when the worksheet has none.
+    """
+    if quality_costs is None or quality_costs.empty:
+        return None
+    df = quality_costs.copy()
+    first_word = df['Cost Category'].astype(str).str.strip().str.split().str[0].str.lower()
+    df['PAF Type'] = first_word.map(PAF_TYPES).fillna('Other')
+    return df
+
+
+def initiative_facts(data_sections, source):
+    """
+    The initiatives of one parsed worksheet, in the common fact table layout.
+
+    Args:
+        data_sections (dict): Sections of a COPQ ('copq') or Manufacturing Cost ('mfg_cost') load.
+        source (str): 'copq' or 'mfg_cost'.
+
+    Returns:
+        pd.DataFrame: INITIATIVE_COLUMNS (empty when the worksheet has no initiatives).
+    """
+    if source == 'copq':
+        df = data_sections.get('quality_initiatives')
+        target_column, cost_column, months_per_target = 'Target COPQ Reduction (£)', 'Estimated Implementation Cost (£)', 12
+    else:
+        df = data_sections.get('cost_reduction_initiatives')
+        target_column, cost_column, months_per_target = 'Target Monthly Savings (£)', 'Implementation Cost (£)', 1
+    if df is None or df.empty:
+        return pd.DataFrame({column: [] for column in INITIATIVE_COLUMNS})
+    return pd.DataFrame({
+        'Source': source,
+        'Initiative': df['Initiative'].astype(str).to_numpy(),
+        'Status': df['Status'].astype(str).str.strip().to_numpy(),
+        'Month Implemented': df['Month Implemented'].to_numpy() if 'Month Implemented' in df.columns else pd.NaT,
+        'Target Monthly Savings (£)': df[target_column].to_numpy(dtype='float64') / months_per_target,
+        'Implementation Cost (£)': df[cost_column].to_numpy(dtype='float64'),
+    }, columns=INITIATIVE_COLUMNS)
+
+
+def unit_cost_series(data_sections, source):
+    """
+    (months, unit cost, units) per tracked month of a worksheet, or None without trend data.
+    COPQ: COPQ per unit produced. Manufacturing Cost: cost per unit.
+    """
+    if source == 'copq':
+        df = data_sections.get('monthly_copq_tracking')
+        if df is None or df.empty:
+            return None
+        units = df['Total Units'].to_numpy(dtype='float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return df['Month'].to_numpy(), df['COPQ (£)'].to_numpy(dtype='float64') / units, units
+    costs = data_sections.get('total_manufacturing_cost')
+    production = data_sections.get('production_data')
+    if costs is None or costs.empty or production is None or len(production) != len(costs):
+        return None
+    # Both sections are columns of the same month header, so rows line up by position
+    return (costs.index.to_numpy(), costs['Manufacturing Cost per Unit (£)'].to_numpy(dtype='float64'),
+            production['Total Units Produced'].to_numpy(dtype='float64'))
+
+
+class InitiativeTracker:
+    """
+    Realised savings of a set of initiatives, with running totals per initiative.
+
+    Attributes:
+        facts (pd.DataFrame): The initiatives (INITIATIVE_COLUMNS).
+        months (list): Months tracked so far.
+        realised (np.ndarray): Realised savings, (initiatives, months).
+        cumulative (np.ndarray): Running total of realised savings per initiative.
+        live_from (np.ndarray): Period each initiative went live (-1: not yet).
+        payback_period (np.ndarray): Period the running total first covered the cost (-1: not yet).
+    """
+
+    def __init__(self, facts):
+        self.facts = facts.reset_index(drop=True)
+        n = len(self.facts)
+        status = self.facts['Status'].astype(str).str.strip().str.lower()
+        self._can_go_live = status.isin(LIVE_STATUSES).to_numpy()
+        implemented = pd.to_datetime(self.facts['Month Implemented'])
+        self._implemented_month = implemented.dt.month.fillna(0).to_numpy(dtype=np.int64)
+        # Completed without an implementation month: live from the first tracked month
+        self._live_at_start = self._can_go_live & implemented.isna().to_numpy() & (status == 'completed').to_numpy()
+
+        self._target = np.nan_to_num(self.facts['Target Monthly Savings (£)'].to_numpy(dtype='float64'))
+        self._cost = self.facts['Implementation Cost (£)'].to_numpy(dtype='float64')
+        self.months = []
+        self.realised = np.zeros((n, 0))
+        self.cumulative = np.zeros(n)
+        self.live_from = np.full(n, -1, dtype=np.int64)
+        self.payback_period = np.full(n, -1, dtype=np.int64)
+        self._baseline = None
+        self._previous_unit_cost = np.nan
+
+    def extend(self, months, unit_costs, units):
+        """
+        Adds a block of months (in order) and updates the running totals.
+
+        Args:
+            months (array-like): Month of each new period (datetimes).
+            unit_costs (array-like): Unit cost of each new period.
+            units (array-like): Units produced in each new period.
+        """
+        months = pd.to_datetime(pd.Index(months))
+        unit_costs = np.asarray(unit_costs, dtype='float64')
+        units = np.asarray(units, dtype='float64')
+        first, count = len(self.months), len(months)
+        if not count:
+            return
+        periods = np.arange(first, first + count)
+
+        # Initiatives going live in this block: the first period of their month
+        pending = (self.live_from < 0) & self._can_go_live
+        if first == 0:
+            self.live_from[pending & self._live_at_start] = 0
+            pending &= ~self._live_at_start
+        month_numbers = months.month.to_numpy()
+        matches = pending[:, None] & (self._implemented_month[:, None] == month_numbers[None, :])
+        starts = matches.any(axis=1)
+        self.live_from[starts] = periods[matches[starts].argmax(axis=1)]
+
+        live = (self.live_from[:, None] >= 0) & (self.live_from[:, None] <= periods[None, :])
+        # The portfolio baseline is the unit cost of the month before the first go-live
+        if self._baseline is None and live.any():
+            first_live = int(live.any(axis=0).argmax())
+            before = unit_costs[first_live - 1] if first_live > 0 else self._previous_unit_cost
+            self._baseline = before if np.isfinite(before) else unit_costs[first_live]
+        baseline = self._baseline if self._baseline is not None else np.nan
+        portfolio = np.nan_to_num((baseline - unit_costs) * units)
+
+        weights = live * self._target[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = np.nan_to_num(weights / weights.sum(axis=0))
+        block = share * portfolio[None, :]
+
+        running = self.cumulative[:, None] + np.cumsum(block, axis=1)
+        covered = (running >= self._cost[:, None]) & live & (self._cost[:, None] > 0)
+        newly_paid = (self.payback_period < 0) & covered.any(axis=1)
+        self.payback_period[newly_paid] = periods[covered[newly_paid].argmax(axis=1)]
+
+        self.realised = np.hstack([self.realised, block])
+        self.cumulative = running[:, -1]
+        self.months.extend(months)
+        self._previous_unit_cost = unit_costs[-1]
+
+    def summary(self):
+        """One row per initiative: SUMMARY_COLUMNS, as of the last tracked month."""
+        months = pd.Index(self.months)
+        live_months = np.where(self.live_from >= 0, len(self.months) - self.live_from, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average = np.where(live_months > 0, self.cumulative / live_months, np.nan)
+            roi = np.where(self._cost > 0, self.cumulative / self._cost, np.nan)
+            projected = np.where(average > 0, self._cost / average, np.nan)
+        summary = self.facts.copy()
+        summary['Live From'] = months[self.live_from].where(self.live_from >= 0) if len(months) else pd.NaT
+        summary['Realised Savings to Date (£)'] = self.cumulative
+        summary['ROI to Date (%)'] = roi
+        summary['Payback Month'] = months[self.payback_period].where(self.payback_period >= 0) if len(months) else pd.NaT
+        summary['Projected Payback (months)'] = projected
+        return summary[SUMMARY_COLUMNS]
+
+    def tracking(self):
+        """Long frame: one row per (initiative, tracked month), TRACKING_COLUMNS."""
+        n, periods = self.realised.shape
+        initiative = np.repeat(np.arange(n), periods)
+        period = np.tile(np.arange(periods), n)
+        return pd.DataFrame({
+            'Source': self.facts['Source'].to_numpy()[initiative],
+            'Initiative': self.facts['Initiative'].to_numpy()[initiative],
+            'Status': self.facts['Status'].to_numpy()[initiative],
+            'Period': period.astype(np.int32),
+            'Month': pd.Index(self.months)[period] if periods else pd.to_datetime([]),
+            'Live': ((self.live_from[initiative] >= 0) & (self.live_from[initiative] <= period)),
+            'Realised Savings (£)': self.realised.ravel(),
+            'Cumulative Savings (£)': np.cumsum(self.realised, axis=1).ravel(),
+            'Implementation Cost (£)': self._cost[initiative],
+        }, columns=TRACKING_COLUMNS)
+
+
+def filter_by_status(df, status=ALL_STATUSES):
+    """Rows of an initiative summary or tracking frame with one status (all rows for ALL_STATUSES)."""
+    if not status or status == ALL_STATUSES:
+        return df
+    return df[(df['Status'] == status).to_numpy()]
+
+
+def track_initiatives(data_sections, source):
+    """
+    Initiative summary and monthly tracking for one parsed worksheet.
+
+    Returns:
+        tuple: (summary, tracking) frames, or (None, None) without initiatives or trend data.
+    """
+    facts = initiative_facts(data_sections, source)
+    series = unit_cost_series(data_sections, source)
+    if facts.empty or series is None:
+        return None, None
+    tracker = InitiativeTracker(facts)
+    tracker.extend(*series)
+    return tracker.summary(), tracker.tracking()
+
+
+class InitiativeIndex:
+    """
+    ROI views over the tracking frames of one or more sources, with positions indexed by
+    status and cumulative savings held as an (initiatives, periods) array.
+
+    Sources with fewer tracked months keep their last running total for later periods.
+    """
+
+    def __init__(self, tracking):
+        source_codes, _ = pd.factorize(tracking['Source'])
+        initiative_codes, initiatives = pd.factorize(tracking['Initiative'])
+        keys, first, codes = np.unique(source_codes.astype(np.int64) * max(len(initiatives), 1) + initiative_codes,
+                                       return_index=True, return_inverse=True)
+        self.source = tracking['Source'].astype(str).to_numpy()[first]
+        self.initiative = tracking['Initiative'].astype(str).to_numpy()[first]
+        self.status = tracking['Status'].astype(str).to_numpy()[first]
+        self.cost = tracking['Implementation Cost (£)'].to_numpy(dtype='float64')[first]
+
+        periods = tracking['Period'].to_numpy()
+        self.n_periods = int(periods.max()) + 1 if len(periods) else 0
+        cumulative = np.full((len(keys), self.n_periods), np.nan)
+        cumulative[codes, periods] = tracking['Cumulative Savings (£)'].to_numpy(dtype='float64')
+        live = np.zeros((len(keys), self.n_periods), dtype=bool)
+        live[codes, periods] = tracking['Live'].to_numpy(dtype=bool)
+        # Forward-fill the running totals of shorter sources
+        filled = np.where(np.isnan(cumulative), 0, np.arange(self.n_periods)[None, :])
+        self.cumulative = np.take_along_axis(cumulative, np.maximum.accumulate(filled, axis=1), axis=1)
+        self.cumulative = np.nan_to_num(self.cumulative)
+        self.live_from = np.where(live.any(axis=1), live.argmax(axis=1), -1)
+        paid = (self.cumulative >= self.cost[:, None]) & (self.cost[:, None] > 0) & live
+        self.payback_period = np.where(paid.any(axis=1), paid.argmax(axis=1), -1)
+
+        # Month of each period (every source's tracking starts at the first month)
+        months = np.full(self.n_periods, np.datetime64('NaT'), dtype='datetime64[ns]')
+        months[periods] = pd.to_datetime(tracking['Month']).to_numpy(dtype='datetime64[ns]')
+        self.months = pd.Series(months)
+
+        self.by_status = {status: np.flatnonzero(self.status == status) for status in pd.unique(self.status)}
+
+    def statuses(self):
+        return sorted(self.by_status)
+
+    def roi_view(self, status=ALL_STATUSES, period=None):
+        """
+        Initiatives of one status (or all) with realised savings, ROI and payback as of a period.
+
+        Returns:
+            pd.DataFrame: One row per initiative, largest realised savings first.
+        """
+        rows = (np.arange(len(self.status)) if not status or status == ALL_STATUSES
+                else self.by_status.get(status, np.array([], dtype=np.int64)))
+        period = self.n_periods - 1 if period is None else min(max(int(period), 0), self.n_periods - 1)
+        realised = self.cumulative[rows, period] if self.n_periods else np.zeros(len(rows))
+        paid = (self.payback_period[rows] >= 0) & (self.payback_period[rows] <= period)
+        view = pd.DataFrame({
+            'Initiative': self.initiative[rows],
+            'Source': self.source[rows],
+            'Status': self.status[rows],
+            'Live From': self.months.to_numpy()[np.maximum(self.live_from[rows], 0)] if self.n_periods else pd.NaT,
+            'Implementation Cost (£)': self.cost[rows],
+            'Realised Savings (£)': realised,
+            'ROI (%)': np.where(self.cost[rows] > 0, realised / np.where(self.cost[rows] > 0, self.cost[rows], 1), np.nan),
+            'Paid Back': paid,
+        })
+        view.loc[self.live_from[rows] < 0, 'Live From'] = pd.NaT
+        return view.sort_values('Realised Savings (£)', ascending=False, kind='stable').reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    from data_processor import load_and_process_copq_data, load_and_process_mfg_cost_data
+
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 20)
+    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    loaded = {
+        'copq': load_and_process_copq_data(os.path.join(data_dir, 'COPQ_Dummy_Data.csv')),
+        'mfg_cost': load_and_process_mfg_cost_data(os.path.join(data_dir, 'Manufacturing_Cost_per_Unit_Calculator.csv')),
+    }
+    trackings = []
+    for source, sections in loaded.items():
+        summary, tracking = track_initiatives(sections, source)
+        print(f"\n{source} initiatives:\n", summary.to_string())
+        trackings.append(tracking)
+
+    index = InitiativeIndex(pd.concat(trackings, ignore_index=True))
+    print("\nIn Progress, as of the third month:\n", index.roi_view('In Progress', 2).to_string())
+
+    # Hundreds of initiatives over five years
+    rng = np.random.default_rng(0)
+    n, months = 500, 60
+    facts = pd.DataFrame({
+        'Source': 'mfg_cost',
+        'Initiative': [f"Initiative {i}" for i in range(n)],
+        'Status': rng.choice(['Completed', 'In Progress', 'Planned'], size=n),
+        'Month Implemented': pd.to_datetime(rng.integers(1, 13, size=n).astype(str), format='%m'),
+        'Target Monthly Savings (£)': rng.uniform(1000, 10000, size=n),
+        'Implementation Cost (£)': rng.uniform(10000, 50000, size=n),
+    })
+    started = time.perf_counter()
+    tracker = InitiativeTracker(facts)
+    tracker.extend(pd.to_datetime([f"1900-{m % 12 + 1:02d}-01" for m in range(months)]),
+                   np.linspace(42, 38, months), np.full(months, 20000.0))
+    index = InitiativeIndex(tracker.tracking())
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(100):
+        index.roi_view('In Progress', 30)
+    print(f"\n{n} initiatives x {months} months: built in {built * 1000:.1f} ms, "
+          f"ROI view in {(time.perf_counter() - started) * 10:.2f} ms")
@@ -0,0 +1,322 @@
+# src/kpi_api.py
+#
+# Read-only HTTP API for other plant systems (MES, BI tools), so they no longer need to
+# scrape the dashboard:
+#
+#   /api/v1                                   datasets, their versions, KPI and frame names
+#   /api/v1/<dataset>/kpis                    the dataset's KPI dict
+#   /api/v1/<dataset>/frames/<frame>[.json|.arrow][?<filters>]
+#                                             one augmented frame as JSON records or an
+#                                             Arrow IPC stream (needs pyarrow)
+#
+# Frame filters: start_date / end_date (YYYY-MM-DD, on the Month index or column),
+# columns (comma-separated), offset and limit (non-negative integers). Errors are JSON:
+# {"error": <status name>, "status": <code>, "message": ...}.
+#
+# Built for many clients polling the same few URLs:
+# - Every response carries an ETag made of the dataset's content fingerprint and the
+#   normalised query, so a poll with If-None-Match gets an empty 304 until that dataset
+#   changes, across restarts and workers alike.
+# - Encoded bodies (plain and gzip) are cached per (dataset version, query), so only the
+#   first request after a change pays for filtering and serialisation.
+# - Clients that send Accept-Encoding: gzip get gzip-compressed bodies.
+#
+# Like exports.py, the routes are registered before the server binds, so pandas and
+# pyarrow are only imported on the first request that needs them.
+
+import collections
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import flask
+from werkzeug.exceptions import HTTPException
+
+from data_registry import DATASET_NAMES
+
+API_VERSION = 'v1'
+
+# Seconds shared caches and clients may reuse a response without revalidating (0: always revalidate)
+API_MAX_AGE = int(os.environ.get('KPI_API_MAX_AGE', 0))
+
+# Encoded responses kept in memory; entries for superseded dataset versions are dropped first
+API_CACHE_ENTRIES = int(os.environ.get('KPI_API_CACHE_ENTRIES', 256))
+
+# Bodies smaller than this are sent uncompressed even when the client accepts gzip
+GZIP_MIN_BYTES = 1024
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+FRAME_FORMATS = ('json', 'arrow')
+
+
+def _pyarrow():
+    """The pyarrow module, or None when it is not installed."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    return pa
+
+
+# --- Encoding ---
+
+def filter_frame(df, args):
+    """
+    Applies the API's frame filters.
+
+    Args:
+        df (pd.DataFrame): An augmented frame.
+        args (dict): Query args: start_date, end_date, columns, offset, limit.
+
+    Returns:
+        pd.DataFrame: The filtered frame, with a Month index moved into a 'Month' column.
+
+    Raises:
+        ValueError: On an unparseable date, an offset or limit that is not a non-negative
+                    integer, or an unknown column.
+    """
+    import pandas as pd
+
+    if isinstance(df.index, pd.DatetimeIndex):
+        df = df.reset_index()
+    start_date, end_date = args.get('start_date'), args.get('end_date')
+    if (start_date or end_date) and 'Month' in df.columns:
+        months = pd.to_datetime(df['Month'])
+        mask = pd.Series(True, index=df.index)
+        if start_date:
+            mask &= months >= pd.to_datetime(start_date, format='%Y-%m-%d')
+        if end_date:
+            mask &= months <= pd.to_datetime(end_date, format='%Y-%m-%d')
+        df = df[mask]
+    if args.get('columns'):
+        columns = [name.strip() for name in args['columns'].split(',') if name.strip()]
+        unknown = [name for name in columns if name not in df.columns]
+        if unknown:
+            raise ValueError(f"Unknown column(s): {', '.join(unknown)}.")
+        df = df[columns]
+    offset = _non_negative_int(args, 'offset')
+    limit = _non_negative_int(args, 'limit')
+    return df.iloc[offset or 0:(offset or 0) + limit if limit is not None else None]
+
+
+def _non_negative_int(args, name):
+    """An integer query arg of at least 0, or None when absent."""
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}': expected an integer.") from None
+    if number < 0:
+        raise ValueError(f"Invalid {name} '{value}': must be at least 0.")
+    return number
+
+
+def encode_frame_json(df, envelope):
+    """The frame as {**envelope, 'columns': [...], 'row_count': n, 'rows': [records]} JSON bytes."""
+    head = json.dumps(dict(envelope, columns=[str(c) for c in df.columns], row_count=len(df)),
+                      separators=(',', ':'), default=str)
+    rows = df.to_json(orient='records', date_format='iso')
+    return (head[:-1] + ',"rows":' + rows + '}').encode('utf-8')
+
+
+def encode_frame_arrow(df, metadata):
+    """The frame as an Arrow IPC stream, with `metadata` in the schema metadata."""
+    pa = _pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           **{k.encode(): str(v).encode() for k, v in metadata.items()}})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# --- Response cache ---
+
+class ResponseCache:
+    """
+    Encoded API bodies keyed by (dataset, dataset version, route, normalised query).
+
+    Entries for older versions of a dataset are dropped when a newer one is stored;
+    beyond `max_entries`, the least recently used entries go.
+    """
+
+    def __init__(self, max_entries=API_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        dataset, version = key[0], key[1]
+        with self._lock:
+            if version > self._latest.get(dataset, -1):
+                self._latest[dataset] = version
+                for stale in [k for k in self._entries if k[0] == dataset and k[1] < version]:
+                    del self._entries[stale]
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def _query_key(args, ignore=()):
+    """Normalised, hashable form of the query args (order-independent)."""
+    return tuple(sorted((k, v) for k, v in args.items(multi=True) if k not in ignore))
+
+
+def _etag(key, content_tag):
+    """ETag of a cache key: its content tag stands in for the (process-local) version."""
+    digest = hashlib.blake2b(repr((key[0], content_tag, key[2:])).encode(), digest_size=8).hexdigest()
+    return f"{API_VERSION}-{key[0]}-{digest}"
+
+
+def _cached_response(key, content_tag, mimetype, encode):
+    """
+    Response for a cache key: the body is encoded (and gzipped) at most once per key.
+    `key` starts with (dataset, dataset version); the ETag is derived from the rest of
+    it and `content_tag` (DatasetSnapshot.content_tag of the data the body shows).
+    """
+    entry = RESPONSE_CACHE.get(key)
+    cache_status = 'HIT'
+    if entry is None:
+        cache_status = 'MISS'
+        body = encode()
+        compressed = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+        entry = {'body': body, 'gzip': compressed, 'etag': _etag(key, content_tag)}
+        RESPONSE_CACHE.put(key, entry)
+
+    use_gzip = entry['gzip'] is not None and 'gzip' in flask.request.accept_encodings
+    response = flask.Response(entry['gzip'] if use_gzip else entry['body'], mimetype=mimetype)
+    # A gzip body is a different representation, so it gets its own strong ETag
+    response.set_etag(entry['etag'] + ('-gz' if use_gzip else ''))
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f"public, max-age={API_MAX_AGE}" if API_MAX_AGE else 'public, no-cache'
+    response.headers['X-Cache'] = cache_status
+    return response.make_conditional(flask.request)
+
+
+# --- Routes ---
+
+def register_api_routes(server, registry):
+    """
+    Adds the read-only /api/v1 endpoints to the Dash Flask server.
+
+    Args:
+        server (flask.Flask): The Dash app's server (app.server).
+        registry (DatasetRegistry): Source of the current dataset snapshot.
+    """
+    prefix = f"/api/{API_VERSION}"
+
+    # API clients get JSON errors; every other route keeps Flask's own error pages
+    @server.errorhandler(HTTPException)
+    def api_error(error):
+        if not flask.request.path.startswith(prefix):
+            return error
+        response = flask.jsonify(error=error.name, status=error.code, message=error.description)
+        response.status_code = error.code
+        return response
+
+    def current_snapshot():
+        snapshot = registry.current() if registry.ready else None
+        if snapshot is None:
+            flask.abort(503, description="Data is still loading.")
+        return snapshot
+
+    def check_dataset(dataset):
+        if dataset not in DATASET_NAMES:
+            flask.abort(404, description=f"Unknown dataset '{dataset}'.")
+
+    def frame_names(snapshot, dataset):
+        frames = snapshot.augmented.get(dataset) or {}
+        return [name for name, df in frames.items() if df is not None]
+
+    @server.route(prefix)
+    def api_index():
+        snapshot = current_snapshot()
+
+        def encode():
+            datasets = {
+                dataset: {
+                    'version': snapshot.dataset_versions.get(dataset, snapshot.version),
+                    'kpis': f"{prefix}/{dataset}/kpis",
+                    'frames': {name: f"{prefix}/{dataset}/frames/{name}" for name in frame_names(snapshot, dataset)},
+                }
+                for dataset in DATASET_NAMES
+            }
+            return json.dumps({'api_version': API_VERSION, 'version': snapshot.version, 'datasets': datasets},
+                              separators=(',', ':')).encode('utf-8')
+        return _cached_response(('index', snapshot.version, 'index'), snapshot.content_tag(), 'application/json', encode)
+
+    @server.route(f"{prefix}/<dataset>/kpis")
+    def api_kpis(dataset):
+        check_dataset(dataset)
+        snapshot = current_snapshot()
+        version = snapshot.dataset_versions.get(dataset, snapshot.version)
+
+        def encode():
+            kpis = snapshot.kpis.get(dataset) or {}
+            return json.dumps({'dataset': dataset, 'version': version, 'kpis': kpis},
+                              separators=(',', ':'), default=str).encode('utf-8')
+        return _cached_response((dataset, version, 'kpis'), snapshot.content_tag((dataset,)), 'application/json', encode)
+
+    @server.route(f"{prefix}/<dataset>/frames/<frame>")
+    def api_frame(dataset, frame):
+        fmt = 'json'
+        if '.' in frame:
+            frame, fmt = frame.rsplit('.', 1)
+        fmt = flask.request.args.get('format', fmt)
+        if fmt not in FRAME_FORMATS:
+            flask.abort(400, description=f"Frames are served as {' or '.join(FRAME_FORMATS)}.")
+        if fmt == 'arrow' and _pyarrow() is None:
+            flask.abort(501, description="Arrow output requires the optional 'pyarrow' package.")
+
+        check_dataset(dataset)
+        snapshot = current_snapshot()
+        if frame not in frame_names(snapshot, dataset):
+            flask.abort(404, description=f"No '{frame}' frame loaded for {dataset}.")
+        version = snapshot.dataset_versions.get(dataset, snapshot.version)
+        args = flask.request.args
+
+        def encode():
+            try:
+                df = filter_frame(snapshot.augmented[dataset][frame], args)
+            except ValueError as e:
+                flask.abort(400, description=str(e))
+            envelope = {'dataset': dataset, 'frame': frame, 'version': version}
+            return encode_frame_json(df, envelope) if fmt == 'json' else encode_frame_arrow(df, envelope)
+
+        key = (dataset, version, 'frame', frame, fmt, _query_key(args, ignore=('format',)))
+        return _cached_response(key, snapshot.content_tag((dataset,)),
+                                'application/json' if fmt == 'json' else ARROW_MIMETYPE, encode)
@@ -2,6 +2,28 @@
 
 import pandas as pd
 
+from shift_calendar import build_shift_oee
+from cost_attribution import build_cost_facts, decompose_cost_per_unit
+from initiatives import quality_cost_breakdown, track_initiatives
+from cost_variance import build_variance_facts, VarianceIndex
+
+def _to_float(value):
+    """
+    Converts a NumPy scalar (e.g. a column mean) to a plain float, so KPI cards and JSON
+    encoding treat every KPI the same way. Missing values map to None.
+    """
+    if value is None or pd.isna(value):
+        return None
+    return float(value)
+
+def _category_rows(breakdown_copq):
+    """Position of the first row of each category in the COPQ breakdown table, keyed by lower-cased name."""
+    categories = breakdown_copq['Category'].astype(str).str.strip().str.lower()
+    rows = {}
+    for position, category in enumerate(categories):
+        rows.setdefault(category, position)
+    return rows
+
 def calculate_copq_kpis(copq_data_sections):
     """
     Calculates various COPQ KPIs based on the processed COPQ data sections.
@@ -28,17 +50,17 @@ def calculate_copq_kpis(copq_data_sections):
         # Let's derive it from the breakdown data for consistency, or monthly if available
         # Preferring monthly_copq_tracking for total COPQ if available as it's a series.
         if monthly_copq_tracking is not None and not monthly_copq_tracking.empty:
-            calculated_kpis['Total COPQ (£)'] = monthly_copq_tracking['COPQ (£)'].sum()
+            calculated_kpis['Total COPQ (£)'] = _to_float(monthly_copq_tracking['COPQ (£)'].sum())
         elif breakdown_copq is not None and not breakdown_copq.empty:
             # If monthly is not available, try to get from breakdown table's 'Total' row
-            total_row = breakdown_copq[breakdown_copq['Category'].str.strip() == 'Total']
-            if not total_row.empty:
-                calculated_kpis['Total COPQ (£)'] = total_row['Cost (£)'].iloc[0]
+            total_row = _category_rows(breakdown_copq).get('total')
+            if total_row is not None:
+                calculated_kpis['Total COPQ (£)'] = _to_float(breakdown_copq['Cost (£)'].iloc[total_row])
             else:
                  calculated_kpis['Total COPQ (£)'] = None # Could not find total COPQ
 
         # 2. Defect Rate (PPM) - Directly from basic_copq
-        calculated_kpis['Defect Rate (PPM)'] = basic_copq.get('Defect Rate (PPM)', None)
+        calculated_kpis['Defect Rate (PPM)'] = _to_float(basic_copq.get('Defect Rate (PPM)', None))
         
         # We need Revenue to calculate percentages of revenue. It's not explicitly in COPQ data.
         # For now, let's assume a dummy revenue or make a note that this needs external input.
@@ -46,13 +68,11 @@ def calculate_copq_kpis(copq_data_sections):
         # In `COPQ_Dummy_Data`, there's a line "COPQ as % of Revenue" at the end.
         # Also, the breakdown table has "% of Revenue". Let's use the breakdown table's percentages.
         if breakdown_copq is not None and not breakdown_copq.empty:
-            scrap_row = breakdown_copq[breakdown_copq['Category'].str.strip() == 'Scrap']
-            rework_row = breakdown_copq[breakdown_copq['Category'].str.strip() == 'Rework']
-            warranty_row = breakdown_copq[breakdown_copq['Category'].str.strip() == 'Warranty']
-            
-            calculated_kpis['Scrap Cost as % of Revenue'] = scrap_row['% of Revenue'].iloc[0] if not scrap_row.empty else None
-            calculated_kpis['Rework Cost as % of Revenue'] = rework_row['% of Revenue'].iloc[0] if not rework_row.empty else None
-            calculated_kpis['Warranty Cost as % of Revenue'] = warranty_row['% of Revenue'].iloc[0] if not warranty_row.empty else None
+            # One category -> row lookup for all three rows
+            category_rows = _category_rows(breakdown_copq)
+            for category in ('Scrap', 'Rework', 'Warranty'):
+                row = category_rows.get(category.lower())
+                calculated_kpis[f'{category} Cost as % of Revenue'] = _to_float(breakdown_copq['% of Revenue'].iloc[row]) if row is not None else None
         else:
             calculated_kpis['Scrap Cost as % of Revenue'] = None
             calculated_kpis['Rework Cost as % of Revenue'] = None
@@ -70,8 +90,11 @@ def calculate_copq_kpis(copq_data_sections):
     augmented_data = {
         'monthly_copq_tracking': monthly_copq_tracking.copy() if monthly_copq_tracking is not None else None,
         'copq_breakdown': breakdown_copq.copy() if breakdown_copq is not None else None,
-        'defect_categories': defect_categories.copy() if defect_categories is not None else None
+        'defect_categories': defect_categories.copy() if defect_categories is not None else None,
+        'quality_costs': quality_cost_breakdown(copq_data_sections.get('quality_costs')),
     }
+    # Quality improvement initiatives and their realised savings against COPQ per unit
+    augmented_data['initiatives'], augmented_data['initiative_tracking'] = track_initiatives(copq_data_sections, 'copq')
 
     # Example of how Scrap Cost formula could be implemented if we had granular data
     # Scrap Cost = Units Scrapped × (Material + Labor + Overhead Cost)
@@ -88,7 +111,7 @@ def calculate_oee_kpis(oee_data_sections):
     Args:
         oee_data_sections (dict): A dictionary containing DataFrames for
                                   'monthly_oee', 'teep_detailed', 'downtime_cost',
-                                  and 'maintenance_costs'.
+                                  and 'maintenance_costs', and the 'basic_data' Series.
                                   
     Returns:
         dict: A dictionary of calculated OEE KPIs and augmented DataFrames.
@@ -103,7 +126,7 @@ def calculate_oee_kpis(oee_data_sections):
         # 1. OEE (%) = Availability × Performance × Quality
         # The monthly_oee table already provides this, so we take the latest or average.
         # Let's calculate the average OEE for the period in the data
-        calculated_kpis['Average OEE (%)'] = monthly_oee_df['OEE (%)'].mean()
+        calculated_kpis['Average OEE (%)'] = _to_float(monthly_oee_df['OEE (%)'].mean())
     else:
         calculated_kpis['Average OEE (%)'] = None
 
@@ -111,14 +134,14 @@ def calculate_oee_kpis(oee_data_sections):
         # 2. TEEP (%) = Utilization × OEE
         # The teep_detailed table already provides this calculated, or we re-calculate.
         # We re-calculated it during parsing, so just take the average here.
-        calculated_kpis['Average TEEP (%)'] = teep_detailed_df['TEEP (%)'].mean()
+        calculated_kpis['Average TEEP (%)'] = _to_float(teep_detailed_df['TEEP (%)'].mean())
     else:
         calculated_kpis['Average TEEP (%)'] = None
 
     if downtime_cost_df is not None and not downtime_cost_df.empty:
         # 3. Downtime Cost per Minute (£)
         # The downtime_cost table provides 'Cost/Min (£)' directly
-        calculated_kpis['Average Downtime Cost per Minute (£)'] = downtime_cost_df['Cost/Min (£)'].mean()
+        calculated_kpis['Average Downtime Cost per Minute (£)'] = _to_float(downtime_cost_df['Cost/Min (£)'].mean())
     else:
         calculated_kpis['Average Downtime Cost per Minute (£)'] = None
 
@@ -126,7 +149,9 @@ def calculate_oee_kpis(oee_data_sections):
     # present in the loaded tables, but we might add columns for visualization later.
     augmented_data = {
         'monthly_oee_trends': monthly_oee_df.copy() if monthly_oee_df is not None else None,
-        'downtime_cost_analysis': downtime_cost_df.copy() if downtime_cost_df is not None else None
+        'downtime_cost_analysis': downtime_cost_df.copy() if downtime_cost_df is not None else None,
+        # Monthly OEE per shift of the calendar built from the worksheet constants
+        'shift_oee_trends': build_shift_oee(oee_data_sections),
     }
    
     return calculated_kpis, augmented_data
@@ -138,7 +163,8 @@ def calculate_mfg_cost_kpis(mfg_cost_data_sections):
     Args:
         mfg_cost_data_sections (dict): A dictionary containing DataFrames for
                                        'production_data', 'total_manufacturing_cost',
-                                       'efficiency_indicators', and 'cost_variance'.
+                                       'efficiency_indicators', and 'cost_variance', and
+                                       the line item and cost driver sections.
                                        
     Returns:
         dict: A dictionary of calculated Manufacturing Cost per Unit KPIs and augmented DataFrames.
@@ -154,38 +180,52 @@ def calculate_mfg_cost_kpis(mfg_cost_data_sections):
     # We can get Manufacturing Cost per Unit directly from the `total_manufacturing_cost` table
     # Let's take the average or the latest value.
     if total_mfg_cost_df is not None and not total_mfg_cost_df.empty:
-        calculated_kpis['Average Total Cost per Unit (£)'] = total_mfg_cost_df['Manufacturing Cost per Unit (£)'].mean()
+        calculated_kpis['Average Total Cost per Unit (£)'] = _to_float(total_mfg_cost_df['Manufacturing Cost per Unit (£)'].mean())
     else:
         calculated_kpis['Average Total Cost per Unit (£)'] = None
     
     # 2. Labor Efficiency (%)
     if efficiency_indicators_df is not None and not efficiency_indicators_df.empty:
-        calculated_kpis['Average Labor Efficiency (%)'] = efficiency_indicators_df['Labor Efficiency (%)'].mean() * 100 # Convert back to %
+        calculated_kpis['Average Labor Efficiency (%)'] = _to_float(efficiency_indicators_df['Labor Efficiency (%)'].mean() * 100) # Convert back to %
     else:
         calculated_kpis['Average Labor Efficiency (%)'] = None
 
     # 3. Material Yield (%)
     if efficiency_indicators_df is not None and not efficiency_indicators_df.empty:
-        calculated_kpis['Average Material Yield (%)'] = efficiency_indicators_df['Material Yield (%)'].mean() * 100 # Convert back to %
+        calculated_kpis['Average Material Yield (%)'] = _to_float(efficiency_indicators_df['Material Yield (%)'].mean() * 100) # Convert back to %
     else:
         calculated_kpis['Average Material Yield (%)'] = None
 
-    # 4. Cost Variance = Actual Cost – Budgeted Cost (We have this directly in cost_variance_df)
-    # We can provide the latest variance or total variance here. Let's take the latest month's variance.
-    if cost_variance_df is not None and not cost_variance_df.empty:
-        latest_variance_row = cost_variance_df.iloc[-1] # Get the last row for the latest month
-        calculated_kpis['Latest Cost Variance (£)'] = latest_variance_row.get('Variance (£)', None)
-        calculated_kpis['Latest Cost Variance (%)'] = latest_variance_row.get('Variance (%)', None) * 100 # Convert back to %
+    # 4. Cost Variance = Actual Cost – Budgeted Cost, for the headline cost line (the first
+    # in the table): the latest month, year to date and the last twelve months. For a
+    # per-unit line these are per-unit figures, unit-weighted over the period (not sums).
+    variance_facts = build_variance_facts(mfg_cost_data_sections)
+    if variance_facts is not None and not variance_facts.empty:
+        variance_index = VarianceIndex(variance_facts)
+        headline = variance_index.kpis()[0]
+        for label, period_type in (('Latest', 'month'), ('YTD', 'ytd'), ('Rolling 12M', 'rolling_12')):
+            view = variance_index.period_view(period_type, kpi=headline).iloc[0]
+            calculated_kpis[f'{label} Cost Variance (£)'] = _to_float(view['Variance (£)'])
+            calculated_kpis[f'{label} Cost Variance (%)'] = _to_float(view['Variance (%)'] * 100) # Convert back to %
     else:
-        calculated_kpis['Latest Cost Variance (£)'] = None
-        calculated_kpis['Latest Cost Variance (%)'] = None
+        for label in ('Latest', 'YTD', 'Rolling 12M'):
+            calculated_kpis[f'{label} Cost Variance (£)'] = None
+            calculated_kpis[f'{label} Cost Variance (%)'] = None
+
+    # Line item facts and the volume/rate/mix attribution of cost per unit changes
+    cost_facts = build_cost_facts(mfg_cost_data_sections)
 
     # Augment DataFrames for trends and breakdowns
     augmented_data = {
         'total_mfg_cost_trends': total_mfg_cost_df.copy() if total_mfg_cost_df is not None else None,
         'efficiency_trends': efficiency_indicators_df.copy() if efficiency_indicators_df is not None else None,
-        'cost_variance_analysis': cost_variance_df.copy() if cost_variance_df is not None else None
+        'cost_variance_analysis': cost_variance_df.copy() if cost_variance_df is not None else None,
+        'cost_variance_facts': variance_facts,
+        'cost_facts': cost_facts,
+        'cost_attribution': decompose_cost_per_unit(cost_facts) if cost_facts is not None else None,
     }
+    # Cost reduction initiatives and their realised savings against cost per unit
+    augmented_data['initiatives'], augmented_data['initiative_tracking'] = track_initiatives(mfg_cost_data_sections, 'mfg_cost')
     
     return calculated_kpis, augmented_data
 
@@ -0,0 +1,219 @@
+# src/live_updates.py
+#
+# Server push for wall displays and other long-lived pages. Instead of each client
+# polling, the browser keeps one Server-Sent Events connection open to /events; when
+# a new dataset version is published the server sends a single small event naming the
+# datasets that changed. The client (assets/live_updates.js) then fetches the new
+# dcc.Store payloads for those datasets only, and only once their tab is showing, so
+# just the figures that read those stores re-run.
+#
+#   /events?since=<position>        text/event-stream of 'dataset' events
+#   /live/changes.json?since=<pos>  the same change message, for clients that poll
+#   /live/stores/<dataset>.json     {store id: store data} for the current version
+#
+# A client's position is "<boot id>-<version>" (the SSE event id and the page's
+# data-version). Versions restart with every server process, so a position from
+# another boot, or one ahead of the current version, cannot be compared; such a
+# client is sent every dataset straight away instead of waiting for the counter.
+#
+# Fan-out stays flat as clients are added: every connection waits on the registry's
+# one condition variable, and each event and store payload is encoded once per
+# version and shared by all connections.
+#
+# Each open stream holds one WSGI worker thread for as long as the page is open, so
+# the server needs more threads than streams: the Flask development server starts a
+# thread per request, gunicorn needs --worker-class gthread --threads N, and waitress
+# needs threads=N, with N above KPI_SSE_MAX_STREAMS plus the normal request load.
+# Beyond KPI_SSE_MAX_STREAMS open streams /events answers 503 and the client polls
+# /live/changes.json instead, retrying the stream now and then. A closed connection
+# frees its slot when the next heartbeat fails to send.
+
+import json
+import os
+import threading
+
+import flask
+from dash import Input, Output
+
+from data_registry import BOOT_ID, DATASET_NAMES
+
+# Seconds between keep-alive comments; they also let the server notice closed connections
+HEARTBEAT_SECONDS = float(os.environ.get('KPI_SSE_HEARTBEAT', 15))
+
+# Milliseconds the browser waits before reconnecting a dropped stream
+RETRY_MILLISECONDS = 3000
+
+# Open /events streams allowed at once; each holds a worker thread (see above)
+MAX_STREAMS = int(os.environ.get('KPI_SSE_MAX_STREAMS', 32))
+
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+# Dataset -> the dashboard tab that shows it
+DATASET_TABS = {
+    'copq': 'tab-copq',
+    'oee': 'tab-oee',
+    'mfg_cost': 'tab-mfg-cost',
+}
+
+_encoded = {}
+_encoded_lock = threading.Lock()
+
+
+def position(version):
+    """The client-facing position for a version of this process."""
+    return f"{BOOT_ID}-{version}"
+
+
+def parse_position(value, current_version):
+    """
+    The version a client position refers to in this process.
+
+    None stays None (no position given). A position from another boot, a malformed
+    one, or one ahead of `current_version` maps to 0, so every dataset counts as changed.
+    """
+    if value is None:
+        return None
+    boot, _, version = value.rpartition('-')
+    if boot != BOOT_ID or not version.isdigit() or int(version) > current_version:
+        return 0
+    return int(version)
+
+
+def _cached(key, encode):
+    """Encodes once per key; entries for superseded versions are dropped as new ones arrive."""
+    with _encoded_lock:
+        value = _encoded.get(key)
+    if value is None:
+        value = encode()
+        with _encoded_lock:
+            latest = max((k[1] for k in _encoded), default=0)
+            if key[1] > latest:
+                for stale in [k for k in _encoded if k[1] < key[1]]:
+                    del _encoded[stale]
+            _encoded[key] = value
+    return value
+
+
+def encode_change(snapshot, since):
+    """JSON message telling a client at version `since` what changed up to `snapshot`."""
+    def encode():
+        changed = snapshot.changed_since(since)
+        payload = {
+            'version': position(snapshot.version),
+            'changed': changed,
+            'tabs': {name: DATASET_TABS.get(name) for name in changed},
+        }
+        return json.dumps(payload, separators=(',', ':'))
+    return _cached(('change', snapshot.version, since), encode)
+
+
+def encode_event(snapshot, since):
+    """The SSE frame carrying encode_change's message."""
+    return _cached(('event', snapshot.version, since),
+                   lambda: f"id: {position(snapshot.version)}\nevent: dataset\ndata: {encode_change(snapshot, since)}\n\n".encode())
+
+
+def encode_store_payloads(snapshot, dataset):
+    """JSON object of store id -> store data for one dataset, as create_data_stores writes it."""
+    from utils.ui_components import DATA_STORES
+
+    def encode():
+        frames = snapshot.augmented.get(dataset) or {}
+        stores = {}
+        for store_id, store_dataset, frame_key, to_json_kwargs in DATA_STORES:
+            if store_dataset != dataset:
+                continue
+            df = frames.get(frame_key)
+            stores[store_id] = df.to_json(**to_json_kwargs) if df is not None else None
+        version = snapshot.dataset_versions.get(dataset, snapshot.version)
+        return json.dumps({'version': version, 'stores': stores}, separators=(',', ':')).encode()
+    return _cached(('stores', snapshot.version, dataset), encode)
+
+
+def event_stream(registry, since):
+    """Yields SSE frames: any changes after `since` straight away, then one per new version."""
+    yield f"retry: {RETRY_MILLISECONDS}\n\n".encode()
+    while True:
+        snapshot = registry.wait_for_version(since, timeout=HEARTBEAT_SECONDS)
+        if snapshot is None or snapshot.version <= since:
+            yield b": keep-alive\n\n"
+            continue
+        yield encode_event(snapshot, since)
+        since = snapshot.version
+
+
+def register_live_update_routes(server, registry):
+    """
+    Adds the /events push channel and the store payload route to the Dash Flask server.
+
+    Args:
+        server (flask.Flask): The Dash app's server (app.server).
+        registry (DatasetRegistry): Source of dataset versions.
+    """
+
+    @server.route('/events')
+    def events():
+        # EventSource sends Last-Event-ID when it reconnects; the page passes ?since= on first connect
+        # After a server restart both carry another boot's position, answered in full
+        value = flask.request.headers.get('Last-Event-ID') or flask.request.args.get('since')
+        since = parse_position(value, registry.version)
+        if since is None:
+            since = registry.version
+        # A 503 ends the EventSource without reconnecting; the client then polls
+        if not _stream_slots.acquire(blocking=False):
+            flask.abort(503, description=f"All {MAX_STREAMS} live update streams are in use; poll /live/changes.json.")
+        response = flask.Response(
+            event_stream(registry, since),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+        # Runs when the server closes the response, including after the client disconnects
+        response.call_on_close(_stream_slots.release)
+        return response
+
+    @server.route('/live/changes.json')
+    def live_changes():
+        snapshot = registry.current()
+        since = parse_position(flask.request.args.get('since'), snapshot.version if snapshot else 0) or 0
+        if snapshot is None or snapshot.version <= since:
+            return flask.Response(status=204)
+        response = flask.Response(encode_change(snapshot, since), mimetype='application/json')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    @server.route('/live/stores/<dataset>.json')
+    def live_stores(dataset):
+        if dataset not in DATASET_NAMES:
+            flask.abort(404, description=f"Unknown dataset '{dataset}'.")
+        snapshot = registry.current()
+        if snapshot is None:
+            flask.abort(503, description="Data is still loading.")
+        response = flask.Response(encode_store_payloads(snapshot, dataset), mimetype='application/json')
+        response.headers['Cache-Control'] = 'no-cache'
+        # From the content, not the version, which another process may reuse for other data
+        response.set_etag(f"{dataset}-{snapshot.content_tag((dataset,))}")
+        return response.make_conditional(flask.request)
+
+
+def create_live_updates_status(snapshot):
+    """Small status line; its data-version tells the client which version the page was built from."""
+    from dash import html
+    return html.Div(id='live-updates-status', className="text-end text-muted small",
+                    **{'data-version': position(snapshot.version if snapshot else 0)})
+
+
+def register_live_update_callbacks(app):
+    # Tells the push client which tab is showing (and connects it on page load), so
+    # updates for hidden tabs wait until they are opened
+    app.clientside_callback(
+        """
+        function(activeTab) {
+            if (window.kpiLiveUpdates) {
+                window.kpiLiveUpdates.setActiveTab(activeTab);
+            }
+            return window.dash_clientside.no_update;
+        }
+        """,
+        Output('live-updates-status', 'title'),
+        [Input('tabs-main', 'active_tab')]
+    )
@@ -0,0 +1,179 @@
+# src/load_profiler.py
+
+import datetime
+import io
+import json
+import logging
+import os
+import pstats
+import tempfile
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('kpi.load')
+
+# Latest load report per worksheet type, filled in by the loaders in data_processor
+LOAD_REPORTS = {}
+
+
+class LoadReport:
+    """
+    Structured account of one worksheet load: where the time went and how much data moved.
+
+    Attributes:
+        worksheet_type (str): 'copq', 'oee' or 'mfg_cost'.
+        source (str): File path (and sheet name for workbooks) the grid came from.
+        bytes_read (int or None): Size of the source file, when it is a file on disk.
+        grid_rows, grid_cols (int): Shape of the raw grid handed to the section parser.
+        timings (dict): Seconds per load step: 'read', 'formulas', 'scan' (search-key/blank-row
+                        index), 'post_process', 'validate' and 'total'.
+        sections (dict): Section name -> rows, locate/parse/convert seconds, bytes before/after.
+        formulas (dict): Formula cell counts from formula_evaluator.evaluate_formulas.
+        validation (list): Exported values that do not match their recomputed value, as
+                           validation.MISMATCH_COLUMNS dicts.
+        error (str or None): The exception that aborted the load, if any.
+    """
+
+    def __init__(self, worksheet_type, source=None):
+        self.worksheet_type = worksheet_type
+        self.source = str(source) if source is not None else None
+        self.bytes_read = None
+        self.grid_rows = 0
+        self.grid_cols = 0
+        self.timings = {}
+        self.sections = {}
+        self.formulas = {}
+        self.validation = []
+        self.error = None
+        self.started_at = datetime.datetime.now().isoformat(timespec='seconds')
+
+    @contextmanager
+    def timed(self, step):
+        """Adds the duration of the `with` block to timings[step]."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[step] = self.timings.get(step, 0.0) + time.perf_counter() - started
+
+    def section(self, section_name):
+        """The (created on first use) stats entry for one section."""
+        return self.sections.setdefault(section_name, {
+            'rows': 0,
+            'locate_seconds': 0.0,
+            'parse_seconds': 0.0,
+            'convert_seconds': 0.0,
+            'bytes_before': 0,
+            'bytes_after': 0,
+        })
+
+    @property
+    def convert_seconds(self):
+        """Total dtype-conversion time across sections."""
+        return sum(stats['convert_seconds'] for stats in self.sections.values())
+
+    def to_dict(self):
+        return {
+            'worksheet_type': self.worksheet_type,
+            'source': self.source,
+            'started_at': self.started_at,
+            'bytes_read': self.bytes_read,
+            'grid_rows': self.grid_rows,
+            'grid_cols': self.grid_cols,
+            'rows_parsed': sum(stats['rows'] for stats in self.sections.values()),
+            'timings': dict(self.timings, convert=self.convert_seconds),
+            'sections': self.sections,
+            'formulas': self.formulas,
+            'validation': self.validation,
+            'error': self.error,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), default=str)
+
+    def summary(self):
+        """Human-readable table of the report, for the command-line harnesses."""
+        t = self.timings
+        lines = [f"Load report for '{self.worksheet_type}' ({self.source}):",
+                 f"  read {t.get('read', 0) * 1000:.1f} ms, scan {t.get('scan', 0) * 1000:.1f} ms, "
+                 f"convert {self.convert_seconds * 1000:.1f} ms, post-process {t.get('post_process', 0) * 1000:.1f} ms, "
+                 f"total {t.get('total', 0) * 1000:.1f} ms; {self.grid_rows} grid rows, "
+                 f"{self.bytes_read if self.bytes_read is not None else '?'} bytes read"]
+        for name, stats in self.sections.items():
+            lines.append(f"  {name:<28} {stats['rows']:>7} rows  locate {stats['locate_seconds'] * 1000:7.2f} ms  "
+                         f"parse {stats['parse_seconds'] * 1000:7.2f} ms  convert {stats['convert_seconds'] * 1000:7.2f} ms")
+        if self.formulas.get('cells'):
+            lines.append(f"  {self.formulas['cells']} formula cell(s) in {self.formulas['groups']} shape(s), "
+                         f"{self.formulas['empty']} left empty (formulas {t.get('formulas', 0) * 1000:.2f} ms)")
+        if self.validation:
+            lines.append(f"  {len(self.validation)} exported value(s) differ from their recomputed value "
+                         f"(validate {t.get('validate', 0) * 1000:.2f} ms)")
+        if self.error:
+            lines.append(f"  ERROR: {self.error}")
+        return "\n".join(lines)
+
+
+def publish_load_report(report):
+    """Stores the report in LOAD_REPORTS and logs it as a single JSON line."""
+    LOAD_REPORTS[report.worksheet_type] = report
+    if report.error:
+        logger.warning(report.to_json())
+    else:
+        logger.info(report.to_json())
+
+
+# --- Whole-load profiling ---
+
+@contextmanager
+def profile_load(label):
+    """
+    Profiles the `with` block when $KPI_PROFILE_LOADS is 'cprofile' or 'pyinstrument'.
+
+    cProfile writes a .prof file (open with snakeviz or pstats) and logs the top functions
+    by cumulative time; pyinstrument writes an HTML call tree. Output goes to
+    $KPI_PROFILE_DIR, or the system temp directory. Without the variable this is a no-op.
+    """
+    mode = os.environ.get('KPI_PROFILE_LOADS', '').strip().lower()
+    if not mode:
+        yield
+        return
+
+    output_dir = os.environ.get('KPI_PROFILE_DIR') or tempfile.gettempdir()
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.join(output_dir, f"load-{label}-{datetime.datetime.now():%Y%m%d-%H%M%S}")
+
+    if mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("Warning: KPI_PROFILE_LOADS=pyinstrument but pyinstrument is not installed; load not profiled.")
+            yield
+            return
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(stem + '.html', 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            logger.info(json.dumps({'profile': label, 'tool': 'pyinstrument', 'path': stem + '.html'}))
+        return
+
+    if mode != 'cprofile':
+        print(f"Warning: unknown KPI_PROFILE_LOADS value '{mode}' (expected 'cprofile' or 'pyinstrument'); load not profiled.")
+        yield
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(stem + '.prof')
+        top = io.StringIO()
+        pstats.Stats(profiler, stream=top).sort_stats('cumulative').print_stats(20)
+        logger.info(json.dumps({'profile': label, 'tool': 'cprofile', 'path': stem + '.prof'}))
+        logger.debug(top.getvalue())
@@ -0,0 +1,260 @@
+# src/mapped_reader.py
+#
+# Memory-mapped reading of very large worksheet CSV exports. read_raw_worksheet turns
+# the whole file into an all-object grid before any section is located, which for a
+# multi-hundred-MB historical export peaks at several times the file size. Here the
+# file is memory-mapped and scanned for the byte offsets of the lines the parser needs:
+#   - one pass finds candidate anchor lines: each window is lower-cased and searched
+#     for the first-column text of every section anchor and of the month header
+#     anchor; each candidate line is split as CSV and checked against the full anchor,
+#     so the first verified line per section is the line the section parser would pick
+#   - each section runs to the next blank line, as in WorksheetParser._block_end
+# Only those byte ranges (plus the title line) are read into a grid, indexed by file
+# line so formula references still resolve (see formula_evaluator.py); the compiled
+# section parser then converts them into typed columns as usual.
+#
+# The mapping is scanned in windows and the pages behind the scan are released with
+# madvise(MADV_DONTNEED), so the resident set stays around one window plus the
+# sections rather than growing with the file.
+
+import csv
+import io
+import mmap
+import os
+import re
+
+import pandas as pd
+
+from section_parser import get_parser, read_raw_worksheet
+
+# CSV worksheets at least this large are read through the mapping ($KPI_MAPPED_READ_MIN_MB)
+MAPPED_READ_MIN_BYTES = int(float(os.environ.get('KPI_MAPPED_READ_MIN_MB', 64)) * 1024 * 1024)
+
+# Bytes scanned between page releases
+SCAN_WINDOW_BYTES = 8 * 1024 * 1024
+
+# A line whose cells are all blank (empty, whitespace or an empty quoted string)
+_BLANK_LINE = re.compile(rb'^[ \t,"]*\r?$', re.MULTILINE)
+
+_MONTH_HEADER = '__month_header__'
+
+
+class MappedWorksheet:
+    """A read-only memory mapping of a worksheet CSV, scanned front to back."""
+
+    def __init__(self, file_path):
+        self._file = open(file_path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+
+    def close(self):
+        if self.size:
+            self.mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def release(self, start, end):
+        """
+        Drops the whole pages of [start, end) from the resident set; they are read back
+        from the page cache if touched again.
+        """
+        start += -start % mmap.PAGESIZE
+        end -= end % mmap.PAGESIZE
+        if end > start and hasattr(self.mm, 'madvise'):
+            self.mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    def search(self, pattern, pos, overlap=0):
+        """
+        First match of `pattern` at or after `pos`, searched one window at a time.
+        `overlap` is the longest match the pattern can make across a window boundary.
+        """
+        while pos < self.size:
+            end = min(pos + SCAN_WINDOW_BYTES, self.size)
+            match = pattern.search(self.mm, pos, min(end + overlap, self.size))
+            if match is not None:
+                return match
+            self.release(pos, end)
+            pos = end
+        return None
+
+    def candidate_lines(self, needles):
+        """
+        Start offsets of the lines containing any of the (lower-case) needles, in file
+        order, matched case-insensitively one window at a time.
+        """
+        overlap = max(len(needle) for needle in needles) - 1
+        pos = last_line = 0
+        while pos < self.size:
+            end = min(pos + SCAN_WINDOW_BYTES, self.size)
+            window = self.mm[pos:min(end + overlap, self.size)].lower()
+            hits = set()
+            for needle in needles:
+                i = window.find(needle)
+                # Matches starting in the overlap belong to the next window
+                while -1 < i < end - pos:
+                    hits.add(pos + i)
+                    i = window.find(needle, i + 1)
+            for hit in sorted(hits):
+                line_start = self.mm.rfind(b'\n', 0, hit) + 1
+                if line_start >= last_line:
+                    last_line = self.next_line(line_start)
+                    yield line_start
+            self.release(pos, end)
+            pos = end
+
+    def next_line(self, pos):
+        """Offset of the line after the one containing `pos`."""
+        end = self.mm.find(b'\n', pos)
+        return self.size if end == -1 else end + 1
+
+    def block_end(self, pos):
+        """Offset of the first blank line at or after `pos`, or the end of the file."""
+        match = self.search(_BLANK_LINE, pos, overlap=1024)
+        return self.size if match is None or match.start() >= self.size else match.start()
+
+    def count_lines(self, start, end):
+        """Newlines in [start, end), counted one window at a time."""
+        lines = 0
+        for pos in range(start, end, SCAN_WINDOW_BYTES):
+            window_end = min(pos + SCAN_WINDOW_BYTES, end)
+            lines += self.mm[pos:window_end].count(b'\n')
+            self.release(pos, window_end)
+        return lines
+
+
+def _matches(anchor, cells):
+    """WorksheetParser._find_anchor for a single line of cells."""
+    for col, needle, mode in anchor:
+        if col >= len(cells):
+            return False
+        cell = cells[col].strip().lower()
+        if (cell != needle) if mode == 'equals' else (needle not in cell):
+            return False
+    return True
+
+
+def locate_sections(mapped, worksheet_type):
+    """
+    Finds the byte range of every section of a worksheet type in a mapped file.
+
+    Returns:
+        dict: Section name (and '__month_header__' for the month header) -> (start, end)
+              offsets of its lines; sections that are not found are omitted.
+    """
+    parser = get_parser(worksheet_type)
+    anchors = {name: section['anchor'] for name, section in parser.sections.items()}
+    if parser.month_header:
+        anchors[_MONTH_HEADER] = parser.month_header[0]
+
+    needles = {needle.encode() for anchor in anchors.values() for col, needle, _ in anchor if col == 0}
+
+    starts = {}
+    for line_start in mapped.candidate_lines(needles):
+        line = mapped.mm[line_start:mapped.next_line(line_start)].decode('utf-8', errors='replace')
+        cells = next(csv.reader([line]), [])
+        # Candidates are only checked against the sections not found yet
+        for name, anchor in anchors.items():
+            if name not in starts and _matches(anchor, cells):
+                starts[name] = line_start
+        if len(starts) == len(anchors):
+            break
+
+    ranges = {}
+    for name, start in starts.items():
+        if name == _MONTH_HEADER:
+            end = start
+            for _ in range(parser.month_header[1] + 1):
+                end = mapped.next_line(end)
+        else:
+            end = mapped.block_end(mapped.next_line(start))
+            # The blank line itself marks the end of the block for the section parser
+            end = mapped.next_line(end) if end < mapped.size else end
+        ranges[name] = (start, end)
+    return ranges
+
+
+def _merge_ranges(ranges):
+    """Sorted, non-overlapping union of (start, end) byte ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def read_mapped_worksheet(file_path, worksheet_type):
+    """
+    Reads only the lines of a worksheet CSV that its sections occupy.
+
+    Args:
+        file_path (str): The CSV export.
+        worksheet_type (str): Which schema's sections to read.
+
+    Returns:
+        pd.DataFrame: All-string grid indexed by zero-based file line (the title line,
+                      the month header and each section block), for process_worksheet.
+    """
+    with MappedWorksheet(file_path) as mapped:
+        if not mapped.size:
+            return read_raw_worksheet(file_path)
+        ranges = locate_sections(mapped, worksheet_type)
+        # The title line comes first, so the grid is as wide as a full read's
+        ranges = _merge_ranges([(0, mapped.next_line(0))] + list(ranges.values()))
+
+        parts, lines, line, offset = [], [], 0, 0
+        for start, end in ranges:
+            line += mapped.count_lines(offset, start)
+            part = mapped.mm[start:end]
+            if not part.endswith(b'\n'):
+                part += b'\n'
+            n_lines = part.count(b'\n')
+            parts.append(part)
+            lines.extend(range(line, line + n_lines))
+            line, offset = line + n_lines, end
+
+    raw_data = read_raw_worksheet(io.BytesIO(b''.join(parts)))
+    if len(raw_data) != len(lines):
+        # Quoted cells spanning lines: the line index would be wrong, so read the whole file
+        print(f"Warning: {file_path} has multi-line cells; it is read in full instead of through the memory map.")
+        return read_raw_worksheet(file_path)
+    raw_data.index = pd.Index(lines)
+    return raw_data
+
+
+def use_mapped_read(file_path):
+    """True for CSV exports large enough to read through the memory map."""
+    return os.path.getsize(file_path) >= MAPPED_READ_MIN_BYTES
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+    from data_processor import process_worksheet
+    from synthetic_data import write_padded_worksheet
+
+    # Synthetic exports with a large block of unrelated rows ahead of their sections
+    padding_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as workdir:
+        for worksheet_type in ('copq', 'oee', 'mfg_cost'):
+            path = os.path.join(workdir, f"{worksheet_type}.csv")
+            n_lines = write_padded_worksheet(path, worksheet_type, padding_mb * 1024 * 1024)
+
+            started = time.perf_counter()
+            full = process_worksheet(worksheet_type, read_raw_worksheet(path))
+            full_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            grid = read_mapped_worksheet(path, worksheet_type)
+            mapped = process_worksheet(worksheet_type, grid)
+            mapped_seconds = time.perf_counter() - started
+
+            same = full.keys() == mapped.keys() and all(full[name].equals(mapped[name]) for name in full)
+            print(f"{worksheet_type:<9} {os.path.getsize(path) / 1e6:7.1f} MB: full read {full_seconds:6.2f} s, "
+                  f"mapped {mapped_seconds:6.2f} s ({len(grid)} of {n_lines} lines), sections identical: {same}")
@@ -0,0 +1,178 @@
+# src/pareto.py
+#
+# Pareto analysis of the COPQ defect categories: codes ranked by cost (or occurrences)
+# with cumulative share, the top N shown individually and the rest folded into
+# "Other", and a drill-down from defect family to defect code.
+#
+# The worksheet has no family column. Families come from the defect type label: a
+# hierarchical code such as "Assembly / DC-0012" belongs to family "Assembly".
+# Labels without a separator are their own family, so a flat list (like the dummy
+# data) is simply a single-level Pareto.
+#
+# A ParetoIndex sorts once per metric and keeps cumulative sums, family totals and a
+# family-grouped ordering. Every query after that is a slice of pre-sorted arrays,
+# so the table and chart stay fast with thousands of codes. Indexes are cached per
+# store payload, like the decoded frames in utils.ui_components.decode_store.
+
+import collections
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.instrumentation import count_cache, timed_phase
+from utils.ui_components import decode_store
+
+# Separators between family and code in a defect type label
+FAMILY_SEPARATORS = (' / ', ' > ')
+
+# Label of the bucket that collects everything outside the top N
+OTHER_LABEL = 'Other'
+
+# Metric name -> defect_categories column
+PARETO_METRICS = {
+    'cost': 'Associated Cost (£)',
+    'occurrences': 'Number of Occurrences',
+}
+
+DEFAULT_TOP_N = 10
+
+# Share of the total that defines the "vital few"
+VITAL_FEW_SHARE = 0.8
+
+
+def split_defect_family(defect_types):
+    """Family of each defect type label (the part before the first separator, or the label itself)."""
+    labels = pd.Series(defect_types, dtype='object').astype(str).str.strip()
+    families = labels.copy()
+    for separator in FAMILY_SEPARATORS:
+        # The first separator found in a label wins
+        split = labels.str.split(separator, n=1, regex=False).str[0].str.strip()
+        families = families.where(families != labels, split)
+    return families
+
+
+class ParetoIndex:
+    """
+    Pre-sorted aggregates of a defect_categories frame, for Pareto queries.
+
+    Attributes:
+        codes (np.ndarray): Defect type labels, without the 'Total' row.
+        families (np.ndarray): Family of each code.
+        has_hierarchy (bool): Whether any family groups more than one code.
+    """
+
+    def __init__(self, df):
+        df = df[df['Defect Type'].astype(str).str.strip().str.lower() != 'total']
+        self.codes = df['Defect Type'].astype(str).str.strip().to_numpy(dtype=object)
+        self.families = split_defect_family(self.codes).to_numpy(dtype=object)
+        self._family_ids, family_names = pd.factorize(self.families)
+        self.family_names = np.asarray(family_names, dtype=object)
+        self.has_hierarchy = len(self.family_names) < len(self.codes)
+        self._values = {
+            metric: pd.to_numeric(df[column], errors='coerce').fillna(0).to_numpy(dtype='float64')
+            for metric, column in PARETO_METRICS.items() if column in df.columns
+        }
+        self._sorted = {}
+
+    def _metric(self, metric):
+        """(codes order, family totals order, family-grouped order, group starts, family totals) for a metric."""
+        if metric not in self._values:
+            raise ValueError(f"Unknown or missing Pareto metric '{metric}'.")
+        cached = self._sorted.get(metric)
+        if cached is None:
+            values = self._values[metric]
+            # Descending by value; ties keep worksheet order
+            order = np.argsort(-values, kind='stable')
+            family_totals = np.bincount(self._family_ids, weights=values, minlength=len(self.family_names))
+            family_order = np.argsort(-family_totals, kind='stable')
+            # Codes grouped by family, each group in descending order
+            grouped = order[np.argsort(self._family_ids[order], kind='stable')]
+            starts = np.searchsorted(self._family_ids[grouped], np.arange(len(self.family_names) + 1))
+            cached = (order, family_order, grouped, starts, family_totals)
+            self._sorted[metric] = cached
+        return cached
+
+    def _level(self, metric, family):
+        """Labels, values (descending) and item counts for one drill-down level."""
+        order, family_order, grouped, starts, family_totals = self._metric(metric)
+        values = self._values[metric]
+        if family is None and self.has_hierarchy:
+            counts = np.diff(starts)
+            return self.family_names[family_order], family_totals[family_order], counts[family_order]
+        if family is None:
+            return self.codes[order], values[order], np.ones(len(order), dtype='int64')
+        matches = np.flatnonzero(self.family_names == family)
+        if not len(matches):
+            # A single code selected rather than a family
+            rows = np.flatnonzero(self.codes == family)
+            return self.codes[rows], values[rows], np.ones(len(rows), dtype='int64')
+        members = grouped[starts[matches[0]]:starts[matches[0] + 1]]
+        return self.codes[members], values[members], np.ones(len(members), dtype='int64')
+
+    def top_level(self, metric='cost'):
+        """Top-level labels (families, or codes without a hierarchy), in descending order."""
+        return list(self._level(metric, None)[0])
+
+    def pareto(self, metric='cost', family=None, top_n=DEFAULT_TOP_N):
+        """
+        Pareto table for the top level (families, or codes without a hierarchy) or for
+        the codes of one family.
+
+        Returns:
+            pd.DataFrame: 'Defect', 'Items', 'Value', 'Share', 'Cumulative Share', in
+                          descending order, with an 'Other' row for everything past `top_n`.
+        """
+        labels, values, counts = self._level(metric, family)
+        total = values.sum()
+        top_n = max(int(top_n or DEFAULT_TOP_N), 1)
+        shown = min(top_n, len(values))
+        cumulative = np.cumsum(values[:shown])
+        rows = {
+            'Defect': list(labels[:shown]),
+            'Items': list(counts[:shown]),
+            'Value': list(values[:shown]),
+            'Cumulative Value': list(cumulative),
+        }
+        if shown < len(values):
+            rows['Defect'].append(f"{OTHER_LABEL} ({len(values) - shown})")
+            rows['Items'].append(int(counts[shown:].sum()))
+            rows['Value'].append(total - (cumulative[-1] if shown else 0.0))
+            rows['Cumulative Value'].append(total)
+        result = pd.DataFrame(rows)
+        result['Share'] = result['Value'] / total if total else 0.0
+        result['Cumulative Share'] = result.pop('Cumulative Value') / total if total else 0.0
+        return result
+
+    def vital_few(self, metric='cost', family=None, share=VITAL_FEW_SHARE):
+        """Number of items at a level that together reach `share` of its total."""
+        _, values, _ = self._level(metric, family)
+        total = values.sum()
+        if not total:
+            return 0
+        cumulative_share = np.cumsum(values) / total
+        return int(min(np.searchsorted(cumulative_share, share - 1e-12) + 1, len(values)))
+
+
+# --- Cached indexes ---
+# One index per store payload (the JSON string). All callbacks reading the defect store
+# get the same payload, so the sort happens once per data version.
+_INDEX_CACHE_SIZE = 8
+_index_cache = collections.OrderedDict()
+_index_lock = threading.Lock()
+
+@timed_phase('filter')
+def get_pareto_index(jsonified_data):
+    """The ParetoIndex for a stored-copq-defect-data payload."""
+    with _index_lock:
+        index = _index_cache.get(jsonified_data)
+        if index is not None:
+            _index_cache.move_to_end(jsonified_data)
+    count_cache(index is not None)
+    if index is None:
+        index = ParetoIndex(decode_store(jsonified_data, 'records'))
+        with _index_lock:
+            _index_cache[jsonified_data] = index
+            while len(_index_cache) > _INDEX_CACHE_SIZE:
+                _index_cache.popitem(last=False)
+    return index
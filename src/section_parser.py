@@ -0,0 +1,360 @@
+# src/section_parser.py
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_schema import WORKSHEET_SCHEMAS, WORKSHEET_START_YEAR, MEMORY_REPORTS, cast_column, memory_bytes
+
+# Characters stripped from numeric cells before conversion: percent signs, currency
+# symbols (including the U+FFFD that replaces '£' in some exports), thousands separators.
+_NUMERIC_JUNK = r'[%£�,\s]'
+
+
+# --- Vectorised cell cleaning ---
+
+def clean_column(values, kind, cast=True):
+    """
+    Converts a column of raw cell strings to the given kind in one vectorised pass.
+
+    Args:
+        values (pd.Series): Raw cells (strings, or numbers when read from Excel).
+        kind (str): One of the kinds used in WORKSHEET_SCHEMAS.
+        cast (bool): Cast to the kind's storage dtype; otherwise numbers stay float64.
+
+    Returns:
+        pd.Series: The converted column.
+    """
+    if kind == 'month':
+        return pd.to_datetime(values.astype(str).str.strip(), format='%B', errors='coerce')
+    if kind in ('text', 'category'):
+        return cast_column(values.astype(str).str.strip(), kind)
+
+    if pd.api.types.is_numeric_dtype(values):
+        numeric = values.astype('float64')
+    else:
+        numeric = pd.to_numeric(values.astype(str).str.replace(_NUMERIC_JUNK, '', regex=True), errors='coerce')
+    if kind == 'percent':
+        numeric = numeric / 100
+    return cast_column(numeric, kind) if cast else numeric
+
+
+def consecutive_months(months):
+    """
+    Dates for a run of consecutive month names (or month-name dates in any year): the
+    first is in WORKSHEET_START_YEAR and the year advances at every rollover, i.e. each
+    month that is not later in the year than the one before it. Missing months are kept
+    as NaT and do not count.
+    """
+    dates = pd.to_datetime(pd.Series(months).astype(str).str.strip(), format='%B', errors='coerce')
+    month_numbers = dates.dt.month.to_numpy()
+    present = ~np.isnan(month_numbers)
+    rollover = np.zeros(len(dates), dtype=np.int64)
+    seen = month_numbers[present]
+    rollover[np.flatnonzero(present)[1:]] = np.diff(seen) <= 0
+    years = WORKSHEET_START_YEAR + np.cumsum(rollover)
+    return pd.DatetimeIndex(pd.to_datetime(
+        {'year': years, 'month': np.nan_to_num(month_numbers, nan=1).astype(np.int64), 'day': 1}
+    ).where(present))
+
+
+# --- Compiled worksheet parser ---
+
+class WorksheetParser:
+    """
+    A worksheet schema compiled for repeated parsing.
+
+    Compilation resolves every anchor into column positions and lower-cased needles and
+    works out how many leading columns need a search key. Parsing then builds that key
+    matrix and the blank-row index once per sheet and locates every section with
+    vectorised masks instead of scanning rows one at a time.
+    """
+
+    def __init__(self, worksheet_type, schema):
+        self.worksheet_type = worksheet_type
+        self.label = schema['label']
+        self.title = schema['title']
+        self.sections = {}
+        key_cols = {0}
+
+        month_header = schema.get('month_header')
+        self.month_header = None
+        if month_header:
+            self.month_header = (self._compile_anchor(month_header['anchor']), month_header.get('offset', 0))
+            key_cols.update(col for col, _, _ in self.month_header[0])
+
+        for section_name, section in schema['sections'].items():
+            anchor = self._compile_anchor(section['anchor'])
+            key_cols.update(col for col, _, _ in anchor)
+            self.sections[section_name] = {
+                'label': section['label'],
+                'layout': section['layout'],
+                'anchor': anchor,
+                'header_offset': section.get('header_offset', 0),
+                'label_overflow': section.get('label_overflow', False),
+                'columns': list(section.get('columns', section.get('fields', []))),
+            }
+        self.key_cols = sorted(key_cols)
+
+    @staticmethod
+    def _compile_anchor(matchers):
+        return [(col, text.strip().lower(), mode) for col, text, mode in matchers]
+
+    # --- Section location ---
+
+    def _build_index(self, raw_data):
+        """Lower-cased search keys for the anchor columns and the positions of blank rows."""
+        as_text = raw_data.astype(str)
+        keys = {}
+        for col in self.key_cols:
+            if col < raw_data.shape[1]:
+                keys[col] = as_text.iloc[:, col].str.strip().str.lower()
+        blank_rows = np.flatnonzero((as_text.apply(lambda c: c.str.strip()) == '').all(axis=1).to_numpy())
+        return keys, blank_rows
+
+    @staticmethod
+    def _find_anchor(anchor, keys, n_rows):
+        mask = np.ones(n_rows, dtype=bool)
+        for col, needle, mode in anchor:
+            column = keys.get(col)
+            if column is None:
+                return -1
+            if mode == 'equals':
+                mask &= (column == needle).to_numpy()
+            else:
+                mask &= column.str.contains(needle, regex=False).to_numpy()
+        hits = np.flatnonzero(mask)
+        return int(hits[0]) if hits.size else -1
+
+    @staticmethod
+    def _block_end(start, blank_rows, n_rows):
+        """First fully blank row at or after `start`, or the end of the sheet."""
+        pos = np.searchsorted(blank_rows, start)
+        return int(blank_rows[pos]) if pos < blank_rows.size else n_rows
+
+    # --- Layout handlers ---
+
+    @staticmethod
+    def _rejoin_split_labels(block, n_columns):
+        """
+        Rejoins first-column labels that the export split on unquoted commas, e.g.
+        'Prevention Costs (Training, Process Improvement)' arriving as two cells. The extra
+        cells are the non-blank, non-numeric cells right after the label (the second column
+        is numeric).
+        """
+        cells = block.to_numpy(dtype=str)
+        extra_width = cells.shape[1] - n_columns
+        if extra_width <= 0:
+            return block.iloc[:, :n_columns]
+        overflow = np.zeros(len(cells), dtype=np.int64)
+        still_text = np.ones(len(cells), dtype=bool)
+        for col in range(1, extra_width + 1):
+            cell = pd.Series(cells[:, col]).str.strip()
+            numeric = pd.to_numeric(cell.str.replace(_NUMERIC_JUNK, '', regex=True), errors='coerce').notna()
+            still_text &= ((cell != '') & ~numeric).to_numpy()
+            overflow += still_text
+        rows = cells[:, :n_columns].astype(object)
+        for extra in np.unique(overflow[overflow > 0]):
+            hit = overflow == extra
+            rows[hit, 0] = [','.join(parts) for parts in cells[hit, :extra + 1]]
+            rows[hit, 1:] = cells[hit, extra + 1:extra + n_columns]
+        return pd.DataFrame(rows, index=block.index)
+
+    def _parse_table(self, raw_data, header_row, end, columns, convert=clean_column, label_overflow=False):
+        if label_overflow:
+            block = self._rejoin_split_labels(raw_data.iloc[header_row + 1:end], len(columns))
+        else:
+            block = raw_data.iloc[header_row + 1:end, :len(columns)]
+        df = pd.DataFrame({name: convert(block.iloc[:, i], kind) for i, (name, kind) in enumerate(columns)})
+        # Rows of tables keyed by month need a month (this drops notes and totals)
+        if columns and columns[0][1] == 'month':
+            key = columns[0][0]
+            df = df.dropna(subset=[key])
+            df[key] = consecutive_months(df[key].dt.month_name()).to_numpy()
+        return df.reset_index(drop=True), block
+
+    def _parse_key_value(self, raw_data, start, end, fields, convert=clean_column):
+        block = raw_data.iloc[start:end, :2]
+        labels = block.iloc[:, 0].astype(str).str.strip()
+        values = {}
+        for name, kind in fields:
+            hits = block.iloc[:, 1][(labels == name).to_numpy()]
+            values[name] = convert(hits.iloc[:1], kind, cast=False).iloc[0] if not hits.empty else np.nan
+        return pd.Series(values, dtype='float64'), block
+
+    def _parse_wide(self, raw_data, start, end, fields, months, convert=clean_column):
+        block = raw_data.iloc[start:end, :1 + len(months)]
+        labels = block.iloc[:, 0].astype(str).str.strip()
+        # One label -> row lookup for the whole block instead of a scan per field
+        first_row = pd.Series(np.arange(len(labels)), index=labels.to_numpy())
+        first_row = first_row[~first_row.index.duplicated()]
+
+        df = pd.DataFrame(index=consecutive_months(months))
+        df.index.name = 'Month'
+        for name, kind in fields:
+            if name in first_row.index:
+                row = block.iloc[first_row[name], 1:1 + len(months)]
+                df[name] = convert(pd.Series(row.to_numpy()), kind).to_numpy()
+            else:
+                df[name] = cast_column(pd.Series(np.nan, index=df.index), kind).to_numpy()
+        return df, block
+
+    @staticmethod
+    def _timed_convert(stats):
+        """clean_column, with its run time added to stats['convert_seconds']."""
+        def convert(values, kind, cast=True):
+            started = time.perf_counter()
+            try:
+                return clean_column(values, kind, cast)
+            finally:
+                stats['convert_seconds'] += time.perf_counter() - started
+        return convert
+
+    # --- Entry point ---
+
+    def parse(self, raw_data, record_memory=True, report=None):
+        """
+        Parses every section of a raw worksheet grid.
+
+        Args:
+            raw_data (pd.DataFrame): The sheet as read with header=None (all cells as strings).
+            record_memory (bool): Store raw vs. typed section sizes in MEMORY_REPORTS.
+            report (load_profiler.LoadReport): Optional report to fill with the scan time and
+                                               per-section rows, locate/parse/convert times and sizes.
+
+        Returns:
+            dict: Section name -> typed DataFrame (or Series for key/value sections).
+                  Sections that cannot be located are omitted with a warning.
+        """
+        raw_data = raw_data.reset_index(drop=True)
+        raw_data.columns = range(raw_data.shape[1])
+        n_rows = len(raw_data)
+        scan_started = time.perf_counter()
+        keys, blank_rows = self._build_index(raw_data)
+
+        months = []
+        if self.month_header:
+            anchor, offset = self.month_header
+            header_idx = self._find_anchor(anchor, keys, n_rows)
+            if header_idx != -1 and header_idx + offset < n_rows:
+                header = raw_data.iloc[header_idx + offset, 1:].astype(str).str.strip()
+                months = [m for m in header.tolist() if m]
+
+        if report is not None:
+            report.grid_rows, report.grid_cols = raw_data.shape
+            report.timings['scan'] = report.timings.get('scan', 0.0) + time.perf_counter() - scan_started
+
+        data_sections = {}
+        memory_report = {}
+        for section_name, section in self.sections.items():
+            located = time.perf_counter()
+            start = self._find_anchor(section['anchor'], keys, n_rows)
+            if start == -1:
+                print(f"Warning: '{section['label']}' section not found in {self.label} file.")
+                continue
+
+            end = self._block_end(start, blank_rows, n_rows)
+            convert = clean_column
+            if report is not None:
+                stats = report.section(section_name)
+                stats['locate_seconds'] = time.perf_counter() - located
+                convert = self._timed_convert(stats)
+
+            parse_started = time.perf_counter()
+            layout = section['layout']
+            if layout == 'table':
+                parsed, block = self._parse_table(raw_data, start + section['header_offset'], end, section['columns'],
+                                                  convert, section['label_overflow'])
+            elif layout == 'key_value':
+                parsed, block = self._parse_key_value(raw_data, start, end, section['columns'], convert)
+            elif layout == 'wide':
+                if not months:
+                    print(f"Warning: month header not found for '{section['label']}' in {self.label} file.")
+                    continue
+                parsed, block = self._parse_wide(raw_data, start, end, section['columns'], months, convert)
+            else:
+                raise ValueError(f"Unknown section layout '{layout}' for section '{section_name}'.")
+
+            data_sections[section_name] = parsed
+            memory_report[section_name] = {'before': memory_bytes(block), 'after': memory_bytes(parsed)}
+            if report is not None:
+                stats['parse_seconds'] = time.perf_counter() - parse_started
+                stats['rows'] = len(parsed)
+                stats['bytes_before'] = memory_report[section_name]['before']
+                stats['bytes_after'] = memory_report[section_name]['after']
+
+        if record_memory:
+            MEMORY_REPORTS[self.worksheet_type] = memory_report
+        return data_sections
+
+
+_COMPILED_PARSERS = {}
+
+
+def get_parser(worksheet_type):
+    """Returns the compiled parser for a worksheet type, compiling it on first use."""
+    parser = _COMPILED_PARSERS.get(worksheet_type)
+    if parser is None:
+        parser = WorksheetParser(worksheet_type, WORKSHEET_SCHEMAS[worksheet_type])
+        _COMPILED_PARSERS[worksheet_type] = parser
+    return parser
+
+
+def classify_worksheet(raw_data, sheet_name=None, title_rows=5):
+    """
+    Works out which worksheet type a raw grid holds from its title row.
+
+    The first non-blank cell in the top `title_rows` rows is matched against each
+    schema's 'title'; if none match, the sheet name (when given) is tried instead.
+
+    Returns:
+        str or None: The worksheet type key, or None if the sheet is not recognised.
+    """
+    candidates = []
+    if len(raw_data) and raw_data.shape[1]:
+        first_cells = raw_data.iloc[:title_rows, 0].astype(str).str.strip().str.lower()
+        candidates.extend([cell for cell in first_cells if cell][:1])
+    if sheet_name:
+        candidates.append(str(sheet_name).strip().lower().replace('_', ' '))
+
+    for text in candidates:
+        for worksheet_type, schema in WORKSHEET_SCHEMAS.items():
+            if schema['title'] in text:
+                return worksheet_type
+    return None
+
+
+def read_raw_worksheet(source):
+    """Reads a worksheet CSV (path or file-like object) into an all-string grid."""
+    # Blank lines are kept, so grid row i is line i + 1 of the file (formula references use line numbers)
+    return pd.read_csv(source, header=None, keep_default_na=False, dtype=str, skip_blank_lines=False)
+
+
+def parse_worksheet(worksheet_type, raw_data, report=None):
+    """Parses a raw worksheet grid with the compiled parser for its type."""
+    return get_parser(worksheet_type).parse(raw_data, report=report)
+
+
+# Benchmark of the compiled parser (for testing purposes, not part of the app flow)
+if __name__ == "__main__":
+    import os
+    import timeit
+
+    current_dir = os.path.dirname(__file__)
+    data_dir = os.path.join(current_dir, '..', 'data')
+    files = {
+        'copq': 'COPQ_Dummy_Data.csv',
+        'oee': 'OEE_Dummy_Data.csv',
+        'mfg_cost': 'Manufacturing_Cost_per_Unit_Calculator.csv',
+    }
+
+    for worksheet_type, file_name in files.items():
+        raw = read_raw_worksheet(os.path.join(data_dir, file_name))
+        # Pad the sheet with unrelated rows ahead of the sections to mimic a large export
+        padding = pd.DataFrame([['filler'] + [''] * (raw.shape[1] - 1)] * 20000, columns=raw.columns)
+        padded = pd.concat([padding, raw], ignore_index=True)
+        parser = get_parser(worksheet_type)
+        for name, grid in (('sample', raw), ('padded x20k', padded)):
+            seconds = min(timeit.repeat(lambda: parser.parse(grid, record_memory=False), number=5, repeat=3)) / 5
+            print(f"{worksheet_type:<9} {name:<12} {len(grid):>7} rows  {seconds * 1000:8.2f} ms/parse")
@@ -0,0 +1,357 @@
+# src/synthetic_data.py
+
+import calendar
+import os
+
+import numpy as np
+
+MONTH_NAMES = list(calendar.month_name)[1:]
+
+DOWNTIME_REASONS = [
+    'Machine Breakdowns', 'Changeovers', 'Material Shortages', 'Operator Errors', 'IT Issues',
+    'Training', 'Power Outages', 'PM Delays', 'Calibration', 'Tooling', 'Supplier QC', 'Minor Stoppages',
+]
+
+# Defect codes are named "<family> / DC-nnnn", so large worksheets have a family -> code hierarchy
+DEFECT_FAMILIES = [
+    'Material', 'Assembly', 'Functional', 'Packaging', 'Cosmetic', 'Dimensional', 'Electrical', 'Labelling',
+]
+
+
+def _month_name(i):
+    # The worksheets label months by name only, so long histories cycle through the year
+    return MONTH_NAMES[i % 12]
+
+
+def _row(*cells, width):
+    cells = [str(c) for c in cells]
+    return ','.join(cells + [''] * (width - len(cells)))
+
+
+def _pct(value):
+    return f"{value * 100:.2f}%"
+
+
+# --- COPQ worksheet ---
+
+def generate_copq_lines(months=6, defect_types=4, initiatives=3, seed=0):
+    """Lines of a COPQ calculator export with the given number of months and defect types."""
+    rng = np.random.default_rng(seed)
+    w = 5
+    units = rng.integers(20000, 32000, size=months)
+    defective = (units * rng.uniform(0.02, 0.035, size=months)).astype(int)
+    copq = defective * rng.uniform(60, 80, size=months)
+    revenue_share = rng.uniform(0.02, 0.035, size=months)
+
+    scrap, rework, warranty = copq[0] * 0.47, copq[0] * 0.34, copq[0] * 0.19
+    total = scrap + rework + warranty
+    lines = [
+        _row('COST OF POOR QUALITY (COPQ) CALCULATION WORKSHEET', width=w),
+        _row(width=w),
+        _row('BASIC PRODUCTION DATA - MONTHLY', width=w),
+        _row('Total Units Produced', units[0], width=w),
+        _row('Defective Units', defective[0], width=w),
+        _row('Defect Rate (%)', _pct(defective[0] / units[0]), width=w),
+        _row('Defect Rate (PPM)', int(defective[0] / units[0] * 1e6), width=w),
+        _row(width=w),
+        _row('TOTAL COST OF POOR QUALITY', width=w),
+        _row('Total Scrap Cost (£)', f"{scrap:.2f}", width=w),
+        _row('Total Rework Cost (£)', f"{rework:.2f}", width=w),
+        _row('Total Warranty Cost (£)', f"{warranty:.2f}", width=w),
+        _row('TOTAL COPQ (£)', f"{total:.2f}", width=w),
+        _row('COPQ as % of Revenue', _pct(revenue_share[0]), width=w),
+        _row(width=w),
+        _row('COST OF QUALITY BREAKDOWN', width=w),
+        _row('Category', 'Cost (£)', '% of Total COPQ', '% of Revenue', width=w),
+    ]
+    for name, cost in (('Scrap', scrap), ('Rework', rework), ('Warranty', warranty)):
+        lines.append(_row(name, f"{cost:.2f}", _pct(cost / total), _pct(revenue_share[0] * cost / total), width=w))
+    lines.append(_row('Total', f"{total:.2f}", '100%', _pct(revenue_share[0]), width=w))
+    lines += [_row(width=w), _row('MONTHLY COPQ TRACKING', width=w),
+              _row('Month', 'Total Units', 'Defective Units', 'COPQ (£)', 'COPQ % of Revenue', width=w)]
+    for i in range(months):
+        lines.append(_row(_month_name(i), units[i], defective[i], f"{copq[i]:.2f}", _pct(revenue_share[i]), width=w))
+
+    prevention, detection = total * 0.45, total * 0.6
+    quality_total = prevention + detection + total
+    lines += [
+        _row(width=w),
+        _row('PREVENTION VS. DETECTION VS. FAILURE COSTS', width=w),
+        _row('Cost Category', 'Monthly Cost (£)', '% of Total Quality Costs', width=w),
+        # The calculator export leaves these labels unquoted, so their commas split cells
+        f"Prevention Costs (Training, Process Improvement),{prevention:.0f},{_pct(prevention / quality_total)},",
+        f"Detection Costs (Inspection, Testing),{detection:.0f},{_pct(detection / quality_total)},",
+        _row('Failure Costs (COPQ)', f"{total:.2f}", _pct(total / quality_total), width=w),
+        _row('Total Quality-Related Costs', f"{quality_total:.2f}", '100%', width=w),
+        _row(width=w),
+        _row('QUALITY IMPROVEMENT INITIATIVES', width=w),
+        _row('Initiative', 'Target COPQ Reduction (£)', 'Estimated Implementation Cost (£)', 'ROI (%)', 'Status', width=w),
+    ]
+    statuses = ['Planned', 'In Progress', 'Completed']
+    for i in range(initiatives):
+        target = rng.integers(5000, 25000)
+        cost = rng.integers(10000, 50000)
+        lines.append(_row(f"Quality Initiative {i + 1}", target, cost, _pct(target / cost), statuses[i % 3], width=w))
+
+    occurrences = rng.integers(10, 400, size=defect_types)
+    cost_share = rng.dirichlet(np.ones(defect_types))
+    lines += [_row(width=w), _row('DEFECT CATEGORIES BREAKDOWN', width=w),
+              _row('Defect Type', 'Number of Occurrences', '% of Total Defects', 'Associated Cost (£)', width=w)]
+    for i in range(defect_types):
+        lines.append(_row(f"{DEFECT_FAMILIES[i % len(DEFECT_FAMILIES)]} / DC-{i + 1:04d}", occurrences[i], _pct(occurrences[i] / occurrences.sum()),
+                          f"{total * cost_share[i]:.2f}", width=w))
+    lines.append(_row('Total', occurrences.sum(), '100%', f"{total:.2f}", width=w))
+    return lines
+
+
+# --- OEE worksheet ---
+
+def generate_oee_lines(months=5, seed=0):
+    """Lines of an OEE calculator export with the given number of months."""
+    rng = np.random.default_rng(seed)
+    w = 7
+    availability = rng.uniform(0.80, 0.92, size=months)
+    performance = rng.uniform(0.84, 0.95, size=months)
+    quality = rng.uniform(0.95, 0.99, size=months)
+    oee = availability * performance * quality
+    scheduled = np.full(months, 60)
+    actual = rng.integers(50, 61, size=months)
+    utilization = actual / scheduled
+    teep = oee * utilization
+
+    lines = [
+        _row('OEE CALCULATION WORKSHEET (WITH TEEP & MAINTENANCE COSTS)', width=w),
+        _row(width=w),
+        _row('BASIC DATA (CONSTANTS)', width=w),
+        _row('Shift Length (minutes)', 480, width=w),
+        _row('Planned Breaks (minutes)', 30, width=w),
+        _row('Meal Breaks (minutes)', 30, width=w),
+        _row('Ideal Cycle Time (seconds)', 12, width=w),
+        _row('Ideal Cycle Time (minutes)', '=B7/60', width=w),
+        _row('Ideal Production Rate (units/minute)', '=1/B8', width=w),
+        _row('Total Possible Shifts/Month', 60, width=w),
+        _row('Total Possible Days/Month', 30, width=w),
+        _row(width=w - 1),
+        '',
+        _row('MONTHLY OEE & TEEP SUMMARY', width=w),
+        _row('Month', 'Availability (%)', 'Performance (%)', 'Quality (%)', 'OEE (%)', 'TEEP (%)', width=w - 1),
+    ]
+    for i in range(months):
+        lines.append(_row(_month_name(i), _pct(availability[i]), _pct(performance[i]), _pct(quality[i]),
+                          _pct(oee[i]), _pct(teep[i]), width=w - 1))
+    lines += [_row(width=w - 1), '', _row('TEEP CALCULATION', width=w),
+              _row('Month', 'Scheduled Shifts', 'Actual Shifts', 'Utilization (%)', 'OEE (%)', 'TEEP (%)', width=w - 1)]
+    first = len(lines) + 1
+    for i in range(months):
+        row_no = first + i
+        lines.append(_row(_month_name(i), scheduled[i], actual[i], _pct(utilization[i]), _pct(oee[i]),
+                          f"=D{row_no}*E{row_no}", width=w - 1))
+
+    preventive = rng.integers(8000, 9500, size=months)
+    corrective = rng.integers(8000, 16000, size=months)
+    downtime_min = rng.integers(500, 1000, size=months)
+    cost_per_min = rng.uniform(20, 25, size=months)
+    downtime_cost = (downtime_min * cost_per_min).round()
+    lines += [_row(width=w - 1), '', _row('MAINTENANCE COSTS BREAKDOWN', width=w),
+              _row('Month', 'Preventive (£)', 'Corrective (£)', 'Downtime Cost (£)', 'Total (£)', '% of Revenue', width=w - 1)]
+    for i in range(months):
+        total = preventive[i] + corrective[i] + downtime_cost[i]
+        lines.append(_row(_month_name(i), preventive[i], corrective[i], f"{downtime_cost[i]:.0f}", f"{total:.0f}",
+                          _pct(rng.uniform(0.015, 0.03)), width=w - 1))
+
+    lines += [_row(width=w - 1), '', _row('DOWNTIME COST ANALYSIS', width=w),
+              _row('Month', 'Downtime (min)', 'Cost/Min (£)', 'Total Cost (£)', 'Root Cause (Top 3)', width=w)]
+    for i in range(months):
+        reasons = rng.choice(DOWNTIME_REASONS, size=3, replace=False)
+        shares = sorted(rng.integers(10, 45, size=3), reverse=True)
+        causes = ', '.join(f"{reason} ({share}%)" for reason, share in zip(reasons, shares))
+        # Root causes are written unquoted, exactly like the calculator export
+        lines.append(f"{_month_name(i)},{downtime_min[i]},{cost_per_min[i]:.2f},{downtime_cost[i]:.0f},{causes}")
+    lines += [_row(width=w - 1), '']
+    return lines
+
+
+# --- Manufacturing Cost worksheet ---
+
+MATERIAL_ITEMS = ['Raw Material A Cost (£)', 'Raw Material B Cost (£)', 'Raw Material C Cost (£)',
+                  'Components Cost (£)', 'Packaging Materials (£)']
+OVERHEAD_ITEMS = ['Indirect Labor Cost (£)', 'Equipment Depreciation (£)', 'Facility Costs (Rent/Mortgage) (£)',
+                  'Utilities (£)', 'Maintenance and Repairs (£)', 'Consumable Supplies (£)',
+                  'Production IT Systems (£)', 'Other Overhead Costs (£)']
+LABOR_ITEMS = [('Production', 'Production Labor Hours', 'Average Labor Rate (£/hour)', 'Production Labor Cost (£)'),
+               ('Setup', 'Setup Labor Hours', 'Average Setup Labor Rate (£/hour)', 'Setup Labor Cost (£)'),
+               ('Quality Control', 'Quality Control Labor Hours', 'Average QC Labor Rate (£/hour)', 'Quality Control Labor Cost (£)')]
+
+
+def generate_mfg_cost_lines(months=5, initiatives=4, seed=0):
+    """Lines of a Manufacturing Cost per Unit calculator export with one column per month."""
+    rng = np.random.default_rng(seed)
+    w = months + 2
+
+    def values_row(label, values, fmt="{:.2f}"):
+        return _row(label, *[fmt.format(v) for v in values], width=w)
+
+    units = rng.integers(17000, 22000, size=months)
+    materials = {item: units * rng.uniform(1.3, 9.0) * rng.uniform(0.97, 1.05, size=months) for item in MATERIAL_ITEMS}
+    material_total = sum(materials.values())
+    labor = {}
+    for name, hours_label, rate_label, cost_label in LABOR_ITEMS:
+        hours = units * rng.uniform(0.015, 0.23) * rng.uniform(0.95, 1.05, size=months)
+        rate = rng.uniform(28, 34) * np.cumprod(rng.uniform(1.0, 1.01, size=months))
+        labor[name] = (hours, rate, hours * rate)
+    labor_total = sum(cost for _, _, cost in labor.values())
+    overheads = {item: rng.uniform(7000, 56000) * rng.uniform(0.9, 1.1, size=months) for item in OVERHEAD_ITEMS}
+    overhead_total = sum(overheads.values())
+    total = material_total + labor_total + overhead_total
+
+    lines = [
+        _row('MANUFACTURING COST PER UNIT CALCULATION WORKSHEET', width=w),
+        _row(width=w),
+        _row('MONTHLY PRODUCTION DATA', width=w),
+        _row('', *[_month_name(i) for i in range(months)], width=w),
+        values_row('Total Units Produced', units, "{:.0f}"),
+        _row(width=w),
+        _row('DIRECT MATERIAL COSTS (£)', width=w),
+    ]
+    lines += [values_row(item, values, "{:.0f}") for item, values in materials.items()]
+    lines += [values_row('Total Direct Material Cost (£)', material_total, "{:.0f}"),
+              values_row('Direct Material Cost per Unit (£)', material_total / units),
+              _row(width=w), _row('DIRECT LABOR COSTS (£)', width=w)]
+    for name, hours_label, rate_label, cost_label in LABOR_ITEMS:
+        hours, rate, cost = labor[name]
+        lines += [values_row(hours_label, hours, "{:.0f}"), values_row(rate_label, rate), values_row(cost_label, cost)]
+    lines += [values_row('Total Direct Labor Cost (£)', labor_total),
+              values_row('Direct Labor Cost per Unit (£)', labor_total / units),
+              _row(width=w), _row('MANUFACTURING OVERHEAD COSTS (£)', width=w)]
+    lines += [values_row(item, values, "{:.0f}") for item, values in overheads.items()]
+    lines += [values_row('Total Manufacturing Overhead (£)', overhead_total, "{:.0f}"),
+              values_row('Manufacturing Overhead per Unit (£)', overhead_total / units),
+              _row(width=w), _row('TOTAL MANUFACTURING COST (£)', width=w),
+              values_row('Total Direct Material Cost (£)', material_total, "{:.0f}"),
+              values_row('Total Direct Labor Cost (£)', labor_total),
+              values_row('Total Manufacturing Overhead (£)', overhead_total, "{:.0f}"),
+              values_row('Total Manufacturing Cost (£)', total),
+              values_row('Manufacturing Cost per Unit (£)', total / units),
+              _row(width=w), _row('COST EFFICIENCY INDICATORS', width=w),
+              values_row('Material Yield (%)', rng.uniform(91, 95, size=months), "{:.1f}"),
+              values_row('Labor Efficiency (%)', rng.uniform(94, 99, size=months), "{:.1f}"),
+              values_row('Capacity Utilization (%)', rng.uniform(84, 99, size=months), "{:.1f}"),
+              _row(width=w), _row('COST VARIANCE ANALYSIS (£)', width=w),
+              _row('', 'Actual', 'Budget', 'Variance (£)', 'Variance (%)', width=w)]
+    cost_per_unit = total / units
+    budget = cost_per_unit * rng.uniform(0.94, 0.99, size=months)
+    # Cost lines under the headline figure, budgeted from their own generator so the
+    # rest of the worksheet is unchanged
+    line_rng = np.random.default_rng(seed + 1)
+    cost_lines = [('Manufacturing Cost/Unit', cost_per_unit, budget)] + [
+        (label, actual, actual * line_rng.uniform(0.93, 1.01, size=months))
+        for label, actual in (('Direct Material Cost/Unit', material_total / units),
+                              ('Direct Labor Cost/Unit', labor_total / units),
+                              ('Manufacturing Overhead/Unit', overhead_total / units))]
+    for i in range(months):
+        for label, actual, planned in cost_lines:
+            variance = actual[i] - planned[i]
+            lines.append(_row(f"{_month_name(i)} {label}", f"{actual[i]:.2f}", f"{planned[i]:.2f}",
+                              f"{variance:.2f}", f"{variance / planned[i] * 100:.2f}", width=w))
+
+    # Cost driver indices relative to the first month
+    material_index = 100 * np.cumprod(np.r_[1.0, rng.uniform(0.97, 1.05, size=months - 1)])
+    labor_index = 100 * np.cumprod(np.r_[1.0, rng.uniform(1.0, 1.01, size=months - 1)])
+    energy_index = 100 * np.cumprod(np.r_[1.0, rng.uniform(0.93, 1.08, size=months - 1)])
+    total_index = 100 * (total / units) / (total[0] / units[0])
+
+    lines += [_row(width=w), _row('COST REDUCTION INITIATIVES (£)', width=w),
+              _row('Initiative', 'Target Monthly Savings (£)', 'Implementation Cost (£)', 'Payback Period (months)',
+                   'Status', 'Month Implemented', width=w)]
+    statuses = ['Completed', 'In Progress', 'Planned']
+    for i in range(initiatives):
+        target = rng.integers(2000, 9000)
+        cost = target * rng.uniform(2, 9)
+        lines.append(_row(f"Cost Initiative {i + 1}", target, f"{cost:.0f}", f"{cost / target:.2f}", statuses[i % 3],
+                          _month_name(int(rng.integers(min(months, 12)))), width=w))
+
+    lines += [_row(width=w), _row('TRENDING ANALYSIS - KEY COST DRIVERS', width=w),
+              _row('Month', 'Raw Material Index (Base=100)', 'Labor Rate Index (Base=100)',
+                   'Energy Cost Index (Base=100)', 'Total Cost Index (Base=100)', width=w)]
+    for i in range(months):
+        lines.append(_row(_month_name(i), f"{material_index[i]:.1f}", f"{labor_index[i]:.1f}",
+                          f"{energy_index[i]:.1f}", f"{total_index[i]:.1f}", width=w))
+    lines.append(_row(width=w))
+    return lines
+
+
+GENERATORS = {
+    'copq': lambda months, defect_types, seed: generate_copq_lines(months=months, defect_types=defect_types, seed=seed),
+    'oee': lambda months, defect_types, seed: generate_oee_lines(months=months, seed=seed),
+    'mfg_cost': lambda months, defect_types, seed: generate_mfg_cost_lines(months=months, seed=seed),
+}
+
+
+def generate_worksheet_text(worksheet_type, months=12, defect_types=5, seed=0):
+    """Returns a synthetic worksheet of the given type as CSV text."""
+    return '\n'.join(GENERATORS[worksheet_type](months, defect_types, seed)) + '\n'
+
+
+def write_synthetic_worksheets(output_dir, months=12, sites=1, lines=1, defect_types=5, seed=0):
+    """
+    Writes one COPQ, OEE and Mfg Cost worksheet per site and production line.
+
+    Args:
+        output_dir (str): Directory to write into (created if missing).
+        months (int): Months of history per worksheet.
+        sites (int): Number of sites.
+        lines (int): Production lines per site.
+        defect_types (int): Defect categories in each COPQ worksheet.
+        seed (int): Base random seed; each site/line gets its own derived seed.
+
+    Returns:
+        list: Paths of the files written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for site in range(sites):
+        for line in range(lines):
+            sheet_seed = seed + site * 1000 + line
+            for worksheet_type in GENERATORS:
+                path = os.path.join(output_dir, f"site{site + 1:02d}_line{line + 1:02d}_{worksheet_type}.csv")
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(generate_worksheet_text(worksheet_type, months, defect_types, sheet_seed))
+                paths.append(path)
+    return paths
+
+
+def write_padded_worksheet(path, worksheet_type, padding_bytes, months=24, defect_types=8, seed=0):
+    """
+    Writes a worksheet with `padding_bytes` of unrelated rows (an archived log) between
+    its title line and its sections, like a large historical export.
+
+    Returns:
+        int: Lines in the file.
+    """
+    title, rest = generate_worksheet_text(worksheet_type, months, defect_types, seed).split('\n', 1)
+    filler = 'archived log entry {}' + ',x' * title.count(',') + '\n'
+    written = n_lines = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(title + '\n')
+        while written < padding_bytes:
+            chunk = ''.join(filler.format(n_lines + i) for i in range(10000))
+            f.write(chunk)
+            written, n_lines = written + len(chunk), n_lines + 10000
+        f.write(rest)
+    return 1 + n_lines + rest.count('\n')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write synthetic COPQ/OEE/Mfg Cost worksheets.")
+    parser.add_argument('output_dir')
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--sites', type=int, default=1)
+    parser.add_argument('--lines', type=int, default=1)
+    parser.add_argument('--defect-types', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    written = write_synthetic_worksheets(args.output_dir, args.months, args.sites, args.lines, args.defect_types, args.seed)
+    print(f"Wrote {len(written)} worksheets to {args.output_dir}")
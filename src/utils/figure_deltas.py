@@ -0,0 +1,98 @@
+# src/utils/figure_deltas.py
+#
+# Incremental updates for the monthly trend charts. A full figure carries every month
+# of history; when new data only revises the latest month or appends months, the
+# callback instead returns a dash.Patch that assigns/extends just those points, so the
+# response grows with the new data rather than with the history.
+#
+# What the client currently shows is described by a small "rendered" dict kept in a
+# dcc.Store next to the graph: the filter key, the number of rows, a digest of all
+# rows but the last, and a digest of the last row.
+
+import hashlib
+import math
+
+import pandas as pd
+from dash import Patch, no_update
+
+
+def _row_hashes(df, x, ys):
+    return pd.util.hash_pandas_object(df[[x, *ys]], index=False).to_numpy()
+
+
+def _digest(hashes):
+    return hashlib.blake2b(hashes.tobytes(), digest_size=12).hexdigest()
+
+
+def trend_signature(df, x, ys, key):
+    """The "rendered" description of a trend figure drawn from `df` under filter `key`."""
+    hashes = _row_hashes(df, x, ys)
+    return {
+        'key': key,
+        'rows': len(df),
+        'prefix': _digest(hashes[:-1]),
+        'last': _digest(hashes[-1:]),
+    }
+
+
+def _x_values(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return [ts.isoformat() if pd.notna(ts) else None for ts in series]
+    return series.tolist()
+
+
+def _y_values(series):
+    return [None if v is None or (isinstance(v, float) and math.isnan(v)) else v
+            for v in series.astype(float).tolist()]
+
+
+def with_plain_arrays(fig, df, x, ys):
+    """
+    Rewrites the trace arrays of a px trend figure (one trace per y column, in order)
+    as plain JSON lists. Plotly otherwise encodes them as base64 typed arrays, which
+    a Patch cannot index into or extend.
+    """
+    x_values = _x_values(df[x])
+    for trace, y in zip(fig.data, ys):
+        trace.x = x_values
+        trace.y = _y_values(df[y])
+    return fig
+
+
+def trend_figure_update(rendered, df, x, ys, key, build_figure):
+    """
+    Figure (or Patch) for a trend chart, plus the new "rendered" store value.
+
+    Args:
+        rendered (dict or None): The store value from the previous call.
+        df (pd.DataFrame): The rows to show, sorted by `x`.
+        x (str): Column on the x axis.
+        ys (list): Columns plotted, one trace each, in trace order.
+        key (list): Everything other than the data that shapes the figure (filter values);
+                    a different key always redraws the whole figure.
+        build_figure (callable): Builds the full figure from `df`.
+
+    Returns:
+        tuple: (full figure, Patch or dash.no_update; new rendered dict)
+    """
+    signature = trend_signature(df, x, ys, key)
+    if rendered and rendered.get('key') == key and 0 < rendered.get('rows', 0) <= len(df):
+        shown = rendered['rows']
+        hashes = _row_hashes(df, x, ys)
+        if _digest(hashes[:shown - 1]) == rendered['prefix']:
+            last_changed = _digest(hashes[shown - 1:shown]) != rendered['last']
+            if not last_changed and shown == len(df):
+                return no_update, signature
+
+            patch = Patch()
+            appended = df.iloc[shown:]
+            appended_x = _x_values(appended[x])
+            for trace_index, y in enumerate(ys):
+                if last_changed:
+                    patch['data'][trace_index]['y'][shown - 1] = _y_values(df[y].iloc[shown - 1:shown])[0]
+                if len(appended):
+                    patch['data'][trace_index]['x'].extend(appended_x)
+                    patch['data'][trace_index]['y'].extend(_y_values(appended[y]))
+            return patch, signature
+
+    return with_plain_arrays(build_figure(df), df, x, ys), signature
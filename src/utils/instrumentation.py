@@ -0,0 +1,383 @@
+# src/utils/instrumentation.py
+
+import bisect
+import collections
+import functools
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import flask
+from dash.exceptions import PreventUpdate
+
+PHASES = ('decode', 'filter', 'figure', 'other', 'serialise')
+
+# Prometheus histogram buckets for callback wall time, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Recent latencies kept per callback for the admin tab's percentiles
+PERCENTILE_WINDOW = 1024
+
+_active = threading.local()
+
+
+class CallbackRecord:
+    """Timings and sizes of one callback invocation."""
+
+    def __init__(self, name):
+        self.name = name
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.current_phase = None
+        self.wall = 0.0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced = False
+        self.error = False
+
+
+class CallbackMetrics:
+    """Thread-safe aggregate of callback records, keyed by callback name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _new_stats(self):
+        return {
+            'calls': 0,
+            'errors': 0,
+            'wall_sum': 0.0,
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            'recent': collections.deque(maxlen=PERCENTILE_WINDOW),
+            'phases': dict.fromkeys(PHASES, 0.0),
+            'input_bytes': 0,
+            'output_bytes': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'coalesced': 0,
+        }
+
+    def observe(self, record):
+        # Callback time not claimed by a tagged phase is reported as 'other'
+        record.phases['other'] = max(record.wall - sum(record.phases[p] for p in ('decode', 'filter', 'figure')), 0.0)
+        total = record.wall + record.phases['serialise']
+        with self._lock:
+            stats = self._stats.setdefault(record.name, self._new_stats())
+            stats['calls'] += 1
+            stats['errors'] += int(record.error)
+            stats['wall_sum'] += total
+            stats['buckets'][bisect.bisect_left(LATENCY_BUCKETS, total)] += 1
+            stats['recent'].append(total)
+            for phase, seconds in record.phases.items():
+                stats['phases'][phase] += seconds
+            stats['input_bytes'] += record.input_bytes
+            stats['output_bytes'] += record.output_bytes
+            stats['cache_hits'] += record.cache_hits
+            stats['cache_misses'] += record.cache_misses
+            stats['coalesced'] += int(record.coalesced)
+
+    def snapshot(self):
+        """Per-callback summary rows (latencies in ms, bytes and phases averaged per call)."""
+        import numpy as np
+        with self._lock:
+            items = [(name, dict(stats, recent=list(stats['recent']), phases=dict(stats['phases'])))
+                     for name, stats in self._stats.items()]
+        rows = []
+        for name, stats in sorted(items):
+            calls = stats['calls']
+            p50, p95, p99 = np.percentile(np.array(stats['recent']) * 1000, [50, 95, 99])
+            row = {
+                'Callback': name,
+                'Calls': calls,
+                'Errors': stats['errors'],
+                'p50 (ms)': p50,
+                'p95 (ms)': p95,
+                'p99 (ms)': p99,
+            }
+            for phase in PHASES:
+                row[f"{phase.capitalize()} (ms)"] = stats['phases'][phase] / calls * 1000
+            row['Input (bytes)'] = stats['input_bytes'] / calls
+            row['Output (bytes)'] = stats['output_bytes'] / calls
+            row['Cache hits'] = stats['cache_hits']
+            row['Cache misses'] = stats['cache_misses']
+            row['Coalesced'] = stats['coalesced']
+            rows.append(row)
+        return rows
+
+    def to_prometheus(self):
+        """Renders all callback metrics in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted((name, dict(stats, phases=dict(stats['phases']), buckets=list(stats['buckets'])))
+                           for name, stats in self._stats.items())
+
+        prefix = 'kpi_dashboard_callback'
+        lines = [
+            f"# HELP {prefix}_duration_seconds Callback request time, including Dash serialisation.",
+            f"# TYPE {prefix}_duration_seconds histogram",
+        ]
+        for name, stats in items:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), stats['buckets']):
+                cumulative += count
+                lines.append(f'{prefix}_duration_seconds_bucket{{callback="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_duration_seconds_sum{{callback="{name}"}} {stats["wall_sum"]:.6f}')
+            lines.append(f'{prefix}_duration_seconds_count{{callback="{name}"}} {stats["calls"]}')
+
+        lines += [f"# HELP {prefix}_phase_seconds_total Time spent per callback phase.",
+                  f"# TYPE {prefix}_phase_seconds_total counter"]
+        for name, stats in items:
+            for phase, seconds in stats['phases'].items():
+                lines.append(f'{prefix}_phase_seconds_total{{callback="{name}",phase="{phase}"}} {seconds:.6f}')
+
+        counters = (
+            ('input_bytes_total', 'input_bytes', "Request payload bytes received."),
+            ('output_bytes_total', 'output_bytes', "Response payload bytes sent."),
+            ('cache_hits_total', 'cache_hits', "Cache hits while serving the callback."),
+            ('cache_misses_total', 'cache_misses', "Cache misses while serving the callback."),
+            ('coalesced_total', 'coalesced', "Calls answered with the response of an identical concurrent request."),
+            ('errors_total', 'errors', "Callbacks that raised an exception."),
+        )
+        for metric, key, help_text in counters:
+            lines += [f"# HELP {prefix}_{metric} {help_text}", f"# TYPE {prefix}_{metric} counter"]
+            lines += [f'{prefix}_{metric}{{callback="{name}"}} {stats[key]}' for name, stats in items]
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+METRICS = CallbackMetrics()
+
+
+# --- Recording hooks used inside callbacks ---
+
+def timed_phase(phase):
+    """
+    Decorator attributing a helper's run time to a phase of the calling callback.
+
+    Outside an instrumented callback (e.g. from the export routes) the helper runs untimed.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record = getattr(_active, 'record', None)
+            if record is None:
+                return func(*args, **kwargs)
+            # A phase nested in another (a figure builder calling a filter) is carved out of the outer one
+            outer = record.current_phase
+            record.current_phase = phase
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                record.phases[phase] += elapsed
+                if outer is not None:
+                    record.phases[outer] -= elapsed
+                record.current_phase = outer
+        return wrapper
+    return decorator
+
+
+def count_cache(hit):
+    """Counts a cache hit or miss against the running callback, if any."""
+    record = getattr(_active, 'record', None)
+    if record is not None:
+        if hit:
+            record.cache_hits += 1
+        else:
+            record.cache_misses += 1
+
+
+# --- Request coalescing ---
+
+class _Flight:
+    """One computation and the outcome its callers share."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.finished = None
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs concurrent calls with the same key once: the first caller computes, callers
+    arriving while it runs wait and share its result (or its exception).
+
+    A finished outcome is still shared for `linger` seconds, as clients released by the
+    same event (a page load, a new dataset version) drift apart by a few requests. After
+    that an identical call computes afresh.
+    """
+
+    def __init__(self, linger=1.0):
+        self.linger = linger
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def _expire(self, now):
+        expired = [key for key, flight in self._flights.items()
+                   if flight.finished is not None and now - flight.finished > self.linger]
+        for key in expired:
+            del self._flights[key]
+
+    def do(self, key, func):
+        """Returns (func() or the result of the identical call in flight, whether it was shared)."""
+        with self._lock:
+            self._expire(time.monotonic())
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                flight.finished = time.monotonic()
+                if flight.error is not None or self.linger <= 0:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def clear(self):
+        with self._lock:
+            self._flights.clear()
+
+
+# Seconds a finished callback response is still shared with identical requests
+COALESCE_LINGER_SECONDS = float(os.environ.get('KPI_COALESCE_LINGER', 1.0))
+
+CALLBACK_FLIGHTS = SingleFlight(COALESCE_LINGER_SECONDS)
+
+
+# --- Callback wrapping ---
+
+def instrument(func, name=None):
+    """Wraps a callback function so each call is recorded in METRICS."""
+    name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        record = CallbackRecord(name)
+        _active.record = record
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            record.error = True
+            raise
+        finally:
+            record.wall = time.perf_counter() - started
+            _active.record = None
+            if flask.has_request_context():
+                # Completed by the after_request hook once Dash has serialised the response
+                flask.g.kpi_callback_record = record
+            else:
+                METRICS.observe(record)
+    return wrapper
+
+
+@contextmanager
+def instrument_callbacks(app):
+    """
+    Instruments every callback registered on `app` inside the `with` block:
+
+        with instrument_callbacks(app):
+            register_copq_callbacks(app)
+    """
+    original = app.callback
+
+    def callback(*args, **kwargs):
+        decorator = original(*args, **kwargs)
+        return lambda func: decorator(instrument(func))
+
+    app.callback = callback
+    try:
+        yield app
+    finally:
+        app.callback = original
+
+
+def coalesce_callback_requests(app, dataset_version=None):
+    """
+    Makes identical concurrent callback requests share one response.
+
+    A Dash callback request names the callback and carries every input and state, so
+    requests with the same body for the same dataset version have the same response.
+    The first one is dispatched as usual (decode, filter, figure build and Dash's
+    serialisation of the figure); identical requests arriving meanwhile, or within
+    COALESCE_LINGER_SECONDS of it finishing, get a copy of its response bytes. Thirty
+    wall displays opening the default view cost one page load.
+
+    Args:
+        app (dash.Dash): The app, after Dash has registered its routes.
+        dataset_version (callable, optional): Returns the current dataset version.
+    """
+    server = app.server
+    endpoint = next(rule.endpoint for rule in server.url_map.iter_rules()
+                    if rule.rule.endswith('_dash-update-component'))
+    dispatch = server.view_functions[endpoint]
+
+    def respond():
+        response = server.make_response(dispatch())
+        record = flask.g.get('kpi_callback_record')
+        headers = [(k, v) for k, v in response.headers if k.lower() != 'content-length']
+        return response.status_code, headers, response.get_data(), record.name if record else None
+
+    @functools.wraps(dispatch)
+    def coalesced_dispatch():
+        started = time.perf_counter()
+        key = (dataset_version() if dataset_version else None,
+               hashlib.blake2b(flask.request.get_data(), digest_size=16).digest())
+        (status, headers, body, name), shared = CALLBACK_FLIGHTS.do(key, respond)
+        if shared and name is not None:
+            record = CallbackRecord(name)
+            record.coalesced = True
+            record.wall = time.perf_counter() - started
+            flask.g.kpi_callback_record = record
+        return flask.Response(body, status=status, headers=headers)
+
+    server.view_functions[endpoint] = coalesced_dispatch
+
+
+def register_metrics_routes(server):
+    """
+    Adds the /metrics endpoint and the request hooks that complete callback records
+    with payload sizes and Dash's own (de)serialisation time.
+    """
+
+    @server.before_request
+    def _start_callback_timer():
+        flask.g.kpi_request_started = time.perf_counter()
+
+    @server.after_request
+    def _finish_callback_record(response):
+        record = flask.g.pop('kpi_callback_record', None)
+        if record is not None:
+            elapsed = time.perf_counter() - flask.g.get('kpi_request_started', time.perf_counter())
+            record.phases['serialise'] = max(elapsed - record.wall, 0.0)
+            record.input_bytes = flask.request.content_length or 0
+            record.output_bytes = response.calculate_content_length() or 0
+            METRICS.observe(record)
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        return flask.Response(METRICS.to_prometheus(), mimetype='text/plain; version=0.0.4')
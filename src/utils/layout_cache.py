@@ -0,0 +1,84 @@
+# src/utils/layout_cache.py
+
+import gzip
+import threading
+
+import flask
+
+
+class LayoutCache:
+    """
+    The page layout of the current dataset version, pre-rendered once.
+
+    Every part of the page that is not drawn by a callback (KPI cards, filter option
+    lists, the stores) only changes with the dataset version, so the layout is built
+    once per version and kept as the JSON body Dash would send for /_dash-layout, plain
+    and gzipped. Serving a page load is then a lookup rather than a component tree
+    build and serialisation.
+    """
+
+    def __init__(self, build):
+        """`build(snapshot)` returns the layout component tree for a dataset snapshot."""
+        self._build = build
+        self._lock = threading.Lock()
+        self._entry = None
+
+    def get(self, snapshot):
+        """{'version', 'layout', 'body', 'gzip', 'etag'} for the snapshot, rendering it on first use."""
+        entry = self._entry
+        if entry is not None and entry['version'] == snapshot.version:
+            return entry
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry['version'] != snapshot.version:
+                # Dash's own serialiser, imported here to keep plotly out of the app's startup
+                from plotly.io.json import to_json_plotly
+                layout = self._build(snapshot)
+                body = to_json_plotly(layout).encode()
+                entry = {
+                    'version': snapshot.version,
+                    'layout': layout,
+                    'body': body,
+                    'gzip': gzip.compress(body, compresslevel=6),
+                    # From the data's fingerprints, not the version: versions restart in
+                    # every process, and a reused one would 304 a browser onto old data
+                    'etag': f"layout-{snapshot.content_tag()}",
+                }
+                self._entry = entry
+            return entry
+
+    def response(self, snapshot):
+        """The /_dash-layout response for the snapshot, honouring gzip and If-None-Match."""
+        entry = self.get(snapshot)
+        use_gzip = 'gzip' in flask.request.accept_encodings
+        response = flask.Response(entry['gzip'] if use_gzip else entry['body'], mimetype='application/json')
+        response.set_etag(entry['etag'] + ('-gz' if use_gzip else ''))
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        # Browsers revalidate on every page load; unchanged data is a 304
+        response.cache_control.no_cache = True
+        return response.make_conditional(flask.request)
+
+
+def serve_cached_layout(app, layout_cache, current_snapshot):
+    """
+    Answers Dash's /_dash-layout requests from `layout_cache`.
+
+    Args:
+        app (dash.Dash): The app, after Dash has registered its routes.
+        layout_cache (LayoutCache): Pre-rendered layouts.
+        current_snapshot (callable): Returns the snapshot to serve, or None to fall back
+                                     to Dash's own layout route (e.g. a loading page).
+    """
+    server = app.server
+    endpoint = next(rule.endpoint for rule in server.url_map.iter_rules() if rule.rule.endswith('/_dash-layout'))
+    dash_serve_layout = server.view_functions[endpoint]
+
+    def serve_layout_json():
+        snapshot = current_snapshot()
+        if snapshot is None:
+            return dash_serve_layout()
+        return layout_cache.response(snapshot)
+
+    server.view_functions[endpoint] = serve_layout_json
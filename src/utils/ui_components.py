@@ -1,7 +1,14 @@
 # src/utils/ui_components.py
 
-from dash import html
+import collections
+import io
+import threading
+
+from dash import dcc, html
 import dash_bootstrap_components as dbc
+import pandas as pd
+
+from utils.instrumentation import timed_phase, count_cache
 
 def create_kpi_card(title, value, unit="", is_percentage=False):
     """Creates a standardized KPI display card."""
@@ -22,4 +29,52 @@ def create_filter_card(children):
     return dbc.Card(
         dbc.CardBody(children),
         className="mb-4 shadow-sm rounded-lg"
-    )
\ No newline at end of file
+    )
+
+# dcc.Store id -> (dataset, augmented frame key, to_json keyword arguments)
+DATA_STORES = [
+    ('stored-copq-data', 'copq', 'monthly_copq_tracking', {'date_format': 'iso', 'orient': 'records'}),
+    ('stored-copq-breakdown-data', 'copq', 'copq_breakdown', {'orient': 'records'}),
+    ('stored-copq-defect-data', 'copq', 'defect_categories', {'orient': 'records'}),
+    ('stored-oee-data', 'oee', 'monthly_oee_trends', {'date_format': 'iso', 'orient': 'split'}),
+    ('stored-downtime-data', 'oee', 'downtime_cost_analysis', {'date_format': 'iso', 'orient': 'split'}),
+    ('stored-oee-shift-data', 'oee', 'shift_oee_trends', {'date_format': 'iso', 'orient': 'split'}),
+    ('stored-mfg-cost-data', 'mfg_cost', 'total_mfg_cost_trends', {'date_format': 'iso', 'orient': 'split'}),
+    ('stored-efficiency-data', 'mfg_cost', 'efficiency_trends', {'date_format': 'iso', 'orient': 'split'}),
+    ('stored-cost-variance-data', 'mfg_cost', 'cost_variance_analysis', {'orient': 'split'}),
+    ('stored-cost-variance-facts', 'mfg_cost', 'cost_variance_facts', {'date_format': 'iso', 'orient': 'split'}),
+    ('stored-cost-attribution-data', 'mfg_cost', 'cost_attribution', {'date_format': 'iso', 'orient': 'split'}),
+    ('stored-copq-initiative-data', 'copq', 'initiative_tracking', {'date_format': 'iso', 'orient': 'split'}),
+    ('stored-mfg-initiative-data', 'mfg_cost', 'initiative_tracking', {'date_format': 'iso', 'orient': 'split'}),
+]
+
+def create_data_stores(augmented_datasets):
+    """Creates the hidden dcc.Store components that hand the augmented frames to the callbacks."""
+    stores = []
+    for store_id, dataset, frame_key, to_json_kwargs in DATA_STORES:
+        df = (augmented_datasets.get(dataset) or {}).get(frame_key)
+        stores.append(dcc.Store(id=store_id, data=df.to_json(**to_json_kwargs) if df is not None else None))
+    return stores
+
+# Decoded store payloads, keyed by the JSON string itself. Every callback that reads a
+# store receives the same (unchanged) JSON, so the frame is only parsed once per payload.
+_DECODE_CACHE_SIZE = 16
+_decode_cache = collections.OrderedDict()
+_decode_lock = threading.Lock()
+
+@timed_phase('decode')
+def decode_store(jsonified_data, orient):
+    """Decodes a dcc.Store payload written by create_data_stores back into a DataFrame (a private copy)."""
+    key = (orient, jsonified_data)
+    with _decode_lock:
+        df = _decode_cache.get(key)
+        if df is not None:
+            _decode_cache.move_to_end(key)
+    count_cache(df is not None)
+    if df is None:
+        df = pd.read_json(io.StringIO(jsonified_data), orient=orient)
+        with _decode_lock:
+            _decode_cache[key] = df
+            while len(_decode_cache) > _DECODE_CACHE_SIZE:
+                _decode_cache.popitem(last=False)
+    return df.copy()
@@ -0,0 +1,226 @@
+# src/validation.py
+#
+# Consistency checks for the derived values in the calculator exports. Totals such as
+# 'Total Manufacturing Cost (£)', 'Manufacturing Cost per Unit (£)' and 'Defect Rate
+# (PPM)' are stored in the worksheets as values, so an export taken before the
+# spreadsheet recalculated carries stale figures. Each check recomputes one derived
+# value from its components for every row at once and compares it with the exported
+# value; rows that disagree beyond the export's rounding are reported as mismatches.
+#
+# Checks only read the parsed sections. Mismatches are reported, not corrected: the
+# dashboards keep showing the figures the worksheet owner exported.
+
+import numpy as np
+import pandas as pd
+
+# Relative tolerance for every check, on top of each check's absolute tolerance
+# (which covers the rounding of the exported figures)
+REL_TOLERANCE = 1e-4
+
+MISMATCH_COLUMNS = ['Section', 'Field', 'Row', 'Reported', 'Recomputed', 'Difference']
+
+
+def _row_labels(rows):
+    """Labels for reported rows: month names for a Month index, the labels themselves otherwise."""
+    if isinstance(rows, pd.DatetimeIndex):
+        return rows.strftime('%B').to_numpy(dtype=object)
+    return np.asarray(rows, dtype=object)
+
+
+def _values(obj, field):
+    values = obj[field]
+    if not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values, errors='coerce')
+    return values.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _is_total(labels):
+    """Boolean mask of the 'Total' rows of a label column (compared per category when categorical)."""
+    if isinstance(labels.dtype, pd.CategoricalDtype):
+        totals = np.flatnonzero(labels.cat.categories.astype(str).str.strip().str.lower() == 'total')
+        return np.isin(labels.cat.codes.to_numpy(), totals)
+    return labels.astype(str).str.strip().str.lower().to_numpy() == 'total'
+
+
+# --- Checks ---
+# Each check returns (section, field, rows, reported values, recomputed values, absolute
+# tolerance), or None when the section or a component is missing. `rows` (a Month index
+# or an array of labels) is only turned into labels for the rows that mismatch.
+
+def _mfg_total_cost(data_sections):
+    df = data_sections.get('total_manufacturing_cost')
+    if df is None or df.empty:
+        return None
+    recomputed = (_values(df, 'Total Direct Material Cost (£)') + _values(df, 'Total Direct Labor Cost (£)')
+                  + _values(df, 'Total Manufacturing Overhead (£)'))
+    # Material and overhead totals are exported in whole pounds
+    return ('total_manufacturing_cost', 'Total Manufacturing Cost (£)', df.index,
+            _values(df, 'Total Manufacturing Cost (£)'), recomputed, 1.0)
+
+
+def _mfg_cost_per_unit(data_sections):
+    df = data_sections.get('total_manufacturing_cost')
+    production = data_sections.get('production_data')
+    if df is None or df.empty or production is None or len(production) != len(df):
+        return None
+    # Both sections are columns of the same month header, so rows line up by position
+    units = _values(production, 'Total Units Produced')
+    components = (_values(df, 'Total Direct Material Cost (£)') + _values(df, 'Total Direct Labor Cost (£)')
+                  + _values(df, 'Total Manufacturing Overhead (£)'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recomputed = np.where(units > 0, components / units, np.nan)
+    return ('total_manufacturing_cost', 'Manufacturing Cost per Unit (£)', df.index,
+            _values(df, 'Manufacturing Cost per Unit (£)'), recomputed, 0.01)
+
+
+def _copq_defect_rate_ppm(data_sections):
+    basic = data_sections.get('basic_copq')
+    if basic is None or basic.empty or 'Defect Rate (PPM)' not in basic.index:
+        return None
+    units, defective = float(basic.get('Total Units Produced', np.nan)), float(basic.get('Defective Units', np.nan))
+    recomputed = defective / units * 1e6 if units else np.nan
+    # The export truncates PPM to a whole number
+    return ('basic_copq', 'Defect Rate (PPM)', np.array(['Monthly'], dtype=object),
+            np.array([float(basic['Defect Rate (PPM)'])]), np.array([recomputed]), 1.0)
+
+
+def _copq_defect_rate_percent(data_sections):
+    basic = data_sections.get('basic_copq')
+    if basic is None or basic.empty or 'Defect Rate (%)' not in basic.index:
+        return None
+    units, defective = float(basic.get('Total Units Produced', np.nan)), float(basic.get('Defective Units', np.nan))
+    recomputed = defective / units if units else np.nan
+    # Percentages are exported to two decimal places (stored as fractions)
+    return ('basic_copq', 'Defect Rate (%)', np.array(['Monthly'], dtype=object),
+            np.array([float(basic['Defect Rate (%)'])]), np.array([recomputed]), 5e-5)
+
+
+def _copq_breakdown_total(data_sections):
+    df = data_sections.get('breakdown_copq')
+    if df is None or df.empty:
+        return None
+    is_total = _is_total(df['Category'])
+    if not is_total.any():
+        return None
+    costs = _values(df, 'Cost (£)')
+    return ('breakdown_copq', 'Cost (£)', np.array(['Total'], dtype=object),
+            costs[is_total][:1], np.array([np.nansum(costs[~is_total])]), 0.01 * (~is_total).sum())
+
+
+def _copq_defect_category_totals(data_sections):
+    df = data_sections.get('defect_categories')
+    if df is None or df.empty:
+        return None
+    is_total = _is_total(df['Defect Type'])
+    if not is_total.any():
+        return None
+    fields = ['Number of Occurrences', 'Associated Cost (£)']
+    values = np.column_stack([_values(df, field) for field in fields])
+    reported = values[is_total][0]
+    recomputed = np.nansum(values[~is_total], axis=0)
+    # Row labels carry the field, as both totals are checked in one comparison
+    return ('defect_categories', 'Total', np.array(fields, dtype=object), reported, recomputed,
+            np.array([0.5, 0.01 * (~is_total).sum()]))
+
+
+# Line items of each cost section that add up to its total
+_LINE_ITEM_TOTALS = {
+    'direct_material': ('Total Direct Material Cost (£)', ['Raw Material A Cost (£)', 'Raw Material B Cost (£)',
+                                                          'Raw Material C Cost (£)', 'Components Cost (£)',
+                                                          'Packaging Materials (£)']),
+    'direct_labor': ('Total Direct Labor Cost (£)', ['Production Labor Cost (£)', 'Setup Labor Cost (£)',
+                                                    'Quality Control Labor Cost (£)']),
+    'manufacturing_overhead': ('Total Manufacturing Overhead (£)', [
+        'Indirect Labor Cost (£)', 'Equipment Depreciation (£)', 'Facility Costs (Rent/Mortgage) (£)',
+        'Utilities (£)', 'Maintenance and Repairs (£)', 'Consumable Supplies (£)', 'Production IT Systems (£)',
+        'Other Overhead Costs (£)']),
+}
+
+
+def _mfg_line_item_totals(section):
+    def check(data_sections):
+        df = data_sections.get(section)
+        total, items = _LINE_ITEM_TOTALS[section]
+        if df is None or df.empty or total not in df.columns:
+            return None
+        recomputed = np.sum([_values(df, item) for item in items], axis=0)
+        return (section, total, df.index, _values(df, total), recomputed, 0.01 * len(items))
+    check.__name__ = f"_mfg_{section}_total"
+    return check
+
+
+VALIDATION_CHECKS = {
+    'copq': [_copq_defect_rate_ppm, _copq_defect_rate_percent, _copq_breakdown_total, _copq_defect_category_totals],
+    'oee': [],
+    'mfg_cost': [_mfg_total_cost, _mfg_cost_per_unit] + [_mfg_line_item_totals(section) for section in _LINE_ITEM_TOTALS],
+}
+
+
+def validate_sections(worksheet_type, data_sections, rel_tolerance=REL_TOLERANCE):
+    """
+    Recomputes the derived values of a parsed worksheet and compares them with the exported ones.
+
+    Args:
+        worksheet_type (str): 'copq', 'oee' or 'mfg_cost'.
+        data_sections (dict): Sections returned by section_parser.parse_worksheet.
+        rel_tolerance (float): Relative tolerance, on top of each check's absolute tolerance.
+
+    Returns:
+        pd.DataFrame: One row per mismatch, with MISMATCH_COLUMNS (empty when consistent).
+    """
+    mismatches = []
+    for check in VALIDATION_CHECKS.get(worksheet_type, []):
+        result = check(data_sections)
+        if result is None:
+            continue
+        section, field, rows, reported, recomputed, abs_tolerance = result
+        # Missing exported or component values are not mismatches
+        comparable = ~(np.isnan(reported) | np.isnan(recomputed))
+        bad = comparable & ~np.isclose(reported, recomputed, rtol=rel_tolerance, atol=abs_tolerance)
+        if bad.any():
+            mismatches.append(pd.DataFrame({
+                'Section': section,
+                'Field': field,
+                'Row': _row_labels(rows[bad]),
+                'Reported': reported[bad],
+                'Recomputed': recomputed[bad],
+                'Difference': reported[bad] - recomputed[bad],
+            }))
+    if not mismatches:
+        return pd.DataFrame({column: [] for column in MISMATCH_COLUMNS})
+    return pd.concat(mismatches, ignore_index=True)
+
+
+def format_mismatches(mismatches, limit=5):
+    """Short human-readable list of mismatches, for warnings and load report summaries."""
+    lines = [f"    {m.Section}.{m.Field} [{m.Row}]: exported {m.Reported:,.4g}, recomputed {m.Recomputed:,.4g}"
+             for m in mismatches.head(limit).itertuples(index=False)]
+    if len(mismatches) > limit:
+        lines.append(f"    ... and {len(mismatches) - limit} more")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    from data_processor import load_and_process_copq_data, load_and_process_mfg_cost_data
+
+    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    loaded = {
+        'copq': load_and_process_copq_data(os.path.join(data_dir, 'COPQ_Dummy_Data.csv')),
+        'mfg_cost': load_and_process_mfg_cost_data(os.path.join(data_dir, 'Manufacturing_Cost_per_Unit_Calculator.csv')),
+    }
+    for worksheet_type, sections in loaded.items():
+        started = time.perf_counter()
+        found = validate_sections(worksheet_type, sections)
+        elapsed = time.perf_counter() - started
+        print(f"\n{worksheet_type}: {len(found)} mismatch(es) in {elapsed * 1000:.2f} ms")
+        if len(found):
+            print(format_mismatches(found))
+
+    # A stale total: bump one month's cost per unit and check it is flagged
+    stale = dict(loaded['mfg_cost'])
+    stale['total_manufacturing_cost'] = stale['total_manufacturing_cost'].copy()
+    stale['total_manufacturing_cost'].iloc[2, stale['total_manufacturing_cost'].columns.get_loc('Manufacturing Cost per Unit (£)')] += 1.5
+    print("\nWith a stale cost per unit:")
+    print(format_mismatches(validate_sections('mfg_cost', stale)))
@@ -0,0 +1,232 @@
+# src/what_if.py
+#
+# What-if simulation of manufacturing cost per unit and COPQ. Planners describe a
+# scenario as relative changes to a few drivers ("material yield +2%, scrap -10%"),
+# and cost per unit and COPQ are recomputed for every month (and site, when the fact
+# store holds several) of the baseline.
+#
+# Each scenario is one element of a parameter vector. The baseline is one row per
+# (site, month). Every result is a single NumPy broadcast of shape
+# (scenarios, rows), so thousands of Monte Carlo scenarios cost about as much as a
+# handful of pandas operations.
+#
+# Driver model, per baseline row:
+#   material  = material cost * baseline yield / scenario yield   (yield capped at 100%)
+#   labour    = labour cost * baseline efficiency / scenario efficiency
+#   overhead  = overhead * (1 + overhead change)
+#   cost/unit = (material + labour + overhead) / units produced
+#   COPQ      = COPQ * (1 + defect rate change) * (1 + scrap change * scrap share)
+
+import numpy as np
+import pandas as pd
+
+# Relative changes a scenario can apply, e.g. {'material_yield': 0.02, 'scrap': -0.10}
+SCENARIO_PARAMETERS = ('material_yield', 'labor_efficiency', 'overhead', 'defect_rate', 'scrap')
+
+# Monte Carlo: default standard deviation of each driver around the planner's change
+DEFAULT_UNCERTAINTY = 0.02
+
+DEFAULT_SCENARIOS = 5000
+
+PERCENTILES = (5, 50, 95)
+
+
+# --- Baselines ---
+
+def mfg_cost_baseline(total_mfg_cost_df, efficiency_df):
+    """
+    One row per (site, month) with the cost drivers the simulation needs.
+
+    Accepts the worksheet frames (indexed by Month) or fact store frames (with 'Site'
+    and 'Month' columns). Units produced are derived as total cost / cost per unit.
+
+    Returns:
+        pd.DataFrame: 'Site', 'Month', 'Material', 'Labor', 'Overhead', 'Units', 'Yield', 'Labor Efficiency'.
+    """
+    def keyed(df):
+        df = df.reset_index() if 'Month' not in df.columns else df.copy()
+        if 'Site' not in df.columns:
+            df['Site'] = ''
+        # Month labels repeat in multi-year worksheets; pair repeats up in order
+        df['_occurrence'] = df.groupby(['Site', 'Month']).cumcount()
+        return df
+
+    keys = ['Site', 'Month', '_occurrence']
+    costs = keyed(total_mfg_cost_df)
+    efficiency = keyed(efficiency_df)[keys + ['Material Yield (%)', 'Labor Efficiency (%)']]
+    merged = costs.merge(efficiency, on=keys, how='left')
+
+    baseline = pd.DataFrame({
+        'Site': merged['Site'],
+        'Month': merged['Month'],
+        'Material': merged['Total Direct Material Cost (£)'].astype('float64'),
+        'Labor': merged['Total Direct Labor Cost (£)'].astype('float64'),
+        'Overhead': merged['Total Manufacturing Overhead (£)'].astype('float64'),
+        'Units': (merged['Total Manufacturing Cost (£)'] / merged['Manufacturing Cost per Unit (£)']).astype('float64'),
+        # Missing efficiency data means the driver has no effect (ratio of 1)
+        'Yield': merged['Material Yield (%)'].astype('float64').fillna(1.0),
+        'Labor Efficiency': merged['Labor Efficiency (%)'].astype('float64').fillna(1.0),
+    })
+    return baseline.dropna(subset=['Material', 'Labor', 'Overhead', 'Units']).reset_index(drop=True)
+
+
+def copq_baseline(monthly_copq_df, breakdown_df=None):
+    """
+    One row per (site, month) of COPQ, with the scrap share of COPQ from the breakdown table.
+
+    Returns:
+        pd.DataFrame: 'Site', 'Month', 'COPQ', 'Scrap Share'.
+    """
+    df = monthly_copq_df.copy()
+    if 'Site' not in df.columns:
+        df['Site'] = ''
+    scrap_share = 0.0
+    if breakdown_df is not None and not breakdown_df.empty:
+        categories = breakdown_df['Category'].astype(str).str.strip().str.lower()
+        costs = pd.to_numeric(breakdown_df['Cost (£)'], errors='coerce')
+        total = costs[categories != 'total'].sum()
+        if total:
+            scrap_share = float(costs[categories == 'scrap'].sum() / total)
+    return pd.DataFrame({
+        'Site': df['Site'],
+        'Month': df['Month'],
+        'COPQ': df['COPQ (£)'].astype('float64'),
+        'Scrap Share': scrap_share,
+    }).dropna(subset=['COPQ']).reset_index(drop=True)
+
+
+# --- Scenarios ---
+
+def scenario_vectors(changes=None, n=1):
+    """Parameter vectors for `n` copies of one deterministic scenario (missing drivers unchanged)."""
+    changes = changes or {}
+    return {name: np.full(n, float(changes.get(name) or 0.0)) for name in SCENARIO_PARAMETERS}
+
+
+def monte_carlo_scenarios(changes=None, uncertainty=DEFAULT_UNCERTAINTY, n=DEFAULT_SCENARIOS, seed=0):
+    """
+    `n` random scenarios: each driver is normal around the planner's change.
+
+    Args:
+        changes (dict): Driver -> mean relative change (e.g. {'scrap': -0.10}).
+        uncertainty (float or dict): Standard deviation of every driver, or per driver.
+    """
+    changes = changes or {}
+    rng = np.random.default_rng(seed)
+    scenarios = {}
+    for name in SCENARIO_PARAMETERS:
+        sd = uncertainty.get(name, DEFAULT_UNCERTAINTY) if isinstance(uncertainty, dict) else uncertainty
+        scenarios[name] = rng.normal(float(changes.get(name) or 0.0), sd, size=n)
+    return scenarios
+
+
+# --- Simulation (one broadcast per quantity) ---
+
+def simulate_mfg_cost(baseline, scenarios):
+    """
+    Cost per unit and total manufacturing cost for every scenario and baseline row.
+
+    Returns:
+        dict: 'cost_per_unit' and 'total_cost', arrays of shape (scenarios, rows).
+    """
+    yield_change = scenarios['material_yield'][:, None]
+    labor_change = scenarios['labor_efficiency'][:, None]
+    overhead_change = scenarios['overhead'][:, None]
+
+    base_yield = baseline['Yield'].to_numpy()[None, :]
+    base_efficiency = baseline['Labor Efficiency'].to_numpy()[None, :]
+    new_yield = np.clip(base_yield * (1 + yield_change), 1e-6, 1.0)
+    new_efficiency = np.maximum(base_efficiency * (1 + labor_change), 1e-6)
+
+    material = baseline['Material'].to_numpy()[None, :] * (base_yield / new_yield)
+    labor = baseline['Labor'].to_numpy()[None, :] * (base_efficiency / new_efficiency)
+    overhead = baseline['Overhead'].to_numpy()[None, :] * (1 + overhead_change)
+    total = material + labor + overhead
+    return {'cost_per_unit': total / baseline['Units'].to_numpy()[None, :], 'total_cost': total}
+
+
+def simulate_copq(baseline, scenarios):
+    """COPQ for every scenario and baseline row, shape (scenarios, rows)."""
+    defect_change = scenarios['defect_rate'][:, None]
+    scrap_change = scenarios['scrap'][:, None]
+    scrap_share = baseline['Scrap Share'].to_numpy()[None, :]
+    copq = baseline['COPQ'].to_numpy()[None, :]
+    return np.maximum(copq * (1 + defect_change) * (1 + scrap_change * scrap_share), 0.0)
+
+
+def _month_matrix(baseline):
+    """(months, rows x months one-hot matrix) for summing rows of every site into months."""
+    codes, months = pd.factorize(baseline['Month'], sort=True)
+    matrix = np.zeros((len(baseline), len(months)))
+    matrix[np.arange(len(baseline)), codes] = 1.0
+    return months, matrix
+
+
+def _monthly_summary(months, baseline_values, simulated, value_name):
+    summary = pd.DataFrame({'Month': months, f"{value_name} Baseline": baseline_values})
+    for p, values in zip(PERCENTILES, np.percentile(simulated, PERCENTILES, axis=0)):
+        summary[f"{value_name} P{p}"] = values
+    return summary
+
+
+def _totals(baseline_value, per_scenario):
+    p5, p50, p95 = np.percentile(per_scenario, PERCENTILES)
+    return {'baseline': float(baseline_value), 'P5': float(p5), 'P50': float(p50), 'P95': float(p95)}
+
+
+def run_what_if(mfg_baseline, copq_base, changes=None, uncertainty=DEFAULT_UNCERTAINTY,
+                n=DEFAULT_SCENARIOS, seed=0):
+    """
+    Runs one what-if question: a Monte Carlo around the planner's changes (or the
+    exact scenario when `uncertainty` is 0). Sites are summed into months, so the
+    monthly figures are for the whole business.
+
+    Returns:
+        dict: 'cost_per_unit' and 'copq' (per-month frames of baseline and P5/P50/P95),
+              'totals' ({quantity: {'baseline', 'P5', 'P50', 'P95'}}), 'scenarios' (int).
+    """
+    scenarios = (scenario_vectors(changes) if not uncertainty
+                 else monte_carlo_scenarios(changes, uncertainty, n, seed))
+    result = {'scenarios': len(scenarios['scrap']), 'totals': {}}
+
+    if mfg_baseline is not None and not mfg_baseline.empty:
+        mfg = simulate_mfg_cost(mfg_baseline, scenarios)
+        months, matrix = _month_matrix(mfg_baseline)
+        baseline_total = (mfg_baseline['Material'] + mfg_baseline['Labor'] + mfg_baseline['Overhead']).to_numpy()
+        units = mfg_baseline['Units'].to_numpy()
+        monthly_units = units @ matrix
+        result['cost_per_unit'] = _monthly_summary(
+            months, (baseline_total @ matrix) / monthly_units, (mfg['total_cost'] @ matrix) / monthly_units,
+            'Cost per Unit (£)')
+        scenario_totals = mfg['total_cost'].sum(axis=1)
+        result['totals']['Average Cost per Unit (£)'] = _totals(baseline_total.sum() / units.sum(), scenario_totals / units.sum())
+        result['totals']['Total Manufacturing Cost (£)'] = _totals(baseline_total.sum(), scenario_totals)
+
+    if copq_base is not None and not copq_base.empty:
+        copq = simulate_copq(copq_base, scenarios)
+        months, matrix = _month_matrix(copq_base)
+        result['copq'] = _monthly_summary(months, copq_base['COPQ'].to_numpy() @ matrix, copq @ matrix, 'COPQ (£)')
+        result['totals']['Total COPQ (£)'] = _totals(copq_base['COPQ'].sum(), copq.sum(axis=1))
+
+    return result
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    from data_processor import load_and_process_mfg_cost_data, load_and_process_copq_data
+
+    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    mfg_sections = load_and_process_mfg_cost_data(os.path.join(data_dir, 'Manufacturing_Cost_per_Unit_Calculator.csv'))
+    copq_sections = load_and_process_copq_data(os.path.join(data_dir, 'COPQ_Dummy_Data.csv'))
+    mfg_base = mfg_cost_baseline(mfg_sections['total_manufacturing_cost'], mfg_sections['efficiency_indicators'])
+    copq_base = copq_baseline(copq_sections['monthly_copq_tracking'], copq_sections['breakdown_copq'])
+
+    changes = {'material_yield': 0.02, 'scrap': -0.10}
+    started = time.perf_counter()
+    result = run_what_if(mfg_base, copq_base, changes, n=10000)
+    elapsed = time.perf_counter() - started
+    print(f"\n{result['scenarios']:,} scenarios x {len(mfg_base)} months in {elapsed * 1000:.1f} ms for {changes}")
+    for name, totals in result['totals'].items():
+        print(f"  {name:<32} baseline {totals['baseline']:>14,.2f}   P5 {totals['P5']:>14,.2f}   "
+              f"P50 {totals['P50']:>14,.2f}   P95 {totals['P95']:>14,.2f}")
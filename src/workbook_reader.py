@@ -0,0 +1,79 @@
+# src/workbook_reader.py
+
+import datetime
+
+import pandas as pd
+
+from section_parser import classify_worksheet
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+
+
+def is_workbook(file_path):
+    """True if the path points at an Excel workbook rather than a CSV export."""
+    return str(file_path).lower().endswith(EXCEL_EXTENSIONS)
+
+
+def _cell_text(cell):
+    """
+    Renders a read-only cell the way the calculator's CSV export does, so the section
+    parsers see the same strings for both sources. Percent-formatted numbers become
+    '84.05%', month dates become their month name and empty cells become ''.
+    """
+    value = cell.value
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.strftime('%B')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        number_format = getattr(cell, 'number_format', '') or ''
+        if '%' in number_format:
+            return f"{value * 100:.10g}%"
+        return f"{value:.15g}"
+    return str(value)
+
+
+def _sheet_to_grid(worksheet):
+    """Streams one worksheet's rows into an all-string grid, like read_csv(dtype=str)."""
+    rows = []
+    width = 0
+    for row in worksheet.iter_rows():
+        values = [_cell_text(cell) for cell in row]
+        # Trailing empty cells carry no information and vary in count between rows
+        while values and values[-1] == '':
+            values.pop()
+        width = max(width, len(values))
+        rows.append(values)
+    return pd.DataFrame([values + [''] * (width - len(values)) for values in rows], dtype=str)
+
+
+def iter_workbook_sheets(file_path):
+    """
+    Yields (sheet_name, raw_grid) for each sheet of a workbook, one sheet at a time.
+
+    The workbook is opened in openpyxl's read-only mode, so rows are streamed from the
+    file and only the sheet currently being converted is held in memory. Formula cells
+    yield the values Excel cached when the workbook was last saved.
+    """
+    from openpyxl import load_workbook  # only needed for workbook sources
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield worksheet.title, _sheet_to_grid(worksheet)
+    finally:
+        workbook.close()
+
+
+def read_workbook_sheet(file_path, worksheet_type):
+    """
+    Returns the raw grid of the first sheet whose title row matches the worksheet type.
+
+    Raises:
+        ValueError: If no sheet in the workbook matches.
+    """
+    for sheet_name, raw_data in iter_workbook_sheets(file_path):
+        if classify_worksheet(raw_data, sheet_name) == worksheet_type:
+            return raw_data
+    raise ValueError(f"No '{worksheet_type}' worksheet found in workbook {file_path}.")
+